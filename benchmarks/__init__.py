@@ -0,0 +1,3 @@
+"""
+Bash-Copilot 性能基准测试包
+"""
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+DNS缓存和TLS会话恢复的连接耗时基准
+
+DNS: 对给定的主机名分别测量系统解析和新进程从磁盘缓存读取解析结果的耗时
+（当前环境无法解析时报告错误）。
+TLS: 在本机启动一个HTTPS服务（openssl 生成的自签名证书，每次请求后关闭连接），
+前面加注入往返延迟的代理，比较完整握手和恢复会话的新连接请求耗时。
+TLS 1.3 恢复会话省去证书传输和校验，--tls12 时还省去一次往返。
+
+用法:
+$ python -m benchmarks.connect_bench --rtt-ms 80 --runs 5 --tls12
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.startup_bench import make_certificate, start_delay_proxy
+from src.utils.dns_cache import DNSCache
+from src.utils.http_client import close_sessions, get_session
+
+HOSTS = ["api.siliconflow.cn", "openrouter.ai"]
+
+class CloseHandler(BaseHTTPRequestHandler):
+    """返回固定回复并关闭连接"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.reused.append(self.connection.session_reused)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+def bench_dns(hosts: list, runs: int) -> dict:
+    """
+    比较系统解析和磁盘缓存的耗时
+
+    Args:
+        hosts (list): 主机名列表
+        runs (int): 运行次数
+
+    Returns:
+        dict: 每个主机名的耗时中位数(毫秒)或错误信息
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dns.db")
+        for host in hosts:
+            try:
+                system = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+                    system.append(time.perf_counter() - start)
+            except socket.gaierror as e:
+                report[host] = {"error": str(e)}
+                continue
+            cache = DNSCache(path)
+            cache.resolve(host, 443)
+            cache.close()
+            cached = []
+            for _ in range(runs):
+                # 新进程需要打开缓存数据库
+                start = time.perf_counter()
+                cache = DNSCache(path)
+                cache.resolve(host, 443)
+                cached.append(time.perf_counter() - start)
+                cache.close()
+            report[host] = {"system_ms": round(statistics.median(system) * 1000, 2),
+                            "cached_ms": round(statistics.median(cached) * 1000, 2)}
+    return report
+
+def bench_tls(rtt_ms: int, runs: int, tls12: bool) -> dict:
+    """
+    比较完整握手和恢复会话的新连接请求耗时
+
+    Args:
+        rtt_ms (int): 注入的往返延迟(毫秒)
+        runs (int): 运行次数
+        tls12 (bool): 服务器最高只支持 TLS 1.2
+
+    Returns:
+        dict: 两种连接的耗时中位数和会话恢复情况
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        if tls12:
+            context.maximum_version = ssl.TLSVersion.TLSv1_2
+        server = ThreadingHTTPServer(("127.0.0.1", 0), CloseHandler)
+        server.reused = []
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        proxy = start_delay_proxy(server.server_port, rtt_ms / 1000)
+        url = f"https://localhost:{proxy.getsockname()[1]}/"
+
+        full, resumed = [], []
+        try:
+            for _ in range(runs):
+                # 关闭会话相当于新进程，第一个连接需要完整握手
+                close_sessions()
+                for timings in (full, resumed):
+                    start = time.perf_counter()
+                    get_session(url).get(url, verify=cert, timeout=30).raise_for_status()
+                    timings.append(time.perf_counter() - start)
+        finally:
+            close_sessions()
+            proxy.close()
+            server.shutdown()
+            server.server_close()
+
+    return {"rtt_ms": rtt_ms, "tls": "1.2" if tls12 else "1.3",
+            "full_handshake_ms": round(statistics.median(full) * 1000, 1),
+            "resumed_ms": round(statistics.median(resumed) * 1000, 1),
+            "resumed_connections": sum(server.reused), "connections": len(server.reused)}
+
+def main():
+    parser = argparse.ArgumentParser(description="DNS缓存和TLS会话恢复的连接耗时基准")
+    parser.add_argument("--hosts", nargs="+", default=HOSTS, help="测量解析耗时的主机名")
+    parser.add_argument("--rtt-ms", type=int, default=80, help="注入的往返延迟(毫秒)")
+    parser.add_argument("--runs", type=int, default=5, help="运行次数")
+    parser.add_argument("--tls12", action="store_true", help="服务器最高只支持 TLS 1.2")
+    args = parser.parse_args()
+    report = {"dns": bench_dns(args.hosts, args.runs),
+              "tls": bench_tls(args.rtt_ms, args.runs, args.tls12)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+本地模拟的模型提供商
+
+兼容 OpenAI/OpenRouter 的 /chat/completions 接口，可以配置首字节延迟、生成速度、
+回复长度，按比例注入429和500错误，请求中带 "stream": true 时以服务端事件(SSE)
+逐个token返回，合并请求按编号逐行回复。还实现了 OpenAI 风格的批处理接口
+（/files、/batches 和 /files/<编号>/content），批处理在后台线程中逐个请求处理。
+供基准测试和需要真实网络传输的测试使用。
+
+用法:
+$ python -m benchmarks.mock_provider --port 8000 --ttfb-ms 300 --tokens-per-second 50
+然后在 models.yaml 中把提供商的 url 改为 http://127.0.0.1:8000/v1/chat/completions
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# 默认回复
+DEFAULT_REPLY = "ls -la"
+
+# 合并请求中的一个查询
+PACKED_ITEM_PATTERN = re.compile(r"^\[\d+\] ", re.MULTILINE)
+
+def parse_multipart(content_type: str, body: bytes) -> Dict[str, bytes]:
+    """
+    解析 multipart/form-data 请求体
+
+    Args:
+        content_type (str): 请求的 Content-Type
+        body (bytes): 请求体
+
+    Returns:
+        Dict[str, bytes]: 字段名到内容的映射
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        return {}
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+def completion_body(model: str, tokens: List[str], prompt_tokens: int) -> Dict:
+    """聊天接口的非流式响应"""
+    return {"id": "mock", "object": "chat.completion", "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                      "total_tokens": prompt_tokens + len(tokens)}}
+
+class MockHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 请求"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写入，不关闭Nagle算法时第二次写入要等待客户端的延迟确认
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        """发送JSON响应"""
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: int, message: str,
+                        headers: Optional[Dict[str, str]] = None) -> None:
+        """发送 OpenAI 格式的错误"""
+        self.server.record(status)
+        self.send_json(status, {"error": {"message": message, "code": status}}, headers)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.rstrip("/")
+        if path.endswith("/files") or path.endswith("/batches"):
+            self.batch_post(path, body)
+            return
+        if not path.endswith("/chat/completions"):
+            self.send_error_json(404, f"未知路径: {self.path}")
+            return
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send_error_json(401, "缺少API密钥")
+            return
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_error_json(400, "请求体不是有效的JSON")
+            return
+
+        fault = server.draw_fault()
+        if fault == 429:
+            self.send_error_json(429, "请求过于频繁", {"Retry-After": str(server.retry_after)})
+            return
+        if fault == 500:
+            self.send_error_json(500, "服务器内部错误")
+            return
+
+        time.sleep(server.ttfb)
+        tokens = server.reply_tokens(payload.get("model", ""), server.packed_count(payload))
+        model = payload.get("model", "mock")
+        result = completion_body(model, tokens, max(1, len(body) // 4))
+        if payload.get("stream"):
+            self.stream(tokens, result["usage"] if (payload.get("stream_options") or {}).get("include_usage")
+                        else None, model)
+        else:
+            if server.tokens_per_second:
+                time.sleep(len(tokens) / server.tokens_per_second)
+            # 先记录再发送，客户端收到回复时计数已经更新
+            server.record(200)
+            self.send_json(200, result)
+
+    def batch_post(self, path: str, body: bytes) -> None:
+        """上传批处理输入文件或创建批处理"""
+        server = self.server
+        owner = self.headers.get("Authorization", "")
+        if not owner.startswith("Bearer "):
+            self.send_error_json(401, "缺少API密钥")
+            return
+        if path.endswith("/files"):
+            fields = parse_multipart(self.headers.get("Content-Type", ""), body)
+            if fields.get("purpose") != b"batch" or not fields.get("file"):
+                self.send_error_json(400, "需要 purpose=batch 和输入文件")
+                return
+            self.send_json(200, server.add_file(fields["file"], owner))
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_error_json(400, "请求体不是有效的JSON")
+            return
+        batch = server.create_batch(request.get("input_file_id"), request.get("endpoint"),
+                                    request.get("metadata"), owner)
+        if batch is None:
+            self.send_error_json(404, f"文件不存在: {request.get('input_file_id')}")
+            return
+        self.send_json(200, batch)
+
+    def do_GET(self):
+        server = self.server
+        owner = self.headers.get("Authorization", "")
+        parts = self.path.rstrip("/").split("/")
+        # /v1/batches/<编号> 或 /v1/files/<编号>/content
+        if len(parts) >= 2 and parts[-2] == "batches":
+            batch = server.get_batch(parts[-1], owner)
+            if batch is None:
+                self.send_error_json(404, f"批处理不存在: {parts[-1]}")
+                return
+            self.send_json(200, batch)
+        elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content":
+            data = server.file_content(parts[-2], owner)
+            if data is None:
+                self.send_error_json(404, f"文件不存在: {parts[-2]}")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_error_json(404, f"未知路径: {self.path}")
+
+    def stream(self, tokens: List[str], usage: Optional[Dict[str, int]], model: str) -> None:
+        """以服务端事件逐个token返回"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        interval = 1 / self.server.tokens_per_second if self.server.tokens_per_second else 0
+        try:
+            for token in tokens:
+                chunk = {"id": "mock", "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if interval:
+                    time.sleep(interval)
+            if usage is not None:
+                chunk = {"id": "mock", "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.server.record(200)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭连接（取消请求）
+            self.server.record("cancelled")
+
+class MockProvider(ThreadingHTTPServer):
+    """
+    模拟的模型提供商
+
+    Args:
+        host (str): 监听地址
+        port (int): 监听端口，0表示自动选择
+        ttfb (float): 首字节前的延迟秒数
+        tokens_per_second (float): 生成速度，0表示不限速
+        response_tokens (int, optional): 回复的token数，默认为回复文本本身的长度
+        error_rate (float): 返回500错误的比例
+        rate_limit_rate (float): 返回429错误的比例
+        reply (str): 回复文本
+        replies (Dict[str, str], optional): 按模型名指定的回复
+        seed (int, optional): 错误注入的随机种子
+        batch_seconds (float): 处理一个批处理的秒数
+
+    批处理结束时的状态由 batch_status 指定（默认 "completed"），为 "failed" 时没有结果文件。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttfb: float = 0.0,
+                 tokens_per_second: float = 0.0, response_tokens: Optional[int] = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 reply: str = DEFAULT_REPLY, replies: Optional[Dict[str, str]] = None,
+                 seed: Optional[int] = None, batch_seconds: float = 0.0):
+        super().__init__((host, port), MockHandler)
+        self.ttfb = ttfb
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = 1
+        self.reply = reply
+        self.replies = replies or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.statuses = Counter()  # type: Counter
+        self.thread = None  # type: Optional[threading.Thread]
+        self.batch_seconds = batch_seconds
+        self.batch_status = "completed"
+        self.files = {}  # type: Dict[str, Dict]
+        self.batches = {}  # type: Dict[str, Dict]
+        # 批处理接口的调用次数: upload、create、retrieve、download
+        self.batch_calls = Counter()  # type: Counter
+
+    @property
+    def url(self) -> str:
+        """聊天接口地址"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def requests(self) -> int:
+        """已处理的请求数"""
+        with self.lock:
+            return sum(self.statuses.values())
+
+    def record(self, status) -> None:
+        """记录一次请求的结果"""
+        with self.lock:
+            self.statuses[status] += 1
+
+    def draw_fault(self) -> Optional[int]:
+        """按配置的比例决定本次请求是否返回错误"""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def packed_count(self, payload: Dict) -> int:
+        """
+        合并请求（见 generators/packed_generator.py）中的查询数
+
+        Args:
+            payload (Dict): 请求体
+
+        Returns:
+            int: 最后一条消息中 "[编号] 查询" 形式的行数，不是合并请求时为0
+        """
+        content = (payload.get("messages") or [{}])[-1].get("content") or ""
+        if isinstance(content, list):
+            content = "\n".join(part.get("text", "") for part in content)
+        return len(PACKED_ITEM_PATTERN.findall(content))
+
+    def reply_tokens(self, model: str, packed: int = 0) -> List[str]:
+        """
+        生成回复的token序列
+
+        Args:
+            model (str): 请求的模型名
+            packed (int): 合并请求中的查询数，大于0时按编号逐行回复，不受 response_tokens 限制
+
+        Returns:
+            List[str]: token列表，拼接后即为回复文本
+        """
+        reply = self.replies.get(model, self.reply)
+        if packed:
+            words = "\n".join(f"[{index}] {reply}" for index in range(1, packed + 1)).split(" ")
+            return [(" " if index else "") + word for index, word in enumerate(words)]
+        words = reply.split(" ")
+        count = self.response_tokens if self.response_tokens is not None else len(words)
+        # 按空格切分，空格保留在下一个token的开头；指定长度时循环使用回复中的词
+        return [(" " if index else "") + words[index % len(words)] for index in range(count)]
+
+    def add_file(self, data: bytes, owner: str) -> Dict:
+        """保存上传的文件，返回文件对象"""
+        with self.lock:
+            self.batch_calls["upload"] += 1
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = {"data": data, "owner": owner}
+        return {"id": file_id, "object": "file", "bytes": len(data), "purpose": "batch",
+                "created_at": int(time.time())}
+
+    def file_content(self, file_id: str, owner: str) -> Optional[bytes]:
+        """读取文件内容，文件不存在或不属于该密钥时返回None"""
+        with self.lock:
+            self.batch_calls["download"] += 1
+            entry = self.files.get(file_id)
+        if entry is None or entry["owner"] != owner:
+            return None
+        return entry["data"]
+
+    def create_batch(self, input_file_id: str, endpoint: str, metadata: Optional[Dict],
+                     owner: str) -> Optional[Dict]:
+        """
+        创建批处理并在后台线程中处理
+
+        Args:
+            input_file_id (str): 输入文件编号
+            endpoint (str): 聊天接口的路径
+            metadata (Dict, optional): 附加信息
+            owner (str): 创建者的 Authorization 请求头
+
+        Returns:
+            Optional[Dict]: 批处理对象，输入文件不存在时返回None
+        """
+        with self.lock:
+            self.batch_calls["create"] += 1
+            entry = self.files.get(input_file_id)
+            if entry is None or entry["owner"] != owner:
+                return None
+            lines = [line for line in entry["data"].decode("utf-8").splitlines() if line.strip()]
+            batch_id = f"batch_{len(self.batches) + 1}"
+            batch = {"id": batch_id, "object": "batch", "endpoint": endpoint,
+                     "input_file_id": input_file_id, "completion_window": "24h",
+                     "status": "validating", "output_file_id": None, "error_file_id": None,
+                     "created_at": int(time.time()), "metadata": metadata or {},
+                     "request_counts": {"total": len(lines), "completed": 0, "failed": 0}}
+            self.batches[batch_id] = {"batch": batch, "owner": owner}
+            snapshot = json.loads(json.dumps(batch))
+        threading.Thread(target=self.run_batch, args=(batch, lines), daemon=True).start()
+        return snapshot
+
+    def get_batch(self, batch_id: str, owner: str) -> Optional[Dict]:
+        """查询批处理，不存在或不属于该密钥时返回None"""
+        with self.lock:
+            self.batch_calls["retrieve"] += 1
+            entry = self.batches.get(batch_id)
+            if entry is None or entry["owner"] != owner:
+                return None
+            return json.loads(json.dumps(entry["batch"]))
+
+    def run_batch(self, batch: Dict, lines: List[str]) -> None:
+        """逐个处理批处理中的请求，按 error_rate 和 rate_limit_rate 注入失败"""
+        with self.lock:
+            batch["status"] = "in_progress"
+        delay = self.batch_seconds / max(1, len(lines))
+        outputs = []  # type: List[str]
+        errors = []  # type: List[str]
+        for number, line in enumerate(lines, 1):
+            time.sleep(delay)
+            request = json.loads(line)
+            payload = request.get("body") or {}
+            record = {"id": f"{batch['id']}_req_{number}", "custom_id": request.get("custom_id"),
+                      "error": None}
+            fault = self.draw_fault()
+            if fault is not None:
+                record["response"] = {"status_code": fault, "body": {
+                    "error": {"message": "模拟的错误", "code": fault}}}
+                errors.append(json.dumps(record, ensure_ascii=False))
+            else:
+                tokens = self.reply_tokens(payload.get("model", ""), self.packed_count(payload))
+                body = completion_body(payload.get("model", "mock"), tokens,
+                                       max(1, len(json.dumps(payload)) // 4))
+                record["response"] = {"status_code": 200, "body": body}
+                outputs.append(json.dumps(record, ensure_ascii=False))
+            with self.lock:
+                batch["request_counts"]["failed" if fault is not None else "completed"] += 1
+
+        with self.lock:
+            owner = self.batches[batch["id"]]["owner"]
+            status = self.batch_status
+            if status == "failed":
+                batch["request_counts"].update(completed=0, failed=len(lines))
+            else:
+                for name, rows in (("output_file_id", outputs), ("error_file_id", errors)):
+                    if rows:
+                        file_id = f"file-{len(self.files) + 1}"
+                        self.files[file_id] = {"data": ("\n".join(rows) + "\n").encode("utf-8"),
+                                               "owner": owner}
+                        batch[name] = file_id
+            batch["status"] = status
+
+    def start(self) -> "MockProvider":
+        """在后台线程中开始服务"""
+        self.thread = threading.Thread(target=self.serve_forever, name="mock-provider", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止服务并关闭监听套接字"""
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+
+    def __enter__(self) -> "MockProvider":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的模型提供商")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--ttfb-ms", type=float, default=0, help="首字节前的延迟(毫秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="生成速度，0表示不限速")
+    parser.add_argument("--response-tokens", type=int, help="回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回500错误的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="返回429错误的比例")
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="回复文本")
+    args = parser.parse_args()
+
+    server = MockProvider(args.host, args.port, ttfb=args.ttfb_ms / 1000,
+                          tokens_per_second=args.tokens_per_second,
+                          response_tokens=args.response_tokens, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, reply=args.reply)
+    print(f"模拟提供商: {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+检索模式与朴素截断的对比基准
+
+生成一个在中间位置埋有相关记录的合成日志，分别用首尾截断和BM25检索
+把它压缩到相同的token预算，比较耗时和相关记录的召回率。
+
+用法:
+$ python -m benchmarks.retrieval_bench --size-mb 200
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.file_utils import fit_to_budget
+from src.utils.retrieval import retrieve_file_contents, RETRIEVAL_TOKEN_BUDGET
+
+QUERY = "payment gateway timeout order"
+NEEDLE_COUNT = 20
+
+def generate_log(path: str, size_mb: int) -> list:
+    """
+    生成合成日志，并在中间位置埋入相关记录
+
+    Args:
+        path (str): 输出文件路径
+        size_mb (int): 目标大小(MB)
+
+    Returns:
+        list: 埋入的相关记录
+    """
+    rng = random.Random(42)
+    services = ["auth", "search", "cart", "profile", "inventory", "shipping"]
+    needles = [f"2024-05-01 12:00:{i:02d} ERROR payment gateway timeout order={100000 + i}"
+               for i in range(NEEDLE_COUNT)]
+    target = size_mb * 1024 * 1024
+    written = 0
+    planted = False
+    with open(path, "w") as f:
+        while written < target:
+            if not planted and written >= target // 2:
+                for needle in needles:
+                    f.write(needle + "\n")
+                planted = True
+            line = (f"2024-05-01 11:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} INFO "
+                    f"{rng.choice(services)} request id={rng.randint(1, 10 ** 9)} "
+                    f"latency={rng.randint(1, 500)}ms status=200\n")
+            f.write(line)
+            written += len(line)
+    return needles
+
+def recall(text: str, needles: list) -> float:
+    """
+    计算相关记录的召回率
+
+    Args:
+        text (str): 压缩后的内容
+        needles (list): 相关记录
+
+    Returns:
+        float: 召回率
+    """
+    return sum(1 for needle in needles if needle in text) / len(needles)
+
+def run(size_mb: int, budget: int) -> dict:
+    """
+    运行对比基准
+
+    Args:
+        size_mb (int): 合成日志大小(MB)
+        budget (int): token预算
+
+    Returns:
+        dict: 基准结果
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "app.log")
+        needles = generate_log(path, size_mb)
+
+        start = time.perf_counter()
+        with open(path) as f:
+            truncated = fit_to_budget(path, f.read(), budget)
+        truncate_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        retrieved = retrieve_file_contents([path], QUERY, budget) or []
+        retrieve_seconds = time.perf_counter() - start
+        retrieved_text = "\n".join(content for _, content in retrieved)
+
+    return {
+        "size_mb": size_mb,
+        "budget_tokens": budget,
+        "truncate": {"seconds": round(truncate_seconds, 3), "recall": recall(truncated, needles)},
+        "retrieve": {"seconds": round(retrieve_seconds, 3), "recall": recall(retrieved_text, needles),
+                     "chunks": len(retrieved)}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="检索模式与朴素截断的对比基准")
+    parser.add_argument("--size-mb", type=int, default=50, help="合成日志大小(MB)")
+    parser.add_argument("--budget", type=int, default=RETRIEVAL_TOKEN_BUDGET, help="token预算")
+    args = parser.parse_args()
+    print(json.dumps(run(args.size_mb, args.budget), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+单次查询启动流程的对比基准
+
+在本机启动一个HTTPS对话接口（openssl 生成的自签名证书），前面加一个注入往返延迟的
+TCP代理模拟远程提供商。分别测量顺序流程（环境探测 → 读取文件 → 建立连接并发送请求）
+和重叠流程（后台预连接、并行环境探测，请求使用已建立的连接）的端到端耗时。
+环境探测和读取文件的耗时不少于建立连接时，重叠流程应节省一次往返加TLS握手的时间；
+--probe-ms 在环境探测中加入额外耗时，模拟 lsb_release 较慢的系统。
+
+用法:
+$ python -m benchmarks.startup_bench --rtt-ms 80 --runs 5
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ssl
+import requests
+
+from src.utils.context import get_bash_context
+from src.utils.file_utils import read_file_contents
+from src.utils.http_client import close_sessions, prewarm, prewarmed_session
+
+QUERY = "统计日志中每种错误出现的次数"
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """返回固定回复的对话接口"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"choices": [{"message": {"content": "sort app.log | uniq -c"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_certificate(directory: str) -> tuple:
+    """
+    用 openssl 生成 localhost 的自签名证书
+
+    Returns:
+        tuple: (证书路径, 私钥路径)
+    """
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+                    "-keyout", key, "-out", cert], check=True, capture_output=True)
+    return cert, key
+
+def start_server(cert: str, key: str) -> ThreadingHTTPServer:
+    """启动HTTPS对话接口"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_delay_proxy(target_port: int, rtt: float) -> socket.socket:
+    """
+    启动注入延迟的TCP代理
+
+    建立连接时等待一次往返（模拟TCP握手），之后每个方向的数据延迟半个往返再转发。
+
+    Returns:
+        socket.socket: 监听套接字
+    """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+
+    def pipe(source, dest):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                time.sleep(rtt / 2)
+                dest.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, dest):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def serve():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            time.sleep(rtt)
+            upstream = socket.create_connection(("127.0.0.1", target_port))
+            threading.Thread(target=pipe, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=pipe, args=(upstream, client), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+def probe(extra: float) -> dict:
+    """环境探测，extra 为额外的耗时秒数"""
+    time.sleep(extra)
+    return get_bash_context()
+
+def payload_for(context: dict, file_contents: list) -> dict:
+    """构造请求体"""
+    files = "\n".join(f"{name}:\n{content}" for name, content in file_contents)
+    return {"model": "bench", "messages": [
+        {"role": "system", "content": json.dumps(context)},
+        {"role": "user", "content": f"{files}\n{QUERY}"}]}
+
+def sequential(url: str, filename: str, extra: float) -> float:
+    """顺序流程: 准备完成后才建立连接"""
+    start = time.perf_counter()
+    context = probe(extra)
+    file_contents = read_file_contents([filename], False)
+    with requests.Session() as session:
+        session.post(url, json=payload_for(context, file_contents), timeout=30).raise_for_status()
+    return time.perf_counter() - start
+
+def overlapped(url: str, filename: str, extra: float) -> float:
+    """重叠流程: 预连接和环境探测在后台进行"""
+    close_sessions()
+    start = time.perf_counter()
+    prewarm(url)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        context_future = executor.submit(probe, extra)
+        file_contents = read_file_contents([filename], False)
+        context = context_future.result()
+    session = prewarmed_session(url)
+    session.post(url, json=payload_for(context, file_contents), timeout=30).raise_for_status()
+    return time.perf_counter() - start
+
+def run(rtt_ms: int, runs: int, file_kb: int, probe_ms: int) -> dict:
+    """
+    运行基准
+
+    Args:
+        rtt_ms (int): 注入的往返延迟(毫秒)
+        runs (int): 每种流程的运行次数
+        file_kb (int): 随查询发送的文件大小(KB)
+        probe_ms (int): 环境探测的额外耗时(毫秒)
+
+    Returns:
+        dict: 两种流程的耗时中位数和节省的时间
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        server = start_server(cert, key)
+        proxy = start_delay_proxy(server.server_port, rtt_ms / 1000)
+        url = f"https://localhost:{proxy.getsockname()[1]}/v1/chat/completions"
+        filename = os.path.join(directory, "app.log")
+        with open(filename, "w") as f:
+            line = "2024-05-01 12:00:00 ERROR db timeout\n"
+            f.write(line * (file_kb * 1024 // len(line)))
+
+        os.environ["REQUESTS_CA_BUNDLE"] = cert
+        results = {"sequential": [], "overlapped": []}
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(runs):
+                    results["sequential"].append(sequential(url, filename, probe_ms / 1000))
+                    results["overlapped"].append(overlapped(url, filename, probe_ms / 1000))
+        finally:
+            close_sessions()
+            proxy.close()
+            server.shutdown()
+            server.server_close()
+
+    report = {"rtt_ms": rtt_ms, "runs": runs, "file_kb": file_kb, "probe_ms": probe_ms}
+    for name, timings in results.items():
+        report[f"{name}_ms"] = round(statistics.median(timings) * 1000, 1)
+    report["saved_ms"] = round(report["sequential_ms"] - report["overlapped_ms"], 1)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="单次查询启动流程的对比基准")
+    parser.add_argument("--rtt-ms", type=int, default=80, help="注入的往返延迟(毫秒)")
+    parser.add_argument("--runs", type=int, default=5, help="每种流程的运行次数")
+    parser.add_argument("--file-kb", type=int, default=16,
+                        help="随查询发送的文件大小(KB)，超过约20KB会触发token确认提示")
+    parser.add_argument("--probe-ms", type=int, default=0, help="环境探测的额外耗时(毫秒)")
+    args = parser.parse_args()
+    print(json.dumps(run(args.rtt_ms, args.runs, args.file_kb, args.probe_ms), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+端到端基准测试套件
+
+使用本地模拟的提供商（benchmarks/mock_provider.py）测量:
+- 冷启动: 新进程运行 `bcopilot -help` 的耗时和峰值内存
+- 提示构建: 带文件内容时构建消息列表的耗时
+- token估算: 估算大文件token数的速度
+- 端到端延迟: 单次请求和流式请求首个token的 p50/p99
+- 吞吐量: 不同并发数下的每秒请求数
+- 合并请求: 批量命令查询逐个请求和合并请求时的每秒查询数和每个查询的输入token数
+- 本进程的峰值内存
+
+结果以JSON保存（默认 benchmarks/results/<版本>.json），--compare 比较两次结果，
+变差超过阈值的指标会被标出。
+
+用法:
+$ python -m benchmarks.suite
+$ python -m benchmarks.suite --ttfb-ms 200 --tokens-per-second 80 --output new.json
+$ python -m benchmarks.suite --compare benchmarks/results/old.json new.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# 确保项目根目录在Python路径中
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.mock_provider import MockProvider
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    build_messages,
+    build_request,
+    request_generation,
+    send_request,
+    stream_request
+)
+from src.generators.packed_generator import PackedRunner
+from src.utils.http_client import get_session
+from src.utils.token_utils import estimate_tokens
+
+# 结果的默认保存目录
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# 比较时视为变差的变化比例
+REGRESSION_THRESHOLD = 0.10
+
+# 数值越大越好的指标（按名称后缀判断），其余指标越小越好
+HIGHER_IS_BETTER = ("_rps", "_mb_per_s")
+
+QUERY = "统计日志中每种错误出现的次数"
+
+CONTEXT = {
+    "current_directory": "/home/user/project",
+    "username": "bench",
+    "hostname": "bench-host",
+    "ubuntu_version": "Ubuntu 22.04 LTS"
+}
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    计算分位数（最近秩法）
+
+    Args:
+        values (List[float]): 数值
+        fraction (float): 0到1之间的分位
+
+    Returns:
+        float: 分位数
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def timed(function: Callable[[], Any], repeat: int) -> List[float]:
+    """重复执行并返回每次的耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def synthetic_log(size_bytes: int) -> str:
+    """生成指定大小的合成日志"""
+    rng = random.Random(42)
+    lines = []
+    total = 0
+    while total < size_bytes:
+        line = (f"2024-05-01 12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} "
+                f"{rng.choice(['INFO', 'WARN', 'ERROR'])} service={rng.choice(['auth', 'cart', 'search'])} "
+                f"latency={rng.randint(1, 900)}ms 请求完成\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+def bench_cold_start(runs: int) -> Dict[str, float]:
+    """新进程运行 bcopilot -help 的耗时和峰值内存"""
+    command = [sys.executable, os.path.join(ROOT_DIR, "src", "bcopilot.py"), "-help"]
+    timings = timed(lambda: subprocess.run(command, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.DEVNULL, check=True), runs)
+    return {"cold_start_ms": round(statistics.median(timings), 1),
+            "cold_start_peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+
+def bench_prompt(provider_config: Dict[str, Any], file_kb: int, runs: int) -> Dict[str, float]:
+    """构建带文件内容的消息列表和请求体的耗时"""
+    file_contents = [("app.log", synthetic_log(file_kb * 1024))]
+
+    def build():
+        messages = build_messages(QUERY, CONTEXT, provider_config, False, file_contents)
+        build_request(provider_config, "bench-key", messages, False)
+
+    return {"prompt_build_ms": round(statistics.median(timed(build, runs)), 3)}
+
+def bench_tokens(size_mb: int) -> Dict[str, float]:
+    """估算大文件token数的速度"""
+    text = synthetic_log(size_mb * 1024 * 1024)
+    elapsed = min(timed(lambda: estimate_tokens(text), 3)) / 1000
+    return {"token_estimate_mb_per_s": round(len(text.encode("utf-8")) / 1024 / 1024 / elapsed, 1)}
+
+def bench_latency(provider: MockProvider, provider_config: Dict[str, Any],
+                  model_manager: ModelManager, requests_count: int) -> Dict[str, float]:
+    """单次请求的端到端延迟和流式请求首个token的延迟"""
+    session = get_session(provider.url)
+
+    def generate():
+        ok, reply = request_generation(provider_config, QUERY, CONTEXT, usage={},
+                                       model_manager=model_manager, session=session)
+        if not ok:
+            raise RuntimeError(reply)
+
+    e2e = timed(generate, requests_count)
+
+    headers, payload = build_request(provider_config, "bench-key",
+                                     build_messages(QUERY, CONTEXT, provider_config), False)
+    first_token = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        seen = []
+
+        def on_text(text):
+            if not seen:
+                seen.append((time.perf_counter() - start) * 1000)
+            return False
+
+        ok, reply = stream_request(provider_config, headers, payload, 30, session=session,
+                                   on_text=on_text)
+        if not ok:
+            raise RuntimeError(reply)
+        first_token.append(seen[0])
+
+    return {"e2e_p50_ms": round(percentile(e2e, 0.5), 1),
+            "e2e_p99_ms": round(percentile(e2e, 0.99), 1),
+            "stream_ttft_p50_ms": round(percentile(first_token, 0.5), 1),
+            "stream_ttft_p99_ms": round(percentile(first_token, 0.99), 1)}
+
+def bench_throughput(provider: MockProvider, provider_config: Dict[str, Any],
+                     concurrency_levels: List[int], requests_count: int) -> Dict[str, float]:
+    """不同并发数下的吞吐量"""
+    headers, payload = build_request(provider_config, "bench-key",
+                                     build_messages(QUERY, CONTEXT, provider_config), False)
+    session = get_session(provider.url)
+    results = {}
+    for concurrency in concurrency_levels:
+        def one(_):
+            ok, reply = send_request(provider_config, headers, payload, 30,
+                                     report_cache=False, session=session)
+            if not ok:
+                raise RuntimeError(reply)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests_count)))
+        elapsed = time.perf_counter() - start
+        results[f"throughput_c{concurrency}_rps"] = round(requests_count / elapsed, 1)
+    return results
+
+def bench_packing(provider_config: Dict[str, Any], model_manager: ModelManager,
+                  pack_sizes: List[int], queries_count: int) -> Dict[str, float]:
+    """批量命令查询在不同合并数下的每秒查询数和每个查询的输入token数"""
+    queries = [f"{QUERY}（第{index}个文件）" for index in range(queries_count)]
+    results = {}
+    for size in pack_sizes:
+        runner = PackedRunner(CONTEXT, model_manager=model_manager, pack_size=size,
+                              provider_config=provider_config)
+        start = time.perf_counter()
+        answers = runner.run(queries)
+        elapsed = time.perf_counter() - start
+        if not all(answer["success"] for answer in answers):
+            raise RuntimeError("合并请求基准中有查询失败")
+        results[f"pack{size}_queries_rps"] = round(queries_count / elapsed, 1)
+        results[f"pack{size}_prompt_tokens_per_query"] = round(runner.stats.prompt_tokens / queries_count, 1)
+    return results
+
+def version() -> str:
+    """当前代码的版本（git提交），无法获取时返回 unknown"""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    运行全部基准
+
+    Args:
+        args (argparse.Namespace): 命令行参数
+
+    Returns:
+        Dict[str, Any]: 包含环境信息 (meta)、参数 (params) 和指标 (metrics) 的结果
+    """
+    metrics = {}  # type: Dict[str, float]
+    metrics.update(bench_cold_start(args.runs))
+    with tempfile.TemporaryDirectory() as directory:
+        key_file = os.path.join(directory, "bench_key.txt")
+        with open(key_file, "w") as f:
+            f.write("bench-key")
+        with MockProvider(ttfb=args.ttfb_ms / 1000, tokens_per_second=args.tokens_per_second,
+                          response_tokens=args.response_tokens) as provider:
+            provider_config = {"url": provider.url, "model": "mock-model",
+                               "token_limit": 128000, "key_file": key_file,
+                               "rate_limit": {"requests_per_minute": 1000000,
+                                              "max_concurrency": max(args.concurrency)}}
+            metrics.update(bench_prompt(provider_config, args.file_kb, args.runs))
+            metrics.update(bench_tokens(args.size_mb))
+            metrics.update(bench_latency(provider, provider_config, ModelManager(), args.requests))
+            metrics.update(bench_throughput(provider, provider_config, args.concurrency,
+                                            args.requests))
+            metrics.update(bench_packing(provider_config, ModelManager(), args.pack,
+                                         args.requests))
+    metrics["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    params = {name: getattr(args, name) for name in
+              ("runs", "requests", "concurrency", "pack", "ttfb_ms", "tokens_per_second",
+               "response_tokens", "file_kb", "size_mb")}
+    return {"meta": {"version": version(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": platform.python_version(), "platform": platform.platform()},
+            "params": params, "metrics": metrics}
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any],
+                    threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    比较两次结果的指标
+
+    Args:
+        old (Dict[str, Any]): 之前的结果
+        new (Dict[str, Any]): 新的结果
+        threshold (float): 视为变差的变化比例
+
+    Returns:
+        List[Dict[str, Any]]: 每个共有指标的 name、old、new、change（变化比例）和 regression
+    """
+    rows = []
+    for name in sorted(set(old["metrics"]) & set(new["metrics"])):
+        before, after = old["metrics"][name], new["metrics"][name]
+        change = (after - before) / before if before else 0.0
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        rows.append({"name": name, "old": before, "new": after, "change": change,
+                     "regression": worse > threshold})
+    return rows
+
+def format_comparison(old: Dict[str, Any], new: Dict[str, Any],
+                      rows: List[Dict[str, Any]]) -> str:
+    """生成比较报告"""
+    lines = [f"{old['meta']['version']} -> {new['meta']['version']}"]
+    if old.get("params") != new.get("params"):
+        lines.append("注意: 两次运行的参数不同，结果可能不可比")
+    width = max([len(row["name"]) for row in rows] + [6])
+    lines.append(f"{'指标':<{width - 2}} {'之前':>12} {'之后':>12} {'变化':>9}")
+    for row in rows:
+        mark = "  变差" if row["regression"] else ""
+        lines.append(f"{row['name']:<{width}} {row['old']:>14} {row['new']:>14} "
+                     f"{row['change']:>+10.1%}{mark}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试套件")
+    parser.add_argument("--runs", type=int, default=5, help="冷启动和提示构建的重复次数")
+    parser.add_argument("--requests", type=int, default=50, help="延迟和吞吐量测试的请求数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="吞吐量测试的并发数")
+    parser.add_argument("--pack", type=int, nargs="+", default=[1, 8],
+                        help="合并请求测试的每次合并查询数")
+    parser.add_argument("--ttfb-ms", type=float, default=50, help="模拟提供商的首字节延迟(毫秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="模拟提供商的生成速度")
+    parser.add_argument("--response-tokens", type=int, default=20, help="模拟回复的token数")
+    parser.add_argument("--file-kb", type=int, default=256, help="提示构建测试的文件大小(KB)")
+    parser.add_argument("--size-mb", type=int, default=20, help="token估算测试的文本大小(MB)")
+    parser.add_argument("--output", help="结果保存路径，默认 benchmarks/results/<版本>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="比较两次结果")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        rows = compare_results(old, new)
+        print(format_comparison(old, new, rows))
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+    result = run_suite(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['meta']['version']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result["metrics"], indent=2))
+    print(f"结果已保存到 {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
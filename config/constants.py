@@ -9,5 +9,74 @@ from pathlib import Path
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent.parent.absolute()
 
-# 历史记录文件
+# 历史记录文件（旧版文本格式，可通过 bcopilot history import 导入）
 HISTORY_FILE = os.path.join(SCRIPT_DIR, "logs", "bcopilot_history.log")
+
+# 历史记录存储目录（JSONL分段日志和检索索引）
+HISTORY_DIR = os.path.join(SCRIPT_DIR, "logs", "history")
+HISTORY_SEGMENT_MAX_BYTES = 16 * 1024 * 1024  # 分段日志达到该大小后切换到新分段
+HISTORY_SEGMENT_MAX_AGE = 7 * 86400  # 分段日志的最长写入时间（秒）
+HISTORY_RETENTION_DAYS = 365  # 超过该天数的已封存分段被删除
+HISTORY_MAX_BYTES = 512 * 1024 * 1024  # 所有分段的总大小上限，超出后从最旧的分段开始删除
+
+# 缓存目录
+CACHE_DIR = os.path.join(SCRIPT_DIR, "cache")
+
+# 预处理文件内容缓存
+FILE_CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.db")
+FILE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存容量上限，超出后按LRU淘汰
+
+# 管道输入只保留开头和结尾，中间部分丢弃
+STDIN_HEAD_BYTES = 128 * 1024
+STDIN_TAIL_BYTES = 128 * 1024
+
+# 管道输入在该秒数内没有数据也没有结束时忽略（cron、CI、ssh 继承的不会关闭的管道）
+STDIN_WAIT_SECONDS = 3.0
+
+# 会话延续保存的对话目录，每个会话一个JSON文件
+SESSION_DIR = os.path.join(CACHE_DIR, "sessions")
+
+# 工作区索引目录，每个工作区一个数据库
+WORKSPACE_INDEX_DIR = os.path.join(CACHE_DIR, "workspaces")
+
+# 分块处理(map-reduce)的片段结果缓存
+MAPREDUCE_CACHE_FILE = os.path.join(CACHE_DIR, "mapreduce_cache.db")
+MAPREDUCE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 命令模式自动切换到脚本模式的决定，按规范化后的查询保存
+ESCALATION_CACHE_FILE = os.path.join(CACHE_DIR, "escalations.db")
+ESCALATION_CACHE_MAX_BYTES = 4 * 1024 * 1024
+ESCALATION_CACHE_TTL = 30 * 86400  # 决定保留时间（秒）
+
+# 提供商域名的解析结果，单次调用的进程之间共享
+DNS_CACHE_FILE = os.path.join(CACHE_DIR, "dns.db")
+DNS_CACHE_MAX_BYTES = 256 * 1024
+DNS_CACHE_TTL = 300  # 解析结果保留时间（秒），getaddrinfo 不返回记录本身的TTL
+
+# 后台进程（供 shell 快捷键使用）的Unix套接字，放在仅当前用户可访问（0700）的目录中；
+# 客户端和后台进程都只使用属于当前用户的套接字
+DAEMON_SOCKET_DIR = (os.path.join(os.environ["XDG_RUNTIME_DIR"], "bcopilot") if os.environ.get("XDG_RUNTIME_DIR")
+                     else os.path.join("/tmp", f"bcopilot-{os.getuid()}"))
+DAEMON_SOCKET = os.path.join(DAEMON_SOCKET_DIR, "daemon.sock")
+DAEMON_LOG_FILE = os.path.join(SCRIPT_DIR, "logs", "daemon.log")
+
+# 后台进程的回答缓存，相同目录下的相同查询直接返回
+ANSWER_CACHE_FILE = os.path.join(CACHE_DIR, "answer_cache.db")
+ANSWER_CACHE_MAX_BYTES = 16 * 1024 * 1024
+ANSWER_CACHE_TTL = 7 * 86400  # 缓存的回答保留时间（秒）
+
+# 后台进程空闲时按历史记录预热回答缓存，每个提供商每天最多使用的token数
+# （可在 models.yaml 中用提供商的 warm_tokens_per_day 覆盖，0表示不预热）
+WARM_TOKENS_PER_DAY = 50000
+WARM_STATE_FILE = os.path.join(CACHE_DIR, "warmer.json")
+
+# 团队共享的缓存网关（bcopilot gateway）
+GATEWAY_HOST = "127.0.0.1"
+GATEWAY_PORT = 8088
+GATEWAY_CACHE_FILE = os.path.join(CACHE_DIR, "gateway.db")
+GATEWAY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+GATEWAY_CACHE_TTL = 86400  # 缓存的回复保留时间（秒）
+GATEWAY_UPSTREAM_TIMEOUT = 120  # 向上游发送请求的超时秒数
+
+# 提供商批处理任务（bcopilot batch-submit）的本地记录，每个任务一个JSON文件
+BATCH_JOB_DIR = os.path.join(CACHE_DIR, "batches")
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 """
 Bash-Copilot 提示词模板配置
+
+提示词按变化频率从低到高分块组装，以便服务商的提示前缀缓存生效:
+1. 静态系统指令（SCRIPT_SYSTEM_PROMPT / COMMAND_SYSTEM_PROMPT）
+2. 缓慢变化的环境上下文（ENVIRONMENT_CONTEXT_PROMPT）
+3. 文件内容（FILE_CONTENT_PROMPT）
+4. 用户查询（SCRIPT_QUERY_PROMPT / COMMAND_QUERY_PROMPT）
 """
 
-# 脚本生成提示词模板
-SCRIPT_PROMPT_TEMPLATE = """作为专业的Bash脚本开发者，请为以下任务创建一个完整的bash脚本:
-    
-任务描述: {query}
+# 命令模式下任务过于复杂时模型返回的固定回复
+COMMAND_REFUSAL_MESSAGE = "这个任务无法用单行命令完成，请使用 -script 参数生成完整脚本"
+
+# 脚本生成系统提示词（静态部分，不含任何随调用变化的值）
+SCRIPT_SYSTEM_PROMPT = """作为专业的Bash脚本开发者，请为用户描述的任务创建一个完整的bash脚本。
 
 请生成一个完整的、可执行的bash脚本，包含适当的注释和错误处理。
 脚本应该在Ubuntu 20.04环境中运行。
@@ -15,28 +22,25 @@ SCRIPT_PROMPT_TEMPLATE = """作为专业的Bash脚本开发者，请为以下任
 脚本名称应该符合bash命名规范，只包含小写字母、数字和下划线，最多20个字符，能够准确描述脚本功能。
 
 在回复时，请首先提供脚本名称，格式为：[SCRIPT_NAME: 你的脚本名称]，然后再提供完整脚本。
-
-用户环境:
-- 当前目录: {current_directory}
-- 用户: {username}
-- 主机名: {hostname}
-- 系统: {ubuntu_version}
 """
 
-# 命令生成提示词模板
-COMMAND_PROMPT_TEMPLATE = """你是一个专业的Bash命令生成器，只负责将自然语言转换为Ubuntu 20.04上的bash命令。
+# 命令生成系统提示词（静态部分，不含任何随调用变化的值）
+COMMAND_SYSTEM_PROMPT = """你是一个专业的Bash命令生成器，只负责将自然语言转换为Ubuntu 20.04上的bash命令。
 只返回一行可直接执行的bash命令，不要有任何解释。如果任务太复杂无法用一行命令完成，
-请回复："这个任务无法用单行命令完成，请使用 -script 参数生成完整脚本"。
+请回复："{refusal}"。
+""".format(refusal=COMMAND_REFUSAL_MESSAGE)
 
-用户环境:
+# 环境上下文提示词（同一目录下的多次调用保持不变）
+ENVIRONMENT_CONTEXT_PROMPT = """用户环境:
 - 当前目录: {current_directory}
 - 用户: {username}
 - 主机名: {hostname}
 - 系统: {ubuntu_version}
-
-用户请求: {query}
 """
 
+# 文件内容区块的标题
+FILE_CONTENT_HEADER = "相关文件内容:\n"
+
 # 添加文件内容的提示模板片段
 FILE_CONTENT_PROMPT = """
 文件: {filename}
@@ -45,8 +49,95 @@ FILE_CONTENT_PROMPT = """
 ```
 """
 
+# 脚本生成的查询提示词（放在最后，每次调用都会变化）
+SCRIPT_QUERY_PROMPT = """{file_suffix}任务描述: {query}
+"""
+
+# 命令生成的查询提示词（放在最后，每次调用都会变化）
+COMMAND_QUERY_PROMPT = """{file_suffix}用户请求: {query}
+"""
+
 # 用于脚本生成时添加文件内容的提示词后缀
 SCRIPT_FILE_SUFFIX = "请根据上述文件内容和用户请求生成bash脚本。\n"
 
 # 用于命令生成时添加文件内容的提示词后缀
 COMMAND_FILE_SUFFIX = "请生成与这些文件相关的bash命令来完成用户请求。\n"
+
+# 多个命令请求合并为一次调用时的系统提示词（静态部分，不含任何随调用变化的值）
+PACKED_COMMAND_SYSTEM_PROMPT = """你是一个专业的Bash命令生成器，只负责将自然语言转换为Ubuntu 20.04上的bash命令。
+用户会一次给出多个相互独立的编号请求，请为每个请求分别给出一行可直接执行的bash命令，不要有任何解释。
+严格按以下格式回复，每个请求一行，编号与请求一致，不要遗漏、合并或改变顺序:
+[1] 第1个请求的命令
+[2] 第2个请求的命令
+如果某个任务太复杂无法用一行命令完成，在该编号后回复："{refusal}"。
+""".format(refusal=COMMAND_REFUSAL_MESSAGE)
+
+# 合并请求的查询列表（放在最后，每次调用都会变化）
+PACKED_QUERY_PROMPT = """{file_suffix}共{count}个请求:
+{queries}
+"""
+
+# 合并请求中的一项
+PACKED_QUERY_ITEM = "[{index}] {query}"
+
+# 分块处理时片段中没有相关信息的固定回复
+MAP_NO_RELEVANT_MESSAGE = "无相关信息"
+
+# 分块处理(map阶段)的系统提示词
+MAP_SYSTEM_PROMPT = """你是一个文件内容分析助手，负责从大文件的一个片段中提取与用户任务相关的信息。
+请简洁地列出片段中与任务相关的事实：文件格式、字段或列名、路径、关键配置项、错误模式以及有代表性的原始行。
+不要生成命令或脚本，不要解释。如果片段中没有任何相关信息，只回复："{none}"。
+""".format(none=MAP_NO_RELEVANT_MESSAGE)
+
+# 分块处理的任务描述（同一次运行的所有片段共享）
+MAP_TASK_PROMPT = """用户任务: {query}
+"""
+
+# 分块处理的片段内容
+MAP_CHUNK_PROMPT = """
+文件片段: {label}
+```
+{content}
+```
+"""
+
+# 多轮对话中后续请求的提示词（交互模式和会话延续）
+FOLLOW_UP_QUERY_PROMPT = """请在之前回答的基础上按新的要求修改，回复格式与之前相同。
+用户请求: {query}
+"""
+
+# 会话延续时已发送且未修改的文件
+SESSION_FILE_UNCHANGED_PROMPT = "文件 {filename} 与之前发送的内容相同。\n"
+
+# 会话延续时已发送但有修改的文件，只发送差异
+SESSION_FILE_DIFF_PROMPT = """文件 {filename} 在之前发送后有修改，差异如下:
+```diff
+{diff}
+```
+"""
+
+# 会话延续时环境发生变化
+SESSION_CONTEXT_CHANGED_PROMPT = "环境已变化，当前目录: {current_directory}\n"
+
+# 监视模式中没有需要处理的情况时的固定回复
+WATCH_NONE_MESSAGE = "无需处理"
+
+# 监视模式的系统提示词
+WATCH_SYSTEM_PROMPT = """你负责监视一个不断增长的文件（通常是日志），帮助用户在特定情况出现时及时处理。
+每次会收到之前内容的摘要和文件新追加的内容。如果新内容中出现了用户关心的情况，
+只返回一行可直接执行的Ubuntu 20.04 bash命令，不要有任何解释；否则只回复："{none}"。
+""".format(none=WATCH_NONE_MESSAGE)
+
+# 监视模式的任务描述（同一次监视的所有请求共享）
+WATCH_TASK_PROMPT = """监视文件: {filename}
+用户要求: {query}
+"""
+
+# 监视模式每次请求的新内容
+WATCH_UPDATE_PROMPT = """之前内容的摘要: {summary}
+
+新追加的内容:
+```
+{content}
+```
+"""
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+批量命令 - 合并请求回答查询列表中的命令查询，或者提交为提供商的离线批处理任务
+"""
+
+import sys
+import json
+import time
+from typing import Any, Dict, List
+
+from src.config.model_manager import ModelManager
+from src.generators.batch_job import (
+    submit_job,
+    load_job,
+    list_jobs,
+    save_job,
+    job_client,
+    job_status,
+    job_finished,
+    job_progress,
+    refresh_job,
+    wait_for_job,
+    iter_batch_results,
+    TERMINAL_STATUSES
+)
+from src.generators.packed_generator import PackedRunner
+from src.log.history import append_to_history
+from src.utils.context import get_bash_context
+from src.utils.file_utils import read_file_contents
+
+def read_queries(path: str) -> List[str]:
+    """
+    读取查询列表，每行一个查询，忽略空行和 # 开头的注释
+
+    Args:
+        path (str): 文件路径，"-" 表示标准输入
+
+    Returns:
+        List[str]: 查询列表
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+def format_result(index: int, result: Dict[str, Any]) -> str:
+    """以 shell 注释加命令的形式输出一个结果"""
+    if result["success"]:
+        return f"# {index}. {result['query']}\n{result['answer']}\n"
+    return f"# {index}. {result['query']}\n# 错误: {result['answer']}\n"
+
+def read_batch_input(args):
+    """读取查询列表和共享的文件内容，失败时退出"""
+    try:
+        queries = read_queries(args.input)
+    except OSError as e:
+        print(f"错误: 无法读取查询列表: {str(e)}")
+        sys.exit(1)
+    if not queries:
+        print("错误: 查询列表为空")
+        sys.exit(1)
+
+    file_contents = None
+    if args.filename:
+        file_contents = read_file_contents(args.filename, False)
+        if file_contents is None:
+            sys.exit(1)
+    return queries, file_contents
+
+def handle_batch_command(args):
+    """处理批量命令"""
+    queries, file_contents = read_batch_input(args)
+    runner = PackedRunner(get_bash_context(), file_contents, pack_size=args.pack)
+    start = time.time()
+    results = runner.run(queries)
+    elapsed = time.time() - start
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for index, result in enumerate(results, 1):
+            print(format_result(index, result))
+            if output is not None:
+                record = {"query": result["query"], "packed": result["packed"]}
+                record["command" if result["success"] else "error"] = result["answer"]
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if result["success"]:
+                append_to_history(result["query"], result["answer"], "command", None,
+                                  args.filename, result["usage"])
+    finally:
+        if output is not None:
+            output.close()
+    print(runner.stats.text(elapsed), file=sys.stderr)
+    if runner.stats.failed:
+        sys.exit(1)
+
+
+def format_job_line(job: Dict[str, Any]) -> str:
+    """任务列表中的一行（本地记录的状态）"""
+    done, total = job_progress(job)
+    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(job["created"]))
+    collected = bool(job["batches"]) and all(batch["collected"] for batch in job["batches"])
+    return (f"{job['name']}  {created}  {job_status(job):<11}  {done}/{total}  "
+            f"{job['provider']}/{job['model']}{'  已收集' if collected else ''}")
+
+def format_job_status(job: Dict[str, Any]) -> str:
+    """任务及其每个批处理的状态"""
+    done, total = job_progress(job)
+    lines = [f"任务 {job['name']}: {job_status(job)}，已处理 {done}/{total} 个查询 "
+             f"({job['provider']}/{job['model']}，密钥 {job['key']})"]
+    for batch in job["batches"]:
+        counts = batch["request_counts"]
+        lines.append(f"  {batch['id']}  查询 {batch['start'] + 1}-{batch['start'] + batch['count']}  "
+                     f"{batch['status']}  完成 {counts.get('completed') or 0}，"
+                     f"失败 {counts.get('failed') or 0}")
+    return "\n".join(lines)
+
+def open_job(name: str, model_manager: ModelManager):
+    """读取任务记录并创建客户端，失败时退出"""
+    job = load_job(name)
+    if job is None:
+        print(f"错误: 找不到批处理任务 {name}")
+        sys.exit(1)
+    client = job_client(job, model_manager)
+    if client is None:
+        print(f"错误: 找不到提交任务时使用的API密钥 {job['key']}")
+        sys.exit(1)
+    return job, client
+
+def handle_batch_submit_command(args):
+    """处理 batch-submit 命令"""
+    queries, file_contents = read_batch_input(args)
+    success, result = submit_job(queries, get_bash_context(), file_contents=file_contents,
+                                 filenames=args.filename)
+    if not success:
+        print(f"错误: {result}")
+        sys.exit(1)
+    print(f"已提交批处理任务 {result['name']}: {len(queries)} 个查询，{len(result['batches'])} 个批处理")
+    print(f"查看状态: bcopilot batch-status {result['name']}")
+    print(f"收集结果: bcopilot batch-collect {result['name']}")
+
+def handle_batch_status_command(args):
+    """处理 batch-status 命令"""
+    if not args.job:
+        jobs = list_jobs()
+        if not jobs:
+            print("没有批处理任务")
+        for job in jobs:
+            print(format_job_line(job))
+        return
+
+    job, client = open_job(args.job, ModelManager())
+    if args.wait:
+        wait_for_job(job, client, on_update=lambda current: print(
+            format_job_line(current), file=sys.stderr))
+    else:
+        for error in refresh_job(job, client):
+            print(f"警告: 无法查询批处理状态: {error}", file=sys.stderr)
+        save_job(job)
+    print(format_job_status(job))
+
+def handle_batch_collect_command(args):
+    """处理 batch-collect 命令"""
+    job, client = open_job(args.job, ModelManager())
+    if args.wait:
+        wait_for_job(job, client, on_update=lambda current: print(
+            format_job_line(current), file=sys.stderr))
+    elif not job_finished(job):
+        for error in refresh_job(job, client):
+            print(f"警告: 无法查询批处理状态: {error}", file=sys.stderr)
+        save_job(job)
+
+    counts = {"success": 0, "failed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for batch in job["batches"]:
+            if batch["status"] not in TERMINAL_STATUSES:
+                continue
+            errors = []  # type: List[str]
+            for result in iter_batch_results(job, client, batch, errors):
+                print(format_result(result["index"] + 1, result))
+                if output is not None:
+                    record = {"index": result["index"], "query": result["query"]}
+                    record["command" if result["success"] else "error"] = result["answer"]
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                counts["success" if result["success"] else "failed"] += 1
+                for field in ("prompt_tokens", "completion_tokens"):
+                    counts[field] += result["usage"].get(field) or 0
+                # 重复收集同一个批处理时不再写入历史记录
+                if result["success"] and not batch["collected"]:
+                    append_to_history(result["query"], result["answer"], "command", None,
+                                      job["filenames"], result["usage"])
+            # 结果完整读取后才标记为已收集，并立即保存，下载失败的批处理下次收集时重新写入
+            # 历史记录，中断时已收集的批处理不会重复写入
+            if errors:
+                print(f"警告: {errors[0]}，稍后再次收集", file=sys.stderr)
+            elif not batch["collected"]:
+                batch["collected"] = True
+                save_job(job)
+    finally:
+        if output is not None:
+            output.close()
+
+    pending = sum(batch["count"] for batch in job["batches"]
+                  if batch["status"] not in TERMINAL_STATUSES)
+    summary = (f"{counts['success'] + counts['failed']} 个结果，成功 {counts['success']}，"
+               f"失败 {counts['failed']}，输入 {counts['prompt_tokens']} tokens，"
+               f"输出 {counts['completion_tokens']} tokens")
+    if pending:
+        summary += f"；{pending} 个查询的批处理尚未结束，稍后再次收集或使用 -wait 等待"
+    print(summary, file=sys.stderr)
+    if counts["failed"] or pending:
+        sys.exit(1)
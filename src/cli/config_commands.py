@@ -19,6 +19,9 @@ def handle_config_command(args):
         print("当前配置:")
         print(f"- 命令生成: {manager.config['command']['provider']} ({command_provider['model']})")
         print(f"- 脚本生成: {manager.config['script']['provider']} ({script_provider['model']})")
+        for type_name, label in (("command", "命令"), ("script", "脚本")):
+            if manager.config[type_name].get("cascade"):
+                print(f"- {label}级联路由: {' -> '.join(manager.config[type_name]['cascade'])}")
         
     elif args.action == "set":
         # 设置提供商
@@ -30,6 +33,20 @@ def handle_config_command(args):
             print(f"错误: {str(e)}")
             print("格式应为: 'command.provider_name' 或 'script.provider_name'")
             
+    elif args.action == "cascade":
+        # 设置级联路由，从快速/便宜到强/慢排列
+        try:
+            type_name, names = (args.value or "").split(".", 1)
+            provider_names = [name.strip() for name in names.split(",") if name.strip()]
+            manager.set_cascade(type_name, provider_names)
+            if provider_names:
+                print(f"已将 {type_name} 级联路由设置为 {' -> '.join(provider_names)}")
+            else:
+                print(f"已取消 {type_name} 级联路由")
+        except ValueError as e:
+            print(f"错误: {str(e)}")
+            print("格式应为: 'command.provider1,provider2' 或 'script.provider1,provider2'")
+            
     elif args.action == "add-provider":
         # 交互式添加提供商
         provider_name = input("提供商名称: ")
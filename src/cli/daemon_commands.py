@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+后台进程命令 - 启动、停止和查看后台进程，输出 shell 集成脚本
+"""
+
+import sys
+
+from config.constants import DAEMON_SOCKET, DAEMON_LOG_FILE
+from src.daemon.client import request, start_daemon
+from src.daemon.shell_init import render_shell_init
+
+def format_ms(value):
+    """毫秒数的文本形式，没有数据时为 -"""
+    return "-" if value is None else f"{value:.0f}ms"
+
+def handle_daemon_command(args):
+    """处理后台进程相关命令"""
+    socket_path = args.socket or DAEMON_SOCKET
+
+    if args.action == "run":
+        from src.daemon.server import run_daemon
+        # 由客户端或 start 在后台启动时输出写入日志文件
+        log_file = None if sys.stdout.isatty() else DAEMON_LOG_FILE
+        try:
+            run_daemon(socket_path, log_file)
+        except RuntimeError as e:
+            print(f"错误: {str(e)}")
+            sys.exit(1)
+        return
+
+    try:
+        status = request(socket_path, {"op": "ping"}, timeout=2.0)
+    except OSError:
+        status = None
+
+    if args.action == "start":
+        if status:
+            print(f"后台进程已在运行 (pid {status['pid']})")
+        elif start_daemon(socket_path):
+            print(f"后台进程已启动，套接字: {socket_path}")
+        else:
+            print(f"错误: 后台进程启动失败，请查看日志 {DAEMON_LOG_FILE}")
+            sys.exit(1)
+
+    elif args.action == "stop":
+        if not status:
+            print("后台进程未运行")
+            return
+        request(socket_path, {"op": "shutdown"}, timeout=2.0)
+        print(f"已停止后台进程 (pid {status['pid']})")
+
+    elif args.action == "status":
+        if not status:
+            print("后台进程未运行")
+            return
+        stats = status["stats"]
+        print(f"后台进程运行中 (pid {status['pid']})，已运行 {status['uptime']:.0f} 秒")
+        print(f"- 套接字: {socket_path}")
+        print(f"- 请求: {stats['requests']}  缓存命中: {stats['cache_hits']}  "
+              f"生成: {stats['generated']}  取消: {stats['cancelled']}  "
+              f"错误: {stats['errors']}  进行中: {status['inflight']}")
+        latency = status.get("latency") or {}
+        print(f"- 提供商延迟: p50 {format_ms(latency.get('p50_ms'))}  p99 {format_ms(latency.get('p99_ms'))}")
+        for name, queue in ((status.get("scheduler") or {}).get("classes") or {}).items():
+            print(f"- {name}: 排队 {queue['queued']}  已放行 {queue['dispatched']}  "
+                  f"拒绝 {queue['rejected']}  排队时间 p50 {format_ms(queue['queue_wait_p50_ms'])}  "
+                  f"p99 {format_ms(queue['queue_wait_p99_ms'])}")
+        warmer = status.get("warmer")
+        if warmer:
+            print(f"- 缓存预热: 已预热 {warmer['warmed']}  已是最新 {warmer['fresh']}  "
+                  f"今天 {warmer['tokens_today']}/{warmer['tokens_per_day']} tokens")
+
+def handle_shell_init_command(args):
+    """输出 shell 集成脚本"""
+    try:
+        print(render_shell_init(args.shell, args.socket or DAEMON_SOCKET, args.key), end="")
+    except ValueError as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        sys.exit(1)
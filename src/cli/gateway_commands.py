@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+网关命令 - 运行团队共享的缓存网关
+"""
+
+import sys
+from typing import Any, Dict, List, Optional
+
+def parse_upstreams(entries: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    解析 -upstream 参数
+
+    Args:
+        entries (List[str], optional): NAME=URL 形式的上游列表
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 提供商名到 {"url", "key_file"} 的映射
+
+    Raises:
+        ValueError: 格式不正确
+    """
+    upstreams = {}  # type: Dict[str, Dict[str, Any]]
+    for entry in entries or []:
+        name, _, url = entry.partition("=")
+        if not name or "/" in name or not url.startswith(("http://", "https://")):
+            raise ValueError(f"上游格式应为 NAME=URL: {entry}")
+        upstreams[name] = {"url": url, "key_file": None}
+    return upstreams
+
+def handle_gateway_command(args):
+    """处理网关命令"""
+    try:
+        upstreams = parse_upstreams(args.upstream)
+    except ValueError as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
+
+    from src.gateway.server import run_gateway
+    try:
+        run_gateway(args.host, args.port, upstreams)
+    except OSError as e:
+        print(f"错误: 无法监听 {args.host}:{args.port}: {str(e)}")
+        sys.exit(1)
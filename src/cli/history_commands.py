@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+历史记录命令 - 检索、查看、导出、导入和压缩历史记录
+"""
+
+import re
+import csv
+import sys
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config.constants import HISTORY_FILE
+from src.log.history_store import HistoryStore, FIELDS
+
+# 相对时间的单位（秒）
+TIME_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """
+    解析时间参数
+
+    支持绝对时间 "2024-05-01"、"2024-05-01 12:30[:00]"，
+    以及相对时间 "30m"、"12h"、"7d"、"2w"（表示距现在多久之前）。
+
+    Args:
+        value (str, optional): 时间参数
+
+    Returns:
+        Optional[float]: 时间戳，未提供时返回None
+
+    Raises:
+        ValueError: 无法解析时
+    """
+    if not value:
+        return None
+    match = re.fullmatch(r"(\d+)([mhdw])", value.strip())
+    if match:
+        return time.time() - int(match.group(1)) * TIME_UNITS[match.group(2)]
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间 '{value}'")
+
+def format_time(timestamp: float) -> str:
+    """将时间戳格式化为本地时间"""
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def format_summary(entry: Dict[str, Any]) -> str:
+    """生成单行的记录摘要"""
+    answer = entry["answer"].strip().splitlines()[0] if entry["answer"].strip() else ""
+    if len(answer) > 80:
+        answer = answer[:77] + "..."
+    return (f"#{entry['id']:<6} {format_time(entry['timestamp'])} [{entry['mode']}] "
+            f"{entry['query']}\n        -> {answer}")
+
+def print_entry(entry: Dict[str, Any]):
+    """输出一条记录的全部字段"""
+    print(f"=== #{entry['id']} {format_time(entry['timestamp'])} [{entry['mode']}] ===")
+    print(f"查询: {entry['query']}")
+    if entry["files"]:
+        print(f"相关文件: {', '.join(entry['files'])}")
+    if entry.get("cwd"):
+        print(f"工作目录: {entry['cwd']}")
+    if entry.get("provider") or entry.get("model"):
+        print(f"模型: {entry.get('provider') or '-'} / {entry.get('model') or '-'}")
+    if entry.get("latency_ms") is not None:
+        print(f"耗时: {entry['latency_ms']} ms")
+    if entry.get("prompt_tokens") is not None:
+        print(f"Tokens: 输入 {entry['prompt_tokens']} (缓存 {entry.get('cached_tokens') or 0}), "
+              f"输出 {entry.get('completion_tokens') or 0}")
+    if entry.get("script_path"):
+        print(f"脚本位置: {entry['script_path']}")
+    print(f"结果: {entry['answer']}")
+
+def export_entries(store: HistoryStore, filters: Dict[str, Any], fmt: str, out):
+    """按指定格式导出记录，返回导出的记录数"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(("id",) + FIELDS)
+        for entry in store.iter_entries(**filters):
+            entry["files"] = ";".join(entry["files"])
+            writer.writerow([entry.get(field) for field in ("id",) + FIELDS])
+            count += 1
+    elif fmt == "json":
+        out.write("[")
+        for entry in store.iter_entries(**filters):
+            out.write(("," if count else "") + "\n" + json.dumps(entry, ensure_ascii=False))
+            count += 1
+        out.write("\n]\n")
+    else:
+        for entry in store.iter_entries(**filters):
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def handle_history_command(args):
+    """处理历史记录相关命令"""
+    try:
+        filters = {
+            "text": args.text,
+            "mode": args.mode,
+            "provider": args.provider,
+            "model": args.model,
+            "since": parse_time(args.since),
+            "until": parse_time(args.until),
+            "filename": args.file
+        }
+    except ValueError as e:
+        print(f"错误: {str(e)}")
+        return
+
+    store = HistoryStore()
+    try:
+        if args.action == "search":
+            start = time.time()
+            entries = store.search(limit=args.limit, **filters)
+            elapsed = (time.time() - start) * 1000
+            for entry in entries:
+                print(format_summary(entry))
+            print(f"共找到 {len(entries)} 条记录 (耗时 {elapsed:.1f} ms)")
+
+        elif args.action == "show":
+            if not args.text or not args.text.lstrip("#").isdigit():
+                print("错误: show 操作需要记录编号，例如 bcopilot history show 42")
+                return
+            entry = store.get(int(args.text.lstrip("#")))
+            if entry is None:
+                print(f"错误: 记录 #{args.text.lstrip('#')} 不存在")
+                return
+            print_entry(entry)
+
+        elif args.action == "export":
+            # export 的位置参数同样作为全文检索条件
+            if args.output:
+                with open(args.output, "w", encoding="utf-8", newline="") as f:
+                    count = export_entries(store, filters, args.format, f)
+                print(f"已导出 {count} 条记录到 {args.output}")
+            else:
+                export_entries(store, filters, args.format, sys.stdout)
+
+        elif args.action == "import":
+            path = args.text or HISTORY_FILE
+            try:
+                count = store.import_legacy(path, force=args.force)
+            except OSError as e:
+                print(f"错误: 无法读取历史记录文件 {path}: {str(e)}")
+                return
+            if count is None:
+                print(f"{path} 已经导入过，如需重新导入请使用 -force")
+            else:
+                print(f"已从 {path} 导入 {count} 条记录")
+
+        elif args.action == "compact":
+            stats = store.compact()
+            if not stats:
+                print("另一个进程正在压缩历史记录，请稍后再试")
+                return
+            print(f"压缩完成: 切换分段 {stats['rolled']}，压缩分段 {stats['compressed']}，"
+                  f"删除分段 {stats['removed']}")
+    finally:
+        store.close()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+工作区索引命令 - 建立和更新工作区索引
+"""
+
+import os
+import time
+from src.index.workspace_index import WorkspaceIndex
+
+def handle_index_command(args):
+    """处理工作区索引相关命令"""
+    if not os.path.isdir(args.directory):
+        print(f"错误: 目录 '{args.directory}' 不存在")
+        return
+
+    index = WorkspaceIndex(args.directory)
+    try:
+        if args.action in ("build", "update"):
+            # build 完全重建，update 只处理变化的文件
+            start = time.time()
+            stats = index.update(rebuild=(args.action == "build"))
+            elapsed = time.time() - start
+            print(f"索引{'建立' if args.action == 'build' else '更新'}完成，耗时 {elapsed:.2f} 秒")
+            print(f"- 新增: {stats.get('added', 0)}  更新: {stats.get('updated', 0)}  "
+                  f"删除: {stats.get('removed', 0)}  未变化: {stats.get('unchanged', 0)}  "
+                  f"跳过: {stats.get('skipped', 0)}")
+
+        elif args.action == "status":
+            if not index.exists():
+                print(f"工作区 '{args.directory}' 尚未建立索引")
+                return
+            print(index.summary())
+            print(f"索引位置: {index.path}")
+    finally:
+        index.close()
@@ -8,6 +8,8 @@ import sys
 from typing import Optional
 from argparse import Namespace
 
+from config.constants import GATEWAY_HOST, GATEWAY_PORT
+
 def create_config_parser():
     """
     创建配置模式的命令行参数解析器
@@ -23,13 +25,14 @@ def create_config_parser():
     
     parser.add_argument(
         'action',
-        choices=['show', 'set', 'add-provider', 'list-providers'],
+        choices=['show', 'set', 'cascade', 'add-provider', 'list-providers'],
         help='配置操作'
     )
     parser.add_argument(
         'value',
         nargs='?',
-        help='配置值 (用于 set 操作，格式为 "command.provider" 或 "script.provider")'
+        help='配置值 (set 操作的格式为 "command.provider" 或 "script.provider"；'
+             'cascade 操作的格式为 "command.provider1,provider2"，提供商列表为空时取消级联)'
     )
     
     # 添加一个command字段，以便与查询模式兼容
@@ -37,6 +40,392 @@ def create_config_parser():
     
     return parser
 
+def create_index_parser():
+    """
+    创建工作区索引模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于index命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 工作区索引',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot index ACTION [DIRECTORY]'
+    )
+    
+    parser.add_argument(
+        'action',
+        choices=['build', 'update', 'status'],
+        help='索引操作 (build: 完全重建, update: 只处理变化的文件, status: 显示概要)'
+    )
+    parser.add_argument(
+        'directory',
+        nargs='?',
+        default='.',
+        help='工作区目录 (默认为当前目录)'
+    )
+    
+    parser.set_defaults(command='index')
+    
+    return parser
+
+def create_history_parser():
+    """
+    创建历史记录模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于history命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 历史记录',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot history ACTION [TEXT|ID|FILE] [选项]',
+        epilog="""
+示例:
+  bcopilot history search "nginx 日志"
+  bcopilot history search -mode script -since 7d
+  bcopilot history show 42
+  bcopilot history export -format csv -output history.csv
+  bcopilot history import              # 导入旧版 bcopilot_history.log
+  bcopilot history compact             # 压缩已封存的分段并删除过期记录
+        """
+    )
+    
+    parser.add_argument(
+        'action',
+        choices=['search', 'show', 'export', 'import', 'compact'],
+        help='历史记录操作 (compact: 立即压缩已封存的分段并执行保留策略)'
+    )
+    parser.add_argument(
+        'text',
+        nargs='?',
+        help='检索内容 (search/export)、记录编号 (show) 或旧版历史文件路径 (import)'
+    )
+    parser.add_argument('-mode', choices=['command', 'script'], help='只包含指定类型的记录')
+    parser.add_argument('-provider', type=str, help='只包含指定提供商的记录')
+    parser.add_argument('-model', type=str, help='只包含指定模型的记录')
+    parser.add_argument('-since', type=str, help='起始时间，如 "2024-05-01" 或 "7d"')
+    parser.add_argument('-until', type=str, help='结束时间，格式同 -since')
+    parser.add_argument('-file', type=str, help='只包含相关文件名中含有该内容的记录')
+    parser.add_argument('-limit', type=int, default=20, help='search 返回的最大记录数 (默认20)')
+    parser.add_argument('-format', choices=['jsonl', 'json', 'csv'], default='jsonl',
+                        help='export 的输出格式 (默认jsonl)')
+    parser.add_argument('-output', type=str, help='export 的输出文件 (默认输出到终端)')
+    parser.add_argument('-force', action='store_true', help='import 时忽略已导入标记')
+    
+    parser.set_defaults(command='history')
+    
+    return parser
+
+def create_daemon_parser():
+    """
+    创建后台进程模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于daemon命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 后台进程（供 shell 快捷键使用）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot daemon ACTION [选项]'
+    )
+    
+    parser.add_argument(
+        'action',
+        choices=['start', 'stop', 'status', 'run'],
+        help='后台进程操作 (run: 在前台运行)'
+    )
+    parser.add_argument('-socket', type=str, help='Unix套接字路径 (默认放在仅当前用户可访问的目录中)')
+    
+    parser.set_defaults(command='daemon')
+    
+    return parser
+
+def create_shell_init_parser():
+    """
+    创建 shell 集成脚本的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于shell-init命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 输出 shell 快捷键集成脚本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot shell-init {bash,zsh} [选项]',
+        epilog="""
+示例:
+  eval "$(bcopilot shell-init bash)"            # 加入 ~/.bashrc
+  eval "$(bcopilot shell-init zsh)"             # 加入 ~/.zshrc
+  eval "$(bcopilot shell-init bash -key '\\C-x\\C-g')"
+        """
+    )
+    
+    parser.add_argument('shell', choices=['bash', 'zsh'], help='shell 类型')
+    parser.add_argument('-key', type=str, help='快捷键，使用对应 shell 的写法 (默认 Ctrl-G)')
+    parser.add_argument('-socket', type=str, help='后台进程的Unix套接字路径')
+    
+    parser.set_defaults(command='shell-init')
+    
+    return parser
+
+def create_watch_parser():
+    """
+    创建监视模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于watch命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 监视文件增长，出现指定情况时给出命令',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot watch -filename FILE [选项] "QUERY"',
+        epilog="""
+示例:
+  bcopilot watch -filename app.log "出现磁盘空间不足的错误时给出清理命令"
+  bcopilot watch -filename /var/log/nginx/error.log -interval 60 "上游连接失败时给出重启命令"
+        """
+    )
+    
+    parser.add_argument('-filename', type=str, required=True, help='要监视的文件')
+    parser.add_argument('-debounce', type=float, default=2.0,
+                        help='文件停止增长多少秒后发送请求 (默认2)')
+    parser.add_argument('-interval', type=float, default=10.0,
+                        help='两次请求之间的最短间隔秒数 (默认10)')
+    parser.add_argument('-from-start', dest='from_start', action='store_true',
+                        help='从文件开头开始处理（默认只处理监视开始后追加的内容）')
+    parser.add_argument('-poll', action='store_true', help='定时检查文件而不使用inotify')
+    parser.add_argument('-poll-interval', dest='poll_interval', type=float, default=1.0,
+                        help='定时检查的间隔秒数 (默认1)')
+    parser.add_argument('query', help='需要关注的情况和期望的命令')
+    
+    parser.set_defaults(command='watch')
+    
+    return parser
+
+def create_stats_parser():
+    """
+    创建统计模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于stats命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 级联路由和API密钥统计',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot stats [选项]',
+        epilog="""
+示例:
+  bcopilot stats                 # 各层级的通过率、平均耗时和节省的耗时
+  bcopilot stats -mode command -since 7d
+  bcopilot stats -keys           # 每个API密钥的查询数和token用量
+        """
+    )
+    
+    parser.add_argument('-mode', choices=['command', 'script'], help='只统计指定模式')
+    parser.add_argument('-since', type=str, help='起始时间，如 "2024-05-01" 或 "7d"')
+    parser.add_argument('-keys', action='store_true', help='按API密钥统计用量')
+    
+    parser.set_defaults(command='stats')
+    
+    return parser
+
+def create_batch_parser():
+    """
+    创建批量模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于batch命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 批量生成命令，多个查询合并为一次请求',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot batch [选项] FILE',
+        epilog="""
+示例:
+  bcopilot batch queries.txt                      # 每行一个查询
+  bcopilot batch -pack 16 -output answers.jsonl queries.txt
+  cat queries.txt | bcopilot batch -filename app.log -
+        """
+    )
+    
+    parser.add_argument('input', help='查询列表文件，每行一个查询，"-" 表示标准输入')
+    parser.add_argument('-pack', type=int, default=8,
+                        help='每次请求合并的查询数，1表示逐个请求 (默认8)')
+    parser.add_argument('-filename', type=str, nargs='+', help='所有查询共享的文件内容')
+    parser.add_argument('-output', type=str, help='同时把结果以JSONL写入文件')
+    
+    parser.set_defaults(command='batch')
+    
+    return parser
+
+def create_batch_submit_parser():
+    """
+    创建批处理任务提交的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于batch-submit命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 把查询列表提交为提供商的离线批处理任务（/v1/batches）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot batch-submit [选项] FILE',
+        epilog="""
+示例:
+  bcopilot batch-submit nightly.txt               # 每行一个查询
+  bcopilot batch-submit -filename app.log queries.txt
+        """
+    )
+    
+    parser.add_argument('input', help='查询列表文件，每行一个查询，"-" 表示标准输入')
+    parser.add_argument('-filename', type=str, nargs='+', help='所有查询共享的文件内容')
+    
+    parser.set_defaults(command='batch-submit')
+    
+    return parser
+
+def create_batch_status_parser():
+    """
+    创建批处理任务状态的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于batch-status命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 查询离线批处理任务的状态',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot batch-status [选项] [JOB]',
+        epilog="""
+示例:
+  bcopilot batch-status                           # 列出所有任务
+  bcopilot batch-status 20240501-020000           # 查询任务中每个批处理的状态
+  bcopilot batch-status -wait 20240501-020000     # 等待任务结束
+        """
+    )
+    
+    parser.add_argument('job', nargs='?', help='任务名，省略时列出所有任务')
+    parser.add_argument('-wait', action='store_true', help='轮询直到所有批处理结束')
+    
+    parser.set_defaults(command='batch-status')
+    
+    return parser
+
+def create_batch_collect_parser():
+    """
+    创建批处理结果收集的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于batch-collect命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 下载离线批处理任务的结果并写入历史记录',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot batch-collect [选项] JOB',
+        epilog="""
+示例:
+  bcopilot batch-collect 20240501-020000
+  bcopilot batch-collect -wait -output answers.jsonl 20240501-020000
+        """
+    )
+    
+    parser.add_argument('job', help='任务名')
+    parser.add_argument('-output', type=str, help='同时把结果以JSONL写入文件')
+    parser.add_argument('-wait', action='store_true', help='先轮询直到所有批处理结束')
+    
+    parser.set_defaults(command='batch-collect')
+    
+    return parser
+
+def create_worker_parser():
+    """
+    创建工作进程的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于worker命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 从多台主机共享的工作队列领取查询并生成命令',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot worker -queue DIR|FILE.db [选项]',
+        epilog="""
+示例:
+  bcopilot worker -queue /mnt/shared/bcopilot-queue       # 目录队列
+  bcopilot worker -queue /mnt/shared/queue.db -follow     # SQLite队列，处理完后继续等待
+        """
+    )
+    
+    parser.add_argument('-queue', type=str, required=True,
+                        help='队列目录，或以 .db/.sqlite 结尾的SQLite文件')
+    parser.add_argument('-name', type=str, help='工作进程名称 (默认为 主机名-进程号)')
+    parser.add_argument('-follow', action='store_true', help='队列处理完后继续等待新的查询')
+    parser.add_argument('-lease', type=float,
+                        help='租约秒数，超时未续租的查询重新分配 (默认120，所有进程应相同)')
+    
+    parser.set_defaults(command='worker')
+    
+    return parser
+
+def create_coordinator_parser():
+    """
+    创建协调命令的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于coordinator命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 向工作队列添加查询，汇总所有工作进程的进度和吞吐量',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot coordinator -queue DIR|FILE.db [选项]',
+        epilog="""
+示例:
+  bcopilot coordinator -queue /mnt/shared/bcopilot-queue -add nightly.txt
+  bcopilot coordinator -queue /mnt/shared/bcopilot-queue -watch
+  bcopilot coordinator -queue /mnt/shared/bcopilot-queue -output answers.jsonl
+        """
+    )
+    
+    parser.add_argument('-queue', type=str, required=True,
+                        help='队列目录，或以 .db/.sqlite 结尾的SQLite文件')
+    parser.add_argument('-add', type=str, help='添加查询列表文件中的查询，"-" 表示标准输入')
+    parser.add_argument('-watch', action='store_true', help='定期刷新报告直到队列处理完')
+    parser.add_argument('-output', type=str, help='把所有结果以JSONL导出到文件')
+    parser.add_argument('-lease', type=float, help='租约秒数 (默认120)')
+    
+    parser.set_defaults(command='coordinator')
+    
+    return parser
+
+def create_gateway_parser():
+    """
+    创建网关模式的命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 专用于gateway命令的参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        description='Bash-Copilot: 团队共享的缓存网关（OpenAI兼容）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage='bcopilot gateway [选项]',
+        epilog="""
+示例:
+  bcopilot gateway                                # 转发 models.yaml 中的提供商
+  bcopilot gateway -host 0.0.0.0 -port 9000
+  bcopilot gateway -upstream local=http://127.0.0.1:8000/v1/chat/completions
+
+客户端把 models.yaml 中提供商的 url 改为 http://网关地址:端口/<提供商名>/chat/completions
+        """
+    )
+    
+    parser.add_argument('-host', type=str, default=GATEWAY_HOST,
+                        help=f'监听地址 (默认{GATEWAY_HOST})')
+    parser.add_argument('-port', type=int, default=GATEWAY_PORT,
+                        help=f'监听端口 (默认{GATEWAY_PORT})')
+    parser.add_argument('-upstream', type=str, nargs='+', metavar='NAME=URL',
+                        help='额外或覆盖的上游提供商')
+    
+    parser.set_defaults(command='gateway')
+    
+    return parser
+
 def create_query_parser():
     """
     创建查询模式的命令行参数解析器
@@ -52,6 +441,13 @@ def create_query_parser():
   bcopilot "查找大于100MB的文件"
   bcopilot -script "备份我的主目录"
   bcopilot -filename config.json log.txt "处理这些文件"
+  df -h | bcopilot "清理出更多空间"           # 管道输入作为上下文
+  bcopilot -retrieve -filename app.log "找出所有超时的请求"
+  bcopilot -workspace ~/project "运行这个项目的测试"
+  bcopilot -mapreduce -filename huge.log "统计每种错误出现的次数"
+  bcopilot -i                              # 交互模式
+  bcopilot -continue "改成递归处理子目录"     # 在最近一次会话的基础上修改
+  bcopilot -session deploy -filename app.yaml "根据修改后的配置重新生成"
         """
     )
     
@@ -59,6 +455,20 @@ def create_query_parser():
     parser.add_argument('-script', action='store_true', help='生成脚本而不是单行命令')
     parser.add_argument('-help', action='help', help='显示此帮助信息并退出')
     parser.add_argument('-filename', type=str, nargs='+', help='在提示中包含指定文件的内容')
+    parser.add_argument('-retrieve', action='store_true', help='只包含与查询最相关的文件片段（适用于大文件）')
+    parser.add_argument('-workspace', type=str, metavar='DIR', help='从已建立的工作区索引中检索相关上下文')
+    parser.add_argument('-mapreduce', action='store_true', help='分块处理超出模型上下文的文件，先逐块提取相关信息再生成结果')
+    parser.add_argument('-i', dest='interactive', action='store_true', help='交互模式，连续提问并在之前的回答基础上修改')
+    parser.add_argument('-continue', '--continue', dest='continue_session', action='store_true',
+                        help='在最近一次会话的基础上继续修改，已发送的文件只发送差异')
+    parser.add_argument('-session', '--session', type=str, metavar='NAME',
+                        help='使用指定名称的会话保存和延续对话')
+    parser.add_argument('-no-stdin', dest='no_stdin', action='store_true',
+                        help='不读取标准输入（在脚本循环、cron 或 CI 中使用）')
+    parser.add_argument('-wait-stdin', dest='wait_stdin', action='store_true',
+                        help='一直等待管道输入（非交互运行时默认在几秒内没有数据就忽略）')
+    parser.add_argument('-trace', action='store_true',
+                        help='在标准错误中输出各阶段（预连接、环境探测、读取文件、请求）的耗时时间线')
     parser.add_argument('query', nargs='?', help='自然语言查询')
     
     # 设置默认的command值为None，表示这是查询模式而非config模式
@@ -81,8 +491,18 @@ def create_help_parser():
   bcopilot "自然语言查询"         # 生成bash命令
   bcopilot -script "查询"        # 生成bash脚本
   bcopilot -filename file.txt "查询"  # 包含文件内容
+  bcopilot -i                   # 交互模式
   bcopilot config show          # 显示配置
   bcopilot config set command.openai  # 设置配置
+  bcopilot index build DIR      # 建立工作区索引
+  bcopilot history search "查询"  # 检索历史记录
+  bcopilot watch -filename app.log "查询"  # 监视文件增长
+  bcopilot stats                # 级联路由各层级的统计
+  bcopilot batch queries.txt    # 批量生成命令
+  bcopilot batch-submit queries.txt  # 提交离线批处理任务
+  bcopilot worker -queue DIR    # 从共享队列领取查询
+  bcopilot gateway              # 团队共享的缓存网关
+  eval "$(bcopilot shell-init bash)"  # 启用 shell 快捷键 (Ctrl-G)
         """
     )
     return parser
@@ -108,13 +528,65 @@ def parse_arguments():
         # 使用config专用解析器
         config_parser = create_config_parser()
         return config_parser.parse_args(args[1:])  # 跳过"config"参数
+    elif args[0] == 'index':
+        # 使用index专用解析器
+        index_parser = create_index_parser()
+        return index_parser.parse_args(args[1:])
+    elif args[0] == 'history':
+        # 使用history专用解析器
+        history_parser = create_history_parser()
+        return history_parser.parse_args(args[1:])
+    elif args[0] == 'watch':
+        # 使用watch专用解析器
+        watch_parser = create_watch_parser()
+        return watch_parser.parse_args(args[1:])
+    elif args[0] == 'daemon':
+        # 使用daemon专用解析器
+        daemon_parser = create_daemon_parser()
+        return daemon_parser.parse_args(args[1:])
+    elif args[0] == 'stats':
+        # 使用stats专用解析器
+        stats_parser = create_stats_parser()
+        return stats_parser.parse_args(args[1:])
+    elif args[0] == 'batch':
+        # 使用batch专用解析器
+        batch_parser = create_batch_parser()
+        return batch_parser.parse_args(args[1:])
+    elif args[0] == 'batch-submit':
+        # 使用batch-submit专用解析器
+        batch_submit_parser = create_batch_submit_parser()
+        return batch_submit_parser.parse_args(args[1:])
+    elif args[0] == 'batch-status':
+        # 使用batch-status专用解析器
+        batch_status_parser = create_batch_status_parser()
+        return batch_status_parser.parse_args(args[1:])
+    elif args[0] == 'batch-collect':
+        # 使用batch-collect专用解析器
+        batch_collect_parser = create_batch_collect_parser()
+        return batch_collect_parser.parse_args(args[1:])
+    elif args[0] == 'worker':
+        # 使用worker专用解析器
+        worker_parser = create_worker_parser()
+        return worker_parser.parse_args(args[1:])
+    elif args[0] == 'coordinator':
+        # 使用coordinator专用解析器
+        coordinator_parser = create_coordinator_parser()
+        return coordinator_parser.parse_args(args[1:])
+    elif args[0] == 'gateway':
+        # 使用gateway专用解析器
+        gateway_parser = create_gateway_parser()
+        return gateway_parser.parse_args(args[1:])
+    elif args[0] == 'shell-init':
+        # 使用shell-init专用解析器
+        shell_init_parser = create_shell_init_parser()
+        return shell_init_parser.parse_args(args[1:])
     else:
         # 使用查询解析器
         query_parser = create_query_parser()
         parsed_args = query_parser.parse_args(args)
         
-        # 检查是否提供了查询
-        if not parsed_args.query:
+        # 检查是否提供了查询（交互模式可以不提供）
+        if not parsed_args.query and not parsed_args.interactive:
             query_parser.print_help()
             sys.exit(1)
         
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+交互模式 - 在一个进程中连续提问
+
+模型配置、环境上下文、文件内容和到提供商的连接在整个会话中保持常驻，
+每一轮只需要一次网络请求。后续的提问在之前回答的基础上修改（如"改成递归处理子目录"），
+对话历史按提供商的 token_limit 截断。输入支持 readline 历史和基于历史记录的补全。
+"""
+
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import generate_bash_command, get_provider_config
+from src.generators.conversation import Conversation
+from src.generators.script_generator import create_script_file
+from src.log.history import append_to_history
+from src.log.history_store import HistoryStore
+from src.utils.context import get_bash_context
+from src.utils.file_utils import read_file_contents
+from src.utils.http_client import get_session
+
+try:
+    import readline
+except ImportError:
+    readline = None
+
+# 从历史记录加载到 readline 的查询数量
+REPL_HISTORY_SIZE = 500
+
+# 交互模式内置命令
+REPL_COMMANDS = {
+    ":command": "切换到单行命令模式",
+    ":script": "切换到脚本模式",
+    ":reset": "开始新的对话（保留环境上下文和文件内容）",
+    ":help": "显示帮助",
+    ":quit": "退出交互模式"
+}
+
+class Repl:
+    """交互模式会话"""
+
+    def __init__(self, is_script: bool = False,
+                 file_contents: Optional[List[Tuple[str, str]]] = None,
+                 filenames: Optional[List[str]] = None,
+                 context: Optional[Dict[str, str]] = None,
+                 model_manager: Optional[ModelManager] = None):
+        self.is_script = is_script
+        self.filenames = filenames
+        self.model_manager = model_manager or ModelManager()
+        self.context = context or get_bash_context()
+        self.conversation = Conversation(self.context, file_contents)
+        self.completions = sorted(REPL_COMMANDS)
+
+    def prompt(self) -> str:
+        """
+        生成输入提示符
+
+        Returns:
+            str: 提示符，显示当前模式和对话轮数
+        """
+        mode = "script" if self.is_script else "command"
+        return f"bcopilot[{mode}:{len(self.conversation.turns)}]> "
+
+    def setup_readline(self) -> None:
+        """加载最近的查询作为 readline 历史，并启用补全"""
+        if readline is None:
+            return
+        try:
+            store = HistoryStore()
+            queries = [entry["query"] for entry in store.search(limit=REPL_HISTORY_SIZE)]
+            store.close()
+        except Exception:
+            queries = []
+
+        seen = set()
+        for query in reversed(queries):
+            if "\n" not in query and query not in seen:
+                readline.add_history(query)
+                seen.add(query)
+        self.completions = sorted(seen) + sorted(REPL_COMMANDS)
+
+        # 以整行作为补全单位
+        readline.set_completer_delims("")
+        readline.set_completer(self.complete)
+        readline.parse_and_bind("tab: complete")
+
+    def complete(self, text: str, state: int) -> Optional[str]:
+        """
+        readline 补全函数
+
+        Args:
+            text (str): 当前输入
+            state (int): 第几个候选
+
+        Returns:
+            Optional[str]: 候选项，没有更多时返回None
+        """
+        matches = [item for item in self.completions if item.startswith(text)]
+        return matches[state] if state < len(matches) else None
+
+    def handle_command(self, line: str) -> bool:
+        """
+        处理内置命令
+
+        Args:
+            line (str): 以 ":" 开头的输入
+
+        Returns:
+            bool: 是否继续交互
+        """
+        command = line.split()[0]
+        if command in (":quit", ":exit", ":q"):
+            return False
+        if command == ":command":
+            self.is_script = False
+            print("已切换到单行命令模式")
+        elif command == ":script":
+            self.is_script = True
+            print("已切换到脚本模式")
+        elif command == ":reset":
+            self.conversation.reset()
+            print("已开始新的对话")
+        elif command == ":help":
+            for name, description in REPL_COMMANDS.items():
+                print(f"  {name:<10} {description}")
+        else:
+            print(f"未知命令 {command}，输入 :help 查看可用命令")
+        return True
+
+    def ask(self, query: str) -> bool:
+        """
+        发送一轮查询并输出结果
+
+        Args:
+            query (str): 用户查询
+
+        Returns:
+            bool: 是否成功
+        """
+        provider_config = get_provider_config(self.model_manager, self.is_script)
+        usage = {}
+        success, result = generate_bash_command(
+            query,
+            self.context,
+            is_script=self.is_script,
+            usage=usage,
+            model_manager=self.model_manager,
+            session=get_session(provider_config["url"]),
+            conversation=self.conversation
+        )
+        if not success:
+            print(f"错误: {result}")
+            return False
+
+        self.conversation.add_turn(query, result)
+        script_path = None
+        if self.is_script:
+            script_path = create_script_file(result, query)
+            print(f"\n脚本已创建: {script_path}")
+            print(f"\033[92m{script_path}\033[0m")
+        else:
+            print(f"\033[92m{result}\033[0m")
+        append_to_history(query, result, "script" if self.is_script else "command",
+                          script_path, self.filenames, usage)
+        return True
+
+    def run(self) -> None:
+        """运行交互循环，直到输入 :quit 或 Ctrl-D"""
+        self.setup_readline()
+        print("Bash-Copilot 交互模式，输入 :help 查看命令，Ctrl-D 退出")
+        while True:
+            try:
+                line = input(self.prompt()).strip()
+            except EOFError:
+                print()
+                break
+            except KeyboardInterrupt:
+                print()
+                continue
+            if not line:
+                continue
+            if line.startswith(":"):
+                if not self.handle_command(line):
+                    break
+                continue
+            try:
+                self.ask(line)
+            except KeyboardInterrupt:
+                print("\n已取消")
+
+def run_repl(args) -> None:
+    """
+    启动交互模式
+
+    Args:
+        args: 命令行参数，使用其中的 script 和 filename
+    """
+    file_contents = None
+    if args.filename:
+        file_contents = read_file_contents(args.filename, args.script)
+        if file_contents is None:
+            sys.exit(1)
+
+    repl = Repl(args.script, file_contents, args.filename)
+    if args.query:
+        repl.ask(args.query)
+    repl.run()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+统计命令 - 根据历史记录统计级联路由各层级的通过率和节省的耗时，以及每个API密钥的用量
+"""
+
+import sys
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.cli.history_commands import parse_time
+from src.log.history import flush_history
+from src.log.history_store import HistoryStore
+
+# 模式的显示名称
+MODE_NAMES = {"command": "命令", "script": "脚本"}
+
+# 报告表格的列: (标题, 宽度, 是否右对齐)
+COLUMNS = (("层级", 6, False), ("提供商", 22, False), ("尝试", 6, True), ("通过", 6, True),
+           ("通过率", 8, True), ("平均耗时", 10, True), ("最终回答", 10, True))
+
+def pad(text: str, width: int, right: bool = False) -> str:
+    """按终端显示宽度（中文字符占两列）补齐文本"""
+    shown = sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+    fill = " " * max(0, width - shown)
+    return fill + text if right else text + fill
+
+def format_row(values: Iterable[str]) -> str:
+    """按 COLUMNS 排列一行"""
+    return "  " + " ".join(pad(value, width, right)
+                           for value, (_, width, right) in zip(values, COLUMNS)).rstrip()
+
+def new_tier() -> Dict[str, Any]:
+    """一个层级的空统计"""
+    return {"provider": None, "model": None, "attempts": 0, "passed": 0,
+            "latency_ms": 0, "timed": 0, "reasons": Counter()}
+
+def cascade_stats(entries: Iterable[Dict[str, Any]],
+                  mode: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    汇总使用了级联路由的历史记录
+
+    Args:
+        entries (Iterable[Dict[str, Any]]): 历史记录
+        mode (str, optional): 只统计指定模式
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 按模式分组的统计，包含查询数、总耗时、
+            每个层级的尝试数、通过数、耗时和未通过原因，以及最终回答所在层级的分布
+    """
+    stats = {}  # type: Dict[str, Dict[str, Any]]
+    for entry in entries:
+        attempts = entry.get("cascade")
+        if not attempts or (mode and entry.get("mode") != mode):
+            continue
+        group = stats.setdefault(entry.get("mode", "command"),
+                                 {"queries": 0, "latency_ms": 0, "tiers": {}, "final": Counter()})
+        group["queries"] += 1
+        group["latency_ms"] += entry.get("latency_ms") or 0
+        group["final"][entry.get("tier")] += 1
+        for attempt in attempts:
+            tier = group["tiers"].setdefault(attempt["tier"], new_tier())
+            tier["provider"] = attempt.get("provider")
+            tier["model"] = attempt.get("model")
+            tier["attempts"] += 1
+            if attempt.get("passed"):
+                tier["passed"] += 1
+            elif attempt.get("reason"):
+                # 只按原因的类别统计，去掉具体的程序名和错误信息
+                tier["reasons"][attempt["reason"].split(":")[0]] += 1
+            if attempt.get("latency_ms") is not None:
+                tier["latency_ms"] += attempt["latency_ms"]
+                tier["timed"] += 1
+    return stats
+
+def estimate_savings(group: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """
+    估计与所有查询都直接使用最强层级相比节省的耗时
+
+    最强层级的平均耗时乘以查询数，减去实际的总耗时（包括改用更强模型时多花的时间）。
+
+    Args:
+        group (Dict[str, Any]): cascade_stats 返回的一个模式的统计
+
+    Returns:
+        Optional[Tuple[int, str]]: (节省的毫秒数, 最强层级的提供商)，
+            最强层级没有耗时记录时返回None
+    """
+    if not group["tiers"]:
+        return None
+    top = group["tiers"][max(group["tiers"])]
+    if not top["timed"]:
+        return None
+    average = top["latency_ms"] / top["timed"]
+    return int(average * group["queries"] - group["latency_ms"]), top["provider"]
+
+def format_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    """
+    生成统计报告
+
+    Args:
+        stats (Dict[str, Dict[str, Any]]): cascade_stats 的结果
+
+    Returns:
+        str: 报告文本
+    """
+    if not stats:
+        return "没有使用级联路由的记录（在 models.yaml 中为 command 或 script 配置 cascade 后生效）"
+
+    lines = []  # type: List[str]
+    for mode, group in sorted(stats.items()):
+        lines.append(f"{MODE_NAMES.get(mode, mode)}模式: {group['queries']} 次查询")
+        lines.append(format_row(title for title, _, _ in COLUMNS))
+        for index in sorted(group["tiers"]):
+            tier = group["tiers"][index]
+            latency = f"{tier['latency_ms'] / tier['timed']:.0f} ms" if tier["timed"] else "-"
+            lines.append(format_row([str(index + 1), tier["provider"] or "-", str(tier["attempts"]),
+                                     str(tier["passed"]), f"{tier['passed'] / tier['attempts']:.0%}",
+                                     latency, str(group["final"][index])]))
+            if tier["reasons"]:
+                reasons = ", ".join(f"{reason} {count}" for reason, count in tier["reasons"].most_common())
+                lines.append(f"  {pad('', COLUMNS[0][1])} 未通过: {reasons}")
+        savings = estimate_savings(group)
+        if savings is not None:
+            saved, top = savings
+            verb = "节省" if saved >= 0 else "增加"
+            lines.append(f"  与全部使用 {top} 相比{verb}约 {abs(saved) / 1000:.1f} 秒"
+                         f"（平均每次 {abs(saved) / group['queries']:.0f} ms）")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+def key_stats(entries: Iterable[Dict[str, Any]],
+              mode: Optional[str] = None) -> Dict[Tuple[str, str], Dict[str, int]]:
+    """
+    按提供商和API密钥汇总历史记录
+
+    Args:
+        entries (Iterable[Dict[str, Any]]): 历史记录
+        mode (str, optional): 只统计指定模式
+
+    Returns:
+        Dict[Tuple[str, str], Dict[str, int]]: (提供商, 密钥标签) 到查询数、token用量和总耗时的映射
+    """
+    stats = {}  # type: Dict[Tuple[str, str], Dict[str, int]]
+    for entry in entries:
+        if not entry.get("key") or (mode and entry.get("mode") != mode):
+            continue
+        group = stats.setdefault((entry.get("provider") or "-", entry["key"]),
+                                 {"queries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                  "latency_ms": 0, "timed": 0})
+        group["queries"] += 1
+        group["prompt_tokens"] += entry.get("prompt_tokens") or 0
+        group["completion_tokens"] += entry.get("completion_tokens") or 0
+        if entry.get("latency_ms") is not None:
+            group["latency_ms"] += entry["latency_ms"]
+            group["timed"] += 1
+    return stats
+
+def format_key_stats(stats: Dict[Tuple[str, str], Dict[str, int]]) -> str:
+    """
+    生成每个API密钥的用量报告
+
+    Args:
+        stats (Dict[Tuple[str, str], Dict[str, int]]): key_stats 的结果
+
+    Returns:
+        str: 报告文本
+    """
+    if not stats:
+        return "没有记录所用密钥的历史记录"
+    lines = [f"  {pad('提供商', 22)} {pad('密钥', 36)} {pad('查询', 6, True)} "
+             f"{pad('输入tokens', 12, True)} {pad('输出tokens', 12, True)} {pad('平均耗时', 10, True)}"]
+    for (provider, key), group in sorted(stats.items()):
+        latency = f"{group['latency_ms'] / group['timed']:.0f} ms" if group["timed"] else "-"
+        lines.append(f"  {pad(provider, 22)} {pad(key, 36)} {pad(str(group['queries']), 6, True)} "
+                     f"{pad(str(group['prompt_tokens']), 12, True)} "
+                     f"{pad(str(group['completion_tokens']), 12, True)} {pad(latency, 10, True)}")
+    return "\n".join(line.rstrip() for line in lines)
+
+def handle_stats_command(args):
+    """处理统计命令"""
+    try:
+        since = parse_time(args.since)
+    except ValueError as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
+
+    flush_history()
+    store = HistoryStore()
+    try:
+        if args.keys:
+            report = format_key_stats(key_stats(store.read_log(since=since), args.mode))
+        else:
+            report = format_stats(cascade_stats(store.read_log(since=since), args.mode))
+    finally:
+        store.close()
+    print(report)
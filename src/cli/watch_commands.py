@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+监视命令 - 跟踪文件增长并在出现指定情况时给出命令
+"""
+
+import os
+import sys
+
+from src.generators.watch_generator import Watcher
+from src.utils.context import get_bash_context
+from src.utils.file_follower import FileFollower
+from src.utils.key_pool import missing_key_message
+
+def handle_watch_command(args):
+    """处理监视命令"""
+    if not os.path.isfile(args.filename):
+        print(f"错误: 文件 '{args.filename}' 不存在")
+        sys.exit(1)
+
+    follower = FileFollower(args.filename, from_start=args.from_start,
+                            poll_interval=args.poll_interval, use_inotify=not args.poll)
+    watcher = Watcher(args.filename, args.query, follower, get_bash_context(),
+                      debounce=args.debounce, min_interval=args.interval)
+    if not len(watcher.keys):
+        print(f"错误: {missing_key_message(watcher.provider_config)}")
+        follower.close()
+        sys.exit(1)
+
+    print(f"正在监视 {args.filename} ({follower.mode})，按 Ctrl-C 停止")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        follower.close()
+    print(f"监视结束: {watcher.summary.text()}，共发送 {watcher.queries} 次请求")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+分布式批处理命令 - 工作进程和协调命令
+"""
+
+import sys
+import json
+import time
+
+from src.cli.batch_commands import read_queries
+from src.utils.context import get_bash_context
+from src.workqueue.store import DEFAULT_LEASE_TIMEOUT, open_queue
+from src.workqueue.worker import REPORT_INTERVAL, QueueWorker, format_report, queue_report
+
+def handle_worker_command(args):
+    """处理 worker 命令"""
+    queue = open_queue(args.queue, args.lease or DEFAULT_LEASE_TIMEOUT)
+    worker = QueueWorker(queue, name=args.name)
+    print(f"工作进程 {worker.name} 开始处理 {args.queue}（并发 {worker.limiter.max_concurrency}）",
+          file=sys.stderr)
+    try:
+        stats = worker.run(follow=args.follow)
+    except KeyboardInterrupt:
+        stats = worker.stats
+    finally:
+        queue.close()
+    print(f"工作进程 {worker.name}: 完成 {stats['completed']}，失败 {stats['failed']}，"
+          f"已由其他进程完成 {stats['duplicates']}，暂时失败后放回队列 {stats['retried']}",
+          file=sys.stderr)
+
+def handle_coordinator_command(args):
+    """处理 coordinator 命令"""
+    queue = open_queue(args.queue, args.lease or DEFAULT_LEASE_TIMEOUT)
+    try:
+        if args.add:
+            try:
+                queries = read_queries(args.add)
+            except OSError as e:
+                print(f"错误: 无法读取查询列表: {str(e)}")
+                sys.exit(1)
+            print(f"已添加 {queue.add(queries, get_bash_context())} 个查询")
+
+        report = queue_report(queue)
+        print(format_report(report))
+        try:
+            while args.watch and report["progress"]["pending"] + report["progress"]["leased"]:
+                time.sleep(REPORT_INTERVAL)
+                report = queue_report(queue)
+                print(format_report(report))
+        except KeyboardInterrupt:
+            pass
+
+        if args.output:
+            count = 0
+            with open(args.output, "w", encoding="utf-8") as f:
+                for result in queue.results():
+                    record = {"id": result["id"], "query": result["query"], "worker": result["worker"]}
+                    record["command" if result["success"] else "error"] = result["answer"]
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+            print(f"已导出 {count} 个结果到 {args.output}")
+    finally:
+        queue.close()
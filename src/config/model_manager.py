@@ -7,6 +7,9 @@ import os
 import yaml
 from pathlib import Path
 
+# 已读取的API密钥，按密钥文件的绝对路径缓存
+_api_keys = {}
+
 class ModelManager:
     """模型配置管理器"""
     
@@ -60,12 +63,46 @@ class ModelManager:
         provider_name = self.config["script"]["provider"]
         return self.config["script"]["models"][provider_name]
     
+    def get_cascade(self, type_name):
+        """
+        获取级联路由的提供商列表，按从快速/便宜到强/慢排列
+
+        未配置 cascade 时只包含当前提供商
+
+        Returns:
+            List[Tuple[str, Dict]]: (提供商名称, 提供商配置) 列表
+        """
+        section = self.config[type_name]
+        names = section.get("cascade") or [section["provider"]]
+        return [(name, section["models"][name]) for name in names if name in section["models"]]
+
+    def set_cascade(self, type_name, provider_names):
+        """设置级联路由的提供商列表，为空时取消级联"""
+        if type_name not in ["command", "script"]:
+            raise ValueError(f"未知的类型: {type_name}")
+
+        for provider_name in provider_names:
+            if provider_name not in self.config[type_name]["models"]:
+                raise ValueError(f"未知的提供商: {provider_name}")
+
+        if provider_names:
+            self.config[type_name]["cascade"] = list(provider_names)
+        else:
+            self.config[type_name].pop("cascade", None)
+        self.save_config()
+
     def get_api_key(self, key_file):
-        """从文件读取API密钥"""
+        """从文件读取API密钥，每个进程只读取一次"""
         full_path = os.path.join(self.root_dir, key_file)
+        if full_path in _api_keys:
+            return _api_keys[full_path]
         if os.path.exists(full_path):
             with open(full_path, "r") as f:
-                return f.read().strip()
+                api_key = f.read().strip()
+            # 文件不存在或为空时不缓存，常驻进程中补上密钥后即可使用
+            if api_key:
+                _api_keys[full_path] = api_key
+            return api_key
         return None
     
     def save_config(self):
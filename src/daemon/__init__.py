@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+"""
+常驻后台进程模块包
+"""
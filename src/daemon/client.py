@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+后台进程客户端
+
+shell 快捷键每次按下都会启动这个脚本，因此它只依赖标准库，并以 python -S 运行以减少
+启动时间；后台进程未运行时自动启动。用法:
+
+    python3 -S client.py SOCKET generate CLIENT_ID CWD QUERY [PRIORITY]
+    python3 -S client.py SOCKET cancel CLIENT_ID
+    python3 -S client.py SOCKET ping
+
+generate 成功时把命令输出到标准输出，失败时把错误输出到标准错误并返回非零状态。
+只连接属于当前用户的套接字，其他用户抢先创建的套接字收不到查询。
+PRIORITY 为 interactive（默认）、script 或 batch，后台脚本使用较低的优先级，
+不会挡住 shell 快捷键的请求。
+"""
+
+import sys
+# posix 是内置模块，启动时已经加载
+import posix
+
+try:
+    # 直接使用C实现: 导入 json 和 socket 会加载 re、enum 等模块，启动时间增加约20毫秒
+    import _json
+    import _socket as socket
+
+    class _DecoderContext:
+        """_json.make_scanner 需要的解码选项，与 json.loads 的默认值相同"""
+        strict = True
+        object_hook = None
+        object_pairs_hook = None
+        parse_float = float
+        parse_int = int
+        parse_constant = float
+        memo = {}
+
+    _scan = _json.make_scanner(_DecoderContext())
+
+    def dumps(message):
+        return "{" + ", ".join(_json.encode_basestring_ascii(str(key)) + ": " +
+                               _json.encode_basestring_ascii(str(value))
+                               for key, value in message.items()) + "}"
+
+    def loads(text):
+        return _scan(text, 0)[0]
+except ImportError:
+    import json
+    import socket
+
+    def dumps(message):
+        return json.dumps(message)
+
+    def loads(text):
+        return json.loads(text)
+
+# 等待后台进程启动的最长时间（秒）
+START_TIMEOUT = 10.0
+
+# 等待生成结果的最长时间（秒）
+REQUEST_TIMEOUT = 120.0
+
+# 请求被新的请求取代或取消时的退出状态
+EXIT_CANCELLED = 130
+
+def request(socket_path, message, timeout=REQUEST_TIMEOUT):
+    """
+    向后台进程发送一个请求并等待回复
+
+    Args:
+        socket_path (str): 后台进程的Unix套接字
+        message (Dict[str, str]): 请求，包含 op 字段，值都是字符串
+        timeout (float): 超时秒数
+
+    Returns:
+        Dict[str, Any]: 回复
+
+    Raises:
+        OSError: 无法连接、套接字不属于当前用户或连接中断时
+    """
+    if posix.stat(socket_path).st_uid != posix.getuid():
+        raise PermissionError(f"套接字 {socket_path} 不属于当前用户")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(dumps(message).encode("ascii") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("后台进程关闭了连接")
+            data += chunk
+        return loads(data.decode("utf-8"))
+    finally:
+        sock.close()
+
+def start_daemon(socket_path, timeout=START_TIMEOUT):
+    """
+    在后台启动常驻进程并等待套接字可用
+
+    Args:
+        socket_path (str): 后台进程的Unix套接字
+        timeout (float): 等待秒数
+
+    Returns:
+        bool: 后台进程是否可用
+    """
+    import os
+    import time
+    import subprocess
+
+    entry = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bcopilot.py")
+    with open(os.devnull, "r+b") as devnull:
+        subprocess.Popen([sys.executable, entry, "daemon", "run", "-socket", socket_path],
+                         stdin=devnull, stdout=devnull, stderr=devnull,
+                         start_new_session=True, close_fds=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if request(socket_path, {"op": "ping"}, timeout=1.0).get("ok"):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+def call(socket_path, message, autostart=True):
+    """
+    发送请求，后台进程未运行时先启动它
+
+    Args:
+        socket_path (str): 后台进程的Unix套接字
+        message (Dict[str, str]): 请求
+        autostart (bool): 是否自动启动后台进程
+
+    Returns:
+        Dict[str, Any]: 回复
+    """
+    try:
+        return request(socket_path, message)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not autostart or not start_daemon(socket_path):
+            raise
+        return request(socket_path, message)
+
+def main(argv) -> int:
+    if len(argv) < 2:
+        sys.stderr.write(__doc__)
+        return 2
+    socket_path, op = argv[0], argv[1]
+    if op == "generate" and len(argv) in (5, 6):
+        message = {"op": "generate", "client": argv[2], "cwd": argv[3], "query": argv[4]}
+        if len(argv) == 6:
+            message["priority"] = argv[5]
+    elif op == "cancel" and len(argv) == 3:
+        message = {"op": "cancel", "client": argv[2]}
+    elif op == "ping":
+        message = {"op": "ping"}
+    else:
+        sys.stderr.write(__doc__)
+        return 2
+
+    try:
+        reply = call(socket_path, message, autostart=(op != "cancel"))
+    except KeyboardInterrupt:
+        # 关闭连接即通知后台进程放弃这个请求
+        return EXIT_CANCELLED
+    except OSError as e:
+        sys.stderr.write(f"bcopilot: 无法连接后台进程: {e}\n")
+        return 1
+
+    if reply.get("cancelled"):
+        return EXIT_CANCELLED
+    if not reply.get("ok"):
+        sys.stderr.write(f"bcopilot: {reply.get('error', '未知错误')}\n")
+        return 1
+    if op == "generate":
+        sys.stdout.write(reply["result"])
+    elif op == "ping":
+        sys.stdout.write(" ".join(f"{key}={value}" for key, value in reply.items()) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+常驻后台进程 - 为 shell 快捷键提供低延迟的命令生成
+
+模型配置、环境上下文、到提供商的连接和回答缓存都保持常驻，客户端通过Unix套接字
+发送一行JSON请求并读取一行JSON回复:
+
+    {"op": "generate", "client": "1234", "cwd": "/home/user", "query": "...", "priority": "interactive"}
+    {"op": "cancel", "client": "1234"}
+    {"op": "ping"}
+    {"op": "shutdown"}
+
+同一客户端（通常是shell的PID）的新请求会取代它尚未完成的旧请求，客户端断开连接
+也视为取消；尚未发送的请求不再发送，已经发送的请求完成后结果只写入缓存。
+相同目录下相同查询的请求共享一次生成。
+
+发往提供商的请求经过调度器（见 utils/scheduler.py）: priority 为 interactive（默认，
+shell 快捷键）、script 或 batch，交互式请求排在后台请求之前，同一类别内按客户端公平排队，
+按提供商的 rate_limit 放行。ping 的回复中排队时间和提供商延迟分开统计。
+空闲时按历史记录预热回答缓存（见 daemon/warmer.py）。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import stat
+import socket
+import hashlib
+import threading
+import socketserver
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from config.constants import (
+    DAEMON_SOCKET,
+    ANSWER_CACHE_FILE,
+    ANSWER_CACHE_MAX_BYTES,
+    ANSWER_CACHE_TTL
+)
+from src.config.model_manager import ModelManager
+from src.daemon.warmer import WARM_CLIENT, CacheWarmer
+from src.generators.base_generator import generate_bash_command, get_provider_config
+from src.log.history import append_to_history, flush_history
+from src.utils.context import get_bash_context
+from src.utils.http_client import get_session, close_sessions
+from src.utils.key_pool import get_key_pool
+from src.utils.rate_limiter import RateLimiter, get_rate_limiter
+from src.utils.result_cache import ResultCache
+from src.utils.scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, Scheduler, Ticket, percentile
+
+# 单个请求的最大字节数
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# 等待生成结果时检查取消和断开连接的间隔（秒）
+POLL_INTERVAL = 0.02
+
+# 计算提供商延迟分位数时保留的最近请求数
+LATENCY_WINDOW = 1000
+
+def answer_cache_key(query: str, cwd: str, provider_config: Dict[str, Any]) -> str:
+    """
+    计算回答缓存键
+
+    Args:
+        query (str): 用户查询，空白字符会被规范化
+        cwd (str): 当前目录
+        provider_config (Dict[str, Any]): 提供商配置
+
+    Returns:
+        str: 缓存键
+    """
+    query = re.sub(r"\s+", " ", query.strip())
+    key = json.dumps(["command", provider_config.get("url"), provider_config.get("model"), cwd, query],
+                     ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def connection_closed(conn: socket.socket) -> bool:
+    """
+    检查客户端是否已关闭连接
+
+    Args:
+        conn (socket.socket): 客户端连接
+
+    Returns:
+        bool: 是否已关闭
+    """
+    try:
+        readable, _, _ = select.select([conn], [], [], 0)
+        return bool(readable) and conn.recv(1, socket.MSG_PEEK) == b""
+    except OSError:
+        return True
+
+class Job:
+    """一次生成，相同查询的多个请求共享"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.waiters = 0
+        self.done = threading.Event()
+        self.success = False
+        self.result = None  # type: Optional[str]
+        self.scheduler = None  # type: Optional[Scheduler]
+        self.ticket = None  # type: Optional[Ticket]
+        # 预热缓存的生成，没有用户等待时不写入历史记录
+        self.warm = False
+        self.usage = {}  # type: Dict[str, Any]
+
+class Waiter:
+    """一个客户端正在等待的请求"""
+
+    def __init__(self, client: str, job: Job):
+        self.client = client
+        self.job = job
+        self.cancelled = threading.Event()
+
+class CopilotDaemon:
+    """后台进程状态和请求处理"""
+
+    def __init__(self, cache: Optional[ResultCache] = None,
+                 model_manager: Optional[ModelManager] = None,
+                 context: Optional[Dict[str, str]] = None):
+        self.cache = cache if cache is not None else ResultCache(
+            ANSWER_CACHE_FILE, ANSWER_CACHE_MAX_BYTES, ANSWER_CACHE_TTL)
+        # 未指定配置时在 models.yaml 修改后重新加载
+        self.reload_config = model_manager is None
+        self.model_manager = model_manager or ModelManager()
+        self.config_mtime = self._config_mtime()
+        self.context = context or get_bash_context()
+        self.lock = threading.Lock()
+        self.schedulers = {}  # type: Dict[RateLimiter, Scheduler]
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # type: Deque[float]
+        self.jobs = {}  # type: Dict[str, Job]
+        self.clients = {}  # type: Dict[str, Waiter]
+        self.started = time.time()
+        self.last_request = self.started
+        self.warmer = None  # type: Optional[CacheWarmer]
+        self.stats = {"requests": 0, "cache_hits": 0, "generated": 0, "cancelled": 0, "errors": 0}
+        self.server = None  # type: Optional[DaemonServer]
+
+    def _config_mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.model_manager.config_path)
+        except (OSError, TypeError, AttributeError):
+            return 0.0
+
+    def provider_config(self) -> Dict[str, Any]:
+        """
+        获取命令模式的提供商配置，配置文件修改后重新加载
+
+        Returns:
+            Dict[str, Any]: 提供商配置
+        """
+        if self.reload_config:
+            mtime = self._config_mtime()
+            if mtime != self.config_mtime:
+                self.model_manager = ModelManager()
+                self.config_mtime = mtime
+        return get_provider_config(self.model_manager)
+
+    def scheduler(self, provider_config: Dict[str, Any]) -> Scheduler:
+        """
+        提供商的请求调度器，共享该提供商的速率限制器
+
+        Args:
+            provider_config (Dict[str, Any]): 提供商配置
+
+        Returns:
+            Scheduler: 调度器
+        """
+        limiter = get_rate_limiter(provider_config, len(get_key_pool(provider_config, self.model_manager)))
+        with self.lock:
+            if limiter not in self.schedulers:
+                self.schedulers[limiter] = Scheduler(limiter)
+            return self.schedulers[limiter]
+
+    def status(self) -> Dict[str, Any]:
+        """
+        ping 的回复
+
+        Returns:
+            Dict[str, Any]: 计数、当前提供商各优先级类别的排队情况和提供商延迟分位数（毫秒）
+        """
+        scheduler = self.scheduler(self.provider_config())
+        with self.lock:
+            inflight = len(self.jobs)
+            latencies = list(self.latencies)
+        latency = {}
+        for label, fraction in (("p50", 0.5), ("p99", 0.99)):
+            value = percentile(latencies, fraction)
+            latency[f"{label}_ms"] = round(value, 1) if value is not None else None
+        return {"ok": True, "pid": os.getpid(), "uptime": round(time.time() - self.started, 1),
+                "inflight": inflight, "stats": dict(self.stats),
+                "scheduler": scheduler.snapshot(), "latency": latency,
+                "warmer": self.warmer.snapshot() if self.warmer is not None else None}
+
+    def idle_for(self) -> float:
+        """
+        后台进程空闲的秒数
+
+        Returns:
+            float: 距最近一次生成请求的秒数，有用户请求正在进行时为0
+        """
+        with self.lock:
+            if any(not job.warm for job in self.jobs.values()):
+                return 0.0
+            return max(0.0, time.time() - self.last_request)
+
+    def cached_age(self, query: str, cwd: str, provider_config: Dict[str, Any]) -> Optional[float]:
+        """
+        查询的缓存回答已保存的秒数
+
+        Returns:
+            Optional[float]: 秒数，没有缓存时返回None
+        """
+        return self.cache.age(answer_cache_key(query, cwd, provider_config))
+
+    def refresh(self, query: str, cwd: str,
+                provider_config: Dict[str, Any]) -> Tuple[Optional[bool], Dict[str, Any]]:
+        """
+        以 batch 优先级重新生成查询的回答并写入缓存，等待完成
+
+        Args:
+            query (str): 查询
+            cwd (str): 查询所在的目录
+            provider_config (Dict[str, Any]): 提供商配置
+
+        Returns:
+            Tuple[Optional[bool], Dict[str, Any]]: (是否成功, 调用信息)；相同的请求正在进行
+                或调度器拒绝时为 (None, {})
+        """
+        key = answer_cache_key(query, cwd, provider_config)
+        scheduler = self.scheduler(provider_config)
+        with self.lock:
+            if key in self.jobs:
+                return None, {}
+            job = Job(key)
+            job.warm = True
+            accepted, ticket = scheduler.submit(
+                "batch", WARM_CLIENT, run=lambda: self._run(job, query, cwd, provider_config))
+            if not accepted:
+                return None, {}
+            job.scheduler, job.ticket = scheduler, ticket
+            job.waiters += 1
+            self.jobs[key] = job
+        job.done.wait()
+        with self.lock:
+            job.waiters -= 1
+        return job.success, job.usage
+
+    def start_warmer(self) -> None:
+        """启动空闲时预热回答缓存的线程"""
+        self.warmer = CacheWarmer(self)
+        self.warmer.start()
+
+    def dispatch(self, message: Dict[str, Any], conn: Optional[socket.socket] = None) -> Dict[str, Any]:
+        """
+        处理一个请求
+
+        Args:
+            message (Dict[str, Any]): 请求
+            conn (socket.socket, optional): 客户端连接，用于检测断开
+
+        Returns:
+            Dict[str, Any]: 回复
+        """
+        op = message.get("op")
+        if op == "generate":
+            return self.generate(message, conn)
+        if op == "cancel":
+            return {"ok": True, "cancelled": False, "found": self.cancel(str(message.get("client", "")))}
+        if op == "ping":
+            return self.status()
+        if op == "shutdown":
+            if self.server is not None:
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"ok": True}
+        return {"ok": False, "error": f"未知操作 {op}"}
+
+    def cancel(self, client: str) -> bool:
+        """
+        取消客户端尚未完成的请求
+
+        Args:
+            client (str): 客户端标识
+
+        Returns:
+            bool: 是否有请求被取消
+        """
+        with self.lock:
+            waiter = self.clients.pop(client, None)
+        if waiter is None:
+            return False
+        waiter.cancelled.set()
+        return True
+
+    def generate(self, message: Dict[str, Any], conn: Optional[socket.socket] = None) -> Dict[str, Any]:
+        """
+        生成命令，缓存命中时立即返回
+
+        Args:
+            message (Dict[str, Any]): 包含 query、cwd、client 和可选的 priority 的请求
+            conn (socket.socket, optional): 客户端连接
+
+        Returns:
+            Dict[str, Any]: 回复，包含 result 和 cached，或 error/cancelled
+        """
+        query = str(message.get("query") or "").strip()
+        if not query:
+            return {"ok": False, "error": "查询为空"}
+        cwd = str(message.get("cwd") or self.context.get("current_directory", ""))
+        client = str(message.get("client") or "")
+        priority = str(message.get("priority") or DEFAULT_PRIORITY)
+        if priority not in PRIORITY_CLASSES:
+            return {"ok": False, "error": f"未知的优先级 {priority}，可选 {', '.join(PRIORITY_CLASSES)}"}
+        self.stats["requests"] += 1
+        self.last_request = time.time()
+
+        provider_config = self.provider_config()
+        key = answer_cache_key(query, cwd, provider_config)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            # 取代同一客户端之前的请求
+            if client:
+                self.cancel(client)
+            return {"ok": True, "result": cached, "cached": True}
+
+        scheduler = self.scheduler(provider_config)
+        with self.lock:
+            previous = self.clients.get(client) if client else None
+            if previous is not None:
+                previous.cancelled.set()
+            job = self.jobs.get(key)
+            if job is None:
+                job = Job(key)
+                accepted, ticket = scheduler.submit(
+                    priority, client, run=lambda: self._run(job, query, cwd, provider_config))
+                if not accepted:
+                    self.stats["errors"] += 1
+                    return {"ok": False, "error": f"后台进程繁忙: {ticket}"}
+                job.scheduler, job.ticket = scheduler, ticket
+                self.jobs[key] = job
+            elif job.ticket is not None:
+                # 交互式请求合并到排队中的后台请求（或预热请求）时提升它的优先级
+                job.scheduler.promote(job.ticket, priority)
+                job.warm = False
+            job.waiters += 1
+            waiter = Waiter(client, job)
+            if client:
+                self.clients[client] = waiter
+
+        try:
+            while not job.done.wait(POLL_INTERVAL):
+                if waiter.cancelled.is_set() or (conn is not None and connection_closed(conn)):
+                    self.stats["cancelled"] += 1
+                    return {"ok": False, "cancelled": True}
+        finally:
+            with self.lock:
+                job.waiters -= 1
+                if client and self.clients.get(client) is waiter:
+                    del self.clients[client]
+                if not job.waiters and job.scheduler.cancel(job.ticket):
+                    # 所有等待者都已取消，尚未放行的请求不再发送
+                    self.jobs.pop(job.key, None)
+                    job.done.set()
+
+        if waiter.cancelled.is_set():
+            self.stats["cancelled"] += 1
+            return {"ok": False, "cancelled": True}
+        if not job.success:
+            return {"ok": False, "error": job.result}
+        return {"ok": True, "result": job.result, "cached": False}
+
+    def _run(self, job: Job, query: str, cwd: str, provider_config: Dict[str, Any]) -> None:
+        """调度器放行后在它的线程中向提供商发送请求"""
+        with self.lock:
+            if job.waiters == 0:
+                # 所有等待者都已取消，不再发送请求
+                self.jobs.pop(job.key, None)
+                job.done.set()
+                return
+
+        context = dict(self.context, current_directory=cwd)
+        usage = {}
+        try:
+            success, result = generate_bash_command(
+                query,
+                context,
+                usage=usage,
+                model_manager=self.model_manager,
+                session=get_session(provider_config["url"])
+            )
+        except Exception as e:
+            success, result = False, f"未知错误: {str(e)}"
+
+        if usage.get("latency_ms") is not None:
+            with self.lock:
+                self.latencies.append(usage["latency_ms"])
+        if success:
+            self.cache.put(job.key, result)
+            if not job.warm:
+                self.stats["generated"] += 1
+                append_to_history(query, result, "command", None, None, usage, cwd=cwd)
+        elif not job.warm:
+            self.stats["errors"] += 1
+            print(f"错误: {result}", flush=True)
+
+        job.success, job.result, job.usage = success, result, usage
+        with self.lock:
+            self.jobs.pop(job.key, None)
+        job.done.set()
+
+    def close(self) -> None:
+        """等待进行中的请求完成并释放资源"""
+        if self.warmer is not None:
+            self.warmer.stop_event.set()
+        with self.lock:
+            schedulers = list(self.schedulers.values())
+        for scheduler in schedulers:
+            scheduler.close()
+        flush_history()
+        close_sessions()
+        self.cache.close()
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """处理一个客户端连接上的一个请求"""
+
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        if not line:
+            return
+        try:
+            message = json.loads(line.decode("utf-8"))
+            if not isinstance(message, dict):
+                raise ValueError("请求必须是JSON对象")
+            reply = self.server.copilot.dispatch(message, self.connection)
+        except ValueError as e:
+            reply = {"ok": False, "error": f"无效的请求: {str(e)}"}
+        try:
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+        except OSError:
+            # 客户端已断开
+            pass
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """每个连接一个线程的Unix套接字服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, copilot: CopilotDaemon):
+        self.copilot = copilot
+        copilot.server = self
+        prepare_socket_dir(socket_path)
+        remove_stale_socket(socket_path)
+        # 套接字只允许当前用户访问
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, DaemonHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+def prepare_socket_dir(socket_path: str) -> None:
+    """
+    创建套接字所在的目录（仅当前用户可访问），并确认其他用户无法在其中放置套接字
+
+    Args:
+        socket_path (str): 套接字路径
+
+    Raises:
+        RuntimeError: 目录不属于当前用户，或其他用户可以写入时
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"套接字目录 {directory} 不属于当前用户")
+    if info.st_mode & 0o022:
+        raise RuntimeError(f"套接字目录 {directory} 其他用户可以写入，请改为 0700 或用 -socket 指定其他位置")
+
+def remove_stale_socket(socket_path: str) -> None:
+    """
+    删除上一次运行遗留的套接字文件
+
+    Args:
+        socket_path (str): 套接字路径
+
+    Raises:
+        RuntimeError: 已有后台进程在使用该套接字，或套接字属于其他用户时
+    """
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if info.st_uid != os.getuid():
+        raise RuntimeError(f"套接字 {socket_path} 属于其他用户")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"后台进程已在运行 ({socket_path})")
+
+def run_daemon(socket_path: str = DAEMON_SOCKET, log_file: Optional[str] = None) -> None:
+    """
+    在前台运行后台进程，直到收到 shutdown 请求或 SIGTERM
+
+    Args:
+        socket_path (str): 监听的Unix套接字
+        log_file (str, optional): 输出重定向到的日志文件
+    """
+    if log_file:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        log = open(log_file, "a", buffering=1, encoding="utf-8")
+        sys.stdout = sys.stderr = log
+
+    copilot = CopilotDaemon()
+    server = DaemonServer(socket_path, copilot)
+    copilot.start_warmer()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+        target=server.shutdown, daemon=True).start())
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 后台进程已启动 pid={os.getpid()} socket={socket_path}",
+          flush=True)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        copilot.close()
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 后台进程已退出", flush=True)
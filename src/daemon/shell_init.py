@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+shell 集成脚本 - 生成 bash/zsh 的快捷键绑定
+
+在 ~/.bashrc 或 ~/.zshrc 中加入 eval "$(bcopilot shell-init bash)"（zsh 改为 zsh），
+在提示符下输入自然语言后按快捷键（默认 Ctrl-G），输入行会被替换为生成的命令。
+快捷键通过轻量客户端与后台进程通信，缓存命中时立即返回。
+
+bash 的 bind -x 会阻塞输入，按 Ctrl-C 放弃等待；zsh 的请求在后台进行，等待期间
+修改输入行会取消请求，再次按下快捷键会取代之前的请求。
+"""
+
+import os
+import sys
+import shlex
+from typing import Optional
+
+# 各 shell 的默认快捷键
+DEFAULT_KEYS = {"bash": r"\C-g", "zsh": "^G"}
+
+BASH_TEMPLATE = r"""# Bash-Copilot shell 集成 (bash)
+__bcopilot_widget() {
+    local query="$READLINE_LINE" result
+    [[ -n "${query//[[:space:]]/}" ]] || return
+    result=$(%(python)s -S %(client)s %(socket)s generate "$$" "$PWD" "$query") || return
+    [[ -n "$result" ]] || return
+    READLINE_LINE="$result"
+    READLINE_POINT=${#READLINE_LINE}
+}
+bind -x '"%(key)s": __bcopilot_widget'
+"""
+
+ZSH_TEMPLATE = r"""# Bash-Copilot shell 集成 (zsh)
+zmodload zsh/net/socket 2>/dev/null
+typeset -g __bcopilot_fd='' __bcopilot_query=''
+
+__bcopilot_cancel() {
+    [[ -n $__bcopilot_fd ]] || return 0
+    zle -F $__bcopilot_fd 2>/dev/null
+    exec {__bcopilot_fd}<&-
+    __bcopilot_fd=''
+    # 通知后台进程放弃这个请求
+    if (( $+builtins[zsocket] )) && zsocket %(socket)s 2>/dev/null; then
+        print -u $REPLY -r -- '{"op": "cancel", "client": "'$$'"}'
+        exec {REPLY}>&-
+    else
+        %(python)s -S %(client)s %(socket)s cancel $$ >/dev/null 2>&1 &!
+    fi
+}
+
+__bcopilot_widget() {
+    __bcopilot_cancel
+    [[ -n ${BUFFER//[[:space:]]/} ]] || return 0
+    __bcopilot_query=$BUFFER
+    exec {__bcopilot_fd}< <(%(python)s -S %(client)s %(socket)s generate $$ "$PWD" "$BUFFER" 2>/dev/null)
+    zle -F -w $__bcopilot_fd __bcopilot_ready
+    zle -M 'bcopilot: 正在生成...'
+}
+
+__bcopilot_ready() {
+    local fd=$1 result
+    zle -F $fd
+    IFS= read -r -d '' -u $fd result
+    exec {fd}<&-
+    __bcopilot_fd=''
+    # 等待期间输入行被修改时丢弃结果
+    if [[ -n $result && $BUFFER == "$__bcopilot_query" ]]; then
+        BUFFER=$result
+        CURSOR=$#BUFFER
+    fi
+    zle -M ''
+}
+
+__bcopilot_check() {
+    [[ -n $__bcopilot_fd && $BUFFER != "$__bcopilot_query" ]] && __bcopilot_cancel
+    return 0
+}
+
+zle -N __bcopilot_widget
+zle -N __bcopilot_ready
+zle -N __bcopilot_check
+zle -N __bcopilot_cancel
+autoload -Uz add-zle-hook-widget
+add-zle-hook-widget line-pre-redraw __bcopilot_check
+add-zle-hook-widget line-finish __bcopilot_cancel
+bindkey '%(key)s' __bcopilot_widget
+"""
+
+TEMPLATES = {"bash": BASH_TEMPLATE, "zsh": ZSH_TEMPLATE}
+
+def client_path() -> str:
+    """
+    获取轻量客户端脚本的路径
+
+    Returns:
+        str: client.py 的绝对路径
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "client.py")
+
+def render_shell_init(shell: str, socket_path: str, key: Optional[str] = None) -> str:
+    """
+    生成 shell 集成脚本
+
+    Args:
+        shell (str): bash 或 zsh
+        socket_path (str): 后台进程的Unix套接字
+        key (str, optional): 快捷键，使用对应 shell 的写法，默认 Ctrl-G
+
+    Returns:
+        str: 可以 eval 的脚本
+
+    Raises:
+        ValueError: 不支持的 shell
+    """
+    if shell not in TEMPLATES:
+        raise ValueError(f"不支持的 shell '{shell}'，可选: {', '.join(sorted(TEMPLATES))}")
+    key = key or DEFAULT_KEYS[shell]
+    if "'" in key:
+        raise ValueError(f"无效的快捷键 '{key}'")
+    return TEMPLATES[shell] % {
+        "python": shlex.quote(sys.executable),
+        "client": shlex.quote(client_path()),
+        "socket": shlex.quote(socket_path),
+        "key": key
+    }
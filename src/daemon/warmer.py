@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+空闲时预热回答缓存
+
+后台进程空闲一段时间后，从历史记录中找出最常用、最近用过的命令查询
+（按查询和目录分组，出现次数按时间衰减加权），对回答缓存中没有、已过期或即将过期的
+查询重新生成并写入缓存。第二天早上常用的查询因此直接命中缓存。
+
+- 预热请求以 batch 优先级经过调度器（见 utils/scheduler.py），遵守提供商的速率限制，
+  用户的请求到达时排在预热请求之前；检测到新的用户请求后本轮预热立即停止
+- 每个提供商每天最多使用 warm_tokens_per_day 个token（默认 WARM_TOKENS_PER_DAY），
+  用量保存在 cache/warmer.json 中，后台进程重启后继续累计
+- 预热结果不写入历史记录，不影响之后的频率统计
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from config.constants import WARM_STATE_FILE, WARM_TOKENS_PER_DAY
+from src.log.history_store import HistoryStore
+
+# 后台进程没有请求多少秒后开始预热
+WARM_IDLE_SECONDS = 120.0
+
+# 两轮预热之间的最短间隔秒数
+WARM_INTERVAL = 1800.0
+
+# 检查是否空闲的间隔秒数
+WARM_POLL_INTERVAL = 10.0
+
+# 统计频率时读取的历史记录天数
+WARM_HISTORY_DAYS = 30
+
+# 出现次数按该天数减半加权，最近的查询排在前面
+WARM_HALF_LIFE_DAYS = 7.0
+
+# 至少出现过这么多次的查询才预热
+WARM_MIN_COUNT = 2
+
+# 每轮最多检查的查询数
+WARM_MAX_CANDIDATES = 200
+
+# 缓存的回答保存时间超过存活时间的该比例时提前刷新
+WARM_REFRESH_FRACTION = 0.8
+
+# 历史记录中没有token用量时每个查询的估计token数
+WARM_DEFAULT_TOKENS = 800
+
+# 预热请求在调度器中的客户端标识
+WARM_CLIENT = "warmer"
+
+def normalize_query(query: str) -> str:
+    """规范化空白字符，与回答缓存键的规范化方式相同"""
+    return re.sub(r"\s+", " ", query.strip())
+
+def rank_queries(store: HistoryStore, now: Optional[float] = None,
+                 days: float = WARM_HISTORY_DAYS, half_life_days: float = WARM_HALF_LIFE_DAYS,
+                 min_count: int = WARM_MIN_COUNT,
+                 limit: int = WARM_MAX_CANDIDATES) -> List[Dict[str, Any]]:
+    """
+    按频率和最近使用时间排列历史记录中的命令查询
+
+    不按模型筛选：预热时用后台进程当前的提供商生成回答（与回答缓存键一致），
+    而历史记录中是实际回答的模型，级联生成时为各级的模型
+
+    Args:
+        store (HistoryStore): 历史记录存储
+        now (float, optional): 当前时间
+        days (float): 统计最近多少天的记录
+        half_life_days (float): 出现次数的权重减半所需的天数
+        min_count (int): 最少出现次数
+        limit (int): 返回的最大查询数
+
+    Returns:
+        List[Dict[str, Any]]: 按得分从高到低排列的查询，每项包含 query（最近一次的原文）、
+            cwd、count、score、last（最近一次的时间）和 tokens（平均token用量，没有记录时为None）
+    """
+    now = time.time() if now is None else now
+    half_life = half_life_days * 86400
+    groups = {}  # type: Dict[tuple, Dict[str, Any]]
+    for entry in store.iter_entries(mode="command", since=now - days * 86400):
+        query = normalize_query(entry["query"])
+        if not query:
+            continue
+        key = (query, entry.get("cwd") or "")
+        group = groups.setdefault(key, {"query": entry["query"], "cwd": key[1], "count": 0,
+                                        "score": 0.0, "last": 0.0, "token_total": 0, "token_count": 0})
+        group["count"] += 1
+        group["score"] += 0.5 ** (max(0.0, now - entry["timestamp"]) / half_life)
+        if entry["timestamp"] >= group["last"]:
+            group["last"], group["query"] = entry["timestamp"], entry["query"]
+        tokens = (entry.get("prompt_tokens") or 0) + (entry.get("completion_tokens") or 0)
+        if tokens:
+            group["token_total"] += tokens
+            group["token_count"] += 1
+
+    ranked = []
+    for group in groups.values():
+        if group["count"] < min_count:
+            continue
+        token_total, token_count = group.pop("token_total"), group.pop("token_count")
+        group["tokens"] = token_total // token_count if token_count else None
+        ranked.append(group)
+    ranked.sort(key=lambda group: (-group["score"], -group["last"]))
+    return ranked[:limit]
+
+class WarmBudget:
+    """
+    每个提供商每天的预热token用量，保存在文件中
+
+    Args:
+        path (str): 状态文件
+    """
+
+    def __init__(self, path: str = WARM_STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _load(self, day: str) -> Dict[str, int]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(state, dict) or state.get("day") != day:
+            return {}
+        return dict(state.get("tokens") or {})
+
+    def spent(self, provider_key: str, now: Optional[float] = None) -> int:
+        """
+        今天已经使用的token数
+
+        Args:
+            provider_key (str): 提供商标识（端点和模型）
+            now (float, optional): 当前时间
+
+        Returns:
+            int: token数
+        """
+        with self.lock:
+            return int(self._load(time.strftime("%Y-%m-%d", time.localtime(now))).get(provider_key, 0))
+
+    def spend(self, provider_key: str, tokens: int, now: Optional[float] = None) -> int:
+        """
+        记录一次预热的token用量
+
+        Returns:
+            int: 今天累计的token数
+        """
+        day = time.strftime("%Y-%m-%d", time.localtime(now))
+        with self.lock:
+            spent = self._load(day)
+            spent[provider_key] = int(spent.get(provider_key, 0)) + int(tokens)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"day": day, "tokens": spent}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            return spent[provider_key]
+
+class CacheWarmer:
+    """
+    在后台进程空闲时预热回答缓存的线程
+
+    Args:
+        copilot: 后台进程（CopilotDaemon），提供 provider_config、idle_for、cached_age 和 refresh
+        store (HistoryStore, optional): 历史记录存储
+        budget (WarmBudget, optional): token用量记录
+        idle_seconds (float): 没有请求多少秒后开始预热
+        interval (float): 两轮预热之间的最短间隔秒数
+        poll_interval (float): 检查是否空闲的间隔秒数
+    """
+
+    def __init__(self, copilot, store: Optional[HistoryStore] = None,
+                 budget: Optional[WarmBudget] = None,
+                 idle_seconds: float = WARM_IDLE_SECONDS,
+                 interval: float = WARM_INTERVAL,
+                 poll_interval: float = WARM_POLL_INTERVAL):
+        self.copilot = copilot
+        self.store = store
+        self.budget = budget or WarmBudget()
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.thread = None  # type: Optional[threading.Thread]
+        self.last_round = 0.0
+        self.stats = {"rounds": 0, "warmed": 0, "fresh": 0, "errors": 0, "tokens": 0,
+                      "budget_exhausted": False}
+
+    def start(self) -> None:
+        """启动预热线程"""
+        self.thread = threading.Thread(target=self.run, name="cache-warmer", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """停止预热线程，等待进行中的预热请求完成"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        """空闲且距上一轮足够久时执行一轮预热，直到调用 stop"""
+        while not self.stop_event.wait(self.poll_interval):
+            if time.time() - self.last_round < self.interval:
+                continue
+            if self.copilot.idle_for() < self.idle_seconds:
+                continue
+            try:
+                self.warm_round()
+            except Exception as e:
+                print(f"警告: 预热回答缓存失败: {str(e)}", flush=True)
+            self.last_round = time.time()
+
+    def daily_tokens(self, provider_config: Dict[str, Any]) -> int:
+        """提供商每天的预热token上限"""
+        return int(provider_config.get("warm_tokens_per_day", WARM_TOKENS_PER_DAY) or 0)
+
+    def warm_round(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        执行一轮预热
+
+        Args:
+            now (float, optional): 当前时间
+
+        Returns:
+            Dict[str, int]: 本轮的 candidates、warmed、fresh、errors 和 tokens
+        """
+        provider_config = self.copilot.provider_config()
+        provider_key = f"{provider_config.get('url')}|{provider_config.get('model')}"
+        limit = self.daily_tokens(provider_config)
+        result = {"candidates": 0, "warmed": 0, "fresh": 0, "errors": 0, "tokens": 0}
+        if limit <= 0:
+            return result
+        if self.store is None:
+            self.store = HistoryStore()
+        candidates = rank_queries(self.store, now)
+        result["candidates"] = len(candidates)
+        ttl = self.copilot.cache.ttl
+        self.stats["budget_exhausted"] = False
+
+        for candidate in candidates:
+            if self.stop_event.is_set() or self.copilot.idle_for() < self.idle_seconds:
+                # 用户重新开始使用，剩余的查询留到下一次空闲
+                break
+            age = self.copilot.cached_age(candidate["query"], candidate["cwd"], provider_config)
+            if age is not None and (ttl is None or age < ttl * WARM_REFRESH_FRACTION):
+                result["fresh"] += 1
+                continue
+            estimate = candidate["tokens"] or WARM_DEFAULT_TOKENS
+            if self.budget.spent(provider_key, now) + estimate > limit:
+                self.stats["budget_exhausted"] = True
+                break
+            success, usage = self.copilot.refresh(candidate["query"], candidate["cwd"], provider_config)
+            if success is None:
+                # 相同的请求正在进行，或调度器拒绝了预热请求
+                continue
+            tokens = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+            tokens = tokens or estimate
+            self.budget.spend(provider_key, tokens, now)
+            result["tokens"] += tokens
+            result["warmed" if success else "errors"] += 1
+
+        self.stats["rounds"] += 1
+        for name in ("warmed", "fresh", "errors", "tokens"):
+            self.stats[name] += result[name]
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """预热统计，包含今天已用和每天可用的token数"""
+        provider_config = self.copilot.provider_config()
+        provider_key = f"{provider_config.get('url')}|{provider_config.get('model')}"
+        return dict(self.stats, tokens_today=self.budget.spent(provider_key),
+                    tokens_per_day=self.daily_tokens(provider_config),
+                    last_round=self.last_round or None)
@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+"""
+团队共享的缓存网关模块包
+"""
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+团队共享的缓存网关
+
+OpenAI兼容的HTTP代理，供多台机器上的 bcopilot 共用。models.yaml 中提供商的 url
+改为指向网关即可:
+
+    http://gateway-host:8088/<提供商名>/chat/completions
+
+提供商名和上游地址默认取自网关所在机器的 models.yaml，也可以用 -upstream 指定。
+
+- 共享回复缓存: 上游地址和请求体（不含流式参数）都相同的成功回复直接返回
+- 合并进行中的相同请求: 同一时刻的多个相同请求只向上游发送一次，其余请求等待并共享结果
+- 每个上游一个长连接池（见 utils/http_client.py）
+- 向上游发送的请求按 X-Bcopilot-Priority 请求头的优先级类别和客户端公平排队，
+  按网关机器上该提供商的 rate_limit 放行，预计排队过久时返回429（见 utils/scheduler.py）
+- GET /metrics 返回请求数、缓存命中率、合并数、上游调用数、延迟分位数和各类别的排队时间
+
+客户端请求流式回复时，网关向上游发送普通请求，再以服务端事件(SSE)格式一次返回。
+客户端未带 Authorization 时使用网关所在机器上该提供商的API密钥（配置了多个密钥时
+按 utils/key_pool.py 分散到各个密钥上）。
+缓存在所有客户端之间共享，网关应只在可信网络中监听。
+"""
+
+import sys
+import json
+import time
+import signal
+import hashlib
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from config.constants import (
+    GATEWAY_HOST,
+    GATEWAY_PORT,
+    GATEWAY_CACHE_FILE,
+    GATEWAY_CACHE_MAX_BYTES,
+    GATEWAY_CACHE_TTL,
+    GATEWAY_UPSTREAM_TIMEOUT
+)
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import call_with_keys, extract_usage
+from src.utils.http_client import close_sessions, get_session
+from src.utils.key_pool import KeyPool, get_key_pool, request_tokens
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.result_cache import ResultCache
+from src.utils.scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, Scheduler, Ticket, percentile
+
+# 单个请求体的最大字节数
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# 计算延迟分位数时保留的最近请求数
+LATENCY_WINDOW = 1000
+
+# 转发给客户端的上游响应头
+FORWARDED_HEADERS = ("Retry-After",)
+
+# 不影响回复内容、不参与缓存键计算的请求字段
+STREAM_FIELDS = ("stream", "stream_options")
+
+# 客户端声明优先级类别（interactive、script 或 batch）和自身标识的请求头，
+# 未带标识时按客户端地址公平排队
+PRIORITY_HEADER = "X-Bcopilot-Priority"
+CLIENT_HEADER = "X-Bcopilot-Client"
+
+# 调度器拒绝请求时建议客户端重试的秒数
+REJECTED_RETRY_AFTER = 5
+
+def load_upstreams(model_manager: ModelManager) -> Dict[str, Dict[str, Any]]:
+    """
+    从 models.yaml 读取可以转发的提供商
+
+    Args:
+        model_manager (ModelManager): 模型配置管理器
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 提供商名到提供商配置（url 和密钥设置）的映射
+    """
+    upstreams = {}  # type: Dict[str, Dict[str, Any]]
+    for section in ("command", "script"):
+        for name, provider in (model_manager.config.get(section, {}).get("models") or {}).items():
+            upstreams.setdefault(name, dict(provider))
+    return upstreams
+
+def request_key(url: str, payload: Dict[str, Any]) -> str:
+    """
+    计算请求的缓存键
+
+    Args:
+        url (str): 上游地址
+        payload (Dict[str, Any]): 请求体（已去掉流式参数）
+
+    Returns:
+        str: 缓存键
+    """
+    key = json.dumps([url, payload], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def completion_to_sse(completion: Dict[str, Any], include_usage: bool = False) -> bytes:
+    """
+    把普通回复转换为服务端事件流
+
+    Args:
+        completion (Dict[str, Any]): chat.completion 格式的回复
+        include_usage (bool): 是否在末尾附带用量
+
+    Returns:
+        bytes: SSE 格式的响应体
+    """
+    events = []  # type: List[Dict[str, Any]]
+    choices = []
+    for index, choice in enumerate(completion.get("choices") or []):
+        message = choice.get("message") or {}
+        choices.append({"index": choice.get("index", index), "finish_reason": choice.get("finish_reason"),
+                        "delta": {"role": message.get("role", "assistant"),
+                                  "content": message.get("content") or ""}})
+    base = {"id": completion.get("id", "gateway"), "object": "chat.completion.chunk",
+            "model": completion.get("model")}
+    events.append(dict(base, choices=choices))
+    if include_usage and completion.get("usage"):
+        events.append(dict(base, choices=[], usage=completion["usage"]))
+    body = "".join(f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events)
+    return (body + "data: [DONE]\n\n").encode("utf-8")
+
+def error_body(message: str, status: int) -> bytes:
+    """OpenAI 格式的错误响应体"""
+    return json.dumps({"error": {"message": message, "code": status}}, ensure_ascii=False).encode("utf-8")
+
+class UpstreamReply:
+    """上游的回复"""
+
+    def __init__(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+class Flight:
+    """一次向上游的请求，相同请求共享"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = threading.Event()
+        self.reply = None  # type: Optional[UpstreamReply]
+        self.ticket = None  # type: Optional[Ticket]
+
+class Metrics:
+    """网关的计数和延迟统计"""
+
+    COUNTERS = ("requests", "cache_hits", "coalesced", "upstream_calls", "upstream_errors", "rejected")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # type: Deque[float]
+        self.upstream_latencies = deque(maxlen=LATENCY_WINDOW)  # type: Deque[float]
+
+    def count(self, name: str) -> None:
+        """计数加一"""
+        with self.lock:
+            self.counters[name] += 1
+
+    def observe(self, seconds: float, upstream: bool = False) -> None:
+        """记录一次请求（或上游调用）的耗时"""
+        with self.lock:
+            (self.upstream_latencies if upstream else self.latencies).append(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        当前统计
+
+        Returns:
+            Dict[str, Any]: 计数、命中率（缓存命中和合并的请求占比）和延迟分位数（毫秒）
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = list(self.latencies)
+            upstream = list(self.upstream_latencies)
+        requests_count = counters["requests"]
+        served = counters["cache_hits"] + counters["coalesced"]
+        snapshot = dict(counters)
+        snapshot["uptime"] = round(time.time() - self.started, 1)
+        snapshot["hit_rate"] = round(served / requests_count, 4) if requests_count else 0.0
+        for name, values in (("latency", latencies), ("upstream_latency", upstream)):
+            for label, fraction in (("p50", 0.5), ("p99", 0.99)):
+                value = percentile(values, fraction)
+                snapshot[f"{name}_{label}_ms"] = round(value, 1) if value is not None else None
+        return snapshot
+
+class Gateway:
+    """网关状态和请求处理"""
+
+    def __init__(self, upstreams: Dict[str, Dict[str, Any]],
+                 cache: Optional[ResultCache] = None,
+                 model_manager: Optional[ModelManager] = None,
+                 timeout: float = GATEWAY_UPSTREAM_TIMEOUT,
+                 weights: Optional[Dict[str, float]] = None):
+        self.upstreams = upstreams
+        self.cache = cache if cache is not None else ResultCache(
+            GATEWAY_CACHE_FILE, GATEWAY_CACHE_MAX_BYTES, GATEWAY_CACHE_TTL)
+        self.model_manager = model_manager or ModelManager()
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}  # type: Dict[str, Flight]
+        self.metrics = Metrics()
+        self.weights = weights
+        self.schedulers = {}  # type: Dict[str, Scheduler]
+
+    def key_pool(self, route: str) -> KeyPool:
+        """网关所在机器上该提供商的密钥池，客户端未带 Authorization 时使用"""
+        return get_key_pool(self.upstreams[route], self.model_manager)
+
+    def scheduler(self, route: str) -> Scheduler:
+        """
+        提供商的请求调度器，按网关机器上该提供商的 rate_limit 放行请求
+
+        Args:
+            route (str): 提供商名
+
+        Returns:
+            Scheduler: 该提供商的调度器
+        """
+        with self.lock:
+            if route not in self.schedulers:
+                limiter = get_rate_limiter(self.upstreams[route], len(self.key_pool(route)))
+                self.schedulers[route] = Scheduler(limiter, self.weights)
+            return self.schedulers[route]
+
+    def scheduler_usage(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各提供商调度器的排队情况
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 提供商名到 Scheduler.snapshot() 的映射
+        """
+        with self.lock:
+            schedulers = sorted(self.schedulers.items())
+        return {route: scheduler.snapshot() for route, scheduler in schedulers}
+
+    def key_usage(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        各提供商每个密钥的使用情况
+
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: 提供商名到 KeyPool.snapshot() 的映射
+        """
+        pools = ((route, self.key_pool(route)) for route in sorted(self.upstreams))
+        return {route: pool.snapshot() for route, pool in pools if len(pool)}
+
+    def handle_completion(self, route: str, body: bytes, headers: Dict[str, str],
+                          client: str = "") -> Tuple[UpstreamReply, str]:
+        """
+        处理一个 /chat/completions 请求
+
+        Args:
+            route (str): 提供商名
+            body (bytes): 请求体
+            headers (Dict[str, str]): 请求头
+            client (str): 客户端标识，请求头中没有 X-Bcopilot-Client 时使用
+
+        Returns:
+            Tuple[UpstreamReply, str]: (返回给客户端的回复, 来源: hit/miss/coalesced/error)
+        """
+        self.metrics.count("requests")
+        if route not in self.upstreams:
+            return UpstreamReply(404, error_body(f"未知的提供商: {route}", 404)), "error"
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是JSON对象")
+        except ValueError as e:
+            return UpstreamReply(400, error_body(f"无效的请求: {str(e)}", 400)), "error"
+        # 客户端未带 Authorization 时使用网关的密钥池
+        authorization = headers.get("Authorization") or None
+        if authorization is None and not len(self.key_pool(route)):
+            return UpstreamReply(401, error_body("缺少API密钥", 401)), "error"
+        priority = (headers.get(PRIORITY_HEADER) or DEFAULT_PRIORITY).strip().lower()
+        if priority not in PRIORITY_CLASSES:
+            return UpstreamReply(400, error_body(
+                f"{PRIORITY_HEADER} 必须是 {', '.join(PRIORITY_CLASSES)} 之一", 400)), "error"
+        client = headers.get(CLIENT_HEADER) or client
+
+        stream = bool(payload.get("stream"))
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+        for field in STREAM_FIELDS:
+            payload.pop(field, None)
+        key = request_key(self.upstreams[route]["url"], payload)
+        use_cache = "no-cache" not in headers.get("Cache-Control", "")
+
+        reply, source = None, "hit"
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                reply = UpstreamReply(200, cached.encode("utf-8"))
+        if reply is None:
+            reply, source = self.fetch(key, route, payload, authorization, use_cache, priority, client)
+
+        if source == "hit":
+            self.metrics.count("cache_hits")
+        elif source == "coalesced":
+            self.metrics.count("coalesced")
+        if stream and reply.status == 200:
+            try:
+                return UpstreamReply(200, completion_to_sse(json.loads(reply.body), include_usage),
+                                     {"Content-Type": "text/event-stream"}), source
+            except ValueError:
+                return UpstreamReply(502, error_body("上游返回了无效的JSON", 502)), "error"
+        return reply, source
+
+    def fetch(self, key: str, route: str, payload: Dict[str, Any], authorization: Optional[str],
+              use_cache: bool, priority: str = DEFAULT_PRIORITY,
+              client: str = "") -> Tuple[UpstreamReply, str]:
+        """
+        经过调度器向上游发送请求，相同的进行中请求只发送一次
+
+        合并到仍在排队的请求时，排队的请求提升到两者中较高的优先级类别。只有成功的回复
+        在合并的请求之间共享；失败可能只与发出请求的客户端的密钥有关（401、429等），
+        此时等待的请求用自己的 Authorization 单独发送。
+
+        Returns:
+            Tuple[UpstreamReply, str]: (上游回复, miss、coalesced 或 error)
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight(key)
+                self.flights[key] = flight
+        if not leader:
+            ticket = flight.ticket
+            if ticket is not None:
+                self.scheduler(route).promote(ticket, priority)
+            flight.done.wait()
+            if flight.reply is not None and flight.reply.status == 200:
+                return flight.reply, "coalesced"
+            return self.send(key, route, payload, authorization, priority, client)
+
+        try:
+            # 上一个相同请求可能在检查缓存之后、加入之前刚刚完成
+            cached = self.cache.get(key) if use_cache else None
+            if cached is not None:
+                flight.reply = UpstreamReply(200, cached.encode("utf-8"))
+                return flight.reply, "hit"
+            flight.reply, source = self.send(key, route, payload, authorization, priority,
+                                             client, flight)
+            return flight.reply, source
+        except Exception as e:
+            flight.reply = UpstreamReply(502, error_body(f"网关错误: {str(e)}", 502))
+            return flight.reply, "miss"
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+    def send(self, key: str, route: str, payload: Dict[str, Any], authorization: Optional[str],
+             priority: str = DEFAULT_PRIORITY, client: str = "", flight: Optional[Flight] = None) -> Tuple[UpstreamReply, str]:
+        """
+        经过调度器向上游发送一次请求，成功的回复写入缓存
+
+        Args:
+            flight (Flight, optional): 合并请求的记录，排队期间写入其 ticket，
+                供后来的相同请求提升优先级
+            其余参数与 fetch 相同
+
+        Returns:
+            Tuple[UpstreamReply, str]: (上游回复, miss 或 error)
+        """
+        try:
+            scheduler = self.scheduler(route)
+            accepted, ticket = scheduler.submit(priority, client, request_tokens(payload))
+            if not accepted:
+                self.metrics.count("rejected")
+                return UpstreamReply(429, error_body(f"网关繁忙: {ticket}", 429),
+                                     {"Retry-After": str(REJECTED_RETRY_AFTER)}), "error"
+            if flight is not None:
+                flight.ticket = ticket
+            if not ticket.wait():
+                return UpstreamReply(503, error_body("网关正在关闭", 503)), "error"
+            try:
+                reply = self.call_upstream(route, payload, authorization)
+            finally:
+                scheduler.done(ticket)
+            if reply.status == 200:
+                self.cache.put(key, reply.body.decode("utf-8"))
+            return reply, "miss"
+        except Exception as e:
+            return UpstreamReply(502, error_body(f"网关错误: {str(e)}", 502)), "miss"
+
+    def call_upstream(self, route: str, payload: Dict[str, Any],
+                      authorization: Optional[str]) -> UpstreamReply:
+        """
+        向上游发送请求，客户端未带 Authorization 时从密钥池选择密钥
+
+        Returns:
+            UpstreamReply: 上游回复，网络错误时为502
+        """
+        url = self.upstreams[route]["url"]
+        if authorization is not None:
+            return self.post(url, payload, {"Authorization": authorization}, {})
+        return call_with_keys(self.key_pool(route), {}, payload,
+                              lambda headers, usage: self.post(url, payload, headers, usage))
+
+    def post(self, url: str, payload: Dict[str, Any], headers: Dict[str, str],
+             usage: Dict[str, Any]) -> UpstreamReply:
+        """
+        通过长连接池发送一次请求
+
+        Args:
+            url (str): 上游地址
+            payload (Dict[str, Any]): 请求体
+            headers (Dict[str, str]): 包含 Authorization 的请求头
+            usage (Dict[str, Any]): 写入状态码、Retry-After 和token用量，供密钥池使用
+
+        Returns:
+            UpstreamReply: 上游回复，网络错误时为502
+        """
+        self.metrics.count("upstream_calls")
+        start = time.perf_counter()
+        try:
+            response = get_session(url).post(
+                url,
+                data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                headers=dict(headers, **{"Content-Type": "application/json"}),
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException as e:
+            self.metrics.count("upstream_errors")
+            return UpstreamReply(502, error_body(f"上游请求错误: {str(e)}", 502))
+        finally:
+            self.metrics.observe(time.perf_counter() - start, upstream=True)
+        usage["status"] = response.status_code
+        if response.status_code == 200:
+            try:
+                usage.update(extract_usage(response.json()))
+            except ValueError:
+                pass
+        else:
+            self.metrics.count("upstream_errors")
+            usage["retry_after"] = response.headers.get("Retry-After")
+        headers = {name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers}
+        headers["Content-Type"] = response.headers.get("Content-Type", "application/json")
+        return UpstreamReply(response.status_code, response.content, headers)
+
+    def close(self) -> None:
+        """释放资源"""
+        with self.lock:
+            schedulers = list(self.schedulers.values())
+        for scheduler in schedulers:
+            scheduler.close()
+        close_sessions()
+        self.cache.close()
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """处理网关的HTTP请求"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_reply(self, reply: UpstreamReply, source: Optional[str] = None) -> None:
+        """发送回复"""
+        self.send_response(reply.status)
+        headers = dict({"Content-Type": "application/json"}, **reply.headers)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if source is not None:
+            self.send_header("X-Bcopilot-Cache", source)
+        self.send_header("Content-Length", str(len(reply.body)))
+        self.end_headers()
+        self.wfile.write(reply.body)
+
+    def do_GET(self):
+        gateway = self.server.gateway
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/metrics":
+            body = gateway.metrics.snapshot()
+            body["keys"] = gateway.key_usage()
+            body["scheduler"] = gateway.scheduler_usage()
+        elif path == "/health":
+            body = {"ok": True, "upstreams": sorted(gateway.upstreams)}
+        else:
+            self.send_reply(UpstreamReply(404, error_body(f"未知路径: {self.path}", 404)))
+            return
+        self.send_reply(UpstreamReply(200, json.dumps(body, ensure_ascii=False).encode("utf-8")))
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_reply(UpstreamReply(413, error_body("请求体过大", 413)))
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+        # 路径形如 /<提供商名>/chat/completions 或 /<提供商名>/v1/chat/completions
+        segments = urlsplit(self.path).path.strip("/").split("/")
+        if len(segments) < 3 or segments[-2:] != ["chat", "completions"]:
+            self.send_reply(UpstreamReply(404, error_body(f"未知路径: {self.path}", 404)))
+            return
+        route = segments[0]
+        start = time.perf_counter()
+        reply, source = gateway.handle_completion(route, body, dict(self.headers.items()),
+                                                  self.client_address[0])
+        gateway.metrics.observe(time.perf_counter() - start)
+        try:
+            self.send_reply(reply, source)
+        except OSError:
+            # 客户端已断开
+            self.close_connection = True
+
+class GatewayServer(ThreadingHTTPServer):
+    """每个连接一个线程的HTTP服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], gateway: Gateway):
+        self.gateway = gateway
+        super().__init__(address, GatewayHandler)
+
+def run_gateway(host: str = GATEWAY_HOST, port: int = GATEWAY_PORT,
+                upstreams: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """
+    在前台运行网关，直到 Ctrl-C 或 SIGTERM
+
+    Args:
+        host (str): 监听地址
+        port (int): 监听端口
+        upstreams (Dict[str, Dict[str, Any]], optional): 额外或覆盖的上游
+    """
+    model_manager = ModelManager()
+    routes = load_upstreams(model_manager)
+    routes.update(upstreams or {})
+    gateway = Gateway(routes, model_manager=model_manager)
+    server = GatewayServer((host, port), gateway)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+        target=server.shutdown, daemon=True).start())
+    print(f"网关已启动: http://{host}:{server.server_port}", flush=True)
+    for name, upstream in sorted(routes.items()):
+        print(f"  http://{host}:{server.server_port}/{name}/chat/completions -> {upstream['url']}",
+              flush=True)
+    print(f"  统计: http://{host}:{server.server_port}/metrics", flush=True)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        gateway.close()
+        print("网关已退出", file=sys.stderr, flush=True)
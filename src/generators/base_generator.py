@@ -4,176 +4,635 @@ Base generator 模块 - 基础命令生成功能
 """
 
 import json
+import time
+import threading
 import requests
-from typing import Dict, Tuple, List, Optional
+from typing import Any, Callable, Dict, Tuple, List, Optional
 
 from config.prompts import (
-    SCRIPT_PROMPT_TEMPLATE,
-    COMMAND_PROMPT_TEMPLATE,
+    SCRIPT_SYSTEM_PROMPT,
+    COMMAND_SYSTEM_PROMPT,
+    ENVIRONMENT_CONTEXT_PROMPT,
+    FILE_CONTENT_HEADER,
     FILE_CONTENT_PROMPT,
+    SCRIPT_QUERY_PROMPT,
+    COMMAND_QUERY_PROMPT,
     SCRIPT_FILE_SUFFIX,
     COMMAND_FILE_SUFFIX
 )
 from src.config.model_manager import ModelManager
+from src.utils.complexity import is_likely_complex
+from src.utils.http_client import prewarm, prewarmed_session
+from src.utils.key_pool import KeyPool, get_key_pool, missing_key_message, request_tokens
+from src.utils.trace import tracer
 
-def generate_bash_command(query: str, context: Dict[str, str], 
-                          is_script: bool = False,
-                          file_contents: Optional[List[Tuple[str, str]]] = None) -> Tuple[bool, str]:
+# Anthropic 提示缓存标记
+CACHE_CONTROL_MARKER = {"type": "ephemeral"}
+
+# 流式请求被取消时返回的错误消息
+CANCELLED_MESSAGE = "请求已取消"
+
+# 换用其他密钥重试的状态码
+KEY_FAILURE_STATUSES = (401, 403, 429)
+
+# 暂时性失败的状态码，稍后重试可能成功
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+def is_retryable(usage: Dict[str, Any]) -> bool:
     """
-    通过API将自然语言查询转换为bash命令或脚本
+    判断失败的请求是否为暂时性失败
+
+    Args:
+        usage (Dict[str, Any]): call_with_keys 写入的调用信息
+
+    Returns:
+        bool: 限流、服务端错误，或请求已发出但没有收到响应（网络错误、超时）时为True
+    """
+    status = usage.get("status")
+    if status is None:
+        return "key" in usage
+    return status in RETRY_STATUSES
+
+def supports_cache_control(provider_config: Dict[str, Any]) -> bool:
+    """
+    判断提供商是否需要显式的 cache_control 缓存标记
+
+    OpenRouter 上的 Anthropic 模型需要显式标记缓存断点；
+    OpenAI 兼容的服务商（如硅基流动）会自动缓存相同的前缀，无需标记。
+    可在 models.yaml 中通过 prompt_cache 字段强制开启或关闭。
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+
+    Returns:
+        bool: 是否添加 cache_control 标记
+    """
+    if "prompt_cache" in provider_config:
+        return bool(provider_config["prompt_cache"])
+    return ("openrouter" in provider_config["url"]
+            and provider_config["model"].startswith("anthropic/"))
+
+def format_environment(context: Dict[str, str]) -> str:
+    """
+    生成环境上下文区块
+
+    Args:
+        context (Dict[str, str]): bash环境上下文
+
+    Returns:
+        str: 环境上下文提示词
+    """
+    return ENVIRONMENT_CONTEXT_PROMPT.format(
+        current_directory=context['current_directory'],
+        username=context['username'],
+        hostname=context['hostname'],
+        ubuntu_version=context['ubuntu_version']
+    )
+
+def build_context_blocks(context: Dict[str, str],
+                         file_contents: Optional[List[Tuple[str, str]]] = None) -> List[str]:
+    """
+    构建查询之前的区块: 环境上下文和文件内容
+
+    Args:
+        context (Dict[str, str]): bash环境上下文
+        file_contents (List[Tuple[str, str]], optional): 文件内容列表，每项为(文件名, 内容)的元组
+
+    Returns:
+        List[str]: [环境上下文, 文件内容...]
+    """
+    blocks = [format_environment(context)]
+
+    # 每个文件单独成块，内容不变的文件在多次调用间保持字节一致
+    if file_contents:
+        for index, (filename, content) in enumerate(file_contents):
+            block = FILE_CONTENT_PROMPT.format(filename=filename, content=content)
+            if index == 0:
+                block = FILE_CONTENT_HEADER + block
+            blocks.append(block)
+    return blocks
+
+def build_prompt_blocks(query: str, context: Dict[str, str], is_script: bool = False,
+                        file_contents: Optional[List[Tuple[str, str]]] = None) -> Tuple[str, List[str]]:
+    """
+    按变化频率从低到高构建提示词区块
 
     Args:
         query (str): 用户的自然语言查询
         context (Dict[str, str]): bash环境上下文
         is_script (bool): 是否生成脚本而不是单行命令
         file_contents (List[Tuple[str, str]], optional): 文件内容列表，每项为(文件名, 内容)的元组
-    
+
     Returns:
-        Tuple[bool, str]: (是否成功, 生成的bash命令或错误消息)
+        Tuple[str, List[str]]: (静态系统提示词, [环境上下文, 文件内容..., 查询])
     """
-    # 获取配置
-    model_manager = ModelManager()
-    
-    if is_script:
-        # 脚本生成
-        provider_config = model_manager.get_script_provider()
-        timeout = 120
-        print(f"正在使用 {provider_config['model']} 模型生成脚本，可能需要1-2分钟...")
-    else:
-        # 命令生成  
-        provider_config = model_manager.get_command_provider()
-        timeout = 30
-    
-    # 获取API密钥
-    api_key = model_manager.get_api_key(provider_config["key_file"])
-    if not api_key:
-        return False, f"未找到API密钥，请检查 {provider_config['key_file']}"
+    system_prompt = SCRIPT_SYSTEM_PROMPT if is_script else COMMAND_SYSTEM_PROMPT
 
-    # 构建提示词
+    blocks = build_context_blocks(context, file_contents)
+
+    file_suffix = ""
+    if file_contents:
+        file_suffix = SCRIPT_FILE_SUFFIX if is_script else COMMAND_FILE_SUFFIX
+
+    query_template = SCRIPT_QUERY_PROMPT if is_script else COMMAND_QUERY_PROMPT
+    blocks.append(query_template.format(query=query, file_suffix=file_suffix))
+
+    return system_prompt, blocks
+
+def build_messages(query: str, context: Dict[str, str], provider_config: Dict[str, Any],
+                   is_script: bool = False,
+                   file_contents: Optional[List[Tuple[str, str]]] = None) -> List[Dict[str, Any]]:
+    """
+    构建发送给API的消息列表
+
+    静态系统指令放在 system 消息中，环境上下文、文件内容和查询依次放在 user 消息中，
+    使多次调用共享尽可能长的相同前缀。
+
+    Args:
+        query (str): 用户的自然语言查询
+        context (Dict[str, str]): bash环境上下文
+        provider_config (Dict[str, Any]): 提供商配置
+        is_script (bool): 是否生成脚本而不是单行命令
+        file_contents (List[Tuple[str, str]], optional): 文件内容列表
+
+    Returns:
+        List[Dict[str, Any]]: 消息列表
+    """
+    system_prompt, blocks = build_prompt_blocks(query, context, is_script, file_contents)
+    return format_messages(system_prompt, blocks, provider_config)
+
+def format_messages(system_prompt: str, blocks: List[str],
+                    provider_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    将系统提示词和user区块转换为提供商所需的消息格式
+
+    Args:
+        system_prompt (str): 静态系统提示词
+        blocks (List[str]): 按变化频率从低到高排列的user区块，最后一块为每次变化的内容
+        provider_config (Dict[str, Any]): 提供商配置
+
+    Returns:
+        List[Dict[str, Any]]: 消息列表
+    """
+    if "openrouter" not in provider_config["url"]:
+        # 标准OpenAI兼容格式，依赖服务商的自动前缀缓存
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "\n".join(blocks)}
+        ]
+
+    # OpenRouter使用Claude格式
+    system_content = [{"type": "text", "text": system_prompt}]
+    user_content = [{"type": "text", "text": block} for block in blocks]
+
+    if supports_cache_control(provider_config):
+        # 缓存断点: 静态指令末尾，以及查询之前的最后一个区块（环境或文件内容）
+        system_content[-1]["cache_control"] = dict(CACHE_CONTROL_MARKER)
+        user_content[-2]["cache_control"] = dict(CACHE_CONTROL_MARKER)
+
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_content}
+    ]
+
+def extract_usage(result: Dict[str, Any]) -> Dict[str, int]:
+    """
+    从API响应中提取token用量和提示缓存命中情况
+
+    兼容 OpenAI/OpenRouter 的 prompt_tokens_details.cached_tokens、
+    DeepSeek/硅基流动的 prompt_cache_hit_tokens 以及 Anthropic 的 cache_read_input_tokens。
+
+    Args:
+        result (Dict[str, Any]): API响应
+
+    Returns:
+        Dict[str, int]: 包含 prompt_tokens、completion_tokens、cached_tokens 的字典，
+            服务商未返回缓存信息时不包含 cached_tokens
+    """
+    usage = result.get("usage") or {}
+    stats = {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0)
+    }
+
+    details = usage.get("prompt_tokens_details") or {}
+    for cached in (details.get("cached_tokens"),
+                   usage.get("prompt_cache_hit_tokens"),
+                   usage.get("cache_read_input_tokens")):
+        if cached is not None:
+            stats["cached_tokens"] = int(cached)
+            break
+
+    return stats
+
+def report_cache_usage(stats: Dict[str, int]) -> None:
+    """
+    输出提示缓存命中率
+
+    Args:
+        stats (Dict[str, int]): extract_usage 返回的用量信息
+    """
+    if "cached_tokens" not in stats or not stats["prompt_tokens"]:
+        return
+    rate = stats["cached_tokens"] / stats["prompt_tokens"]
+    print(f"提示缓存命中: {stats['cached_tokens']}/{stats['prompt_tokens']} tokens ({rate:.0%})")
+
+def get_provider_config(model_manager: ModelManager, is_script: bool = False) -> Dict[str, Any]:
+    """
+    获取当前模式使用的提供商配置
+
+    Args:
+        model_manager (ModelManager): 模型配置管理器
+        is_script (bool): 是否为脚本模式
+
+    Returns:
+        Dict[str, Any]: 提供商配置
+    """
     if is_script:
-        # 使用脚本生成提示词模板
-        prompt_text = SCRIPT_PROMPT_TEMPLATE.format(
-            query=query,
-            current_directory=context['current_directory'],
-            username=context['username'],
-            hostname=context['hostname'],
-            ubuntu_version=context['ubuntu_version']
-        )
-        
-        # 添加文件内容（如果有）
-        if file_contents:
-            prompt_text += "\n相关文件内容:\n"
-            for filename, content in file_contents:
-                prompt_text += FILE_CONTENT_PROMPT.format(
-                    filename=filename,
-                    content=content
-                )
-            prompt_text += SCRIPT_FILE_SUFFIX
+        return model_manager.get_script_provider()
+    return model_manager.get_command_provider()
+
+def prewarm_providers(model_manager: ModelManager, is_script: bool = False,
+                      query: Optional[str] = None) -> None:
+    """
+    在后台预先建立到本次查询可能使用的提供商的连接
+
+    包括当前模式级联路由中的所有提供商；命令模式下可能复杂的查询会同时请求脚本
+    （见 generators/escalation.py），因此也连接脚本提供商。
+
+    Args:
+        model_manager (ModelManager): 模型配置管理器
+        is_script (bool): 是否为脚本模式
+        query (str, optional): 用户查询
+    """
+    modes = ["script"] if is_script else ["command"]
+    if not is_script and query and is_likely_complex(query):
+        modes.append("script")
+    for mode in modes:
+        for _, provider_config in model_manager.get_cascade(mode):
+            prewarm(provider_config["url"])
+
+def build_request(provider_config: Dict[str, Any], api_key: str,
+                  messages: List[Dict[str, Any]], is_script: bool = False,
+                  max_tokens: Optional[int] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    构建请求头和请求体
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        api_key (str): API密钥
+        messages (List[Dict[str, Any]]): 消息列表
+        is_script (bool): 是否为脚本模式
+        max_tokens (int, optional): 回复的最大token数，默认按模式决定
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, Any]]: (请求头, 请求体)
+    """
+    # 处理特殊提供商: OpenRouter
+    if "openrouter" in provider_config["url"]:
+        # OpenRouter请求头
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+            "HTTP-Referer": "https://bash-copilot.local",
+            "X-Title": "Bash-Copilot"
+        }
+
+        payload = {
+            "model": provider_config["model"],
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": 4000,
+            "usage": {"include": True}
+        }
+
     else:
-        # 使用命令生成提示词模板
-        prompt_text = COMMAND_PROMPT_TEMPLATE.format(
-            query=query,
-            current_directory=context['current_directory'],
-            username=context['username'],
-            hostname=context['hostname'],
-            ubuntu_version=context['ubuntu_version']
-        )
-        
-        # 添加文件内容（如果有）
-        if file_contents:
-            prompt_text += "\n相关文件内容:\n"
-            for filename, content in file_contents:
-                prompt_text += FILE_CONTENT_PROMPT.format(
-                    filename=filename,
-                    content=content
-                )
-            prompt_text += COMMAND_FILE_SUFFIX
+        # 标准OpenAI兼容格式
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        payload = {
+            "model": provider_config["model"],
+            "messages": messages,
+            "temperature": 0.1 if not is_script else 0.2,
+            "max_tokens": 200 if not is_script else 4000
+        }
+
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+
+    return headers, payload
 
+def format_api_error(response: requests.Response) -> str:
+    """
+    生成非200响应的错误消息
+
+    Args:
+        response (requests.Response): API响应
+
+    Returns:
+        str: 错误消息
+    """
+    try:
+        error_detail = response.json()
+        error_message = error_detail.get("error", {}).get("message", "未知错误")
+        return f"API错误 ({response.status_code}): {error_message}"
+    except:
+        return f"API错误 ({response.status_code}): {response.text}"
+
+def record_status(response: requests.Response, usage: Optional[Dict[str, Any]]) -> None:
+    """把响应状态码和 Retry-After 写入 usage，供密钥池判断密钥是否需要暂停使用"""
+    if usage is None:
+        return
+    usage["status"] = response.status_code
+    if response.status_code != 200 and response.headers.get("Retry-After"):
+        usage["retry_after"] = response.headers["Retry-After"]
+
+def call_with_keys(pool: KeyPool, headers: Dict[str, str], payload: Dict[str, Any],
+                   call: Callable[[Dict[str, str], Dict[str, Any]], Any],
+                   usage: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    使用密钥池中在途token数最少的密钥发送请求
+
+    密钥返回429或401/403时暂停使用该密钥，并换用其他可用的密钥重试。
+
+    Args:
+        pool (KeyPool): 提供商的密钥池，不能为空
+        headers (Dict[str, str]): 请求头，Authorization 会替换为所选的密钥
+        payload (Dict[str, Any]): 请求体，用于估计占用的token数
+        call (Callable): 接收请求头和用量字典并发送请求，需要在用量字典中写入 status
+            （见 record_status），通常返回 (是否成功, 回复或错误消息)
+        usage (Dict[str, Any], optional): 如果提供，将写入最后一次请求的用量和所用密钥的标签
+
+    Returns:
+        Any: 最后一次 call 的返回值
+    """
+    tokens = request_tokens(payload)
+    tried = []  # type: List[str]
+    lease = pool.acquire(tokens)
+    while True:
+        call_usage = {}  # type: Dict[str, Any]
+        try:
+            result = call(dict(headers, Authorization=f"Bearer {lease.value}"), call_usage)
+        finally:
+            lease.release(call_usage)
+        tried.append(lease.label)
+        if usage is not None:
+            usage.update(call_usage)
+            usage["key"] = lease.label
+        if call_usage.get("status") not in KEY_FAILURE_STATUSES:
+            return result
+        lease = pool.acquire(tokens, exclude=tried, cooling=False)
+        if lease is None:
+            return result
+
+def reply_content(result: Dict[str, Any]) -> Optional[str]:
+    """
+    从聊天接口的响应中提取模型回复
+
+    Args:
+        result (Dict[str, Any]): API响应
+
+    Returns:
+        Optional[str]: 去掉首尾空白的回复，响应中没有回复时返回None
+    """
+    if "choices" not in result or len(result["choices"]) == 0:
+        return None
+    content = result["choices"][0]["message"]["content"]
+
+    # 如果内容是列表格式（Claude 3.7 特殊格式），需要提取文本
+    if isinstance(content, list):
+        text_parts = []
+        for item in content:
+            if item.get("type") == "text":
+                text_parts.append(item.get("text", ""))
+        content = "".join(text_parts)
+
+    return content.strip()
+
+def send_request(provider_config: Dict[str, Any], headers: Dict[str, str], payload: Dict[str, Any],
+                 timeout: float, usage: Optional[Dict[str, int]] = None,
+                 report_cache: bool = True,
+                 session: Optional[requests.Session] = None) -> Tuple[bool, str]:
+    """
+    发送请求并解析模型回复
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        headers (Dict[str, str]): 请求头
+        payload (Dict[str, Any]): 请求体
+        timeout (float): 超时秒数
+        usage (Dict[str, int], optional): 如果提供，将写入本次调用的token用量和缓存命中情况
+        report_cache (bool): 是否输出提示缓存命中率
+        session (requests.Session, optional): 复用连接的会话，未提供时每次新建连接
+
+    Returns:
+        Tuple[bool, str]: (是否成功, 模型回复或错误消息)
+    """
     try:
-        # 处理特殊提供商: OpenRouter
-        if "openrouter" in provider_config["url"]:
-            # OpenRouter请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-                "HTTP-Referer": "https://bash-copilot.local",
-                "X-Title": "Bash-Copilot"
-            }
-            
-            # OpenRouter使用Claude格式
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt_text
-                        }
-                    ]
-                }
-            ]
-            
-            payload = {
-                "model": provider_config["model"],
-                "messages": messages,
-                "temperature": 0.2,
-                "max_tokens": 4000
-            }
-            
-        else:
-            # 标准OpenAI兼容格式
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            messages = [{"role": "user", "content": prompt_text}]
-            
-            payload = {
-                "model": provider_config["model"],
-                "messages": messages,
-                "temperature": 0.1 if not is_script else 0.2,
-                "max_tokens": 200 if not is_script else 4000
-            }
-        
         # 发送请求
-        response = requests.post(
+        post = session.post if session is not None else requests.post
+        response = post(
             url=provider_config["url"],
             headers=headers,
             json=payload,
             timeout=timeout
         )
-    
+
+        record_status(response, usage)
+
         # 检查响应状态
         if response.status_code != 200:
-            try:
-                error_detail = response.json()
-                error_message = error_detail.get("error", {}).get("message", "未知错误")
-                return False, f"API错误 ({response.status_code}): {error_message}"
-            except:
-                return False, f"API错误 ({response.status_code}): {response.text}"
-    
+            return False, format_api_error(response)
+
         # 处理成功响应
         result = response.json()
-    
-        if "choices" in result and len(result["choices"]) > 0:
-            content = result["choices"][0]["message"]["content"]
-        
-            # 如果内容是列表格式（Claude 3.7 特殊格式），需要提取文本
-            if isinstance(content, list):
-                text_parts = []
-                for item in content:
-                    if item.get("type") == "text":
-                        text_parts.append(item.get("text", ""))
-                content = "".join(text_parts)
-        
-            return True, content.strip()
-        else:
+
+        # 记录token用量和提示缓存命中率
+        stats = extract_usage(result)
+        if usage is not None:
+            usage.update(stats)
+        if report_cache:
+            report_cache_usage(stats)
+
+        content = reply_content(result)
+        if content is None:
             return False, "API响应格式不正确"
-        
+        return True, content
+
     except requests.exceptions.RequestException as e:
         return False, f"API请求错误: {str(e)}"
     except json.JSONDecodeError:
         return False, f"无法解析API响应: {response.text if 'response' in locals() else '未知响应'}"
     except Exception as e:
         return False, f"未知错误: {str(e)}"
+
+def stream_request(provider_config: Dict[str, Any], headers: Dict[str, str],
+                   payload: Dict[str, Any], timeout: float,
+                   usage: Optional[Dict[str, int]] = None,
+                   session: Optional[requests.Session] = None,
+                   cancel: Optional[threading.Event] = None,
+                   on_text: Optional[Callable[[str], bool]] = None) -> Tuple[bool, str]:
+    """
+    以流式方式发送请求，边接收边拼接模型回复
+
+    每收到一段内容都会检查 cancel，被取消时立即关闭连接，服务商随之停止生成，
+    剩余的输出不再计费。
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        headers (Dict[str, str]): 请求头
+        payload (Dict[str, Any]): 请求体，会加上流式参数
+        timeout (float): 连接和两段内容之间的超时秒数
+        usage (Dict[str, int], optional): 如果提供，将写入服务商在流末尾返回的token用量
+        session (requests.Session, optional): 复用连接的会话
+        cancel (threading.Event, optional): 设置后放弃请求
+        on_text (Callable[[str], bool], optional): 接收目前为止的完整回复，返回True时提前结束
+
+    Returns:
+        Tuple[bool, str]: (是否成功, 模型回复或错误消息)，提前结束时回复只包含已收到的部分
+    """
+    payload = dict(payload, stream=True)
+    if "openrouter" not in provider_config["url"]:
+        # OpenAI兼容的服务商只有在请求时才在流末尾返回用量
+        payload["stream_options"] = {"include_usage": True}
+
+    post = session.post if session is not None else requests.post
+    parts = []  # type: List[str]
+    try:
+        response = post(
+            url=provider_config["url"],
+            headers=headers,
+            json=payload,
+            timeout=timeout,
+            stream=True
+        )
+        with response:
+            record_status(response, usage)
+            if response.status_code != 200:
+                return False, format_api_error(response)
+            for line in response.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    return False, CANCELLED_MESSAGE
+                # 服务端事件格式: "data: {...}"，其余行（注释、心跳）忽略
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage") and usage is not None:
+                    usage.update(extract_usage(chunk))
+                delta = "".join((choice.get("delta") or {}).get("content") or ""
+                                for choice in chunk.get("choices") or [])
+                if delta:
+                    parts.append(delta)
+                    if on_text is not None and on_text("".join(parts)):
+                        break
+    except requests.exceptions.RequestException as e:
+        if cancel is not None and cancel.is_set():
+            return False, CANCELLED_MESSAGE
+        return False, f"API请求错误: {str(e)}"
+    except (json.JSONDecodeError, AttributeError):
+        return False, "无法解析API流式响应"
+
+    if cancel is not None and cancel.is_set():
+        return False, CANCELLED_MESSAGE
+    return True, "".join(parts).strip()
+
+def request_generation(provider_config: Dict[str, Any], query: str, context: Dict[str, str],
+                       is_script: bool = False,
+                       file_contents: Optional[List[Tuple[str, str]]] = None,
+                       usage: Optional[Dict[str, Any]] = None,
+                       model_manager: Optional[ModelManager] = None,
+                       session: Optional[requests.Session] = None,
+                       conversation: Optional[Any] = None,
+                       provider_name: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    使用指定的提供商生成一次命令或脚本
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        provider_name (str, optional): 提供商名称，写入 usage
+        其余参数与 generate_bash_command 相同
+
+    Returns:
+        Tuple[bool, str]: (是否成功, 生成的bash命令或错误消息)
+    """
+    model_manager = model_manager or ModelManager()
+
+    if is_script:
+        # 脚本生成
+        timeout = 120
+        print(f"正在使用 {provider_config['model']} 模型生成脚本，可能需要1-2分钟...")
+    else:
+        # 命令生成
+        timeout = 30
+
+    # 获取API密钥
+    keys = get_key_pool(provider_config, model_manager)
+    if not len(keys):
+        return False, missing_key_message(provider_config)
+
+    # 构建提示词
+    if conversation is not None:
+        messages = conversation.build_messages(query, provider_config, is_script)
+    else:
+        messages = build_messages(query, context, provider_config, is_script, file_contents)
+    headers, payload = build_request(provider_config, "", messages, is_script)
+
+    if session is None:
+        # 已经预连接时使用预先建立的连接
+        session = prewarmed_session(provider_config["url"])
+
+    start = time.time()
+    with tracer.span(f"request {provider_config['model']}"):
+        result = call_with_keys(keys, headers, payload, lambda key_headers, call_usage: send_request(
+            provider_config, key_headers, payload, timeout, call_usage, session=session), usage)
+    if usage is not None:
+        usage["provider"] = provider_name
+        usage["model"] = provider_config["model"]
+        usage["latency_ms"] = int((time.time() - start) * 1000)
+    return result
+
+def generate_bash_command(query: str, context: Dict[str, str],
+                          is_script: bool = False,
+                          file_contents: Optional[List[Tuple[str, str]]] = None,
+                          usage: Optional[Dict[str, Any]] = None,
+                          model_manager: Optional[ModelManager] = None,
+                          session: Optional[requests.Session] = None,
+                          conversation: Optional[Any] = None) -> Tuple[bool, str]:
+    """
+    通过API将自然语言查询转换为bash命令或脚本
+
+    当前模式配置了级联路由（models.yaml 中的 cascade）时，从合适的层级开始，
+    输出未通过本地检查时改用更强的模型（见 generators/cascade.py）。
+
+    Args:
+        query (str): 用户的自然语言查询
+        context (Dict[str, str]): bash环境上下文
+        is_script (bool): 是否生成脚本而不是单行命令
+        file_contents (List[Tuple[str, str]], optional): 文件内容列表，每项为(文件名, 内容)的元组
+        usage (Dict[str, Any], optional): 如果提供，将写入本次调用的提供商、模型、耗时、
+            token用量和缓存命中情况
+        model_manager (ModelManager, optional): 已加载的模型配置，未提供时重新加载
+        session (requests.Session, optional): 复用连接的会话
+        conversation (Conversation, optional): 多轮对话，提供时在之前的对话基础上生成
+
+    Returns:
+        Tuple[bool, str]: (是否成功, 生成的bash命令或错误消息)
+    """
+    # 获取配置
+    model_manager = model_manager or ModelManager()
+    section = "script" if is_script else "command"
+    if len(model_manager.get_cascade(section)) > 1:
+        from src.generators.cascade import generate_with_cascade
+        return generate_with_cascade(query, context, is_script, file_contents, usage,
+                                     model_manager, session, conversation)
+
+    provider_config = get_provider_config(model_manager, is_script)
+    return request_generation(provider_config, query, context, is_script, file_contents, usage,
+                              model_manager, session, conversation,
+                              provider_name=model_manager.config.get(section, {}).get("provider"))
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+提供商批处理任务 - 离线回答大量命令查询
+
+夜间任务等不需要交互延迟的大批量查询使用 OpenAI 风格的批处理接口（/v1/files 和
+/v1/batches）：每个查询写成输入文件中的一行请求，上传后创建批处理，提供商在完成窗口
+（24小时）内处理，价格通常是实时请求的一半。
+
+任务的本地记录保存在 cache/batches/<任务名>.json 中，包括查询列表、提供商、所用密钥的
+标签（批处理只能用创建它的账号查询）和每个批处理的状态，提交、查询状态和收集结果
+可以在不同的进程中完成。
+"""
+
+import os
+import json
+import time
+import tempfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from config.constants import BATCH_JOB_DIR
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    build_messages,
+    build_request,
+    extract_usage,
+    format_api_error,
+    record_status,
+    reply_content
+)
+from src.utils.http_client import get_session
+from src.utils.key_pool import missing_key_message, parse_retry_after, provider_keys
+
+# 批处理的完成窗口
+BATCH_COMPLETION_WINDOW = "24h"
+
+# 每个批处理最多包含的请求数（OpenAI 的上限为50000）
+MAX_BATCH_REQUESTS = 50000
+
+# 每个输入文件的大小上限（OpenAI 的上限为200MB）
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+
+# 上传和下载文件的超时秒数
+BATCH_FILE_TIMEOUT = 300
+
+# 查询批处理状态的超时秒数
+BATCH_STATUS_TIMEOUT = 30
+
+# 轮询间隔: 初始秒数、没有进展时的增长倍数和上限秒数
+POLL_INITIAL_INTERVAL = 10.0
+POLL_BACKOFF = 1.5
+POLL_MAX_INTERVAL = 600.0
+
+# 已结束的批处理状态
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# 输入文件中每个请求的 custom_id 前缀，后接查询序号
+CUSTOM_ID_PREFIX = "q-"
+
+# 任务记录中保存的密钥配置，用于重新找到提交时使用的密钥
+KEY_CONFIG_FIELDS = ("key_file", "key_files", "key_env")
+
+def batch_base_url(provider_config: Dict[str, Any]) -> Optional[str]:
+    """
+    获取提供商批处理接口的基础地址
+
+    默认由聊天接口地址去掉 /chat/completions 得到，也可以在 models.yaml 中用 batch_url 指定。
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+
+    Returns:
+        Optional[str]: 形如 "https://api.openai.com/v1" 的地址，无法推断时返回None
+    """
+    if provider_config.get("batch_url"):
+        return provider_config["batch_url"].rstrip("/")
+    url = provider_config["url"].rstrip("/")
+    if not url.endswith("/chat/completions"):
+        return None
+    return url[:-len("/chat/completions")]
+
+def batch_line(index: int, query: str, context: Dict[str, str], provider_config: Dict[str, Any],
+               endpoint: str, file_contents: Optional[List[Tuple[str, str]]] = None) -> str:
+    """
+    生成输入文件中一个查询的请求行
+
+    请求体与单独的命令请求相同（见 base_generator.request_generation）。
+
+    Args:
+        index (int): 查询序号（从0开始）
+        query (str): 查询
+        context (Dict[str, str]): bash环境上下文
+        provider_config (Dict[str, Any]): 提供商配置
+        endpoint (str): 聊天接口的路径，如 "/v1/chat/completions"
+        file_contents (List[Tuple[str, str]], optional): 所有查询共享的文件内容
+
+    Returns:
+        str: 不含换行的JSON
+    """
+    messages = build_messages(query, context, provider_config, False, file_contents)
+    _, payload = build_request(provider_config, "", messages)
+    return json.dumps({"custom_id": f"{CUSTOM_ID_PREFIX}{index}", "method": "POST",
+                       "url": endpoint, "body": payload}, ensure_ascii=False)
+
+def parse_result_line(line: str, count: int) -> Optional[Tuple[int, bool, str, Dict[str, Any]]]:
+    """
+    解析结果文件或错误文件中的一行
+
+    Args:
+        line (str): JSONL中的一行
+        count (int): 任务的查询数
+
+    Returns:
+        Optional[Tuple[int, bool, str, Dict[str, Any]]]: (查询序号, 是否成功, 命令或错误消息,
+            token用量)，无法确定对应的查询时返回None
+    """
+    try:
+        record = json.loads(line)
+        index = int(str(record.get("custom_id", ""))[len(CUSTOM_ID_PREFIX):])
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if not 0 <= index < count:
+        return None
+
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    status = response.get("status_code")
+    if status == 200:
+        content = reply_content(body)
+        if content is not None:
+            return index, True, content, extract_usage(body)
+        return index, False, "API响应格式不正确", {}
+    error = record.get("error") or body.get("error") or {}
+    if not isinstance(error, dict):
+        error = {"message": str(error)}
+    code = status or error.get("code") or "未知"
+    return index, False, f"API错误 ({code}): {error.get('message') or '未知错误'}", {}
+
+class BatchClient:
+    """
+    OpenAI 风格的文件和批处理接口
+
+    Args:
+        base_url (str): 接口的基础地址，见 batch_base_url
+        api_key (str): API密钥
+    """
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.session = get_session(base_url)
+
+    def request(self, method: str, path: str, timeout: float,
+                info: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Tuple[bool, Any]:
+        """
+        发送请求并解析JSON响应
+
+        Args:
+            method (str): HTTP方法
+            path (str): 相对于基础地址的路径
+            timeout (float): 超时秒数
+            info (Dict[str, Any], optional): 如果提供，将写入响应状态码和 Retry-After
+            **kwargs: 传给 requests 的其他参数
+
+        Returns:
+            Tuple[bool, Any]: (是否成功, 响应JSON或错误消息)
+        """
+        try:
+            response = self.session.request(method, self.base_url + path, headers=self.headers,
+                                            timeout=timeout, **kwargs)
+            record_status(response, info)
+            if response.status_code != 200:
+                return False, format_api_error(response)
+            return True, response.json()
+        except requests.exceptions.RequestException as e:
+            return False, f"API请求错误: {str(e)}"
+        except json.JSONDecodeError:
+            return False, f"无法解析API响应: {response.text}"
+
+    def upload(self, path: str) -> Tuple[bool, str]:
+        """
+        上传批处理输入文件
+
+        Args:
+            path (str): JSONL文件路径
+
+        Returns:
+            Tuple[bool, str]: (是否成功, 文件编号或错误消息)
+        """
+        with open(path, "rb") as f:
+            success, result = self.request(
+                "POST", "/files", BATCH_FILE_TIMEOUT, data={"purpose": "batch"},
+                files={"file": (os.path.basename(path), f, "application/jsonl")})
+        if not success:
+            return False, result
+        return True, result["id"]
+
+    def create(self, input_file_id: str, endpoint: str,
+               metadata: Optional[Dict[str, str]] = None) -> Tuple[bool, Any]:
+        """
+        创建批处理
+
+        Args:
+            input_file_id (str): 输入文件编号
+            endpoint (str): 聊天接口的路径
+            metadata (Dict[str, str], optional): 附加信息
+
+        Returns:
+            Tuple[bool, Any]: (是否成功, 批处理对象或错误消息)
+        """
+        return self.request("POST", "/batches", BATCH_STATUS_TIMEOUT,
+                            json={"input_file_id": input_file_id, "endpoint": endpoint,
+                                  "completion_window": BATCH_COMPLETION_WINDOW,
+                                  "metadata": metadata or {}})
+
+    def retrieve(self, batch_id: str, info: Optional[Dict[str, Any]] = None) -> Tuple[bool, Any]:
+        """查询批处理，返回 (是否成功, 批处理对象或错误消息)"""
+        return self.request("GET", f"/batches/{batch_id}", BATCH_STATUS_TIMEOUT, info)
+
+    def iter_lines(self, file_id: str, errors: List[str]) -> Iterator[str]:
+        """
+        逐行下载结果文件，不把整个文件读入内存
+
+        Args:
+            file_id (str): 文件编号
+            errors (List[str]): 下载失败时加入错误消息
+
+        Yields:
+            str: 文件中的非空行
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/files/{file_id}/content",
+                                        headers=self.headers, timeout=BATCH_FILE_TIMEOUT,
+                                        stream=True)
+            with response:
+                if response.status_code != 200:
+                    errors.append(format_api_error(response))
+                    return
+                for line in response.iter_lines():
+                    if line.strip():
+                        yield line.decode("utf-8")
+        except requests.exceptions.RequestException as e:
+            errors.append(f"API请求错误: {str(e)}")
+
+def job_path(name: str, directory: str = BATCH_JOB_DIR) -> str:
+    """任务记录的文件路径"""
+    return os.path.join(directory, f"{name}.json")
+
+def save_job(job: Dict[str, Any], directory: str = BATCH_JOB_DIR) -> None:
+    """
+    保存任务记录
+
+    Args:
+        job (Dict[str, Any]): 任务记录
+        directory (str): 任务记录目录
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = job_path(job["name"], directory)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def load_job(name: str, directory: str = BATCH_JOB_DIR) -> Optional[Dict[str, Any]]:
+    """
+    读取任务记录
+
+    Args:
+        name (str): 任务名
+        directory (str): 任务记录目录
+
+    Returns:
+        Optional[Dict[str, Any]]: 任务记录，不存在时返回None
+    """
+    try:
+        with open(job_path(os.path.basename(name), directory), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def list_jobs(directory: str = BATCH_JOB_DIR) -> List[Dict[str, Any]]:
+    """
+    所有任务记录，按创建时间排列
+
+    Args:
+        directory (str): 任务记录目录
+
+    Returns:
+        List[Dict[str, Any]]: 任务记录列表
+    """
+    try:
+        names = [name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json")]
+    except OSError:
+        return []
+    jobs = [job for job in (load_job(name, directory) for name in names) if job is not None]
+    return sorted(jobs, key=lambda job: job["created"])
+
+def new_job_name(directory: str = BATCH_JOB_DIR) -> str:
+    """以提交时间命名任务，同一秒内提交多个任务时加上序号"""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    name = base
+    suffix = 1
+    while os.path.exists(job_path(name, directory)):
+        suffix += 1
+        name = f"{base}-{suffix}"
+    return name
+
+def job_client(job: Dict[str, Any], model_manager: ModelManager) -> Optional[BatchClient]:
+    """
+    使用提交任务时的密钥创建客户端
+
+    Args:
+        job (Dict[str, Any]): 任务记录
+        model_manager (ModelManager): 读取密钥使用的模型配置管理器
+
+    Returns:
+        Optional[BatchClient]: 客户端，找不到提交时使用的密钥时返回None
+    """
+    for label, value in provider_keys(job["key_config"], model_manager):
+        if label == job["key"]:
+            return BatchClient(job["batch_url"], value)
+    return None
+
+def job_status(job: Dict[str, Any]) -> str:
+    """
+    任务的整体状态
+
+    Returns:
+        str: 所有批处理状态相同时为该状态，否则为未结束批处理中的第一个状态
+    """
+    statuses = [batch["status"] for batch in job["batches"]]
+    if not statuses:
+        return "failed"
+    if len(set(statuses)) == 1:
+        return statuses[0]
+    return next((status for status in statuses if status not in TERMINAL_STATUSES), statuses[0])
+
+def job_finished(job: Dict[str, Any]) -> bool:
+    """任务的所有批处理是否都已结束"""
+    return all(batch["status"] in TERMINAL_STATUSES for batch in job["batches"])
+
+def job_progress(job: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    任务的进度
+
+    Returns:
+        Tuple[int, int]: (已处理的请求数（含失败）, 总请求数)
+    """
+    done = sum((batch["request_counts"].get("completed") or 0) +
+               (batch["request_counts"].get("failed") or 0) for batch in job["batches"])
+    return done, len(job["queries"])
+
+def submit_job(queries: List[str], context: Dict[str, str],
+               model_manager: Optional[ModelManager] = None,
+               file_contents: Optional[List[Tuple[str, str]]] = None,
+               filenames: Optional[List[str]] = None,
+               provider_config: Optional[Dict[str, Any]] = None,
+               directory: str = BATCH_JOB_DIR,
+               max_requests: int = MAX_BATCH_REQUESTS) -> Tuple[bool, Any]:
+    """
+    生成输入文件，上传并创建批处理
+
+    查询数超过 max_requests 或输入文件超过大小上限时分成多个批处理。
+    已创建的批处理随时写入任务记录，中途失败时已提交的部分仍然可以收集。
+
+    Args:
+        queries (List[str]): 查询列表
+        context (Dict[str, str]): bash环境上下文
+        model_manager (ModelManager, optional): 已加载的模型配置
+        file_contents (List[Tuple[str, str]], optional): 所有查询共享的文件内容
+        filenames (List[str], optional): 文件名，记录到历史中
+        provider_config (Dict[str, Any], optional): 使用的提供商，默认为当前的命令提供商
+        directory (str): 任务记录目录
+        max_requests (int): 每个批处理最多包含的请求数
+
+    Returns:
+        Tuple[bool, Any]: (是否全部提交成功, 任务记录或错误消息)；部分提交时返回错误消息，
+            任务记录已经保存
+    """
+    model_manager = model_manager or ModelManager()
+    provider_config = provider_config or model_manager.get_command_provider()
+    base_url = batch_base_url(provider_config)
+    if base_url is None:
+        return False, f"无法从 {provider_config['url']} 推断批处理接口地址，请在 models.yaml 中设置 batch_url"
+    keys = provider_keys(provider_config, model_manager)
+    if not keys:
+        return False, missing_key_message(provider_config)
+    key_label, key_value = keys[0]
+    client = BatchClient(base_url, key_value)
+    endpoint = urlsplit(base_url).path + "/chat/completions"
+
+    name = new_job_name(directory)
+    job = {
+        "name": name,
+        "created": time.time(),
+        "provider": model_manager.config.get("command", {}).get("provider"),
+        "model": provider_config["model"],
+        "batch_url": base_url,
+        "key": key_label,
+        "key_config": {field: provider_config.get(field) for field in KEY_CONFIG_FIELDS},
+        "filenames": list(filenames or []),
+        "queries": queries,
+        "batches": []
+    }  # type: Dict[str, Any]
+
+    start = 0
+    while start < len(queries):
+        fd, path = tempfile.mkstemp(prefix=f"bcopilot-{name}-", suffix=".jsonl")
+        count = 0
+        size = 0
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                while start + count < len(queries) and count < max_requests:
+                    line = batch_line(start + count, queries[start + count], context,
+                                      provider_config, endpoint, file_contents) + "\n"
+                    line_size = len(line.encode("utf-8"))
+                    if count and size + line_size > MAX_BATCH_FILE_BYTES:
+                        break
+                    f.write(line)
+                    size += line_size
+                    count += 1
+            success, result = client.upload(path)
+        finally:
+            os.unlink(path)
+        if success:
+            file_id = result
+            success, result = client.create(file_id, endpoint,
+                                            {"description": f"bcopilot batch {name}"})
+        if not success:
+            submitted = f"，已提交 {start} 个查询（任务 {name}）" if start else ""
+            return False, f"提交批处理失败: {result}{submitted}"
+        batch = result
+        job["batches"].append({"id": batch["id"], "input_file_id": file_id, "start": start,
+                               "count": count, "status": batch.get("status", "validating"),
+                               "output_file_id": None, "error_file_id": None,
+                               "request_counts": {}, "collected": False})
+        save_job(job, directory)
+        start += count
+    return True, job
+
+def refresh_job(job: Dict[str, Any], client: BatchClient,
+                info: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    更新未结束的批处理的状态
+
+    Args:
+        job (Dict[str, Any]): 任务记录，原地更新
+        client (BatchClient): 客户端
+        info (Dict[str, Any], optional): 如果提供，将写入最后一次失败请求的状态码和 Retry-After
+
+    Returns:
+        List[str]: 查询失败的错误消息
+    """
+    errors = []
+    for batch in job["batches"]:
+        if batch["status"] in TERMINAL_STATUSES:
+            continue
+        call_info = {}  # type: Dict[str, Any]
+        success, result = client.retrieve(batch["id"], call_info)
+        if not success:
+            errors.append(result)
+            if info is not None:
+                info.update(call_info)
+            continue
+        batch["status"] = result.get("status", batch["status"])
+        batch["output_file_id"] = result.get("output_file_id")
+        batch["error_file_id"] = result.get("error_file_id")
+        batch["request_counts"] = result.get("request_counts") or {}
+    return errors
+
+def wait_for_job(job: Dict[str, Any], client: BatchClient, directory: str = BATCH_JOB_DIR,
+                 interval: float = POLL_INITIAL_INTERVAL, max_interval: float = POLL_MAX_INTERVAL,
+                 timeout: Optional[float] = None,
+                 on_update: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+    """
+    轮询直到所有批处理结束
+
+    有进展时保持当前间隔，没有进展或查询失败时间隔增长到 POLL_BACKOFF 倍（不超过
+    max_interval）；提供商返回 Retry-After 时至少等待该时长。
+
+    Args:
+        job (Dict[str, Any]): 任务记录，原地更新并保存
+        client (BatchClient): 客户端
+        directory (str): 任务记录目录
+        interval (float): 初始轮询间隔秒数
+        max_interval (float): 轮询间隔上限秒数
+        timeout (float, optional): 最长等待秒数
+        on_update (Callable[[Dict[str, Any]], None], optional): 每次查询后调用
+
+    Returns:
+        bool: 所有批处理是否都已结束
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    progress = None
+    while True:
+        info = {}  # type: Dict[str, Any]
+        errors = refresh_job(job, client, info)
+        save_job(job, directory)
+        if on_update is not None:
+            on_update(job)
+        if job_finished(job):
+            return True
+
+        current = job_progress(job)
+        if errors or current == progress:
+            interval = min(interval * POLL_BACKOFF, max_interval)
+        progress = current
+        wait = max(interval, parse_retry_after(info.get("retry_after")) or 0.0)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+        time.sleep(wait)
+
+def iter_results(job: Dict[str, Any], client: BatchClient) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    逐个返回已结束的批处理中每个查询的结果
+
+    结果按结果文件中的顺序返回；没有出现在结果文件和错误文件中的查询（批处理失败、
+    过期或被取消，或者下载失败）作为失败的结果在最后返回。
+
+    Args:
+        job (Dict[str, Any]): 任务记录
+        client (BatchClient): 客户端
+
+    Yields:
+        Tuple[Dict[str, Any], Dict[str, Any]]: (所属的批处理, 结果)，结果包含 index、query、
+            success、answer（命令或错误消息）和 usage
+    """
+    for batch in job["batches"]:
+        if batch["status"] in TERMINAL_STATUSES:
+            for result in iter_batch_results(job, client, batch, []):
+                yield batch, result
+
+def iter_batch_results(job: Dict[str, Any], client: BatchClient, batch: Dict[str, Any],
+                       errors: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    逐个返回一个已结束的批处理中每个查询的结果
+
+    Args:
+        job (Dict[str, Any]): 任务记录
+        client (BatchClient): 客户端
+        batch (Dict[str, Any]): 任务记录中的批处理
+        errors (List[str]): 结果文件或错误文件下载失败时加入错误消息；全部返回后为空
+            表示该批处理的结果已完整读取
+
+    Yields:
+        Dict[str, Any]: 结果，格式同 iter_results
+    """
+    queries = job["queries"]
+    seen = set()
+    failure = f"批处理 {batch['id']} 状态为 {batch['status']}，没有结果"
+    for file_id in (batch["output_file_id"], batch["error_file_id"]):
+        if not file_id:
+            continue
+        for line in client.iter_lines(file_id, errors):
+            parsed = parse_result_line(line, len(queries))
+            if parsed is None or parsed[0] in seen:
+                continue
+            index, success, answer, usage = parsed
+            seen.add(index)
+            usage.update(provider=job["provider"], model=job["model"], key=job["key"])
+            yield {"index": index, "query": queries[index], "success": success,
+                   "answer": answer, "usage": usage}
+        if errors:
+            failure = f"无法下载批处理 {batch['id']} 的结果: {errors[0]}"
+            break
+
+    for index in range(batch["start"], batch["start"] + batch["count"]):
+        if index not in seen:
+            yield {"index": index, "query": queries[index], "success": False,
+                   "answer": failure, "usage": {}}
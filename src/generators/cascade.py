@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+级联路由 - 先用快速便宜的模型，只在需要时使用更强的模型
+
+models.yaml 中每种模式可以配置 cascade（从快速/便宜到强/慢的提供商列表）。
+起始层级由本地复杂度估计决定，之前相同查询最终通过检查的层级优先；
+输出未通过本地检查（空输出、命令模式下的多行输出、bash -n 语法错误、
+引用了本机不存在的程序）时改用下一层级。每一层的尝试记录写入历史记录，
+由 `bcopilot stats` 统计各层级的通过率和节省的耗时。
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import request_generation
+from src.generators.escalation import is_refusal, open_escalation_memory
+from src.generators.script_generator import parse_script_reply
+from src.utils.complexity import score_complexity
+from src.utils.http_client import get_session
+from src.utils.output_checks import check_command, check_script
+
+# 累加到总用量中的token字段
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+def choose_start_tier(query: str, tier_count: int,
+                      file_contents: Optional[List[Tuple[str, str]]] = None,
+                      remembered: Optional[int] = None) -> int:
+    """
+    选择起始层级
+
+    Args:
+        query (str): 用户查询
+        tier_count (int): 层级数
+        file_contents (List[Tuple[str, str]], optional): 文件内容列表
+        remembered (int, optional): 之前相同查询最终通过检查的层级
+
+    Returns:
+        int: 起始层级序号
+    """
+    if remembered is not None:
+        return max(0, min(remembered, tier_count - 1))
+    score = score_complexity(query, file_contents)
+    return min(int(score * tier_count), tier_count - 1)
+
+def check_output(text: str, is_script: bool = False) -> Optional[str]:
+    """
+    对生成结果做本地检查
+
+    Args:
+        text (str): 模型回复
+        is_script (bool): 是否为脚本
+
+    Returns:
+        Optional[str]: 未通过检查的原因，通过时返回None
+    """
+    if is_script:
+        return check_script(parse_script_reply(text)[1])
+    if is_refusal(text):
+        # 拒绝消息由命令生成切换到脚本模式处理
+        return None
+    return check_command(text)
+
+def generate_with_cascade(query: str, context: Dict[str, str],
+                          is_script: bool = False,
+                          file_contents: Optional[List[Tuple[str, str]]] = None,
+                          usage: Optional[Dict[str, Any]] = None,
+                          model_manager: Optional[ModelManager] = None,
+                          session: Optional[requests.Session] = None,
+                          conversation: Optional[Any] = None,
+                          request: Optional[Callable[[str, Dict[str, Any], Dict[str, Any]],
+                                                     Tuple[bool, str]]] = None,
+                          cancel: Optional[threading.Event] = None) -> Tuple[bool, str]:
+    """
+    按级联路由生成命令或脚本，参数与 generate_bash_command 相同
+
+    usage 中额外写入 tier（最终使用的层级）和 cascade（每一层的尝试记录），
+    耗时和token用量为所有尝试的总和。
+
+    Args:
+        request (Callable, optional): 向一个层级发送请求，参数为(提供商名称, 提供商配置, 用量)，
+            未提供时使用 request_generation（推测执行的流式请求通过它接入级联路由）
+        cancel (threading.Event, optional): 设置后不再尝试后面的层级
+
+    Returns:
+        Tuple[bool, str]: (是否成功, 生成的bash命令或错误消息)；
+            所有层级都未通过检查时返回最后一层的输出
+    """
+    model_manager = model_manager or ModelManager()
+    mode = "script" if is_script else "command"
+    tiers = model_manager.get_cascade(mode)
+
+    memory = open_escalation_memory()
+    try:
+        remembered = memory.get_tier(query, mode) if memory is not None else None
+        start = choose_start_tier(query, len(tiers), file_contents, remembered)
+
+        attempts = []  # type: List[Dict[str, Any]]
+        totals = {}  # type: Dict[str, int]
+        best = None  # type: Optional[Tuple[int, Dict[str, Any], Tuple[bool, str], Optional[str]]]
+        result = (False, "没有可用的提供商")
+        reason = None
+        for tier in range(start, len(tiers)):
+            name, provider_config = tiers[tier]
+            tier_usage = {}  # type: Dict[str, Any]
+            if request is not None:
+                result = request(name, provider_config, tier_usage)
+            else:
+                tier_session = get_session(provider_config["url"]) if session is not None else None
+                result = request_generation(provider_config, query, context, is_script, file_contents,
+                                            tier_usage, model_manager, tier_session, conversation,
+                                            provider_name=name)
+            reason = check_output(result[1], is_script) if result[0] else "请求失败"
+            attempts.append({"tier": tier, "provider": name, "model": provider_config["model"],
+                             "key": tier_usage.get("key"), "latency_ms": tier_usage.get("latency_ms"),
+                             "passed": reason is None, "reason": reason})
+            for field in TOKEN_FIELDS + ("latency_ms",):
+                if tier_usage.get(field) is not None:
+                    totals[field] = totals.get(field, 0) + tier_usage[field]
+            if result[0]:
+                best = (tier, tier_usage, result, reason)
+            if reason is None or (cancel is not None and cancel.is_set()):
+                break
+            if tier + 1 < len(tiers):
+                print(f"{name} 的输出未通过检查（{reason}），改用 {tiers[tier + 1][0]}")
+
+        if reason is None and memory is not None:
+            memory.remember_tier(query, mode, attempts[-1]["tier"])
+    finally:
+        if memory is not None:
+            memory.close()
+
+    if best is not None:
+        final_tier, final_usage, result, reason = best
+        if reason is not None:
+            print(f"警告: 输出未通过检查（{reason}）")
+    else:
+        final_tier, final_usage = attempts[-1]["tier"] if attempts else start, {}
+
+    if usage is not None:
+        usage.update(final_usage)
+        usage.update(totals)
+        usage["tier"] = final_tier
+        usage["cascade"] = attempts
+    return result
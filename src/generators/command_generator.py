@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 """
 命令生成模块 - 处理单行命令生成
+
+任务无法用单行命令完成时自动切换到脚本模式（见 generators/escalation.py）。
 """
 
 from typing import Dict, Tuple, List, Optional
 from src.generators.base_generator import generate_bash_command
+from src.generators.conversation import Conversation
+from src.generators.escalation import is_refusal, open_escalation_memory, speculate
+from src.generators.script_generator import handle_script_generation
 from src.log.history import append_to_history
+from src.utils.complexity import is_likely_complex
 
 def handle_command_generation(query: str, context: Dict[str, str],
                               file_contents: Optional[List[Tuple[str, str]]] = None,
-                              filenames: Optional[List[str]] = None) -> None:
+                              filenames: Optional[List[str]] = None,
+                              conversation: Optional[Conversation] = None) -> None:
     """
     处理单行命令生成的主要逻辑
 
@@ -18,23 +25,62 @@ def handle_command_generation(query: str, context: Dict[str, str],
         context (Dict[str, str]): 系统上下文
         file_contents (List[Tuple[str, str]], optional): 文件内容列表
         filenames (List[str], optional): 文件名列表
+        conversation (Conversation, optional): 会话中的多轮对话，提供时在之前的对话基础上生成
     """
-    print("正在处理请求...")
-    success, result = generate_bash_command(
-        query, 
-        context, 
-        is_script=False,
-        file_contents=file_contents
-    )
+    memory = open_escalation_memory()
+    try:
+        needs_script = memory.get(query) if memory is not None else None
+        if needs_script:
+            print("此前该查询无法用单行命令完成，直接生成脚本")
+            handle_script_generation(query, context, file_contents, filenames, conversation)
+            return
+
+        print("正在处理请求...")
+        script = None
+        if needs_script is None and is_likely_complex(query, file_contents):
+            # 可能需要脚本，同时开始生成脚本，只保留需要的一个
+            command, script = speculate(query, context, file_contents, conversation=conversation)
+            (success, result), usage = command.result, command.usage
+        else:
+            usage = {}
+            success, result = generate_bash_command(
+                query, 
+                context, 
+                is_script=False,
+                file_contents=file_contents,
+                usage=usage,
+                conversation=conversation
+            )
+
+        if success and is_refusal(result):
+            if memory is not None:
+                memory.remember(query, True)
+            print("这个任务无法用单行命令完成，自动切换到脚本模式")
+            if script is not None:
+                print("脚本已在后台提前开始生成，正在等待完成...")
+                handle_script_generation(query, context, file_contents, filenames, conversation,
+                                         generated=script.wait(), usage=script.usage)
+            else:
+                handle_script_generation(query, context, file_contents, filenames, conversation)
+            return
+        if success and needs_script is None and memory is not None:
+            memory.remember(query, False)
+    finally:
+        if memory is not None:
+            memory.close()
 
     if success:
+        if conversation is not None:
+            conversation.add_turn(query, result)
+        print(f"\033[92m{result}\033[0m")  # 绿色输出命令
+        # 先输出结果，历史记录在后台写入
         append_to_history(
             query, 
             result, 
             "command", 
             None, 
-            filenames
+            filenames,
+            usage
         )
-        print(f"\033[92m{result}\033[0m")  # 绿色输出命令
     else:
         print(f"错误: {result}")
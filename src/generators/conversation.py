@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+多轮对话模块 - 在之前的回答基础上继续修改
+
+第一轮沿用常规的分块提示词（环境上下文、文件内容、查询），之后的每一轮以
+assistant/user 消息追加在后面，因此对话前缀在各轮之间保持不变，可以命中提示缓存。
+后续轮次可以附带额外内容（如文件的差异），附带内容与查询一起保存，重建时字节不变。
+消息总长度超出提供商的 token_limit 时，从最早的中间轮次开始丢弃。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.prompts import FOLLOW_UP_QUERY_PROMPT
+from src.generators.base_generator import build_prompt_blocks, format_messages
+from src.utils.token_utils import estimate_tokens
+
+# 为模型回复预留的token数
+REPLY_RESERVE_TOKENS = 4000
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """
+    估算一条消息的token数
+
+    Args:
+        message (Dict[str, Any]): 消息，content 可以是字符串或区块列表
+
+    Returns:
+        int: 预估token数
+    """
+    content = message["content"]
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content)
+    return estimate_tokens(content)
+
+class Conversation:
+    """多轮对话，保存环境上下文、文件内容和之前的问答"""
+
+    def __init__(self, context: Dict[str, str],
+                 file_contents: Optional[List[Tuple[str, str]]] = None):
+        self.context = context
+        self.file_contents = file_contents
+        self.turns = []  # type: List[Tuple[str, str, str]]
+        self.pending = ""
+
+    def attach(self, text: str) -> None:
+        """
+        设置随下一轮查询一起发送的附加内容
+
+        Args:
+            text (str): 附加内容，放在查询之前
+        """
+        self.pending = text
+
+    def add_turn(self, query: str, answer: str) -> None:
+        """
+        记录一轮问答，连同本轮的附加内容
+
+        Args:
+            query (str): 用户查询
+            answer (str): 模型回答
+        """
+        self.turns.append((query, answer, self.pending if self.turns else ""))
+        self.pending = ""
+
+    def reset(self) -> None:
+        """清空之前的问答，保留环境上下文和文件内容"""
+        self.turns = []
+        self.pending = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为可JSON序列化的字典
+
+        Returns:
+            Dict[str, Any]: 环境上下文、第一轮的文件内容和所有问答
+        """
+        return {"context": self.context,
+                "file_contents": [list(item) for item in self.file_contents or []],
+                "turns": [list(turn) for turn in self.turns]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Conversation":
+        """
+        从 to_dict 的结果恢复对话
+
+        Args:
+            data (Dict[str, Any]): 字典
+
+        Returns:
+            Conversation: 对话
+        """
+        conversation = cls(data["context"], [tuple(item) for item in data["file_contents"]] or None)
+        conversation.turns = [tuple(turn) for turn in data["turns"]]
+        return conversation
+
+    @staticmethod
+    def follow_up(query: str, attachment: str = "") -> Dict[str, str]:
+        """生成后续轮次的user消息"""
+        return {"role": "user", "content": attachment + FOLLOW_UP_QUERY_PROMPT.format(query=query)}
+
+    def build_messages(self, query: str, provider_config: Dict[str, Any],
+                       is_script: bool = False) -> List[Dict[str, Any]]:
+        """
+        构建包含之前问答的消息列表
+
+        Args:
+            query (str): 本轮查询
+            provider_config (Dict[str, Any]): 提供商配置
+            is_script (bool): 是否生成脚本
+
+        Returns:
+            List[Dict[str, Any]]: 消息列表
+        """
+        first_query = self.turns[0][0] if self.turns else query
+        system_prompt, blocks = build_prompt_blocks(first_query, self.context, is_script,
+                                                    self.file_contents)
+        messages = format_messages(system_prompt, blocks, provider_config)
+        if not self.turns:
+            return messages
+
+        # 第一轮的回答和本轮查询始终保留
+        head = messages + [{"role": "assistant", "content": self.turns[0][1]}]
+        current = self.follow_up(query, self.pending)
+        budget = provider_config.get("token_limit", 0) - REPLY_RESERVE_TOKENS
+        used = sum(message_tokens(message) for message in head) + message_tokens(current)
+
+        # 从最新的轮次往前保留，直到超出预算
+        kept = []
+        for turn_query, turn_answer, attachment in reversed(self.turns[1:]):
+            pair = [self.follow_up(turn_query, attachment),
+                    {"role": "assistant", "content": turn_answer}]
+            tokens = sum(message_tokens(message) for message in pair)
+            if budget > 0 and used + tokens > budget:
+                break
+            kept = pair + kept
+            used += tokens
+
+        return head + kept + [current]
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+命令模式自动切换到脚本模式
+
+任务过于复杂时命令模型会回复固定的拒绝消息（COMMAND_REFUSAL_MESSAGE），此时自动改为
+生成脚本，不需要用户加上 -script 重新运行。本地规则判断为可能复杂的查询会同时开始
+生成脚本（推测执行）：命令请求以流式方式接收，回复的开头一旦确定不是拒绝消息就立即
+取消脚本请求；确定是拒绝消息时也立即结束命令请求，直接等待已经开始的脚本。
+每个查询最终是否需要脚本按规范化后的查询保存，下次相同的查询直接选择对应的模式；
+级联路由中给出通过检查的回答的层级也保存在这里。
+"""
+
+import re
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.constants import ESCALATION_CACHE_FILE, ESCALATION_CACHE_MAX_BYTES, ESCALATION_CACHE_TTL
+from config.prompts import COMMAND_REFUSAL_MESSAGE
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    get_provider_config,
+    build_messages,
+    build_request,
+    call_with_keys,
+    stream_request
+)
+from src.utils.http_client import get_session, prewarmed_session
+from src.utils.key_pool import get_key_pool, missing_key_message
+from src.utils.result_cache import ResultCache
+from src.utils.trace import tracer
+
+# 拒绝消息的核心部分（第一个逗号之前），模型有时会省略后半句
+REFUSAL_CORE = COMMAND_REFUSAL_MESSAGE.split("，")[0]
+
+# 流式回复的开头与拒绝消息相同的字符数达到此值时即认定为拒绝
+REFUSAL_PREFIX_CHARS = 6
+
+# 回复开头可能带有的引号和空白
+LEADING_NOISE = " \t\r\n\"'`“”‘’「」"
+
+# 查询末尾的标点
+TRAILING_PUNCTUATION = " 。.!！?？"
+
+def refusal_state(text: str) -> Optional[bool]:
+    """
+    根据（可能不完整的）回复开头判断是否为拒绝消息
+
+    Args:
+        text (str): 目前为止收到的回复
+
+    Returns:
+        Optional[bool]: True表示是拒绝消息，False表示不是，None表示还无法确定
+    """
+    text = text.lstrip(LEADING_NOISE)
+    if not text:
+        return None
+    length = min(len(text), len(REFUSAL_CORE))
+    if text[:length] != REFUSAL_CORE[:length]:
+        return False
+    if length >= REFUSAL_PREFIX_CHARS:
+        return True
+    return None
+
+def is_refusal(text: str) -> bool:
+    """
+    判断完整的回复是否为拒绝消息
+
+    Args:
+        text (str): 模型回复
+
+    Returns:
+        bool: 是否表示任务无法用单行命令完成
+    """
+    if refusal_state(text):
+        return True
+    # 模型改写了措辞但仍然建议使用 -script
+    return "-script" in text and "无法" in text
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询，用作保存切换决定的键
+
+    Args:
+        query (str): 用户查询
+
+    Returns:
+        str: 小写、合并空白并去掉末尾标点后的查询
+    """
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip(TRAILING_PUNCTUATION)
+
+class EscalationMemory:
+    """按查询保存是否需要切换到脚本模式"""
+
+    def __init__(self, path: str = ESCALATION_CACHE_FILE):
+        self.cache = ResultCache(path, ESCALATION_CACHE_MAX_BYTES, ESCALATION_CACHE_TTL)
+
+    def get(self, query: str) -> Optional[bool]:
+        """
+        读取之前的决定
+
+        Args:
+            query (str): 用户查询
+
+        Returns:
+            Optional[bool]: True表示需要脚本，False表示单行命令即可，None表示没有记录
+        """
+        entry = self.cache.get(normalize_query(query))
+        return None if entry is None else bool(entry["script"])
+
+    def remember(self, query: str, needs_script: bool) -> None:
+        """
+        保存决定
+
+        Args:
+            query (str): 用户查询
+            needs_script (bool): 是否需要脚本
+        """
+        self.cache.put(normalize_query(query), {"script": needs_script})
+
+    def get_tier(self, query: str, mode: str) -> Optional[int]:
+        """
+        读取级联路由中之前给出通过检查的回答的层级
+
+        Args:
+            query (str): 用户查询
+            mode (str): command 或 script
+
+        Returns:
+            Optional[int]: 层级序号，没有记录时返回None
+        """
+        entry = self.cache.get(f"tier:{mode}:{normalize_query(query)}")
+        return None if entry is None else int(entry["tier"])
+
+    def remember_tier(self, query: str, mode: str, tier: int) -> None:
+        """
+        保存级联路由中给出通过检查的回答的层级
+
+        Args:
+            query (str): 用户查询
+            mode (str): command 或 script
+            tier (int): 层级序号
+        """
+        self.cache.put(f"tier:{mode}:{normalize_query(query)}", {"tier": tier})
+
+    def close(self) -> None:
+        """关闭缓存"""
+        self.cache.close()
+
+def open_escalation_memory() -> Optional[EscalationMemory]:
+    """
+    打开切换决定的缓存
+
+    Returns:
+        Optional[EscalationMemory]: 缓存，无法打开时返回None（不影响生成）
+    """
+    try:
+        return EscalationMemory()
+    except (OSError, sqlite3.Error):
+        return None
+
+class StreamingGeneration:
+    """可以在后台运行并随时取消的流式生成请求"""
+
+    def __init__(self, query: str, context: Dict[str, str], is_script: bool,
+                 file_contents: Optional[List[Tuple[str, str]]] = None,
+                 model_manager: Optional[ModelManager] = None,
+                 conversation: Optional[Any] = None,
+                 on_text: Optional[Callable[[str], bool]] = None):
+        self.query = query
+        self.context = context
+        self.is_script = is_script
+        self.file_contents = file_contents
+        self.model_manager = model_manager or ModelManager()
+        self.conversation = conversation
+        self.on_text = on_text
+        self.usage = {}  # type: Dict[str, Any]
+        self.result = None  # type: Optional[Tuple[bool, str]]
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def run(self) -> Tuple[bool, str]:
+        """
+        在当前线程中发送请求
+
+        Returns:
+            Tuple[bool, str]: (是否成功, 模型回复或错误消息)
+        """
+        try:
+            self.result = self._generate()
+        except Exception as e:
+            self.result = (False, f"未知错误: {str(e)}")
+        finally:
+            self.done.set()
+        return self.result
+
+    def start(self) -> "StreamingGeneration":
+        """在后台线程中发送请求"""
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self) -> None:
+        """放弃请求，连接在收到下一段内容时关闭"""
+        self.cancelled.set()
+
+    def wait(self) -> Tuple[bool, str]:
+        """
+        等待请求完成
+
+        Returns:
+            Tuple[bool, str]: (是否成功, 模型回复或错误消息)
+        """
+        self.done.wait()
+        return self.result
+
+    def _generate(self) -> Tuple[bool, str]:
+        section = "script" if self.is_script else "command"
+        if len(self.model_manager.get_cascade(section)) > 1:
+            # 与 generate_bash_command 相同，按级联路由选择层级并检查输出
+            from src.generators.cascade import generate_with_cascade
+            return generate_with_cascade(self.query, self.context, self.is_script, self.file_contents,
+                                         self.usage, self.model_manager,
+                                         conversation=self.conversation, request=self._stream,
+                                         cancel=self.cancelled)
+
+        provider_config = get_provider_config(self.model_manager, self.is_script)
+        return self._stream(self.model_manager.config.get(section, {}).get("provider"),
+                            provider_config, self.usage)
+
+    def _stream(self, provider_name: Optional[str], provider_config: Dict[str, Any],
+                usage: Dict[str, Any]) -> Tuple[bool, str]:
+        keys = get_key_pool(provider_config, self.model_manager)
+        if not len(keys):
+            return False, missing_key_message(provider_config)
+
+        if self.conversation is not None:
+            messages = self.conversation.build_messages(self.query, provider_config, self.is_script)
+        else:
+            messages = build_messages(self.query, self.context, provider_config,
+                                      self.is_script, self.file_contents)
+        headers, payload = build_request(provider_config, "", messages, self.is_script)
+
+        session = prewarmed_session(provider_config["url"]) or get_session(provider_config["url"])
+        start = time.time()
+        with tracer.span(f"stream {provider_config['model']}"):
+            result = call_with_keys(keys, headers, payload, lambda key_headers, call_usage: stream_request(
+                provider_config, key_headers, payload, 120 if self.is_script else 30, call_usage,
+                session=session, cancel=self.cancelled, on_text=self.on_text), usage)
+        usage["provider"] = provider_name
+        usage["model"] = provider_config["model"]
+        usage["latency_ms"] = int((time.time() - start) * 1000)
+        return result
+
+def speculate(query: str, context: Dict[str, str],
+              file_contents: Optional[List[Tuple[str, str]]] = None,
+              model_manager: Optional[ModelManager] = None,
+              conversation: Optional[Any] = None
+              ) -> Tuple[StreamingGeneration, Optional[StreamingGeneration]]:
+    """
+    同时发送命令请求和脚本请求，只保留需要的一个
+
+    Args:
+        query (str): 用户查询
+        context (Dict[str, str]): 系统上下文
+        file_contents (List[Tuple[str, str]], optional): 文件内容列表
+        model_manager (ModelManager, optional): 已加载的模型配置
+        conversation (Conversation, optional): 多轮对话
+
+    Returns:
+        Tuple[StreamingGeneration, Optional[StreamingGeneration]]: (已完成的命令请求,
+            命令被拒绝时仍在进行的脚本请求，否则为None)
+    """
+    model_manager = model_manager or ModelManager()
+    script = StreamingGeneration(query, context, True, file_contents, model_manager,
+                                 conversation).start()
+
+    def watch(text: str) -> bool:
+        state = refusal_state(text)
+        if state is False:
+            # 回复的开头已经不是拒绝消息，不再需要脚本
+            script.cancel()
+        return state is True
+
+    command = StreamingGeneration(query, context, False, file_contents, model_manager,
+                                  conversation, on_text=watch)
+    success, result = command.run()
+    if not success or not is_refusal(result) or script.cancelled.is_set():
+        script.cancel()
+        return command, None
+    return command, script
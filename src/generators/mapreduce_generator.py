@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+分块处理(map-reduce)模块 - 处理超出模型上下文的文件
+
+map阶段把文件切分为适合模型预算的片段，并发地从每个片段中提取与任务相关的信息；
+reduce阶段把提取结果作为文件上下文，交给常规的命令或脚本生成流程。
+每个片段的提取结果按内容哈希缓存，文件追加内容后重新运行只会处理新的片段。
+"""
+
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config.constants import MAPREDUCE_CACHE_FILE, MAPREDUCE_CACHE_MAX_BYTES
+from config.prompts import (
+    MAP_SYSTEM_PROMPT,
+    MAP_TASK_PROMPT,
+    MAP_CHUNK_PROMPT,
+    MAP_NO_RELEVANT_MESSAGE
+)
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    get_provider_config,
+    format_messages,
+    build_request,
+    call_with_keys,
+    send_request,
+    report_cache_usage
+)
+from src.utils.key_pool import KeyPool, get_key_pool, missing_key_message
+from src.utils.rate_limiter import RateLimiter, get_rate_limiter
+from src.utils.result_cache import ResultCache
+from src.utils.token_utils import estimate_tokens
+
+# 每个片段的最大token数
+MAP_CHUNK_TOKENS = 24000
+
+# 每个片段提取结果的最大token数
+MAP_MAX_TOKENS = 800
+
+# map请求的超时秒数
+MAP_TIMEOUT = 60
+
+# 遇到429限流时的最大重试次数
+MAP_MAX_RETRIES = 3
+
+# 为提示词模板和模型回复预留的token数
+RESERVED_TOKENS = 4000
+
+# 每个片段至少需要的token数，模型上下文更小时无法分块处理
+MIN_CHUNK_TOKENS = 1000
+
+# 提取结果超出reduce预算时最多再汇总的轮数
+MAX_REDUCE_ROUNDS = 5
+
+def iter_file_chunks(filename: str, chunk_tokens: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    从文件开头按行流式切分片段
+
+    切分只依赖已读取的内容，文件追加内容后之前的完整片段保持不变。
+
+    Args:
+        filename (str): 文件路径
+        chunk_tokens (int): 每个片段的token上限
+
+    Yields:
+        Tuple[int, int, str]: (起始行, 结束行, 片段内容)
+    """
+    lines = []
+    tokens = 0
+    first_line = 1
+    line_number = 0
+    with open(filename, "rb") as f:
+        for raw in f:
+            line = raw.decode("utf-8", errors="replace")
+            line_tokens = estimate_tokens(line)
+            if lines and tokens + line_tokens > chunk_tokens:
+                yield first_line, line_number, "".join(lines)
+                first_line = line_number + 1
+                lines = []
+                tokens = 0
+            line_number += 1
+            lines.append(line)
+            tokens += line_tokens
+    if lines:
+        yield first_line, line_number, "".join(lines)
+
+def chunk_cache_key(query: str, content: str, provider_config: Dict[str, Any]) -> str:
+    """
+    计算片段提取结果的缓存键
+
+    Args:
+        query (str): 用户查询
+        content (str): 片段内容
+        provider_config (Dict[str, Any]): map阶段使用的提供商配置
+
+    Returns:
+        str: 缓存键
+    """
+    digest = hashlib.sha256()
+    for part in (MAP_SYSTEM_PROMPT, provider_config["model"], query, content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class MapRunner:
+    """并发执行map请求，受提供商速率限制约束"""
+
+    def __init__(self, query: str, provider_config: Dict[str, Any], keys: KeyPool,
+                 limiter: RateLimiter, cache: Optional[ResultCache]):
+        self.query = query
+        self.provider_config = provider_config
+        self.keys = keys
+        self.limiter = limiter
+        self.cache = cache
+        self.usage_totals = {"prompt_tokens": 0, "cached_tokens": 0}
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def map_chunk(self, label: str, content: str) -> Tuple[bool, str]:
+        """
+        从单个片段中提取与任务相关的信息
+
+        Args:
+            label (str): 片段名称
+            content (str): 片段内容
+
+        Returns:
+            Tuple[bool, str]: (是否成功, 提取结果或错误消息)
+        """
+        key = chunk_cache_key(self.query, content, self.provider_config)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self.lock:
+                    self.cache_hits += 1
+                return True, cached
+
+        # 任务描述在前，片段内容在后，使所有片段共享相同的前缀
+        messages = format_messages(MAP_SYSTEM_PROMPT, [
+            MAP_TASK_PROMPT.format(query=self.query),
+            MAP_CHUNK_PROMPT.format(label=label, content=content)
+        ], self.provider_config)
+        headers, payload = build_request(self.provider_config, "", messages,
+                                         max_tokens=MAP_MAX_TOKENS)
+
+        for attempt in range(MAP_MAX_RETRIES + 1):
+            usage = {}
+            with self.limiter:
+                success, result = call_with_keys(
+                    self.keys, headers, payload, lambda key_headers, call_usage: send_request(
+                        self.provider_config, key_headers, payload, MAP_TIMEOUT, call_usage,
+                        report_cache=False), usage)
+            with self.lock:
+                self.usage_totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.usage_totals["cached_tokens"] += usage.get("cached_tokens", 0)
+            if success or usage.get("status") != 429 or attempt == MAP_MAX_RETRIES:
+                break
+            # 被限流时指数退避后重试
+            time.sleep(2 ** attempt)
+
+        if success and self.cache:
+            self.cache.put(key, result)
+        return success, result
+
+    def run(self, chunks: Iterable[Tuple[str, str]]) -> Optional[List[Tuple[str, str]]]:
+        """
+        并发处理所有片段，同时在途的片段数受并发上限约束，避免一次性读入整个文件
+
+        Args:
+            chunks (Iterable[Tuple[str, str]]): (片段名称, 片段内容)
+
+        Returns:
+            Optional[List[Tuple[str, str]]]: 按原顺序排列的 (片段名称, 提取结果)，
+                已去除没有相关信息的片段；任一片段失败时返回None
+        """
+        workers = self.limiter.max_concurrency
+        results = {}
+        pending = deque()
+        submitted = 0
+        chunks = iter(chunks)
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or not exhausted:
+                # 保持最多 2 倍并发数的片段在途
+                while not exhausted and len(pending) < workers * 2:
+                    try:
+                        label, content = next(chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = executor.submit(self.map_chunk, label, content)
+                    pending.append((submitted, label, future))
+                    submitted += 1
+
+                if not pending:
+                    break
+                done, _ = wait([future for _, _, future in pending], return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[2] in done]:
+                    pending.remove(item)
+                    position, label, future = item
+                    success, notes = future.result()
+                    if not success:
+                        print(f"\n错误: 处理片段 {label} 失败: {notes}")
+                        for _, _, other in pending:
+                            other.cancel()
+                        return None
+                    results[position] = (label, notes)
+                print(f"分块处理进度: 已完成 {len(results)} 个片段 (缓存命中 {self.cache_hits})", end="\r")
+        print()
+
+        return [results[position] for position in sorted(results)
+                if results[position][1].strip() != MAP_NO_RELEVANT_MESSAGE]
+
+def group_notes(notes: List[Tuple[str, str]], chunk_tokens: int) -> Iterator[Tuple[str, str]]:
+    """
+    将提取结果合并为不超过片段预算的组，用于再次汇总
+
+    Args:
+        notes (List[Tuple[str, str]]): (片段名称, 提取结果) 列表
+        chunk_tokens (int): 每组的token上限
+
+    Yields:
+        Tuple[str, str]: (组名称, 组内容)
+    """
+    group = []
+    tokens = 0
+    index = 1
+    for label, text in notes:
+        entry = f"[{label}]\n{text}\n"
+        entry_tokens = estimate_tokens(entry)
+        if group and tokens + entry_tokens > chunk_tokens:
+            yield f"提取结果 第{index}组", "\n".join(group)
+            index += 1
+            group = []
+            tokens = 0
+        group.append(entry)
+        tokens += entry_tokens
+    if group:
+        yield f"提取结果 第{index}组", "\n".join(group)
+
+def map_reduce_file_contents(query: str, filenames: List[str],
+                             is_script: bool = False) -> Optional[List[Tuple[str, str]]]:
+    """
+    通过分块提取把任意大小的文件压缩为适合reduce阶段的上下文
+
+    Args:
+        query (str): 用户查询
+        filenames (List[str]): 文件列表
+        is_script (bool): reduce阶段是否为脚本模式
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: (片段名称, 提取结果) 列表，出错时返回None
+    """
+    model_manager = ModelManager()
+    # map阶段使用命令模式的提供商（通常更快、更便宜）
+    map_provider = get_provider_config(model_manager, is_script=False)
+    reduce_provider = get_provider_config(model_manager, is_script)
+
+    keys = get_key_pool(map_provider, model_manager)
+    if not len(keys):
+        print(f"错误: {missing_key_message(map_provider)}")
+        return None
+
+    available = map_provider["token_limit"] - RESERVED_TOKENS
+    if available < MIN_CHUNK_TOKENS:
+        print(f"错误: 模型 {map_provider['model']} 的上下文 ({map_provider['token_limit']} tokens) "
+              f"过小，无法分块处理，至少需要 {MIN_CHUNK_TOKENS + RESERVED_TOKENS} tokens")
+        return None
+    chunk_tokens = min(MAP_CHUNK_TOKENS, available)
+    reduce_budget = max(0, reduce_provider["token_limit"] - RESERVED_TOKENS)
+
+    try:
+        cache = ResultCache(MAPREDUCE_CACHE_FILE, MAPREDUCE_CACHE_MAX_BYTES)
+    except Exception:
+        cache = None
+
+    runner = MapRunner(query, map_provider, keys, get_rate_limiter(map_provider, len(keys)), cache)
+
+    def file_chunks():
+        for filename in filenames:
+            for start_line, end_line, content in iter_file_chunks(filename, chunk_tokens):
+                yield f"{filename} (第{start_line}-{end_line}行)", content
+
+    try:
+        notes = runner.run(file_chunks())
+    except OSError as e:
+        print(f"读取文件出错: {str(e)}")
+        return None
+
+    # 提取结果仍然超出reduce预算时，逐轮汇总；结果数和token数都没有减少时停止，
+    # 避免每条结果都接近片段预算时反复提取相同的内容
+    rounds = 0
+    while notes is not None and len(notes) > 1:
+        total = sum(estimate_tokens(text) for _, text in notes)
+        if total <= reduce_budget:
+            break
+        if rounds == MAX_REDUCE_ROUNDS:
+            print(f"警告: 汇总 {rounds} 轮后提取结果仍超出预算，使用当前结果")
+            break
+        print(f"提取结果超出预算，继续汇总 {len(notes)} 个结果...")
+        summarized = runner.run(group_notes(notes, chunk_tokens))
+        rounds += 1
+        if summarized is not None and len(summarized) >= len(notes) and \
+                sum(estimate_tokens(text) for _, text in summarized) >= total:
+            print("警告: 再次汇总没有缩小提取结果，使用当前结果")
+            break
+        notes = summarized
+
+    if notes is None:
+        return None
+
+    if runner.usage_totals["prompt_tokens"]:
+        report_cache_usage(runner.usage_totals)
+    print(f"分块处理完成: {len(notes)} 个片段包含相关信息")
+    return notes
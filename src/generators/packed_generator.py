@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+合并命令请求 - 一次API调用回答多个简短的命令查询
+
+批量处理时大部分命令查询只有几百个token，单独发送时每个请求都要重复系统指令和
+环境上下文，并承担一次请求的往返开销。共享同一上下文的多个查询合并为一个编号请求，
+回复按编号拆分回各个查询；编号缺失、重复或为空的回答改为单独请求。合并请求本身失败
+（网络或HTTP错误）时与查询内容无关，暂时性失败重试合并请求，仍然失败时整组报告错误，
+不会把一次失败放大为每个查询一次单独请求。
+"""
+
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.prompts import (
+    PACKED_COMMAND_SYSTEM_PROMPT,
+    PACKED_QUERY_PROMPT,
+    PACKED_QUERY_ITEM,
+    COMMAND_FILE_SUFFIX
+)
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    get_provider_config,
+    build_context_blocks,
+    format_messages,
+    build_request,
+    call_with_keys,
+    is_retryable,
+    request_generation,
+    send_request
+)
+from src.utils.http_client import get_session
+from src.utils.key_pool import get_key_pool, missing_key_message
+from src.utils.rate_limiter import get_rate_limiter
+
+# 每次合并的默认查询数
+DEFAULT_PACK_SIZE = 8
+
+# 合并请求中每个查询的回复token上限（与单独的命令请求相同）
+PACKED_TOKENS_PER_QUERY = 200
+
+# 合并请求的超时秒数
+PACKED_TIMEOUT = 60
+
+# 合并请求暂时性失败（限流、服务端错误、网络错误）时的最多重试次数
+PACKED_RETRIES = 2
+
+# 重试合并请求前的退避秒数，按重试次数加倍
+PACKED_RETRY_DELAY = 2.0
+
+# 回复中的一个回答: "[编号] 命令"
+ANSWER_PATTERN = re.compile(r"^\s*\[(\d+)\]\s*(.*?)\s*$")
+
+def pack_query_text(query: str) -> str:
+    """把查询压缩为一行，避免换行打乱编号"""
+    return " ".join(query.split())
+
+def build_packed_messages(queries: List[str], context: Dict[str, str],
+                          provider_config: Dict[str, Any],
+                          file_contents: Optional[List[Tuple[str, str]]] = None) -> List[Dict[str, Any]]:
+    """
+    构建合并请求的消息列表
+
+    系统指令、环境上下文和文件内容与单独请求一样放在前面，编号的查询列表放在最后。
+
+    Args:
+        queries (List[str]): 查询列表
+        context (Dict[str, str]): bash环境上下文
+        provider_config (Dict[str, Any]): 提供商配置
+        file_contents (List[Tuple[str, str]], optional): 所有查询共享的文件内容
+
+    Returns:
+        List[Dict[str, Any]]: 消息列表
+    """
+    items = "\n".join(PACKED_QUERY_ITEM.format(index=index, query=pack_query_text(query))
+                      for index, query in enumerate(queries, 1))
+    blocks = build_context_blocks(context, file_contents)
+    blocks.append(PACKED_QUERY_PROMPT.format(file_suffix=COMMAND_FILE_SUFFIX if file_contents else "",
+                                             count=len(queries), queries=items))
+    return format_messages(PACKED_COMMAND_SYSTEM_PROMPT, blocks, provider_config)
+
+def parse_packed_reply(reply: str, count: int) -> Dict[int, str]:
+    """
+    按编号拆分合并请求的回复
+
+    Args:
+        reply (str): 模型回复
+        count (int): 查询数
+
+    Returns:
+        Dict[int, str]: 查询序号（从0开始）到命令的映射，只包含能确定归属的回答
+    """
+    answers = {}  # type: Dict[int, str]
+    duplicated = set()
+    for line in reply.splitlines():
+        match = ANSWER_PATTERN.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        answer = match.group(2)
+        # 去掉模型有时添加的行内代码标记
+        if len(answer) > 1 and answer.startswith("`") and answer.endswith("`"):
+            answer = answer.strip("`").strip()
+        if not 0 <= index < count or not answer:
+            continue
+        if index in answers:
+            duplicated.add(index)
+        answers[index] = answer
+    for index in duplicated:
+        del answers[index]
+    return answers
+
+class BatchStats:
+    """批量处理的统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.requests = 0
+        self.packed = 0
+        self.fallback = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, requests: int = 0, usage: Optional[Dict[str, Any]] = None, **counts: int) -> None:
+        """累加请求数、token用量和各类查询数"""
+        usage = usage or {}
+        with self.lock:
+            self.requests += requests
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def text(self, elapsed: float) -> str:
+        """统计摘要"""
+        rate = self.queries / elapsed if elapsed > 0 else 0.0
+        per_query = self.prompt_tokens / self.queries if self.queries else 0
+        return (f"{self.queries} 个查询，{self.requests} 次请求（合并回答 {self.packed}，"
+                f"单独请求 {self.fallback}，失败 {self.failed}），耗时 {elapsed:.1f} 秒，"
+                f"{rate:.1f} 查询/秒，平均每个查询输入 {per_query:.0f} tokens")
+
+class PackedRunner:
+    """
+    合并请求回答一批命令查询
+
+    Args:
+        context (Dict[str, str]): 所有查询共享的bash环境上下文
+        file_contents (List[Tuple[str, str]], optional): 所有查询共享的文件内容
+        model_manager (ModelManager, optional): 已加载的模型配置
+        pack_size (int): 每次合并的查询数，1表示全部单独请求
+        provider_config (Dict[str, Any], optional): 使用的提供商，默认为当前的命令提供商
+    """
+
+    def __init__(self, context: Dict[str, str],
+                 file_contents: Optional[List[Tuple[str, str]]] = None,
+                 model_manager: Optional[ModelManager] = None,
+                 pack_size: int = DEFAULT_PACK_SIZE,
+                 provider_config: Optional[Dict[str, Any]] = None):
+        self.context = context
+        self.file_contents = file_contents
+        self.model_manager = model_manager or ModelManager()
+        self.pack_size = max(1, pack_size)
+        self.provider_config = provider_config or get_provider_config(self.model_manager)
+        self.provider_name = self.model_manager.config.get("command", {}).get("provider")
+        self.keys = get_key_pool(self.provider_config, self.model_manager)
+        self.limiter = get_rate_limiter(self.provider_config, len(self.keys))
+        self.session = get_session(self.provider_config["url"])
+        self.stats = BatchStats()
+
+    def request_packed(self, queries: List[str]) -> Tuple[bool, str, Dict[str, Any]]:
+        """
+        发送一个合并请求
+
+        Args:
+            queries (List[str]): 查询列表
+
+        Returns:
+            Tuple[bool, str, Dict[str, Any]]: (是否成功, 模型回复或错误消息, 用量)
+        """
+        messages = build_packed_messages(queries, self.context, self.provider_config,
+                                         self.file_contents)
+        headers, payload = build_request(self.provider_config, "", messages,
+                                         max_tokens=PACKED_TOKENS_PER_QUERY * len(queries))
+        usage = {}  # type: Dict[str, Any]
+        start = time.time()
+        with self.limiter:
+            success, reply = call_with_keys(
+                self.keys, headers, payload, lambda key_headers, call_usage: send_request(
+                    self.provider_config, key_headers, payload, PACKED_TIMEOUT, call_usage,
+                    report_cache=False, session=self.session), usage)
+        usage["latency_ms"] = int((time.time() - start) * 1000)
+        self.stats.add(requests=1, usage=usage)
+        return success, reply, usage
+
+    def request_single(self, query: str) -> Dict[str, Any]:
+        """单独请求一个查询"""
+        usage = {}  # type: Dict[str, Any]
+        with self.limiter:
+            success, answer = request_generation(self.provider_config, query, self.context, False,
+                                                 self.file_contents, usage, self.model_manager,
+                                                 self.session, provider_name=self.provider_name)
+        self.stats.add(requests=1, usage=usage, fallback=1, failed=0 if success else 1)
+        return {"query": query, "success": success, "answer": answer, "packed": False,
+                "usage": usage}
+
+    def run_group(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """
+        回答一组查询，合并请求的回复中未能解析出回答的查询改为单独请求
+
+        Args:
+            queries (List[str]): 查询列表
+
+        Returns:
+            List[Dict[str, Any]]: 每个查询的结果，见 run
+        """
+        if len(queries) == 1:
+            return [self.request_single(queries[0])]
+
+        success, reply, usage = self.request_packed(queries)
+        for attempt in range(PACKED_RETRIES):
+            if success or not is_retryable(usage):
+                break
+            time.sleep(PACKED_RETRY_DELAY * 2 ** attempt)
+            success, reply, usage = self.request_packed(queries)
+        shared = {"provider": self.provider_name, "model": self.provider_config["model"],
+                  "key": usage.get("key"), "latency_ms": usage.get("latency_ms")}
+        if not success:
+            self.stats.add(failed=len(queries))
+            return [{"query": query, "success": False, "answer": reply, "packed": True,
+                     "usage": dict(shared)} for query in queries]
+
+        answers = parse_packed_reply(reply, len(queries))
+        # 合并请求的token用量平均分给得到回答的查询
+        for field in ("prompt_tokens", "completion_tokens"):
+            if usage.get(field) is not None and answers:
+                shared[field] = usage[field] // len(answers)
+        self.stats.add(packed=len(answers))
+
+        results = []
+        for index, query in enumerate(queries):
+            if index in answers:
+                results.append({"query": query, "success": True, "answer": answers[index],
+                                "packed": True, "usage": dict(shared)})
+            else:
+                results.append(self.request_single(query))
+        return results
+
+    def run(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """
+        回答所有查询，各组并发发送，受提供商速率限制约束
+
+        Args:
+            queries (List[str]): 查询列表
+
+        Returns:
+            List[Dict[str, Any]]: 按原顺序排列的结果，每项包含 query、success、
+                answer（命令或错误消息）、packed（是否由合并请求回答）和 usage
+        """
+        self.stats.add(queries=len(queries))
+        if not len(self.keys):
+            message = missing_key_message(self.provider_config)
+            self.stats.add(failed=len(queries))
+            return [{"query": query, "success": False, "answer": message, "packed": False,
+                     "usage": {}} for query in queries]
+        groups = [queries[start:start + self.pack_size]
+                  for start in range(0, len(queries), self.pack_size)]
+        with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency) as executor:
+            return [result for results in executor.map(self.run_group, groups)
+                    for result in results]
@@ -5,20 +5,20 @@
 
 import os
 from datetime import datetime
-from typing import Dict, Tuple, List, Optional
+from typing import Any, Dict, Tuple, List, Optional
 from src.generators.base_generator import generate_bash_command
+from src.generators.conversation import Conversation
 from src.log.history import append_to_history
 
-def create_script_file(content: str, query: str) -> str:
+def parse_script_reply(content: str) -> Tuple[Optional[str], str]:
     """
-    创建可执行脚本文件，保存在用户当前工作目录
+    从模型回复中提取脚本名称和脚本内容
 
     Args:
-        content (str): 脚本内容
-        query (str): 用户的原始查询，用于生成默认文件名
-    
+        content (str): 模型回复
+
     Returns:
-        str: 脚本文件路径
+        Tuple[Optional[str], str]: (清理后的脚本名称，没有时为None, 脚本内容)
     """
     # 尝试从内容中提取脚本名称
     script_name = None
@@ -35,12 +35,6 @@ def create_script_file(content: str, query: str) -> str:
         except:
             script_name = None
 
-    # 如果没有成功提取脚本名称，使用默认名称
-    if not script_name or len(script_name) < 2:
-        # 默认名称: script_日期时间
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        script_name = f"script_{timestamp}"
-
     # 提取代码块，如果输出包含Markdown代码块
     if "```bash" in content or "```sh" in content:
         try:
@@ -53,6 +47,27 @@ def create_script_file(content: str, query: str) -> str:
             # 如果提取失败，则使用原始内容
             pass
 
+    return script_name, content
+
+def create_script_file(content: str, query: str) -> str:
+    """
+    创建可执行脚本文件，保存在用户当前工作目录
+
+    Args:
+        content (str): 脚本内容
+        query (str): 用户的原始查询，用于生成默认文件名
+    
+    Returns:
+        str: 脚本文件路径
+    """
+    script_name, content = parse_script_reply(content)
+
+    # 如果没有成功提取脚本名称，使用默认名称
+    if not script_name or len(script_name) < 2:
+        # 默认名称: script_日期时间
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        script_name = f"script_{timestamp}"
+
     # 确保文件名不重复
     script_path = os.path.join(os.getcwd(), f"{script_name}.sh")
     counter = 1
@@ -74,7 +89,10 @@ def create_script_file(content: str, query: str) -> str:
 
 def handle_script_generation(query: str, context: Dict[str, str], 
                             file_contents: Optional[List[Tuple[str, str]]] = None,
-                            filenames: Optional[List[str]] = None) -> None:
+                            filenames: Optional[List[str]] = None,
+                            conversation: Optional[Conversation] = None,
+                            generated: Optional[Tuple[bool, str]] = None,
+                            usage: Optional[Dict[str, Any]] = None) -> None:
     """
     处理脚本生成的主要逻辑
 
@@ -83,26 +101,41 @@ def handle_script_generation(query: str, context: Dict[str, str],
         context (Dict[str, str]): 系统上下文
         file_contents (List[Tuple[str, str]], optional): 文件内容列表
         filenames (List[str], optional): 文件名列表
+        conversation (Conversation, optional): 会话中的多轮对话，提供时在之前的对话基础上生成
+        generated (Tuple[bool, str], optional): 已经生成的结果（如命令模式中提前开始的脚本请求），
+            提供时不再发送请求
+        usage (Dict[str, Any], optional): 与 generated 对应的用量信息
     """
-    print("正在处理请求...")
-    success, result = generate_bash_command(
-        query, 
-        context, 
-        is_script=True,
-        file_contents=file_contents
-    )
+    if generated is not None:
+        success, result = generated
+        usage = usage or {}
+    else:
+        print("正在处理请求...")
+        usage = {}
+        success, result = generate_bash_command(
+            query, 
+            context, 
+            is_script=True,
+            file_contents=file_contents,
+            usage=usage,
+            conversation=conversation
+        )
 
     if success:
+        if conversation is not None:
+            conversation.add_turn(query, result)
         script_path = create_script_file(result, query)
+        print(f"\n脚本已创建: {script_path}")
+        print("您可以使用以下命令运行脚本:")
+        print(f"\033[92m{script_path}\033[0m")
+        # 先输出结果，历史记录在后台写入
         append_to_history(
             query, 
             result, 
             "script", 
             script_path, 
-            filenames
+            filenames,
+            usage
         )
-        print(f"\n脚本已创建: {script_path}")
-        print("您可以使用以下命令运行脚本:")
-        print(f"\033[92m{script_path}\033[0m")
     else:
         print(f"错误: {result}")
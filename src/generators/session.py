@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+会话延续 - 跨多次调用保存对话
+
+指定 -continue 或 -session 的查询才会保存为会话，普通查询（包括管道输入和文件内容）
+不写入磁盘。-continue 在最近使用的会话（没有时为 default 会话）基础上继续，
+-session NAME 使用指定名称的会话。继续时第一轮的环境上下文和文件内容
+按保存的原样重建，使提示前缀在各次调用之间字节不变；再次指定的文件如果已经发送过，
+只发送引用或与上次发送内容的差异。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import SESSION_DIR
+from config.prompts import (
+    FILE_CONTENT_PROMPT,
+    SESSION_FILE_UNCHANGED_PROMPT,
+    SESSION_FILE_DIFF_PROMPT,
+    SESSION_CONTEXT_CHANGED_PROMPT
+)
+from src.generators.conversation import Conversation
+from src.utils.token_utils import estimate_tokens
+
+# 未指定名称时使用的会话
+DEFAULT_SESSION = "default"
+
+# 会话名称只能包含字母、数字、点、下划线和连字符
+SESSION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+def latest_session(directory: str = SESSION_DIR) -> Optional[str]:
+    """
+    获取最近使用的会话名称
+
+    Args:
+        directory (str): 会话目录
+
+    Returns:
+        Optional[str]: 会话名称，没有会话时返回None
+    """
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(".json")]
+    except OSError:
+        return None
+    if not names:
+        return None
+    latest = max(names, key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+    return latest[:-len(".json")]
+
+def file_delta(filename: str, previous: str, current: str) -> str:
+    """
+    生成文件相对于上次发送内容的附加内容
+
+    Args:
+        filename (str): 文件名
+        previous (str): 上次发送的内容
+        current (str): 当前内容
+
+    Returns:
+        str: 未修改时为引用，有修改时为差异；差异比完整内容更长时发送完整内容
+    """
+    if previous == current:
+        return SESSION_FILE_UNCHANGED_PROMPT.format(filename=filename)
+    diff = "\n".join(difflib.unified_diff(previous.splitlines(), current.splitlines(),
+                                          fromfile=filename, tofile=filename, lineterm="", n=2))
+    if estimate_tokens(diff) >= estimate_tokens(current):
+        return FILE_CONTENT_PROMPT.format(filename=filename, content=current)
+    return SESSION_FILE_DIFF_PROMPT.format(filename=filename, diff=diff)
+
+class Session:
+    """保存在磁盘上的多轮对话"""
+
+    def __init__(self, name: str, directory: str = SESSION_DIR):
+        if not SESSION_NAME_PATTERN.match(name):
+            raise ValueError(f"无效的会话名称 '{name}'，只能包含字母、数字、点、下划线和连字符")
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.json")
+        self.conversation = None  # type: Optional[Conversation]
+        # 每个文件最近一次发送的内容
+        self.files = {}  # type: Dict[str, str]
+        self._staged_files = None
+        self._saved_turns = 0
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                conversation = Conversation.from_dict(data["conversation"])
+                files = dict(data["files"])
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # 无法读取或格式错误的会话文件按新会话处理，保存时覆盖
+                print(f"警告: 无法读取会话 '{name}'，将开始新的会话: {str(e)}", file=sys.stderr)
+            else:
+                self.conversation = conversation
+                self.files = files
+                self._saved_turns = len(conversation.turns)
+
+    def start(self, context: Dict[str, str],
+              file_contents: Optional[List[Tuple[str, str]]] = None) -> Conversation:
+        """
+        开始新的对话，丢弃会话中之前的内容
+
+        Args:
+            context (Dict[str, str]): 环境上下文
+            file_contents (List[Tuple[str, str]], optional): 文件内容
+
+        Returns:
+            Conversation: 新的对话
+        """
+        self.conversation = Conversation(context, file_contents)
+        self._staged_files = dict(file_contents or [])
+        self._saved_turns = 0
+        return self.conversation
+
+    def resume(self, context: Dict[str, str],
+               file_contents: Optional[List[Tuple[str, str]]] = None) -> Conversation:
+        """
+        在之前的对话基础上继续，只为本轮附加变化的内容
+
+        Args:
+            context (Dict[str, str]): 当前环境上下文
+            file_contents (List[Tuple[str, str]], optional): 本次指定的文件内容
+
+        Returns:
+            Conversation: 附加了本轮内容的对话
+        """
+        if self.conversation is None or not self.conversation.turns:
+            return self.start(context, file_contents)
+
+        parts = []
+        if context.get("current_directory") != self.conversation.context.get("current_directory"):
+            parts.append(SESSION_CONTEXT_CHANGED_PROMPT.format(
+                current_directory=context.get("current_directory")))
+
+        staged = dict(self.files)
+        for filename, content in file_contents or []:
+            if filename in staged:
+                parts.append(file_delta(filename, staged[filename], content))
+            else:
+                parts.append(FILE_CONTENT_PROMPT.format(filename=filename, content=content))
+            staged[filename] = content
+
+        self._staged_files = staged
+        self.conversation.attach("".join(parts))
+        return self.conversation
+
+    def save(self) -> bool:
+        """
+        对话有新的问答时保存会话
+
+        Returns:
+            bool: 是否保存
+        """
+        if self.conversation is None or len(self.conversation.turns) <= self._saved_turns:
+            return False
+        if self._staged_files is not None:
+            self.files = self._staged_files
+            self._staged_files = None
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {"name": self.name, "updated": time.time(), "files": self.files,
+                "conversation": self.conversation.to_dict()}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._saved_turns = len(self.conversation.turns)
+        return True
+
+def open_session(name: Optional[str], continue_latest: bool,
+                 directory: str = SESSION_DIR) -> Session:
+    """
+    根据命令行参数打开会话
+
+    Args:
+        name (str, optional): -session 指定的名称
+        continue_latest (bool): 是否指定了 -continue
+        directory (str): 会话目录
+
+    Returns:
+        Session: 会话
+
+    Raises:
+        ValueError: 会话名称无效时
+    """
+    if not name:
+        name = (latest_session(directory) if continue_latest else None) or DEFAULT_SESSION
+    return Session(name, directory)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+监视模式 - 文件增长时根据新内容增量地重新查询
+
+只有新追加的内容和之前内容的简要摘要会发送给模型，环境上下文和任务描述作为共享前缀
+保持不变。新内容停止增长 debounce 秒后才发送请求（文件持续增长时最长等待 max_wait 秒），
+两次请求之间至少间隔 min_interval 秒，并受提供商速率限制约束。两次请求之间的新内容
+只保留开头和结尾，因此CPU和token消耗只与追加的字节数有关，与文件总大小无关。
+"""
+
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config.prompts import (
+    WATCH_NONE_MESSAGE,
+    WATCH_SYSTEM_PROMPT,
+    WATCH_TASK_PROMPT,
+    WATCH_UPDATE_PROMPT
+)
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import (
+    get_provider_config,
+    format_environment,
+    format_messages,
+    build_request,
+    call_with_keys,
+    send_request
+)
+from src.log.history import append_to_history
+from src.utils.file_follower import FileFollower
+from src.utils.file_utils import LOG_LEVELS, fit_to_budget
+from src.utils.http_client import get_session
+from src.utils.key_pool import get_key_pool, missing_key_message
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.stream_input import HeadTailBuffer
+
+# 新内容停止增长多少秒后发送请求
+WATCH_DEBOUNCE = 2.0
+
+# 两次请求之间的最短间隔（秒）
+WATCH_MIN_INTERVAL = 10.0
+
+# 文件持续增长时，新内容最长等待多少秒后发送请求
+WATCH_MAX_WAIT = 30.0
+
+# 每次请求中新内容的token上限
+WATCH_MAX_TOKENS = 4000
+
+# 两次请求之间保留的新内容字节数（开头和结尾各一半）
+WATCH_BUFFER_BYTES = 64 * 1024
+
+# 请求超时秒数
+WATCH_TIMEOUT = 30
+
+# 包含任一日志级别的整行，每行最多匹配一次
+LEVEL_LINE_PATTERN = re.compile(
+    rb"(?m)^[^\n]*(?:" + b"|".join(re.escape(level.encode("ascii")) for level in LOG_LEVELS) + rb")[^\n]*")
+
+# 摘要中保留的最近提醒数
+SUMMARY_ALERTS = 3
+
+def format_size(size: int) -> str:
+    """将字节数格式化为易读的大小"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+class WatchStats:
+    """已处理内容的统计，用正则表达式只找出包含日志级别的行，不逐行处理其余内容"""
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.levels = Counter()
+        self.alerts = deque(maxlen=SUMMARY_ALERTS)
+
+    def add(self, data: bytes) -> None:
+        """
+        统计一块新内容
+
+        Args:
+            data (bytes): 以完整的行结束的内容
+        """
+        self.lines += data.count(b"\n")
+        self.bytes += len(data)
+        # 与 file_utils 的格式摘要相同，每行只计入按 LOG_LEVELS 顺序第一个出现的级别
+        for line in LEVEL_LINE_PATTERN.findall(data):
+            text = line.decode("ascii", errors="replace")
+            for level in LOG_LEVELS:
+                if level in text:
+                    self.levels[level] += 1
+                    break
+
+    def merge(self, other: "WatchStats") -> None:
+        """
+        合并另一份统计
+
+        Args:
+            other (WatchStats): 新处理的内容的统计
+        """
+        self.lines += other.lines
+        self.bytes += other.bytes
+        self.levels.update(other.levels)
+
+    def text(self, skipped_bytes: int = 0) -> str:
+        """
+        生成摘要文本
+
+        Args:
+            skipped_bytes (int): 监视开始前已有、未读取的字节数
+
+        Returns:
+            str: 一行摘要
+        """
+        parts = [f"已处理 {self.lines} 行 ({format_size(self.bytes)})"]
+        if skipped_bytes:
+            parts.append(f"监视开始前已有 {format_size(skipped_bytes)} 未读取")
+        if self.levels:
+            parts.append("关键字出现次数: " + ", ".join(f"{k}={v}" for k, v in self.levels.most_common()))
+        if self.alerts:
+            parts.append("已发出的提醒: " + "; ".join(self.alerts))
+        return "；".join(parts)
+
+class Watcher:
+    """跟踪文件并在新内容出现用户关心的情况时给出命令"""
+
+    def __init__(self, filename: str, query: str, follower: FileFollower,
+                 context: Dict[str, str], model_manager: Optional[ModelManager] = None,
+                 debounce: float = WATCH_DEBOUNCE, min_interval: float = WATCH_MIN_INTERVAL,
+                 max_wait: float = WATCH_MAX_WAIT, output: Callable[[str], None] = print):
+        self.filename = filename
+        self.query = query
+        self.follower = follower
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_wait = max(max_wait, debounce)
+        self.output = output
+
+        self.model_manager = model_manager or ModelManager()
+        self.provider_config = get_provider_config(self.model_manager)
+        self.keys = get_key_pool(self.provider_config, self.model_manager)
+        self.session = get_session(self.provider_config["url"])
+        self.limiter = get_rate_limiter(self.provider_config, len(self.keys))
+        # 环境和任务描述在所有请求之间保持不变
+        self.prefix = [format_environment(context),
+                       WATCH_TASK_PROMPT.format(filename=filename, query=query)]
+
+        self.summary = WatchStats()
+        # 从末尾开始监视时，开始前已有的内容不会被读取
+        self.skipped_bytes = follower.offset
+        self._reset_pending()
+        self.last_query = float("-inf")
+        self.queries = 0
+
+    def _reset_pending(self) -> None:
+        self.pending = HeadTailBuffer(WATCH_BUFFER_BYTES // 2, WATCH_BUFFER_BYTES // 2)
+        self.pending_stats = WatchStats()
+        self.first_pending = None  # type: Optional[float]
+        self.last_data = None  # type: Optional[float]
+
+    def collect(self, now: Optional[float] = None) -> int:
+        """
+        读取文件新追加的内容
+
+        Args:
+            now (float, optional): 当前时间
+
+        Returns:
+            int: 新读取的字节数
+        """
+        now = time.monotonic() if now is None else now
+        total = 0
+        for data in self.follower.read_new():
+            self.pending.write(data)
+            self.pending_stats.add(data)
+            total += len(data)
+        if total:
+            self.last_data = now
+            if self.first_pending is None:
+                self.first_pending = now
+        return total
+
+    def due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        计算距离可以发送下一次请求的秒数
+
+        Args:
+            now (float, optional): 当前时间
+
+        Returns:
+            Optional[float]: 秒数，0表示现在就应发送；没有新内容时返回None
+        """
+        if self.first_pending is None:
+            return None
+        now = time.monotonic() if now is None else now
+        ready = min(self.last_data + self.debounce, self.first_pending + self.max_wait)
+        return max(0.0, ready - now, self.last_query + self.min_interval - now)
+
+    def build_messages(self) -> Tuple[list, str]:
+        """
+        构建本次请求的消息
+
+        Returns:
+            Tuple[list, str]: (消息列表, 发送的新内容)
+        """
+        content = fit_to_budget(self.filename, self.pending.getvalue(), WATCH_MAX_TOKENS)
+        update = WATCH_UPDATE_PROMPT.format(summary=self.summary.text(self.skipped_bytes),
+                                            content=content)
+        return format_messages(WATCH_SYSTEM_PROMPT, self.prefix + [update], self.provider_config), content
+
+    def send(self, now: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        发送新内容并处理回复
+
+        Args:
+            now (float, optional): 当前时间
+
+        Returns:
+            Tuple[bool, str]: (是否成功, 模型回复或错误消息)
+        """
+        self.last_query = time.monotonic() if now is None else now
+        if not len(self.keys):
+            return False, missing_key_message(self.provider_config)
+
+        messages, _ = self.build_messages()
+        headers, payload = build_request(self.provider_config, "", messages)
+        usage = {}  # type: Dict[str, Any]
+        start = time.time()
+        with self.limiter:
+            success, result = call_with_keys(
+                self.keys, headers, payload, lambda key_headers, call_usage: send_request(
+                    self.provider_config, key_headers, payload, WATCH_TIMEOUT, call_usage,
+                    report_cache=False, session=self.session), usage)
+        if not success:
+            # 保留未处理的内容，下一次请求时重试
+            return False, result
+
+        self.queries += 1
+        self.summary.merge(self.pending_stats)
+        self._reset_pending()
+        if result.strip() != WATCH_NONE_MESSAGE:
+            self.summary.alerts.append(result)
+            usage.update(provider=self.model_manager.config.get("command", {}).get("provider"),
+                         model=self.provider_config["model"],
+                         latency_ms=int((time.time() - start) * 1000))
+            append_to_history(self.query, result, "command", None, [self.filename], usage)
+        return True, result
+
+    def step(self, now: Optional[float] = None) -> Optional[Tuple[bool, str]]:
+        """
+        读取新内容，到时间时发送请求
+
+        Args:
+            now (float, optional): 当前时间
+
+        Returns:
+            Optional[Tuple[bool, str]]: 发送了请求时返回结果，否则返回None
+        """
+        self.collect(now)
+        if self.due_in(now) != 0:
+            return None
+        success, result = self.send(now)
+        stamp = time.strftime("%H:%M:%S")
+        if not success:
+            self.output(f"[{stamp}] 错误: {result}")
+        elif result.strip() != WATCH_NONE_MESSAGE:
+            self.output(f"[{stamp}] \033[92m{result}\033[0m")
+        return success, result
+
+    def run(self) -> None:
+        """持续监视，直到按 Ctrl-C"""
+        while True:
+            wait = self.due_in()
+            # 没有待发送的内容时一直等待文件变化
+            self.follower.wait(60.0 if wait is None else wait)
+            self.step()
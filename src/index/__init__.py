@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+"""
+工作区索引模块包
+"""
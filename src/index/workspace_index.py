@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+持久化的增量工作区索引
+
+为经常查询的项目目录保存按片段切分的全文索引(SQLite FTS5)、各文件的token数、
+语言/格式以及目录概要。更新时按 mtime 和内容哈希只重新索引变化的文件，
+查询时直接从索引中检索相关片段，无需重新读取整个目录树。
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import CACHE_DIR, WORKSPACE_INDEX_DIR
+from src.utils.token_utils import estimate_tokens
+from src.utils.retrieval import query_terms, tokenize, split_line_chunks, RETRIEVAL_TOKEN_BUDGET
+
+# 建索引时跳过的目录
+IGNORED_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv",
+                ".tox", ".mypy_cache", ".pytest_cache", "dist", "build"}
+
+# 超过该大小的文件不建索引
+MAX_FILE_BYTES = 5 * 1024 * 1024
+
+# 索引格式版本，格式不同的旧索引在打开时清空，需要重新建立；
+# 修改 tokenize 的切分方式时也要增加版本（删除检索词时按相同方式重新切分）
+INDEX_VERSION = "2"
+
+# 扩展名到语言/格式的映射
+LANGUAGES = {
+    ".py": "python", ".sh": "shell", ".bash": "shell", ".zsh": "shell",
+    ".js": "javascript", ".ts": "typescript", ".go": "go", ".rs": "rust",
+    ".c": "c", ".h": "c", ".cpp": "cpp", ".java": "java", ".rb": "ruby",
+    ".json": "json", ".yaml": "yaml", ".yml": "yaml", ".toml": "toml",
+    ".ini": "ini", ".conf": "config", ".cfg": "config", ".xml": "xml",
+    ".md": "markdown", ".txt": "text", ".csv": "csv", ".log": "log",
+    ".sql": "sql", ".html": "html", ".css": "css"
+}
+
+def detect_language(path: str) -> str:
+    """
+    根据文件名判断语言或格式
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str: 语言或格式名称
+    """
+    name = os.path.basename(path)
+    if name in ("Dockerfile", "Makefile"):
+        return name.lower()
+    return LANGUAGES.get(os.path.splitext(name)[1].lower(), "other")
+
+def chunk_terms_text(path: str, content: str) -> str:
+    """
+    片段的检索词文本，文件路径也作为检索词，便于按文件名查找
+
+    Args:
+        path (str): 文件相对路径
+        content (str): 片段正文
+
+    Returns:
+        str: 空格分隔的检索词
+    """
+    return " ".join(tokenize(path) + tokenize(content))
+
+def index_path_for(root: str) -> str:
+    """
+    获取工作区索引数据库的路径
+
+    Args:
+        root (str): 工作区目录
+
+    Returns:
+        str: 数据库文件路径
+    """
+    digest = hashlib.sha1(os.path.realpath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(WORKSPACE_INDEX_DIR, f"{digest}.db")
+
+class WorkspaceIndex:
+    """工作区索引"""
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = os.path.realpath(root)
+        self.path = path or index_path_for(self.root)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """创建索引表，格式版本不同的旧索引先清空"""
+        with self.conn:
+            if self._version() not in (None, INDEX_VERSION):
+                for table in ("files", "chunks", "chunk_terms", "meta"):
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " tokens INTEGER NOT NULL,"
+                " language TEXT NOT NULL)"
+            )
+            # 片段正文以zlib压缩存储
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " start_line INTEGER NOT NULL,"
+                " end_line INTEGER NOT NULL,"
+                " content BLOB NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path)")
+            # 检索词由 tokenize 预先切分，rowid 与 chunks.id 对应；
+            # 不保存检索词原文（content=''），片段信息只保存在 chunks 中
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(terms, content='')"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                              (INDEX_VERSION,))
+
+    def _version(self) -> Optional[str]:
+        """已有索引的格式版本，新数据库返回None，没有记录版本的旧索引返回空字符串"""
+        if not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone():
+            return None
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row is not None else ""
+
+    def exists(self) -> bool:
+        """
+        判断索引是否已经建立
+
+        Returns:
+            bool: 是否已建立
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+        return row is not None
+
+    def _walk(self):
+        """遍历工作区中需要建索引的文件，返回相对路径"""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if d not in IGNORED_DIRS and not d.startswith("."))
+            # 不索引 Bash-Copilot 自身的缓存目录
+            if os.path.realpath(dirpath).startswith(os.path.realpath(CACHE_DIR)):
+                continue
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                if os.path.islink(full_path) or not os.path.isfile(full_path):
+                    continue
+                yield os.path.relpath(full_path, self.root)
+
+    def _read_text(self, full_path: str) -> Optional[bytes]:
+        """读取文本文件，二进制文件返回None"""
+        with open(full_path, "rb") as f:
+            data = f.read()
+        if b"\0" in data[:8192]:
+            return None
+        return data
+
+    def _remove_file(self, path: str):
+        """删除文件的所有索引数据"""
+        rows = self.conn.execute("SELECT id, content FROM chunks WHERE path = ?", (path,)).fetchall()
+        # 不保存原文的FTS5表删除时需要提供写入时的检索词，按相同方式重新切分
+        self.conn.executemany(
+            "INSERT INTO chunk_terms (chunk_terms, rowid, terms) VALUES ('delete', ?, ?)",
+            [(chunk_id, chunk_terms_text(path, zlib.decompress(content).decode("utf-8")))
+             for chunk_id, content in rows])
+        self.conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _index_file(self, path: str, st: os.stat_result, data: bytes, digest: str):
+        """为单个文件写入片段和检索词"""
+        text = data.decode("utf-8", errors="replace")
+        self._remove_file(path)
+        for start_line, end_line, content in split_line_chunks(text):
+            cursor = self.conn.execute(
+                "INSERT INTO chunks (path, start_line, end_line, content) VALUES (?, ?, ?, ?)",
+                (path, start_line, end_line, zlib.compress(content.encode("utf-8")))
+            )
+            self.conn.execute("INSERT INTO chunk_terms (rowid, terms) VALUES (?, ?)",
+                              (cursor.lastrowid, chunk_terms_text(path, content)))
+        self.conn.execute(
+            "INSERT INTO files (path, size, mtime_ns, content_hash, tokens, language)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, digest, estimate_tokens(text), detect_language(path))
+        )
+
+    def update(self, rebuild: bool = False) -> Dict[str, int]:
+        """
+        增量更新索引，只重新索引新增或内容变化的文件
+
+        Args:
+            rebuild (bool): 是否丢弃现有索引完全重建
+
+        Returns:
+            Dict[str, int]: 各类文件的数量统计 (added/updated/removed/unchanged/skipped)
+        """
+        stats = Counter()
+        with self.conn:
+            if rebuild:
+                for table in ("files", "chunks"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute("INSERT INTO chunk_terms (chunk_terms) VALUES ('delete-all')")
+                self.conn.execute("DELETE FROM meta WHERE key != 'version'")
+
+            known = {row[0]: row[1:] for row in self.conn.execute(
+                "SELECT path, size, mtime_ns, content_hash FROM files")}
+            seen = set()
+
+            for path in self._walk():
+                full_path = os.path.join(self.root, path)
+                try:
+                    st = os.stat(full_path)
+                    if st.st_size > MAX_FILE_BYTES:
+                        stats["skipped"] += 1
+                        continue
+                    previous = known.get(path)
+                    if previous and previous[0] == st.st_size and previous[1] == st.st_mtime_ns:
+                        seen.add(path)
+                        stats["unchanged"] += 1
+                        continue
+                    data = self._read_text(full_path)
+                except OSError:
+                    stats["skipped"] += 1
+                    continue
+                if data is None:
+                    stats["skipped"] += 1
+                    continue
+
+                seen.add(path)
+                digest = hashlib.sha256(data).hexdigest()
+                if previous and previous[2] == digest:
+                    # 只有mtime变化，内容未变
+                    self.conn.execute("UPDATE files SET mtime_ns = ? WHERE path = ?",
+                                      (st.st_mtime_ns, path))
+                    stats["unchanged"] += 1
+                    continue
+
+                self._index_file(path, st, data, digest)
+                stats["updated" if previous else "added"] += 1
+
+            for path in set(known) - seen:
+                self._remove_file(path)
+                stats["removed"] += 1
+
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root', ?)", (self.root,))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)",
+                              (str(time.time()),))
+        return dict(stats)
+
+    def summary(self) -> str:
+        """
+        生成目录概要
+
+        Returns:
+            str: 文件数、语言分布、token总数和顶层目录
+        """
+        count, tokens = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM files").fetchone()
+        languages = self.conn.execute(
+            "SELECT language, COUNT(*) FROM files GROUP BY language ORDER BY COUNT(*) DESC LIMIT 10"
+        ).fetchall()
+        top_level = Counter(path.split(os.sep, 1)[0] if os.sep in path else "."
+                            for (path,) in self.conn.execute("SELECT path FROM files"))
+
+        lines = [f"根目录: {self.root}",
+                 f"共 {count} 个文件, 预估 {tokens} tokens",
+                 "语言/格式: " + ", ".join(f"{lang}={n}" for lang, n in languages)]
+        if top_level:
+            lines.append("顶层目录: " + ", ".join(f"{name}({n})" for name, n in top_level.most_common(15)))
+        return "\n".join(lines)
+
+    def search(self, query: str, budget: int = RETRIEVAL_TOKEN_BUDGET) -> List[Tuple[str, str]]:
+        """
+        检索与查询最相关的片段
+
+        Args:
+            query (str): 用户查询
+            budget (int): 片段内容的token预算
+
+        Returns:
+            List[Tuple[str, str]]: (带行号范围的片段名称, 片段内容) 列表
+        """
+        terms = sorted(set(query_terms(query)))
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self.conn.execute(
+            "SELECT c.path, c.start_line, c.end_line, c.content"
+            " FROM chunk_terms JOIN chunks c ON c.id = chunk_terms.rowid"
+            " WHERE chunk_terms MATCH ? ORDER BY bm25(chunk_terms) LIMIT ?",
+            (match, max(1, budget // 100))
+        ).fetchall()
+
+        selected = []
+        used = 0
+        for path, start_line, end_line, content in rows:
+            text = zlib.decompress(content).decode("utf-8")
+            tokens = estimate_tokens(text)
+            if used + tokens > budget:
+                continue
+            selected.append((path, start_line, end_line, text))
+            used += tokens
+
+        selected.sort()
+        return [(f"{path} (第{start_line}-{end_line}行)", text.rstrip("\n"))
+                for path, start_line, end_line, text in selected]
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+def workspace_file_contents(root: str, query: str) -> Optional[List[Tuple[str, str]]]:
+    """
+    从工作区索引中获取查询上下文
+
+    Args:
+        root (str): 工作区目录
+        query (str): 用户查询
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: 目录概要和相关片段组成的文件内容列表，索引不存在时返回None
+    """
+    # 没有索引时不打开数据库，避免为该目录创建空的索引文件
+    index = WorkspaceIndex(root) if os.path.exists(index_path_for(root)) else None
+    try:
+        if index is None or not index.exists():
+            print(f"错误: 工作区 '{root}' 尚未建立索引")
+            print(f"请先运行: bcopilot index build {root}")
+            return None
+        results = index.search(query)
+        print(f"从工作区索引检索到 {len(results)} 个相关片段")
+        return [("工作区概要", index.summary())] + results
+    finally:
+        if index is not None:
+            index.close()
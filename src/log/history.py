@@ -1,17 +1,77 @@
 #!/usr/bin/env python3
 """
 历史记录日志功能
+
+记录在后台线程中写入历史记录存储，调用方在结果输出后提交记录即可返回，
+进程退出前会写完所有已提交的记录。
 """
 
-from datetime import datetime
-from typing import List, Optional
-from config.constants import HISTORY_FILE
+import sys
+import queue
+import atexit
+import threading
+from typing import Any, Dict, List, Optional
+from src.log.history_store import HistoryStore, make_entry
+
+class HistoryWriter:
+    """在后台线程中顺序写入历史记录"""
+
+    def __init__(self, store: Optional[HistoryStore] = None):
+        self.store = store
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, entry: Dict[str, Any]) -> None:
+        """
+        提交一条历史记录，首次提交时启动写入线程
+
+        Args:
+            entry (Dict[str, Any]): 历史记录
+        """
+        with self.lock:
+            if self.thread is None:
+                if self.store is None:
+                    try:
+                        self.store = HistoryStore()
+                    except Exception as e:
+                        # 历史记录目录不可用时丢弃该记录，不影响调用者，下次提交时重试
+                        print(f"警告: 打开历史记录失败: {str(e)}", file=sys.stderr)
+                        return
+                self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+        self.queue.put(entry)
+
+    def _run(self):
+        """写入线程的主循环"""
+        while True:
+            entry = self.queue.get()
+            try:
+                self.store.append(entry)
+            except Exception as e:
+                print(f"警告: 写入历史记录失败: {str(e)}", file=sys.stderr)
+            finally:
+                self.queue.task_done()
 
-def append_to_history(query: str, answer: str, type_name: str = "command", 
-                     script_path: Optional[str] = None, 
-                     filenames: Optional[List[str]] = None) -> None:
+    def flush(self) -> None:
+        """等待所有已提交的记录写入完成"""
+        if self.thread is not None:
+            self.queue.join()
+
+_writer = HistoryWriter()
+
+def flush_history() -> None:
+    """等待后台写入的历史记录全部落盘"""
+    _writer.flush()
+
+def append_to_history(query: str, answer: str, type_name: str = "command",
+                     script_path: Optional[str] = None,
+                     filenames: Optional[List[str]] = None,
+                     usage: Optional[Dict[str, Any]] = None,
+                     cwd: Optional[str] = None) -> None:
     """
-    将查询和结果追加到历史记录文件
+    将查询和结果提交到历史记录存储，实际写入在后台线程中完成
 
     Args:
         query (str): 用户的查询
@@ -19,26 +79,26 @@ def append_to_history(query: str, answer: str, type_name: str = "command",
         type_name (str): 记录类型 (command/script)
         script_path (str, optional): 脚本保存路径，仅在type_name为"script"时有效
         filenames (List[str], optional): 包含在提示中的文件名列表
+        usage (Dict[str, Any], optional): generate_bash_command 写入的调用信息
+            （提供商、模型、所用密钥的标签、耗时、token用量，以及级联路由的层级和每一层的尝试记录）
+        cwd (str, optional): 查询所在的目录，默认为当前进程的工作目录（后台进程代替客户端记录时需要指定）
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # 准备要写入的内容
-    entry = f"""
-=== {timestamp} [{type_name}] ===
-查询: {query}
-"""
-    # 如果指定了文件，添加文件信息
-    if filenames:
-        entry += f"相关文件: {', '.join(filenames)}\n"
-    
-    entry += f"结果: {answer}\n"
-
-    # 如果是脚本类型且提供了脚本路径，则添加脚本路径信息
-    if type_name == "script" and script_path:
-        entry += f"脚本位置: {script_path}\n"
-    
-    entry += f"{'=' * 60}\n"
-
-    # 追加到历史文件
-    with open(HISTORY_FILE, 'a') as f:
-        f.write(entry)
+    usage = usage or {}
+    entry = make_entry(
+        query,
+        answer,
+        type_name,
+        files=list(filenames or []),
+        script_path=script_path if type_name == "script" else None,
+        provider=usage.get("provider"),
+        model=usage.get("model"),
+        latency_ms=usage.get("latency_ms"),
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        cached_tokens=usage.get("cached_tokens"),
+        tier=usage.get("tier"),
+        cascade=usage.get("cascade"),
+        key=usage.get("key"),
+        cwd=cwd
+    )
+    _writer.submit(entry)
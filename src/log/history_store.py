@@ -0,0 +1,842 @@
+#!/usr/bin/env python3
+"""
+历史记录存储
+
+每条历史记录是一行JSON，追加写入 logs/history/ 下的分段日志 (segment-NNNNNN.jsonl)。
+检索使用旁路的SQLite索引：字段索引支持按模式、提供商、模型和时间过滤，
+FTS5全文索引支持按查询、结果和文件名检索。写入时只追加日志，
+查询前从上次索引到的位置增量追赶，因此写入开销恒定，查询不需要扫描日志。
+
+分段日志达到大小或时间上限后封存，封存的分段压缩为由独立gzip成员组成的
+.jsonl.gz 文件，并附带稀疏时间索引 (.idx)，按时间范围读取时直接定位到相关的块。
+压缩和按时间、总大小的保留策略在后台进程中执行，不阻塞写入。
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import fcntl
+import sqlite3
+import subprocess
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config.constants import (
+    SCRIPT_DIR,
+    HISTORY_DIR,
+    HISTORY_SEGMENT_MAX_BYTES,
+    HISTORY_SEGMENT_MAX_AGE,
+    HISTORY_RETENTION_DAYS,
+    HISTORY_MAX_BYTES
+)
+from src.utils.retrieval import tokenize
+
+# 分段日志文件名格式，封存后的分段带有 .gz 后缀
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.jsonl(\.gz)?$")
+
+# 封存分段的稀疏时间索引后缀
+SPARSE_INDEX_SUFFIX = ".idx"
+
+# 检索索引文件名
+INDEX_FILENAME = "index.db"
+
+# 压缩时每个gzip成员包含的未压缩字节数
+BLOCK_BYTES = 64 * 1024
+
+# 分段停止写入多久后才压缩，避免与仍在写入旧分段的进程冲突（秒）
+SEAL_GRACE_SECONDS = 60
+
+# 后台压缩的最短间隔（秒）
+COMPACT_INTERVAL = 3600
+
+# 压缩锁和上次压缩时间标记的文件名
+COMPACT_LOCK_FILENAME = "compact.lock"
+
+# 每批写入索引的记录数
+INDEX_BATCH_SIZE = 5000
+
+# 不超过该字节数的记录用一次 write 写入，更大的记录可能被拆分为多次 write
+SINGLE_WRITE_BYTES = 4096
+
+# 正在导入旧版历史记录时导入标记的值，导入完成后改为完成时间
+LEGACY_IMPORTING = "importing"
+
+# 记录的结构化字段，依次对应索引表的列
+FIELDS = ("timestamp", "mode", "query", "answer", "provider", "model", "latency_ms",
+          "prompt_tokens", "completion_tokens", "cached_tokens", "files", "script_path", "cwd")
+
+# 查询索引表时读取的列
+COLUMNS = ", ".join(["entries.id"] + [f"entries.{field}" for field in FIELDS])
+
+def segment_name(sequence: int) -> str:
+    """
+    生成分段日志的文件名
+
+    Args:
+        sequence (int): 分段序号
+
+    Returns:
+        str: 文件名
+    """
+    return f"segment-{sequence:06d}.jsonl"
+
+def make_entry(query: str, answer: str, mode: str = "command", **fields: Any) -> Dict[str, Any]:
+    """
+    构造一条历史记录
+
+    Args:
+        query (str): 用户查询
+        answer (str): 生成的结果
+        mode (str): 记录类型 (command/script)
+        **fields: 其他结构化字段，见 FIELDS
+
+    Returns:
+        Dict[str, Any]: 历史记录
+    """
+    entry = {"timestamp": time.time(), "mode": mode, "query": query, "answer": answer,
+             "files": [], "cwd": os.getcwd()}
+    entry.update({key: value for key, value in fields.items() if value is not None})
+    return entry
+
+def encode_entry(entry: Dict[str, Any]) -> bytes:
+    """
+    将历史记录编码为一行JSON
+
+    Args:
+        entry (Dict[str, Any]): 历史记录
+
+    Returns:
+        bytes: 以换行结尾的UTF-8编码
+    """
+    return (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def entry_terms(entry: Dict[str, Any]) -> str:
+    """
+    生成全文索引使用的检索词
+
+    Args:
+        entry (Dict[str, Any]): 历史记录
+
+    Returns:
+        str: 空格分隔的检索词
+    """
+    text = " ".join([entry.get("query") or "", entry.get("answer") or "",
+                     " ".join(entry.get("files") or [])])
+    return " ".join(tokenize(text))
+
+def append_record(path: str, data: bytes) -> int:
+    """
+    以 O_APPEND 方式追加一条完整的记录
+
+    不超过 SINGLE_WRITE_BYTES 的记录在 flock 共享锁下用一次 write 写入，多个进程可以
+    同时追加小记录；更大的记录可能被拆分为多次 write，在 flock 排他锁下写入，写入期间
+    其他进程的追加（无论大小）都会等待，记录不会交错。
+
+    Args:
+        path (str): 分段日志路径
+        data (bytes): 编码后的记录
+
+    Returns:
+        int: 写入后的文件大小
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        single = len(data) <= SINGLE_WRITE_BYTES
+        fcntl.flock(fd, fcntl.LOCK_SH if single else fcntl.LOCK_EX)
+        try:
+            if single:
+                written = os.write(fd, data)
+                if written != len(data):
+                    raise OSError(f"历史记录写入不完整 ({written}/{len(data)} 字节)")
+            else:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+def segment_sequence(name: str) -> int:
+    """
+    获取分段日志的序号
+
+    Args:
+        name (str): 分段日志文件名
+
+    Returns:
+        int: 序号
+    """
+    return int(SEGMENT_PATTERN.match(name).group(1))
+
+def entry_timestamp(line: bytes) -> Optional[float]:
+    """读取一行记录的时间戳，无法解析时返回None"""
+    try:
+        return float(json.loads(line)["timestamp"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def compress_segment(path: str) -> str:
+    """
+    压缩一个已封存的分段日志
+
+    每约 BLOCK_BYTES 的完整行压缩为一个独立的gzip成员，整个文件仍可用 zcat 读取；
+    同时写入稀疏时间索引，记录每个块的时间范围、压缩后位置和未压缩起始位置。
+
+    Args:
+        path (str): .jsonl 分段日志路径
+
+    Returns:
+        str: .jsonl.gz 文件路径
+    """
+    target = path + ".gz"
+    blocks = []
+    uncompressed = 0
+    with open(path, "rb") as src, open(target + ".tmp", "wb") as dst:
+        while True:
+            lines = src.readlines(BLOCK_BYTES)
+            if not lines:
+                break
+            data = b"".join(lines)
+            stamps = [ts for ts in map(entry_timestamp, lines) if ts is not None]
+            member = gzip.compress(data, mtime=0)
+            blocks.append({"start": uncompressed, "offset": dst.tell(), "length": len(member),
+                           "min_ts": min(stamps) if stamps else None,
+                           "max_ts": max(stamps) if stamps else None})
+            dst.write(member)
+            uncompressed += len(data)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    stamps = [block[key] for block in blocks for key in ("min_ts", "max_ts") if block[key] is not None]
+    sparse_index = {"size": uncompressed, "min_ts": min(stamps) if stamps else None,
+                    "max_ts": max(stamps) if stamps else None, "blocks": blocks}
+    with open(target + SPARSE_INDEX_SUFFIX, "w") as f:
+        json.dump(sparse_index, f)
+    # 稀疏索引先落盘，.gz 文件出现即表示压缩完整
+    os.rename(target + ".tmp", target)
+    os.remove(path)
+    return target
+
+def load_sparse_index(path: str) -> Dict[str, Any]:
+    """
+    读取封存分段的稀疏时间索引
+
+    Args:
+        path (str): .jsonl.gz 文件路径
+
+    Returns:
+        Dict[str, Any]: 稀疏索引
+    """
+    with open(path + SPARSE_INDEX_SUFFIX) as f:
+        return json.load(f)
+
+def iter_compressed_lines(path: str, start: int = 0, since: Optional[float] = None,
+                          until: Optional[float] = None) -> Iterator[Tuple[int, bytes]]:
+    """
+    读取封存分段中的行，只解压与位置和时间范围相关的块
+
+    Args:
+        path (str): .jsonl.gz 文件路径
+        start (int): 未压缩数据中的起始位置，之前的行被跳过
+        since (float, optional): 只读取包含该时间之后记录的块
+        until (float, optional): 只读取包含该时间之前记录的块
+
+    Yields:
+        Tuple[int, bytes]: (行在未压缩数据中的位置, 行内容)
+    """
+    sparse_index = load_sparse_index(path)
+    blocks = sparse_index["blocks"]
+    with open(path, "rb") as f:
+        for position, block in enumerate(blocks):
+            end = blocks[position + 1]["start"] if position + 1 < len(blocks) else sparse_index["size"]
+            if end <= start:
+                continue
+            if since is not None and block["max_ts"] is not None and block["max_ts"] < since:
+                continue
+            if until is not None and block["min_ts"] is not None and block["min_ts"] >= until:
+                continue
+            f.seek(block["offset"])
+            data = zlib.decompress(f.read(block["length"]), wbits=31)
+            offset = block["start"]
+            for line in data.splitlines(keepends=True):
+                if offset >= start:
+                    yield offset, line
+                offset += len(line)
+
+def start_background_compaction(directory: str, settings: Dict[str, Any]) -> None:
+    """
+    在独立的后台进程中执行压缩和保留策略，当前进程不等待其结束
+
+    Args:
+        directory (str): 历史记录目录
+        settings (Dict[str, Any]): HistoryStore 的分段和保留设置
+    """
+    code = ("import sys, json; from src.log.history_store import HistoryStore; "
+            "HistoryStore(sys.argv[1], auto_compact=False, **json.loads(sys.argv[2])).compact()")
+    try:
+        subprocess.Popen([sys.executable, "-c", code, directory, json.dumps(settings)],
+                         cwd=str(SCRIPT_DIR), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        pass
+
+def parse_legacy_history(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    解析旧版文本格式的历史记录文件
+
+    Args:
+        path (str): bcopilot_history.log 路径
+
+    Yields:
+        Dict[str, Any]: 历史记录
+    """
+    header = re.compile(r"^=== (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] ===$")
+    prefixes = {"查询: ": "query", "相关文件: ": "files", "结果: ": "answer", "脚本位置: ": "script_path"}
+    separator = "=" * 60
+
+    entry = None
+    field = None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            match = header.match(line)
+            if match:
+                when = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+                entry = {"timestamp": when.timestamp(), "mode": match.group(2),
+                         "query": "", "answer": "", "files": []}
+                field = None
+                continue
+            if entry is None:
+                continue
+            if line == separator:
+                yield entry
+                entry = None
+                continue
+            for prefix, name in prefixes.items():
+                if line.startswith(prefix):
+                    field = name
+                    value = line[len(prefix):]
+                    entry[field] = value.split(", ") if field == "files" else value
+                    break
+            else:
+                # 多行脚本内容属于上一个字段
+                if field in ("query", "answer"):
+                    entry[field] += "\n" + line
+
+class HistoryStore:
+    """历史记录的分段日志和检索索引"""
+
+    def __init__(self, directory: str = HISTORY_DIR,
+                 segment_max_bytes: int = HISTORY_SEGMENT_MAX_BYTES,
+                 segment_max_age: float = HISTORY_SEGMENT_MAX_AGE,
+                 retention_days: float = HISTORY_RETENTION_DAYS,
+                 max_bytes: int = HISTORY_MAX_BYTES,
+                 auto_compact: bool = True):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.settings = {"segment_max_bytes": segment_max_bytes, "segment_max_age": segment_max_age,
+                         "retention_days": retention_days, "max_bytes": max_bytes}
+        self.auto_compact = auto_compact
+        self._conn = None
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self) -> List[str]:
+        """
+        列出所有分段日志，按序号排列
+
+        压缩过程中中断可能同时留下 .jsonl 和 .jsonl.gz，此时只返回完整的 .gz 文件。
+
+        Returns:
+            List[str]: 文件名列表
+        """
+        names = {}
+        for name in os.listdir(self.directory):
+            if SEGMENT_PATTERN.match(name):
+                sequence = segment_sequence(name)
+                if sequence not in names or name.endswith(".gz"):
+                    names[sequence] = name
+        return [names[sequence] for sequence in sorted(names)]
+
+    def active_segment(self) -> str:
+        """
+        获取当前写入的分段日志路径
+
+        Returns:
+            str: 序号最大的未封存分段日志路径
+        """
+        segments = self.segments()
+        if not segments:
+            return os.path.join(self.directory, segment_name(1))
+        if segments[-1].endswith(".gz"):
+            return os.path.join(self.directory, segment_name(segment_sequence(segments[-1]) + 1))
+        return os.path.join(self.directory, segments[-1])
+
+    def _roll(self, path: str) -> None:
+        """创建下一个分段，之后的记录写入新分段"""
+        following = segment_name(segment_sequence(os.path.basename(path)) + 1)
+        os.close(os.open(os.path.join(self.directory, following), os.O_WRONLY | os.O_CREAT, 0o644))
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        """
+        追加一条历史记录，分段达到大小上限时切换到新分段并触发后台压缩
+
+        多个进程可以同时追加，每条记录都完整地写在一行中。
+
+        Args:
+            entry (Dict[str, Any]): 历史记录
+        """
+        path = self.active_segment()
+        size = append_record(path, encode_entry(entry))
+        rolled = size >= self.settings["segment_max_bytes"]
+        if rolled:
+            self._roll(path)
+        if self.auto_compact:
+            self.maybe_compact(force=rolled)
+
+    def maybe_compact(self, force: bool = False) -> bool:
+        """
+        距离上次压缩超过 COMPACT_INTERVAL 时启动后台压缩
+
+        Args:
+            force (bool): 是否忽略时间间隔
+
+        Returns:
+            bool: 是否启动了后台压缩
+        """
+        stamp = os.path.join(self.directory, COMPACT_LOCK_FILENAME)
+        try:
+            due = time.time() - os.path.getmtime(stamp) >= COMPACT_INTERVAL
+        except OSError:
+            due = True
+        if not (force or due):
+            return False
+        # 先更新时间标记，避免同一时间多个进程重复启动
+        with open(stamp, "a"):
+            os.utime(stamp)
+        start_background_compaction(self.directory, self.settings)
+        return True
+
+    def compact(self) -> Dict[str, int]:
+        """
+        执行按时间切换分段、压缩已封存分段和保留策略
+
+        同一时间只有一个进程执行压缩，其他进程直接返回。
+
+        Returns:
+            Dict[str, int]: 统计 (rolled/compressed/removed)，未获得压缩锁时为空
+        """
+        stats = {"rolled": 0, "compressed": 0, "removed": 0}
+        with open(os.path.join(self.directory, COMPACT_LOCK_FILENAME), "a") as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return {}
+            now = time.time()
+
+            # 按时间切换分段
+            active = self.active_segment()
+            if os.path.exists(active):
+                with open(active, "rb") as f:
+                    first = entry_timestamp(f.readline())
+                if first is not None and now - first >= self.settings["segment_max_age"]:
+                    self._roll(active)
+                    stats["rolled"] += 1
+                    active = self.active_segment()
+
+            # 压缩前先把封存分段完整写入索引
+            self.sync()
+            offsets = dict(self.conn.execute("SELECT name, indexed_offset FROM segments"))
+            for name in self.segments():
+                path = os.path.join(self.directory, name)
+                if name.endswith(".gz") or path == active:
+                    continue
+                st = os.stat(path)
+                if now - st.st_mtime < SEAL_GRACE_SECONDS or offsets.get(name, 0) < st.st_size:
+                    continue
+                if os.path.exists(path + ".gz"):
+                    # 上次压缩已完成但未删除原文件
+                    os.remove(path)
+                else:
+                    compress_segment(path)
+                stats["compressed"] += 1
+
+            stats["removed"] = self._apply_retention(now, active)
+            for name in os.listdir(self.directory):
+                if name.endswith(".gz.tmp"):
+                    os.remove(os.path.join(self.directory, name))
+        return stats
+
+    def _segment_info(self, name: str) -> Tuple[int, Optional[float]]:
+        """获取封存分段的磁盘大小和最新记录时间"""
+        path = os.path.join(self.directory, name)
+        size = os.path.getsize(path)
+        if name.endswith(".gz"):
+            size += os.path.getsize(path + SPARSE_INDEX_SUFFIX)
+            return size, load_sparse_index(path)["max_ts"]
+        # 尚未压缩的封存分段以修改时间作为最新记录时间
+        return size, os.path.getmtime(path)
+
+    def _apply_retention(self, now: float, active: str) -> int:
+        """删除超过保留时间的分段，并在总大小超限时从最旧的分段开始删除"""
+        sealed = [name for name in self.segments() if os.path.join(self.directory, name) != active]
+        info = {name: self._segment_info(name) for name in sealed}
+        total = sum(size for size, _ in info.values())
+        if os.path.exists(active):
+            total += os.path.getsize(active)
+
+        removed = 0
+        cutoff = now - self.settings["retention_days"] * 86400
+        for name in sealed:
+            size, newest = info[name]
+            if (newest is not None and newest < cutoff) or total > self.settings["max_bytes"]:
+                self._remove_segment(name)
+                total -= size
+                removed += 1
+        return removed
+
+    def _remove_segment(self, name: str) -> None:
+        """删除分段文件及其索引记录"""
+        logical = name[:-3] if name.endswith(".gz") else name
+        with self.conn:
+            self.conn.execute("DELETE FROM entry_terms WHERE rowid IN"
+                              " (SELECT id FROM entries WHERE segment = ?)", (logical,))
+            self.conn.execute("DELETE FROM entries WHERE segment = ?", (logical,))
+            self.conn.execute("DELETE FROM segments WHERE name = ?", (logical,))
+        path = os.path.join(self.directory, name)
+        for suffix in ("", SPARSE_INDEX_SUFFIX):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def read_log(self, since: Optional[float] = None,
+                 until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        不经过检索索引直接按时间范围读取分段日志
+
+        封存分段先按稀疏索引的整体时间范围跳过，再只解压范围内的块。
+
+        Args:
+            since (float, optional): 起始时间戳（包含）
+            until (float, optional): 结束时间戳（不包含）
+
+        Yields:
+            Dict[str, Any]: 历史记录
+        """
+        for name in self.segments():
+            path = os.path.join(self.directory, name)
+            if name.endswith(".gz"):
+                sparse_index = load_sparse_index(path)
+                if since is not None and sparse_index["max_ts"] is not None and sparse_index["max_ts"] < since:
+                    continue
+                if until is not None and sparse_index["min_ts"] is not None and sparse_index["min_ts"] >= until:
+                    continue
+                lines = (line for _, line in iter_compressed_lines(path, 0, since, until))
+            else:
+                lines = open(path, "rb")
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                timestamp = entry.get("timestamp", 0) if isinstance(entry, dict) else None
+                if timestamp is None or (since is not None and timestamp < since) or \
+                        (until is not None and timestamp >= until):
+                    continue
+                yield entry
+            if not name.endswith(".gz"):
+                lines.close()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """检索索引的数据库连接，首次使用时创建"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.index_path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_tables()
+        return self._conn
+
+    def _create_tables(self):
+        """创建索引表"""
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY,"
+                " timestamp REAL NOT NULL,"
+                " mode TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " provider TEXT,"
+                " model TEXT,"
+                " latency_ms INTEGER,"
+                " prompt_tokens INTEGER,"
+                " completion_tokens INTEGER,"
+                " cached_tokens INTEGER,"
+                " files TEXT NOT NULL,"
+                " script_path TEXT,"
+                " cwd TEXT,"
+                " segment TEXT NOT NULL,"
+                " offset INTEGER NOT NULL)"
+            )
+            for column in ("timestamp", "mode", "provider", "model", "segment"):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS entries_{column} ON entries ({column})")
+            # 检索词由 tokenize 预先切分，rowid 与 entries.id 对应
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entry_terms USING fts5(terms)")
+            # 每个分段日志已经索引到的字节位置
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                " name TEXT PRIMARY KEY,"
+                " indexed_offset INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def sync(self) -> int:
+        """
+        把分段日志中尚未索引的记录写入索引
+
+        Returns:
+            int: 新索引的记录数
+        """
+        conn = self.conn
+        indexed = 0
+        # IMMEDIATE 事务保证多个进程同时追赶时不会重复索引
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            offsets = dict(conn.execute("SELECT name, indexed_offset FROM segments"))
+            for name in self.segments():
+                path = os.path.join(self.directory, name)
+                if name.endswith(".gz"):
+                    # 封存分段通常在压缩前已经完整索引，只有重建索引时才需要解压
+                    logical = name[:-3]
+                    if load_sparse_index(path)["size"] > offsets.get(logical, 0):
+                        lines = iter_compressed_lines(path, offsets.get(logical, 0))
+                        indexed += self._index_lines(logical, lines, offsets.get(logical, 0))
+                elif os.path.getsize(path) > offsets.get(name, 0):
+                    with open(path, "rb") as f:
+                        f.seek(offsets.get(name, 0))
+                        lines = self._iter_lines(f, offsets.get(name, 0))
+                        indexed += self._index_lines(name, lines, offsets.get(name, 0))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return indexed
+
+    def _iter_lines(self, f, offset: int) -> Iterator[Tuple[int, bytes]]:
+        """从当前位置读取完整的行"""
+        while True:
+            line = f.readline()
+            # 不完整的行可能正在被写入，留到下次处理
+            if not line or not line.endswith(b"\n"):
+                return
+            yield offset, line
+            offset += len(line)
+
+    def _index_lines(self, name: str, lines: Iterator[Tuple[int, bytes]], offset: int) -> int:
+        """索引一个分段中的行，并记录索引到的位置"""
+        count = 0
+        batch = []
+        for line_offset, line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict):
+                batch.append((entry, line_offset))
+            offset = line_offset + len(line)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                count += self._insert(batch, name)
+                batch = []
+        count += self._insert(batch, name)
+        self.conn.execute("INSERT OR REPLACE INTO segments (name, indexed_offset) VALUES (?, ?)",
+                          (name, offset))
+        return count
+
+    def _insert(self, batch: List[tuple], segment: str) -> int:
+        """把一批记录写入字段表和全文索引"""
+        for entry, offset in batch:
+            values = [entry.get(field) for field in FIELDS]
+            values[FIELDS.index("files")] = json.dumps(entry.get("files") or [], ensure_ascii=False)
+            values[FIELDS.index("query")] = entry.get("query") or ""
+            values[FIELDS.index("answer")] = entry.get("answer") or ""
+            values[FIELDS.index("mode")] = entry.get("mode") or "command"
+            values[FIELDS.index("timestamp")] = entry.get("timestamp") or 0.0
+            cursor = self.conn.execute(
+                f"INSERT INTO entries ({', '.join(FIELDS)}, segment, offset)"
+                f" VALUES ({', '.join('?' * (len(FIELDS) + 2))})",
+                values + [segment, offset]
+            )
+            self.conn.execute("INSERT INTO entry_terms (rowid, terms) VALUES (?, ?)",
+                              (cursor.lastrowid, entry_terms(entry)))
+        return len(batch)
+
+    def _row_to_entry(self, row: tuple) -> Dict[str, Any]:
+        """把索引表的一行转换为历史记录"""
+        entry = dict(zip(("id",) + FIELDS, row))
+        entry["files"] = json.loads(entry["files"])
+        return entry
+
+    def _query(self, columns: str, order: str, text: Optional[str], mode: Optional[str],
+               provider: Optional[str], model: Optional[str], since: Optional[float],
+               until: Optional[float], filename: Optional[str]):
+        """根据过滤条件生成查询语句和参数"""
+        clauses = []
+        params = []
+        source = "entries"
+        order_by = "entries.id"
+        if text:
+            terms = sorted(set(tokenize(text)))
+            if not terms:
+                clauses.append("0")
+            else:
+                # 从全文索引出发按rowid倒序遍历，取够记录即可停止
+                source = "entry_terms JOIN entries ON entries.id = entry_terms.rowid"
+                order_by = "entry_terms.rowid"
+                clauses.append("entry_terms MATCH ?")
+                params.append(" AND ".join('"' + term.replace('"', '""') + '"' for term in terms))
+        for column, value in (("mode", mode), ("provider", provider), ("model", model)):
+            if value:
+                clauses.append(f"entries.{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("entries.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("entries.timestamp < ?")
+            params.append(until)
+        if filename:
+            clauses.append("entries.files LIKE ?")
+            params.append("%" + json.dumps(filename, ensure_ascii=False)[1:-1] + "%")
+        return (f"SELECT {columns} FROM {source} WHERE {' AND '.join(clauses) or '1'}"
+                f" ORDER BY {order_by} {order}"), params
+
+    def search(self, text: Optional[str] = None, mode: Optional[str] = None,
+               provider: Optional[str] = None, model: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               filename: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        检索历史记录，按写入顺序从新到旧排列
+
+        Args:
+            text (str, optional): 全文检索内容，所有检索词都需要出现
+            mode (str, optional): 记录类型
+            provider (str, optional): 提供商
+            model (str, optional): 模型
+            since (float, optional): 起始时间戳（包含）
+            until (float, optional): 结束时间戳（不包含）
+            filename (str, optional): 相关文件名包含的内容
+            limit (int): 返回的最大记录数
+
+        Returns:
+            List[Dict[str, Any]]: 历史记录列表，每条带有索引编号 id
+        """
+        self.sync()
+        sql, params = self._query(COLUMNS, "DESC", text, mode, provider, model, since, until, filename)
+        rows = self.conn.execute(sql + " LIMIT ?", params + [limit]).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """
+        按索引编号读取一条历史记录
+
+        Args:
+            entry_id (int): search 返回的编号
+
+        Returns:
+            Optional[Dict[str, Any]]: 历史记录，不存在时返回None
+        """
+        self.sync()
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def iter_entries(self, text: Optional[str] = None, mode: Optional[str] = None,
+                     provider: Optional[str] = None, model: Optional[str] = None,
+                     since: Optional[float] = None, until: Optional[float] = None,
+                     filename: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按写入顺序从旧到新遍历符合条件的历史记录
+
+        Args:
+            与 search 相同的过滤条件（不含 limit）
+
+        Yields:
+            Dict[str, Any]: 历史记录
+        """
+        self.sync()
+        sql, params = self._query(COLUMNS, "ASC", text, mode, provider, model, since, until, filename)
+        for row in self.conn.execute(sql, params):
+            yield self._row_to_entry(row)
+
+    def count(self) -> int:
+        """
+        统计已索引的记录数
+
+        Returns:
+            int: 记录数
+        """
+        self.sync()
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def import_legacy(self, path: str, force: bool = False) -> Optional[int]:
+        """
+        导入旧版文本格式的历史记录，同一文件默认只导入一次
+
+        Args:
+            path (str): 旧版历史记录文件路径
+            force (bool): 是否忽略已导入标记重新导入
+
+        Returns:
+            Optional[int]: 导入的记录数，已经导入过时返回None
+        """
+        key = "legacy_import:" + os.path.realpath(path)
+        conn = self.conn
+        # 先在 IMMEDIATE 事务中占用导入标记，多个进程同时导入同一文件时只有一个进程导入
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            claimed = force or not conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone()
+            if claimed:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             (key, LEGACY_IMPORTING))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if not claimed:
+            return None
+
+        # 与 append 相同，逐条以 O_APPEND 写入并按大小切换分段，可与其他进程同时写入
+        count = 0
+        rolled = False
+        try:
+            for entry in parse_legacy_history(path):
+                segment = self.active_segment()
+                if append_record(segment, encode_entry(entry)) >= self.settings["segment_max_bytes"]:
+                    self._roll(segment)
+                    rolled = True
+                count += 1
+        except BaseException:
+            # 导入中断时释放标记，之后可以重新导入
+            with conn:
+                conn.execute("DELETE FROM meta WHERE key = ? AND value = ?", (key, LEGACY_IMPORTING))
+            raise
+        if rolled and self.auto_compact:
+            self.maybe_compact(force=True)
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         (key, str(time.time())))
+        self.sync()
+        return count
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -12,6 +12,19 @@ Bash-Copilot: 将自然语言转换为bash命令的命令行工具
 $ bcopilot "如何查找最大的5个文件"     # 仅生成单行命令
 $ bcopilot -script "如何查找系统中的大文件"  # 生成完整脚本
 $ bcopilot -filename file1.txt file2.json "处理这些文件"  # 包含文件内容作为上下文
+$ df -h | bcopilot "清理出更多空间"  # 包含管道输入作为上下文
+$ bcopilot -retrieve -filename app.log "找出超时的请求"  # 只包含与查询相关的文件片段
+$ bcopilot -workspace ~/project "运行测试"  # 从工作区索引中检索上下文
+$ bcopilot -mapreduce -filename huge.log "统计错误"  # 分块处理超出上下文的文件
+$ bcopilot -i  # 交互模式，支持多轮修改
+$ bcopilot -continue "改成递归处理子目录"  # 在最近一次会话的基础上修改
+$ bcopilot index build ~/project  # 建立工作区索引
+$ bcopilot history search "nginx"  # 检索历史记录
+$ bcopilot watch -filename app.log "出现OOM时给出处理命令"  # 监视文件增长
+$ bcopilot batch queries.txt  # 批量生成命令，多个查询合并为一次请求
+$ bcopilot batch-submit nightly.txt  # 提交为提供商的离线批处理任务
+$ bcopilot worker -queue /mnt/shared/queue  # 多台主机从共享队列领取查询
+$ eval "$(bcopilot shell-init bash)"  # 启用 shell 快捷键，由后台进程提供服务
 $ bcopilot config show  # 显示当前配置
 $ bcopilot config set command.openai  # 切换模型提供商
 $ bcopilot -help  # 显示帮助信息
@@ -20,53 +33,215 @@ $ bcopilot -help  # 显示帮助信息
 import os
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Tuple, List, Optional
 
 from src.config.model_manager import ModelManager
 from src.cli.parser import parse_arguments
 from src.utils.context import get_bash_context
+from src.utils.trace import tracer
 from src.utils.file_utils import read_file_contents
+from src.utils.stream_input import read_stdin, STDIN_NAME
+from src.utils.retrieval import retrieve_file_contents
+from src.index.workspace_index import workspace_file_contents
+from src.generators.base_generator import prewarm_providers
 from src.generators.command_generator import handle_command_generation
 from src.generators.script_generator import handle_script_generation
+from src.generators.mapreduce_generator import map_reduce_file_contents
+from src.generators.session import open_session
+
+def traced_bash_context() -> Dict[str, str]:
+    """获取bash环境上下文并记录耗时"""
+    with tracer.span("context"):
+        return get_bash_context()
 
 def main():
     # 解析命令行参数
     args = parse_arguments()
+    if getattr(args, "trace", False):
+        tracer.enable()
     
     # 处理配置命令
     if args.command == "config":
         from src.cli.config_commands import handle_config_command
         handle_config_command(args)
         return
+
+    # 处理工作区索引命令
+    if args.command == "index":
+        from src.cli.index_commands import handle_index_command
+        handle_index_command(args)
+        return
+
+    # 处理历史记录命令
+    if args.command == "history":
+        from src.cli.history_commands import handle_history_command
+        handle_history_command(args)
+        return
+    
+    # 监视文件增长
+    if args.command == "watch":
+        from src.cli.watch_commands import handle_watch_command
+        handle_watch_command(args)
+        return
+
+    # 处理后台进程命令
+    if args.command == "daemon":
+        from src.cli.daemon_commands import handle_daemon_command
+        handle_daemon_command(args)
+        return
+
+    # 级联路由统计
+    if args.command == "stats":
+        from src.cli.stats_commands import handle_stats_command
+        handle_stats_command(args)
+        return
+
+    # 批量生成命令
+    if args.command == "batch":
+        from src.cli.batch_commands import handle_batch_command
+        handle_batch_command(args)
+        return
+
+    # 提供商的离线批处理任务
+    if args.command == "batch-submit":
+        from src.cli.batch_commands import handle_batch_submit_command
+        handle_batch_submit_command(args)
+        return
+
+    if args.command == "batch-status":
+        from src.cli.batch_commands import handle_batch_status_command
+        handle_batch_status_command(args)
+        return
+
+    if args.command == "batch-collect":
+        from src.cli.batch_commands import handle_batch_collect_command
+        handle_batch_collect_command(args)
+        return
+
+    # 多台主机共享工作队列的分布式批处理
+    if args.command == "worker":
+        from src.cli.worker_commands import handle_worker_command
+        handle_worker_command(args)
+        return
+
+    if args.command == "coordinator":
+        from src.cli.worker_commands import handle_coordinator_command
+        handle_coordinator_command(args)
+        return
+
+    # 团队共享的缓存网关
+    if args.command == "gateway":
+        from src.cli.gateway_commands import handle_gateway_command
+        handle_gateway_command(args)
+        return
+
+    # 输出 shell 集成脚本
+    if args.command == "shell-init":
+        from src.cli.daemon_commands import handle_shell_init_command
+        handle_shell_init_command(args)
+        return
     
-    # 获取bash环境上下文
-    context = get_bash_context()
+    # 交互模式
+    if args.interactive:
+        from src.cli.repl import run_repl
+        run_repl(args)
+        return
 
     # 根据参数决定是否直接生成脚本
     is_script_mode = args.script
 
+    # 模式确定后立即在后台建立到提供商的连接（DNS、TCP、TLS），
+    # 与下面的环境探测和文件读取同时进行，请求时直接使用已建立的连接
+    prewarm_providers(ModelManager(), is_script_mode, args.query)
+
+    # 在后台获取bash环境上下文
+    context_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context")
+    context_future = context_executor.submit(traced_bash_context)
+    context_executor.shutdown(wait=False)
+
+    # 读取管道输入（如 df -h | bcopilot "..."），只保留开头和结尾
+    stdin_contents = None
+    stdin_content = None
+    if not args.no_stdin:
+        with tracer.span("stdin"):
+            stdin_content = read_stdin(None) if args.wait_stdin else read_stdin()
+    if stdin_content is not None:
+        stdin_contents = [(STDIN_NAME, stdin_content)]
+
     # 读取文件内容（如果指定了-filename）
     file_contents = None
     if args.filename:
-        file_contents = read_file_contents(args.filename, is_script_mode)
+        with tracer.span("files"):
+            if args.mapreduce:
+                # 分块提取相关信息，适用于超出模型上下文的文件
+                file_contents = map_reduce_file_contents(args.query, args.filename, is_script_mode)
+                if file_contents is None:
+                    sys.exit(1)
+            elif args.retrieve:
+                # 只检索与查询相关的片段，没有匹配时退回到读取完整文件
+                file_contents = retrieve_file_contents(args.filename, args.query)
+            if file_contents is None:
+                # 管道输入与文件一起分配token预算
+                file_contents = read_file_contents(args.filename, is_script_mode,
+                                                   extra_contents=stdin_contents)
+                stdin_contents = None
         if file_contents is None:
             sys.exit(1)
 
+    if stdin_contents is not None:
+        stdin_contents = read_file_contents([], is_script_mode, extra_contents=stdin_contents)
+        if stdin_contents is None:
+            sys.exit(1)
+        file_contents = (file_contents or []) + stdin_contents
+
+    # 从工作区索引中检索上下文（如果指定了-workspace）
+    if args.workspace:
+        with tracer.span("workspace"):
+            workspace_contents = workspace_file_contents(args.workspace, args.query)
+        if workspace_contents is None:
+            sys.exit(1)
+        file_contents = (file_contents or []) + workspace_contents
+
+    context = context_future.result()
+
+    # 只有 -continue/-session 才打开会话，在之前的对话基础上继续并保存；
+    # 普通查询不把管道输入和文件内容写入磁盘
+    session = None
+    conversation = None
+    if args.session or args.continue_session:
+        try:
+            session = open_session(args.session, args.continue_session)
+        except (ValueError, OSError) as e:
+            print(f"错误: 无法打开会话: {str(e)}")
+            sys.exit(1)
+        conversation = session.resume(context, file_contents)
+
     # 根据模式调用不同的生成器
     if is_script_mode:
         handle_script_generation(
             args.query, 
             context, 
             file_contents,
-            args.filename
+            args.filename,
+            conversation
         )
     else:
         handle_command_generation(
             args.query, 
             context, 
             file_contents,
-            args.filename
+            args.filename,
+            conversation
         )
 
+    if session is not None:
+        try:
+            session.save()
+        except OSError as e:
+            print(f"警告: 保存会话失败: {str(e)}")
+
+    tracer.report()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+查询复杂度估计
+
+用几条本地规则（查询长度、步骤和控制流关键字、文件内容大小）估计查询的复杂度，
+不需要任何网络请求。得分超过阈值的查询在命令模式下会同时提前开始生成脚本
+（见 generators/escalation.py）；级联路由按得分选择起始层级（见 generators/cascade.py）。
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# 超过此得分的查询提前开始生成脚本
+SPECULATIVE_THRESHOLD = 0.5
+
+# 表示多个步骤的连接词
+STEP_MARKERS = ("然后", "之后", "接着", "并且", "同时", "最后", "再把", "再将",
+                "then", "afterwards", "and also", "finally")
+
+# 需要条件判断或循环的词
+CONTROL_MARKERS = ("如果", "否则", "循环", "每隔", "每天", "每小时", "每周", "定时", "直到",
+                   "重试", "遍历", "逐个", "if ", "else", "loop", "for each", "every ",
+                   "until", "retry")
+
+# 通常需要完整脚本的任务
+SCRIPT_MARKERS = ("脚本", "监控", "备份", "部署", "菜单", "交互式", "报告", "安装并配置",
+                  "script", "monitor", "backup", "deploy", "menu", "interactive", "report")
+
+# 文件内容达到此字符数时复杂度加满
+LARGE_CONTEXT_CHARS = 100000
+
+# 分句符号
+CLAUSE_PATTERN = re.compile(r"[，,；;、。]")
+
+def count_markers(text: str, markers: Tuple[str, ...]) -> int:
+    """统计文本中出现的不同标记词数量"""
+    return sum(1 for marker in markers if marker in text)
+
+def score_complexity(query: str,
+                     file_contents: Optional[List[Tuple[str, str]]] = None) -> float:
+    """
+    估计查询的复杂度
+
+    Args:
+        query (str): 用户查询
+        file_contents (List[Tuple[str, str]], optional): 随查询发送的文件内容
+
+    Returns:
+        float: 0到1之间的得分，越高越可能需要完整脚本
+    """
+    text = query.lower()
+    score = min(len(query) / 120, 1.0) * 0.2
+    score += min(count_markers(text, STEP_MARKERS) * 0.2, 0.4)
+    score += min(count_markers(text, CONTROL_MARKERS) * 0.25, 0.5)
+    score += min(count_markers(text, SCRIPT_MARKERS) * 0.35, 0.5)
+    if len(CLAUSE_PATTERN.findall(query)) >= 3:
+        score += 0.15
+    if file_contents:
+        # 文件越多、越大，越需要更强的模型理解上下文
+        if len(file_contents) >= 2:
+            score += 0.1
+        size = sum(len(content) for _, content in file_contents)
+        score += min(size / LARGE_CONTEXT_CHARS, 1.0) * 0.2
+    return round(min(score, 1.0), 3)
+
+def is_likely_complex(query: str,
+                      file_contents: Optional[List[Tuple[str, str]]] = None) -> bool:
+    """
+    判断查询是否可能需要完整脚本
+
+    Args:
+        query (str): 用户查询
+        file_contents (List[Tuple[str, str]], optional): 随查询发送的文件内容
+
+    Returns:
+        bool: 得分是否达到 SPECULATIVE_THRESHOLD
+    """
+    return score_complexity(query, file_contents) >= SPECULATIVE_THRESHOLD
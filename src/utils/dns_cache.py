@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+DNS解析结果的磁盘缓存
+
+单次调用的命令行进程每次启动都要重新解析提供商的域名。解析结果保存在
+cache/dns.db 中，DNS_CACHE_TTL 内的后续调用直接连接缓存的地址，不再等待解析。
+getaddrinfo 不返回记录本身的TTL，因此使用固定的较短存活时间；缓存的地址连接失败时
+删除该记录并重新解析（见 utils/http_client.py）。
+"""
+
+import socket
+import sqlite3
+import ipaddress
+import threading
+from typing import List, Optional
+
+from config.constants import DNS_CACHE_FILE, DNS_CACHE_MAX_BYTES, DNS_CACHE_TTL
+from src.utils.result_cache import ResultCache
+
+def is_ip_address(host: str) -> bool:
+    """判断主机名是否已经是IP地址"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+class DNSCache:
+    """按 (主机, 端口) 保存解析地址的缓存"""
+
+    def __init__(self, path: str = DNS_CACHE_FILE, ttl: float = DNS_CACHE_TTL):
+        self.cache = ResultCache(path, DNS_CACHE_MAX_BYTES, ttl=ttl)
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """
+        解析主机名，优先使用缓存
+
+        Args:
+            host (str): 主机名
+            port (int): 端口
+
+        Returns:
+            List[str]: 地址列表，按 getaddrinfo 返回的顺序；无法解析时返回空列表
+        """
+        if is_ip_address(host):
+            return [host]
+        key = f"{host}:{port}"
+        addresses = self.cache.get(key)
+        if addresses:
+            return addresses
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            return []
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if addresses:
+            self.cache.put(key, addresses)
+        return addresses
+
+    def forget(self, host: str, port: int) -> None:
+        """
+        删除缓存的解析结果（地址已无法连接时）
+
+        Args:
+            host (str): 主机名
+            port (int): 端口
+        """
+        self.cache.delete(f"{host}:{port}")
+
+    def close(self) -> None:
+        """关闭缓存数据库"""
+        self.cache.close()
+
+_dns_cache = None  # type: Optional[DNSCache]
+_dns_cache_lock = threading.Lock()
+
+def shared_dns_cache() -> Optional[DNSCache]:
+    """
+    获取进程内共享的DNS缓存
+
+    Returns:
+        Optional[DNSCache]: 缓存，无法打开缓存数据库时返回None
+    """
+    global _dns_cache
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            try:
+                _dns_cache = DNSCache()
+            except (sqlite3.Error, OSError):
+                return None
+        return _dns_cache
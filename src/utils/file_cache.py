@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+预处理文件内容缓存
+
+对同一文件的多次查询复用已计算的token数、压缩/截断表示和格式摘要。
+缓存以 (设备号, inode, 大小, mtime_ns) 为键，键失效时回退到内容哈希，
+数据保存在容量受限的SQLite数据库中，超出容量时按最近最少使用(LRU)淘汰。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Optional
+
+from config.constants import FILE_CACHE_FILE, FILE_CACHE_MAX_BYTES
+
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def stat_key(filename: str) -> str:
+    """
+    根据文件元数据生成缓存键
+
+    Args:
+        filename (str): 文件路径
+
+    Returns:
+        str: 形如 "设备号:inode:大小:mtime_ns" 的键
+    """
+    st = os.stat(filename)
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+def content_hash(filename: str) -> str:
+    """
+    流式计算文件内容的SHA-256哈希
+
+    Args:
+        filename (str): 文件路径
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileCache:
+    """预处理文件内容缓存"""
+
+    def __init__(self, path: str = FILE_CACHE_FILE, max_bytes: int = FILE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """创建缓存表"""
+        with self.conn:
+            # 文件元数据到内容哈希的映射
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " stat_key TEXT PRIMARY KEY,"
+                " content_hash TEXT NOT NULL)"
+            )
+            # 按内容哈希存储的预处理结果
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS artefacts ("
+                " content_hash TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " PRIMARY KEY (content_hash, name))"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS artefacts_lru ON artefacts (last_access)"
+            )
+
+    def resolve(self, filename: str) -> str:
+        """
+        获取文件的内容哈希，元数据未变化时无需读取文件
+
+        Args:
+            filename (str): 文件路径
+
+        Returns:
+            str: 内容哈希
+        """
+        key = stat_key(filename)
+        row = self.conn.execute(
+            "SELECT content_hash FROM files WHERE stat_key = ?", (key,)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        # 元数据不匹配（如文件被复制或touch过），回退到内容哈希
+        digest = content_hash(filename)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (stat_key, content_hash) VALUES (?, ?)",
+                (key, digest)
+            )
+        return digest
+
+    def get(self, filename: str, name: str) -> Optional[Any]:
+        """
+        读取文件的预处理结果
+
+        Args:
+            filename (str): 文件路径
+            name (str): 预处理结果名称，如 "tokens"、"fit:64000"、"summary"
+
+        Returns:
+            Optional[Any]: 缓存的值，不存在时返回None
+        """
+        digest = self.resolve(filename)
+        row = self.conn.execute(
+            "SELECT value FROM artefacts WHERE content_hash = ? AND name = ?",
+            (digest, name)
+        ).fetchone()
+        if row is None:
+            return None
+
+        with self.conn:
+            self.conn.execute(
+                "UPDATE artefacts SET last_access = ? WHERE content_hash = ? AND name = ?",
+                (time.time(), digest, name)
+            )
+        return json.loads(row[0])
+
+    def put(self, filename: str, name: str, value: Any) -> None:
+        """
+        保存文件的预处理结果，并在超出容量时淘汰最久未使用的条目
+
+        Args:
+            filename (str): 文件路径
+            name (str): 预处理结果名称
+            value (Any): 可JSON序列化的值
+        """
+        digest = self.resolve(filename)
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artefacts (content_hash, name, value, size, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (digest, name, encoded, len(encoded.encode("utf-8")), time.time())
+            )
+        self._evict()
+
+    def total_size(self) -> int:
+        """
+        获取缓存数据的总字节数
+
+        Returns:
+            int: 总字节数
+        """
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM artefacts").fetchone()[0]
+
+    def _evict(self):
+        """按LRU顺序淘汰条目直到总大小不超过上限"""
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for digest, name, size in self.conn.execute(
+            "SELECT content_hash, name, size FROM artefacts ORDER BY last_access"
+        ):
+            victims.append((digest, name))
+            excess -= size
+            if excess <= 0:
+                break
+
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM artefacts WHERE content_hash = ? AND name = ?", victims
+            )
+            # 清理不再有任何预处理结果的元数据映射
+            self.conn.execute(
+                "DELETE FROM files WHERE content_hash NOT IN"
+                " (SELECT DISTINCT content_hash FROM artefacts)"
+            )
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
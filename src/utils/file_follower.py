@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+跟踪不断增长的文件（类似 tail -F）
+
+通过 inotify 监视文件所在目录，不支持 inotify 时退回到定时检查文件大小。
+读取位置保存在打开的文件对象中，每次只读取新追加的内容，不会重新读取已处理的部分；
+文件被截断时从头开始，被轮转（重命名后新建）时先读完旧文件剩余的内容再切换到新文件。
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import Iterator, Optional
+
+# inotify 事件（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct("iIII")
+
+# 每次读取的字节数
+READ_CHUNK_BYTES = 256 * 1024
+
+# 没有换行的行最多缓存的字节数，超出后直接输出
+MAX_PARTIAL_BYTES = 1024 * 1024
+
+class Inotify:
+    """通过 ctypes 调用 libc 的 inotify 接口"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError(errno.ENOSYS, "找不到libc")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "系统不支持inotify")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """
+        监视目录或文件
+
+        Args:
+            path (str): 路径
+            mask (int): 事件掩码
+
+        Returns:
+            int: 监视描述符
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_names(self, timeout: float) -> Optional[set]:
+        """
+        等待事件并返回涉及的文件名
+
+        Args:
+            timeout (float): 最长等待秒数
+
+        Returns:
+            Optional[set]: 事件涉及的文件名集合，超时返回None
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return None
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                offset += length
+        return names
+
+    def close(self) -> None:
+        """关闭inotify描述符"""
+        os.close(self.fd)
+
+class FileFollower:
+    """跟踪文件新追加的内容"""
+
+    def __init__(self, path: str, from_start: bool = False, poll_interval: float = 1.0,
+                 use_inotify: bool = True):
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self.file = open(self.path, "rb")
+        st = os.fstat(self.file.fileno())
+        self.identity = (st.st_dev, st.st_ino)
+        # 启动时文件已有的字节数，从末尾开始时这部分不会被读取
+        self.initial_size = st.st_size
+        if not from_start:
+            self.file.seek(0, os.SEEK_END)
+        self.offset = self.file.tell()
+        self.partial = b""
+        self.truncations = 0
+        self.rotations = 0
+
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+                self.inotify.add_watch(os.path.dirname(self.path))
+            except (OSError, AttributeError):
+                if self.inotify is not None:
+                    self.inotify.close()
+                self.inotify = None
+
+    @property
+    def mode(self) -> str:
+        """跟踪方式: inotify 或 polling"""
+        return "inotify" if self.inotify is not None else "polling"
+
+    def wait(self, timeout: float) -> None:
+        """
+        等待文件可能发生变化，最长等待 timeout 秒
+
+        Args:
+            timeout (float): 最长等待秒数
+        """
+        if self.inotify is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        deadline = time.monotonic() + timeout
+        name = os.path.basename(self.path)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            names = self.inotify.read_names(remaining)
+            # 同一目录中其他文件的事件不需要处理
+            if names is None or name in names:
+                return
+
+    def _drain(self) -> Iterator[bytes]:
+        """读取当前文件对象中的新内容"""
+        while True:
+            data = self.file.read(READ_CHUNK_BYTES)
+            if not data:
+                return
+            self.offset += len(data)
+            yield data
+
+    def _complete_lines(self, data: bytes) -> bytes:
+        """只返回完整的行，末尾不完整的行留到下一次"""
+        data = self.partial + data
+        cut = data.rfind(b"\n") + 1
+        if cut == 0 and len(data) < MAX_PARTIAL_BYTES:
+            self.partial = data
+            return b""
+        if cut == 0:
+            cut = len(data)
+        self.partial = data[cut:]
+        return data[:cut]
+
+    def read_new(self) -> Iterator[bytes]:
+        """
+        读取上次读取之后追加的完整行
+
+        Yields:
+            bytes: 新内容，每块都以完整的行结束
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # 轮转过程中文件暂时不存在，先读取旧文件剩余的内容
+            st = None
+
+        if st is not None and (st.st_dev, st.st_ino) == self.identity and st.st_size < self.offset:
+            # 文件被截断（如 copytruncate），从头开始
+            self.truncations += 1
+            self.file.seek(0)
+            self.offset = 0
+            self.partial = b""
+
+        for data in self._drain():
+            data = self._complete_lines(data)
+            if data:
+                yield data
+
+        if st is not None and (st.st_dev, st.st_ino) != self.identity:
+            # 文件被轮转，切换到新文件
+            try:
+                new_file = open(self.path, "rb")
+            except FileNotFoundError:
+                return
+            self.rotations += 1
+            if self.partial:
+                yield self.partial + b"\n"
+                self.partial = b""
+            self.file.close()
+            self.file = new_file
+            new_st = os.fstat(new_file.fileno())
+            self.identity = (new_st.st_dev, new_st.st_ino)
+            self.offset = 0
+            for data in self._drain():
+                data = self._complete_lines(data)
+                if data:
+                    yield data
+
+    def close(self) -> None:
+        """关闭文件和inotify描述符"""
+        self.file.close()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
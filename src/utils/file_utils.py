@@ -3,61 +3,303 @@
 文件处理工具
 """
 
+import os
 import sys
+import json
+from collections import Counter
 from typing import List, Tuple, Optional
 from src.utils.token_utils import estimate_tokens
+from src.utils.file_cache import FileCache
 from config.api.endpoints import COMMAND_MODEL, SCRIPT_MODEL, MODEL_TOKEN_LIMITS
 
-def read_file_contents(filenames: List[str], is_script_mode: bool) -> Optional[List[Tuple[str, str]]]:
+# 截断表示的预算按此粒度向下取整，使不同查询之间更容易复用缓存
+BUDGET_GRANULARITY = 1000
+
+# 单个文件最少保留的token数，低于该值时放弃截断
+MIN_FILE_BUDGET = 500
+
+# 日志级别关键字，用于生成日志摘要
+LOG_LEVELS = ("ERROR", "WARN", "INFO", "DEBUG", "FATAL", "CRITICAL")
+
+def collapse_repeated_lines(lines: List[str]) -> List[str]:
+    """
+    折叠连续重复的行
+
+    Args:
+        lines (List[str]): 原始行列表
+
+    Returns:
+        List[str]: 折叠后的行列表，重复行以 "[上一行重复 N 次]" 标注
+    """
+    collapsed = []
+    previous = None
+    repeats = 0
+    for line in lines:
+        if line == previous:
+            repeats += 1
+            continue
+        if repeats:
+            collapsed.append(f"[上一行重复 {repeats} 次]")
+        collapsed.append(line)
+        previous = line
+        repeats = 0
+    if repeats:
+        collapsed.append(f"[上一行重复 {repeats} 次]")
+    return collapsed
+
+def summarize_content(filename: str, content: str) -> str:
+    """
+    按文件格式生成简要摘要
+
+    Args:
+        filename (str): 文件名，用于判断格式
+        content (str): 文件内容
+
+    Returns:
+        str: 摘要文本
+    """
+    lines = content.splitlines()
+    ext = os.path.splitext(filename)[1].lower()
+    summary = [f"共 {len(lines)} 行, {len(content)} 个字符"]
+
+    if ext == ".json":
+        try:
+            data = json.loads(content)
+            if isinstance(data, dict):
+                summary.append(f"JSON对象, 顶层键: {', '.join(list(data)[:20])}")
+            elif isinstance(data, list):
+                summary.append(f"JSON数组, 共 {len(data)} 项")
+        except ValueError:
+            summary.append("JSON格式无法解析")
+    elif ext in (".yaml", ".yml"):
+        keys = [line.split(":", 1)[0] for line in lines
+                if line and not line[0].isspace() and not line.startswith("#") and ":" in line]
+        summary.append(f"YAML文档, 顶层键: {', '.join(keys[:20])}")
+    elif ext in (".csv", ".tsv"):
+        if lines:
+            summary.append(f"表头: {lines[0][:200]}")
+    else:
+        levels = Counter()
+        for line in lines:
+            for level in LOG_LEVELS:
+                if level in line:
+                    levels[level] += 1
+                    break
+        if levels:
+            summary.append("日志级别统计: " + ", ".join(f"{k}={v}" for k, v in levels.most_common()))
+
+    return "\n".join(summary)
+
+def fit_to_budget(filename: str, content: str, budget: int) -> str:
+    """
+    将文件内容压缩到指定token预算以内
+
+    先折叠重复行；仍超出预算时保留开头和结尾，并附加格式摘要。
+
+    Args:
+        filename (str): 文件名
+        content (str): 文件内容
+        budget (int): token预算
+
+    Returns:
+        str: 不超过预算的文件表示
+    """
+    lines = collapse_repeated_lines(content.splitlines())
+    compressed = "\n".join(lines)
+    if estimate_tokens(compressed) <= budget:
+        return compressed
+
+    summary = f"[文件摘要]\n{summarize_content(filename, content)}\n"
+    remaining = budget - estimate_tokens(summary) - 50
+
+    # 开头和结尾各占一半预算
+    head, head_tokens = [], 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if head_tokens + tokens > remaining // 2:
+            break
+        head.append(line)
+        head_tokens += tokens
+
+    tail, tail_tokens = [], 0
+    for line in reversed(lines[len(head):]):
+        tokens = estimate_tokens(line) + 1
+        if tail_tokens + tokens > remaining - head_tokens:
+            break
+        tail.append(line)
+        tail_tokens += tokens
+    tail.reverse()
+
+    omitted = len(lines) - len(head) - len(tail)
+    marker = f"[内容已截断: 省略了中间 {omitted} 行]"
+    return "\n".join([summary] + head + [marker] + tail)
+
+def read_text(filename: str) -> str:
+    """
+    读取文本文件内容
+
+    Args:
+        filename (str): 文件路径
+
+    Returns:
+        str: 文件内容
+    """
+    with open(filename, 'r') as f:
+        return f.read()
+
+def allocate_budgets(token_counts: List[int], available: int) -> List[Optional[int]]:
+    """
+    为各文件分配token预算，小文件完整保留，大文件平分剩余预算
+
+    Args:
+        token_counts (List[int]): 各文件的token数
+        available (int): 文件内容可用的token总数
+
+    Returns:
+        List[Optional[int]]: 各文件的预算，None表示完整保留
+    """
+    budgets = [None] * len(token_counts)
+    remaining = available
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i])
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        if token_counts[index] <= share:
+            remaining -= token_counts[index]
+            continue
+        budget = share // BUDGET_GRANULARITY * BUDGET_GRANULARITY
+        budgets[index] = budget
+        remaining -= budget
+    return budgets
+
+def confirm(prompt: str) -> bool:
+    """
+    询问用户是否继续
+
+    标准输入是管道时（内容已被读取）从 /dev/tty 读取回答，无法读取终端时视为取消。
+
+    Args:
+        prompt (str): 提示信息
+
+    Returns:
+        bool: 用户是否输入了 y
+    """
+    if sys.stdin.isatty():
+        return input(prompt).strip().lower() == 'y'
+    try:
+        with open("/dev/tty", "r+") as tty:
+            tty.write(prompt)
+            tty.flush()
+            return tty.readline().strip().lower() == 'y'
+    except OSError:
+        print(f"{prompt}无法读取终端输入，视为取消")
+        return False
+
+def read_file_contents(filenames: List[str], is_script_mode: bool,
+                       cache: Optional[FileCache] = None,
+                       extra_contents: Optional[List[Tuple[str, str]]] = None) -> Optional[List[Tuple[str, str]]]:
     """
     读取指定文件的内容，并检查token限制
 
+    token数和压缩/截断表示会按文件内容缓存，重复查询同一文件时无需重新读取和估算。
+
     Args:
         filenames (List[str]): 需要读取的文件列表
         is_script_mode (bool): 是否为脚本生成模式
-    
+        cache (FileCache, optional): 预处理缓存，默认使用全局缓存
+        extra_contents (List[Tuple[str, str]], optional): 已在内存中的内容（如管道输入），
+            与文件一起分配token预算，不使用缓存
+
     Returns:
         Optional[List[Tuple[str, str]]]: 文件内容列表，每项为(文件名, 内容)的元组。如果超出token限制或出错则返回None
     """
     # 选择对应的模型和token限制
     model = SCRIPT_MODEL if is_script_mode else COMMAND_MODEL
     token_limit = MODEL_TOKEN_LIMITS[model]
-    
+
     # 为系统提示和模型回复预留空间
     available_tokens = token_limit - 2000
-    
-    file_contents = []
+
     total_tokens = 500  # 环境上下文的token估算
-    
+
     # 添加查询的tokens（估算值）
     query_tokens = 200  # 假设查询平均不超过200 tokens
     total_tokens += query_tokens
-    
+
+    if cache is None:
+        try:
+            cache = FileCache()
+        except Exception:
+            cache = None
+
+    # 内存中的内容不对应磁盘文件，不经过缓存
+    loaded = dict(extra_contents or [])
+    in_memory = set(loaded)
+    filenames = list(filenames or []) + [name for name, _ in extra_contents or []]
+
+    # 先获取各文件的token数，已缓存的文件无需读取
+    token_counts = []
     for filename in filenames:
+        if filename in in_memory:
+            token_counts.append(estimate_tokens(loaded[filename]))
+            continue
+        try:
+            file_tokens = cache.get(filename, "tokens") if cache else None
+            if file_tokens is None:
+                loaded[filename] = read_text(filename)
+                file_tokens = estimate_tokens(loaded[filename])
+                if cache:
+                    cache.put(filename, "tokens", file_tokens)
+            token_counts.append(file_tokens)
+        except Exception as e:
+            print(f"读取文件 '{filename}' 出错: {str(e)}")
+            return None
+
+    budgets = allocate_budgets(token_counts, available_tokens - total_tokens)
+
+    file_contents = []
+    for filename, file_tokens, budget in zip(filenames, token_counts, budgets):
         try:
-            with open(filename, 'r') as f:
-                content = f.read()
-            file_tokens = estimate_tokens(content)
-            total_tokens += file_tokens
+            if budget is None:
+                content = loaded.get(filename)
+                if content is None:
+                    content = read_text(filename)
+                total_tokens += file_tokens
+                print(f"包含文件内容: {filename} (预估 {file_tokens} tokens)")
+            elif budget < MIN_FILE_BUDGET:
+                # 预算过小，截断后已无意义，按完整大小计入以触发超限检查
+                total_tokens += file_tokens
+                continue
+            else:
+                name = f"fit:{budget}"
+                file_cache = cache if filename not in in_memory else None
+                content = file_cache.get(filename, name) if file_cache else None
+                if content is None:
+                    source = loaded.get(filename)
+                    if source is None:
+                        source = read_text(filename)
+                    content = fit_to_budget(filename, source, budget)
+                    if file_cache:
+                        file_cache.put(filename, name, content)
+                fitted_tokens = estimate_tokens(content)
+                total_tokens += fitted_tokens
+                print(f"包含文件内容: {filename} (预估 {file_tokens} tokens，已压缩至 {fitted_tokens} tokens)")
             file_contents.append((filename, content))
-            print(f"包含文件内容: {filename} (预估 {file_tokens} tokens)")
         except Exception as e:
             print(f"读取文件 '{filename}' 出错: {str(e)}")
             return None
-    
+
     # 在读取所有文件后，检查token总量
     if total_tokens > 6000:
         print(f"警告: 预估token消耗({total_tokens})可能过大，这可能会导致较高的API调用成本。")
-        confirm = input("是否继续操作？(y/N): ")
-        if confirm.lower() != 'y':
+        if not confirm("是否继续操作？(y/N): "):
             print("操作已取消")
             sys.exit(0)
-    
+
     # 检查是否已超出token限制
     if total_tokens > available_tokens:
         print(f"错误: 文件内容太大，预估超过{total_tokens}个tokens")
         print(f"超出了{model}模型的限制({available_tokens} tokens)")
-        print("请减少文件数量或使用更小的文件")
+        print("请减少文件数量、使用更小的文件，或使用 -mapreduce 参数分块处理")
         return None
-    
+
     return file_contents
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+HTTP连接池
+
+同一进程内按 (协议, 主机, 端口) 复用 requests.Session，
+长时间运行的模式（交互模式、后台进程）中后续请求直接复用已建立的TCP/TLS连接。
+
+单次查询时，模式确定后立即在后台预先建立连接（DNS解析、TCP连接、TLS握手），
+与环境探测和文件读取同时进行，请求发送时直接使用已经建立的连接。
+
+主机名通过磁盘上的DNS缓存解析（见 utils/dns_cache.py），后续调用不再等待解析。
+每个主机的连接共用一个SSL上下文，新连接恢复同一主机之前的TLS会话，省去证书传输和校验
+（TLS 1.2 还省去一次往返）。CPython 的 ssl 模块不能序列化TLS会话，会话只能在进程内恢复
+（交互模式、后台进程、分块处理的并行请求）；跨调用保持连接请使用后台进程。
+
+DNS缓存和预连接依赖 urllib3 的内部接口（连接的 _dns_host、连接池的 _get_conn、_put_conn
+和 pool.queue），使用前都先检查是否存在，urllib3 升级后接口变化时退化为不使用缓存的地址、
+不预连接，而不是让请求出错。
+"""
+
+import ssl
+import weakref
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from src.utils.dns_cache import is_ip_address, shared_dns_cache
+from src.utils.trace import tracer
+
+# 每个主机保持的最大连接数
+POOL_MAXSIZE = 8
+
+# 预连接的超时秒数
+PREWARM_TIMEOUT = 10
+
+_sessions = {}  # type: Dict[str, requests.Session]
+_prewarms = {}  # type: Dict[str, threading.Thread]
+_sessions_lock = threading.Lock()
+
+class CachedDNSMixin:
+    """通过DNS缓存解析主机名的连接"""
+
+    def _new_conn(self):
+        host = getattr(self, "_dns_host", None)
+        if not isinstance(host, str):
+            return super()._new_conn()
+        cache = shared_dns_cache() if not is_ip_address(host) else None
+        addresses = cache.resolve(host, self.port) if cache is not None else []
+        if not addresses or addresses[0] == host:
+            return super()._new_conn()
+        # 只在建立TCP连接时使用地址，SNI和证书校验仍使用主机名
+        self._dns_host = addresses[0]
+        try:
+            return super()._new_conn()
+        except (NewConnectionError, ConnectTimeoutError):
+            # 缓存的地址可能已经失效，删除后按正常流程重新解析
+            cache.forget(host, self.port)
+            self._dns_host = host
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+class CachedDNSHTTPConnection(CachedDNSMixin, HTTPConnection):
+    pass
+
+class CachedDNSHTTPSConnection(CachedDNSMixin, HTTPSConnection):
+    pass
+
+class CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSHTTPConnection
+
+class CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+class ResumableSSLSocket(ssl.SSLSocket):
+    """关闭前把TLS会话交给上下文保存的套接字"""
+
+    def close(self):
+        if isinstance(self.context, SessionReusingContext):
+            self.context.remember(self)
+        super().close()
+
+class SessionReusingContext(ssl.SSLContext):
+    """按主机保存TLS会话的SSL上下文，新连接恢复同一主机之前的会话"""
+
+    sslsocket_class = ResumableSSLSocket
+
+    def __new__(cls, protocol: int = ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol: int = ssl.PROTOCOL_TLS_CLIENT):
+        super().__init__()
+        # 与 urllib3 默认的上下文相同（主机名由 urllib3 校验），但不禁用会话票据
+        self.minimum_version = ssl.TLSVersion.TLSv1_2
+        self.options |= ssl.OP_NO_COMPRESSION
+        self.check_hostname = False
+        self.sessions = {}  # type: Dict[str, ssl.SSLSession]
+        self.sockets = weakref.WeakSet()
+        self.session_lock = threading.Lock()
+
+    def remember(self, sock: ssl.SSLSocket) -> None:
+        """
+        保存连接的TLS会话（已收到会话票据时）
+
+        Args:
+            sock (ssl.SSLSocket): TLS连接
+        """
+        try:
+            session = sock.session
+        except (ValueError, OSError):
+            return
+        if session is not None and session.has_ticket and sock.server_hostname:
+            with self.session_lock:
+                self.sessions[sock.server_hostname] = session
+
+    def session_for(self, server_hostname: str) -> Optional[ssl.SSLSession]:
+        """
+        获取可以恢复的会话，优先使用仍打开的连接的最新会话
+
+        Args:
+            server_hostname (str): 主机名
+
+        Returns:
+            Optional[ssl.SSLSession]: 会话，没有时返回None
+        """
+        for sock in list(self.sockets):
+            if sock.server_hostname == server_hostname:
+                self.remember(sock)
+        with self.session_lock:
+            return self.sessions.get(server_hostname)
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and server_hostname and not server_side:
+            session = self.session_for(server_hostname)
+        ssl_sock = super().wrap_socket(sock, server_side=server_side,
+                                       do_handshake_on_connect=do_handshake_on_connect,
+                                       suppress_ragged_eofs=suppress_ragged_eofs,
+                                       server_hostname=server_hostname, session=session)
+        self.sockets.add(ssl_sock)
+        return ssl_sock
+
+class CachingAdapter(HTTPAdapter):
+    """使用DNS缓存和TLS会话恢复的适配器，每个适配器（即每个主机）一个SSL上下文"""
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault("ssl_context", SessionReusingContext())
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": CachedDNSHTTPConnectionPool,
+                                                   "https": CachedDNSHTTPSConnectionPool}
+
+def origin_of(url: str) -> str:
+    """
+    获取URL的协议、主机和端口
+
+    Args:
+        url (str): 请求地址
+
+    Returns:
+        str: 形如 "https://api.example.com:443" 的字符串
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+def get_session(url: str) -> requests.Session:
+    """
+    获取目标主机共享的会话
+
+    Args:
+        url (str): 请求地址
+
+    Returns:
+        requests.Session: 带连接池的会话
+    """
+    key = origin_of(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = CachingAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+        return session
+
+def connection_pool(session: requests.Session, url: str):
+    """
+    获取会话向 url 发送请求时使用的 urllib3 连接池
+
+    与 requests 发送请求时的选择方式相同（包括证书校验和代理设置），
+    保证预先建立的连接放入的正是之后请求使用的连接池。
+
+    Args:
+        session (requests.Session): 会话
+        url (str): 请求地址
+
+    Returns:
+        urllib3.connectionpool.HTTPConnectionPool: 连接池
+    """
+    adapter = session.get_adapter(url)
+    settings = session.merge_environment_settings(url, {}, None, None, None)
+    if hasattr(adapter, "get_connection_with_tls_context"):
+        request = requests.Request("POST", url).prepare()
+        return adapter.get_connection_with_tls_context(request, settings["verify"],
+                                                       settings["proxies"], settings["cert"])
+    return adapter.get_connection(url, settings["proxies"])
+
+def _open_connection(url: str, timeout: float) -> None:
+    """建立一个连接并放入会话的连接池"""
+    with tracer.span(f"prewarm {urlsplit(url).hostname}"):
+        try:
+            pool = connection_pool(get_session(url), url)
+        except (requests.exceptions.RequestException, ValueError):
+            return
+        get_conn = getattr(pool, "_get_conn", None)
+        put_conn = getattr(pool, "_put_conn", None)
+        if get_conn is None or put_conn is None:
+            return
+        try:
+            conn = get_conn()
+        except Exception:
+            return
+        try:
+            if getattr(conn, "sock", None) is None:
+                conn.timeout = timeout
+                conn.connect()
+        except Exception:
+            # 预连接失败（DNS、连接或TLS错误）不影响请求，请求时会重新建立连接并报告错误
+            conn.close()
+        finally:
+            try:
+                put_conn(conn)
+            except Exception:
+                conn.close()
+
+def _consume_session_tickets(url: str) -> None:
+    """
+    读取预连接后服务器发送的TLS会话票据
+
+    TLS 1.3 服务器在握手完成后才发送会话票据，空闲连接的套接字因此变为可读，
+    urllib3 取出连接时会把可读的连接当作已断开而丢弃。发送请求前先读取这些票据，
+    票据之外的数据或对端关闭说明连接确实不可用，直接关闭。
+    """
+    try:
+        pool = connection_pool(get_session(url), url)
+    except (requests.exceptions.RequestException, ValueError):
+        return
+    queue = getattr(getattr(pool, "pool", None), "queue", None)
+    try:
+        idle = list(queue) if queue is not None else []
+    except TypeError:
+        return
+    for conn in idle:
+        sock = getattr(conn, "sock", None)
+        if not isinstance(sock, ssl.SSLSocket):
+            continue
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            sock.recv(1)
+            conn.close()
+        except ssl.SSLWantReadError:
+            sock.settimeout(timeout)
+        except OSError:
+            conn.close()
+
+def prewarm(url: str, timeout: float = PREWARM_TIMEOUT) -> None:
+    """
+    在后台预先建立到目标主机的连接，同一主机只建立一次
+
+    Args:
+        url (str): 请求地址
+        timeout (float): 连接超时秒数
+    """
+    key = origin_of(url)
+    with _sessions_lock:
+        if key in _prewarms:
+            return
+        thread = threading.Thread(target=_open_connection, args=(url, timeout),
+                                  name="prewarm", daemon=True)
+        _prewarms[key] = thread
+    thread.start()
+
+def prewarmed_session(url: str) -> Optional[requests.Session]:
+    """
+    获取已经预连接的会话，预连接仍在进行时等待其完成
+
+    Args:
+        url (str): 请求地址
+
+    Returns:
+        Optional[requests.Session]: 会话，没有对该主机预连接时返回None
+    """
+    thread = _prewarms.get(origin_of(url))
+    if thread is None:
+        return None
+    if thread.is_alive():
+        with tracer.span("wait prewarm"):
+            thread.join(PREWARM_TIMEOUT)
+    _consume_session_tickets(url)
+    return get_session(url)
+
+def close_sessions() -> None:
+    """关闭所有会话及其连接"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _prewarms.clear()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+提供商的API密钥池
+
+一个提供商可以配置多个密钥，请求分散到各个密钥上以突破单个密钥的速率限制:
+
+    key_file: "config/api/siliconflow_key.txt"
+    key_files: ["config/api/siliconflow_key2.txt", "config/api/siliconflow_key3.txt"]
+    key_env: "SILICONFLOW_API_KEYS"     # 环境变量，多个密钥用逗号或空白分隔
+
+每个请求使用在途token数最少的密钥；返回429的密钥按 Retry-After（默认60秒）、
+返回401/403的密钥在10分钟内不再使用。暂停状态按密钥本身保存，同一进程中使用同一密钥的
+所有密钥池（不同模型、不同端点）共享。所有密钥都被限流时等待最早恢复的密钥，
+而不是立即用被限流的密钥再次请求。models.yaml 中的 rate_limit 是每个密钥的限制。
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.utils.token_utils import estimate_tokens
+
+# 返回429且没有 Retry-After 时暂停使用的秒数
+RATE_LIMITED_COOLDOWN = 60.0
+
+# 返回401/403后暂停使用的秒数
+UNAUTHORIZED_COOLDOWN = 600.0
+
+# Retry-After 的上限秒数
+MAX_RETRY_AFTER = 600.0
+
+# 按密钥共享的暂停状态: 密钥 -> (暂停到的 time.monotonic() 时间, 是否因401/403暂停)
+_cooldowns = {}  # type: Dict[str, Tuple[float, bool]]
+_cooldowns_lock = threading.Lock()
+
+def request_tokens(payload: Dict[str, Any]) -> int:
+    """
+    估计一个请求占用的token数（输入加最大输出）
+
+    Args:
+        payload (Dict[str, Any]): 请求体
+
+    Returns:
+        int: token数
+    """
+    messages = json.dumps(payload.get("messages") or [], ensure_ascii=False)
+    return estimate_tokens(messages) + int(payload.get("max_tokens") or 0)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析秒数形式的 Retry-After，无法解析时返回None"""
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def split_keys(value: str) -> List[str]:
+    """把环境变量中的多个密钥按逗号或空白切分"""
+    return [key for key in re.split(r"[\s,]+", value) if key]
+
+def provider_keys(provider_config: Dict[str, Any], model_manager: Any) -> List[Tuple[str, str]]:
+    """
+    读取提供商配置的所有密钥
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        model_manager (ModelManager): 读取密钥文件使用的模型配置管理器
+
+    Returns:
+        List[Tuple[str, str]]: (标签, 密钥) 列表，已去除重复的密钥；标签是密钥文件路径
+            或 "环境变量名[序号]"
+    """
+    key_files = [provider_config.get("key_file")] + list(provider_config.get("key_files") or [])
+    keys = []  # type: List[Tuple[str, str]]
+    for key_file in key_files:
+        if key_file:
+            value = model_manager.get_api_key(key_file)
+            if value:
+                keys.append((key_file, value))
+    env = provider_config.get("key_env")
+    if env:
+        for index, value in enumerate(split_keys(os.environ.get(env, "")), 1):
+            keys.append((f"{env}[{index}]", value))
+    seen = set()
+    unique = []
+    for label, value in keys:
+        if value not in seen:
+            seen.add(value)
+            unique.append((label, value))
+    return unique
+
+def missing_key_message(provider_config: Dict[str, Any]) -> str:
+    """
+    提供商没有可用密钥时的错误消息，列出配置的所有密钥来源
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+
+    Returns:
+        str: 错误消息
+    """
+    sources = [key_file for key_file in [provider_config.get("key_file")] +
+               list(provider_config.get("key_files") or []) if key_file]
+    env = provider_config.get("key_env")
+    if env:
+        sources.append(f"环境变量 {env}")
+    return f"未找到API密钥，请检查 {'、'.join(sources) or '提供商的 key_file 配置'}"
+
+class ApiKey:
+    """一个密钥及其使用状态"""
+
+    def __init__(self, label: str, value: str):
+        self.label = label
+        self.value = value
+        self.inflight = 0
+        self.outstanding_tokens = 0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.unauthorized = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def cooldown_until(self) -> float:
+        """暂停到的 time.monotonic() 时间，所有使用该密钥的密钥池共享"""
+        return _cooldowns.get(self.value, (0.0, False))[0]
+
+    @property
+    def unauthorized_cooldown(self) -> bool:
+        """当前的暂停是否因401/403引起"""
+        return _cooldowns.get(self.value, (0.0, False))[1]
+
+    def cool_down(self, seconds: float, unauthorized: bool = False) -> None:
+        """
+        暂停使用该密钥，已有更长的暂停时保留原来的暂停
+
+        Args:
+            seconds (float): 暂停秒数
+            unauthorized (bool): 是否因401/403暂停
+        """
+        until = time.monotonic() + seconds
+        with _cooldowns_lock:
+            current = _cooldowns.get(self.value)
+            if current is None or current[0] < until:
+                _cooldowns[self.value] = (until, unauthorized)
+
+class KeyLease:
+    """一次请求占用的密钥，请求结束后调用 release"""
+
+    def __init__(self, pool: "KeyPool", key: ApiKey, tokens: int):
+        self.pool = pool
+        self.key = key
+        self.tokens = tokens
+        self.released = False
+
+    @property
+    def label(self) -> str:
+        return self.key.label
+
+    @property
+    def value(self) -> str:
+        return self.key.value
+
+    def release(self, usage: Optional[Dict[str, Any]] = None) -> None:
+        """
+        归还密钥并记录本次请求的结果
+
+        Args:
+            usage (Dict[str, Any], optional): send_request 写入的 status、retry_after 和token用量，
+                没有 status 表示请求未得到响应
+        """
+        self.pool.release(self, usage)
+
+class KeyPool:
+    """
+    一个提供商的所有密钥
+
+    Args:
+        keys (Iterable[Tuple[str, str]]): (标签, 密钥) 列表，标签用于报告，不包含密钥本身
+    """
+
+    def __init__(self, keys: Iterable[Tuple[str, str]]):
+        self.keys = [ApiKey(label, value) for label, value in keys]
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def acquire(self, tokens: int = 0, exclude: Iterable[str] = (),
+                cooling: bool = True) -> Optional[KeyLease]:
+        """
+        选择在途token数最少的可用密钥
+
+        Args:
+            tokens (int): 本次请求占用的token数
+            exclude (Iterable[str]): 不使用的密钥标签（本次查询已经失败的密钥）
+            cooling (bool): 所有密钥都在暂停期时是否使用最早恢复的一个；该密钥是被限流时
+                先等到它恢复，因401/403暂停时立即使用（等待也不会恢复，直接报告错误）
+
+        Returns:
+            Optional[KeyLease]: 占用的密钥，没有可用的密钥时返回None
+        """
+        excluded = set(exclude)
+        wait = 0.0
+        with self.lock:
+            now = time.monotonic()
+            candidates = [key for key in self.keys if key.label not in excluded]
+            ready = [key for key in candidates if key.cooldown_until <= now]
+            if ready:
+                key = min(ready, key=lambda k: (k.outstanding_tokens, k.inflight, k.requests))
+            elif cooling and candidates:
+                key = min(candidates, key=lambda k: k.cooldown_until)
+                if not key.unauthorized_cooldown:
+                    wait = key.cooldown_until - now
+            else:
+                return None
+            key.inflight += 1
+            key.outstanding_tokens += tokens
+            key.requests += 1
+        if wait > 0:
+            time.sleep(wait)
+        return KeyLease(self, key, tokens)
+
+    def release(self, lease: KeyLease, usage: Optional[Dict[str, Any]] = None) -> None:
+        """归还密钥，见 KeyLease.release"""
+        usage = usage or {}
+        status = usage.get("status")
+        with self.lock:
+            if lease.released:
+                return
+            lease.released = True
+            key = lease.key
+            key.inflight -= 1
+            key.outstanding_tokens -= lease.tokens
+            key.prompt_tokens += usage.get("prompt_tokens") or 0
+            key.completion_tokens += usage.get("completion_tokens") or 0
+            if status != 200:
+                key.errors += 1
+            if status == 429:
+                key.rate_limited += 1
+                wait = parse_retry_after(usage.get("retry_after"))
+                key.cool_down(RATE_LIMITED_COOLDOWN if wait is None else wait)
+            elif status in (401, 403):
+                key.unauthorized += 1
+                key.cool_down(UNAUTHORIZED_COOLDOWN, unauthorized=True)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        每个密钥的使用情况
+
+        Returns:
+            List[Dict[str, Any]]: 标签、请求数、错误数、token用量、在途请求和剩余暂停秒数
+        """
+        now = time.monotonic()
+        with self.lock:
+            return [{"key": key.label, "requests": key.requests, "errors": key.errors,
+                     "rate_limited": key.rate_limited, "unauthorized": key.unauthorized,
+                     "prompt_tokens": key.prompt_tokens, "completion_tokens": key.completion_tokens,
+                     "inflight": key.inflight,
+                     "cooldown": round(max(0.0, key.cooldown_until - now), 1)}
+                    for key in self.keys]
+
+_pools = {}  # type: Dict[Any, KeyPool]
+_pools_lock = threading.Lock()
+
+def get_key_pool(provider_config: Dict[str, Any], model_manager: Any) -> KeyPool:
+    """
+    获取提供商共享的密钥池
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        model_manager (ModelManager): 读取密钥使用的模型配置管理器
+
+    Returns:
+        KeyPool: 同一端点、模型和密钥共享的密钥池，没有找到密钥时为空
+    """
+    keys = tuple(provider_keys(provider_config, model_manager))
+    pool_key = (provider_config["url"], provider_config.get("model"), keys)
+    with _pools_lock:
+        if pool_key not in _pools:
+            _pools[pool_key] = KeyPool(keys)
+        return _pools[pool_key]
+
+def key_pools() -> List[Tuple[str, KeyPool]]:
+    """
+    本进程使用过的所有密钥池
+
+    Returns:
+        List[Tuple[str, KeyPool]]: (端点, 密钥池) 列表
+    """
+    with _pools_lock:
+        return [(url, pool) for (url, _, _), pool in _pools.items()]
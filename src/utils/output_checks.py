@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+生成结果的本地检查
+
+在不执行生成结果的前提下发现明显有问题的输出：空输出、命令模式下的多行输出、
+bash -n 语法检查失败，以及命令中引用了本机不存在的程序。
+级联路由（见 generators/cascade.py）根据检查结果决定是否改用更强的模型。
+"""
+
+import re
+import shlex
+import shutil
+import subprocess
+from typing import List, Optional
+
+# bash -n 的超时秒数
+SYNTAX_CHECK_TIMEOUT = 5
+
+# 分隔命令的控制符，其后的单词处于命令位置
+CONTROL_OPERATORS = {"|", "||", "&", "&&", ";", ";;", "(", ")", "|&", "`", "$(", "{", "}", "!"}
+
+# 之后仍处于命令位置的关键字
+COMMAND_KEYWORDS = {"if", "then", "else", "elif", "while", "until", "do", "time", "!"}
+
+# 之后是变量名或单词列表，直到下一个控制符才回到命令位置
+LIST_KEYWORDS = {"for", "case", "select", "in", "function"}
+
+# 结束复合命令的关键字
+END_KEYWORDS = {"fi", "done", "esac"}
+
+# bash 内置命令，不需要对应的可执行文件
+BUILTINS = {
+    ".", ":", "[", "[[", "]]", "alias", "bg", "bind", "break", "builtin", "caller", "cd",
+    "command", "compgen", "complete", "continue", "declare", "dirs", "disown", "echo",
+    "enable", "eval", "exec", "exit", "export", "false", "fc", "fg", "getopts", "hash",
+    "help", "history", "jobs", "kill", "let", "local", "logout", "mapfile", "popd",
+    "printf", "pushd", "pwd", "read", "readarray", "readonly", "return", "set", "shift",
+    "shopt", "source", "suspend", "test", "times", "trap", "true", "type", "typeset",
+    "ulimit", "umask", "unalias", "unset", "wait"
+}
+
+# 以另一个命令为参数的命令，其后第一个非选项单词也处于命令位置
+PREFIX_COMMANDS = {"sudo", "env", "nohup", "nice", "timeout", "xargs", "exec", "command",
+                   "builtin", "stdbuf", "ionice", "watch", "strace", "time"}
+
+# 前缀命令中带参数的选项
+PREFIX_OPTIONS_WITH_ARG = {"-u", "-g", "-n", "-s", "-k", "-c", "-I", "-P", "-d", "-L"}
+
+# 变量赋值
+ASSIGNMENT_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\[[^]]*\])?\+?=")
+
+# 前缀命令的数字参数（如 timeout 5、nice -n 10）
+NUMBER_PATTERN = re.compile(r"^\d+(\.\d+)?[smhd]?$")
+
+def strip_code_fence(text: str) -> str:
+    """
+    去掉包裹命令的Markdown代码块或反引号
+
+    Args:
+        text (str): 模型回复
+
+    Returns:
+        str: 命令文本
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text[text.find("\n") + 1:] if "\n" in text else text[3:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    elif len(text) > 1 and text[0] == text[-1] == "`":
+        text = text[1:-1]
+    return text.strip()
+
+def command_names(command: str) -> List[str]:
+    """
+    找出命令中处于命令位置的程序名
+
+    Args:
+        command (str): bash命令
+
+    Returns:
+        List[str]: 程序名，按出现顺序排列，不含变量、路径和关键字
+    """
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        # 引号不匹配，留给语法检查
+        return []
+
+    names = []
+    at_command = True
+    prefix = False
+    skip_next = False
+    for token in tokens:
+        if skip_next:
+            skip_next = False
+            continue
+        if token in CONTROL_OPERATORS or token.endswith(";") and not token.strip(";"):
+            at_command = True
+            prefix = False
+            continue
+        if not at_command:
+            continue
+        if token in COMMAND_KEYWORDS or ASSIGNMENT_PATTERN.match(token):
+            continue
+        if token in LIST_KEYWORDS:
+            at_command = False
+            continue
+        if token in END_KEYWORDS or token.startswith(("$", "<", ">")):
+            at_command = False
+            continue
+        if prefix and (token.startswith("-") or NUMBER_PATTERN.match(token)):
+            skip_next = token in PREFIX_OPTIONS_WITH_ARG
+            continue
+        if "/" not in token:
+            names.append(token)
+        prefix = token in PREFIX_COMMANDS
+        at_command = prefix
+    return names
+
+def missing_commands(command: str) -> List[str]:
+    """
+    找出命令中引用的、本机不存在的程序
+
+    Args:
+        command (str): bash命令
+
+    Returns:
+        List[str]: 不存在的程序名
+    """
+    missing = []
+    for name in command_names(command):
+        if name not in BUILTINS and name not in missing and shutil.which(name) is None:
+            missing.append(name)
+    return missing
+
+def syntax_error(script: str) -> Optional[str]:
+    """
+    用 bash -n 检查语法
+
+    Args:
+        script (str): bash命令或脚本
+
+    Returns:
+        Optional[str]: 第一条错误信息，没有错误或无法检查时返回None
+    """
+    try:
+        result = subprocess.run(["bash", "-n"], input=script, capture_output=True, text=True,
+                                timeout=SYNTAX_CHECK_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode == 0:
+        return None
+    lines = result.stderr.strip().splitlines()
+    return lines[0] if lines else f"bash -n 返回 {result.returncode}"
+
+def check_command(text: str) -> Optional[str]:
+    """
+    检查单行命令
+
+    Args:
+        text (str): 模型回复
+
+    Returns:
+        Optional[str]: 未通过检查的原因，通过时返回None
+    """
+    command = strip_code_fence(text)
+    if not command:
+        return "输出为空"
+    # 以反斜杠结尾的行是同一条命令的续行
+    if len(command.replace("\\\n", " ").splitlines()) > 1:
+        return "命令模式返回了多行输出"
+    error = syntax_error(command)
+    if error:
+        return f"语法错误: {error}"
+    missing = missing_commands(command)
+    if missing:
+        return f"命令不存在: {', '.join(missing)}"
+    return None
+
+def check_script(script: str) -> Optional[str]:
+    """
+    检查脚本
+
+    脚本中常先安装再使用所需的程序，因此不检查程序是否存在。
+
+    Args:
+        script (str): 从回复中提取的脚本内容
+
+    Returns:
+        Optional[str]: 未通过检查的原因，通过时返回None
+    """
+    if not script.strip():
+        return "输出为空"
+    error = syntax_error(script)
+    if error:
+        return f"语法错误: {error}"
+    return None
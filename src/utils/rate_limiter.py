@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+提供商请求速率限制
+
+每个提供商按 models.yaml 中的 rate_limit 配置限制每个API密钥的每分钟请求数和并发请求数:
+
+    rate_limit:
+      requests_per_minute: 60
+      max_concurrency: 4
+"""
+
+import time
+import threading
+from typing import Any, Dict
+
+# 未配置 rate_limit 时的默认值
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_MAX_CONCURRENCY = 4
+
+class RateLimiter:
+    """令牌桶速率限制器，同时限制并发数"""
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, min(float(max_concurrency), requests_per_minute))
+        self.max_concurrency = max_concurrency
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _take(self) -> float:
+        """尝试取出一个令牌，返回需要等待的秒数，0表示已取出"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """阻塞直到可以发送下一个请求"""
+        self.slots.acquire()
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def release(self) -> None:
+        """请求完成后释放并发槽位"""
+        self.slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+_limiters = {}  # type: Dict[str, RateLimiter]
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider_config: Dict[str, Any], key_count: int = 1) -> RateLimiter:
+    """
+    获取提供商共享的速率限制器
+
+    rate_limit 是每个API密钥的限制，配置了多个密钥时按密钥数放大
+    （请求按在途token数分散到各个密钥上，见 utils/key_pool.py）。
+
+    Args:
+        provider_config (Dict[str, Any]): 提供商配置
+        key_count (int): 提供商的密钥数
+
+    Returns:
+        RateLimiter: 同一端点、模型和密钥数共享的限制器
+    """
+    key_count = max(1, key_count)
+    key = f"{provider_config['url']}|{provider_config.get('model')}|{key_count}"
+    with _limiters_lock:
+        if key not in _limiters:
+            limits = provider_config.get("rate_limit") or {}
+            _limiters[key] = RateLimiter(
+                limits.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE) * key_count,
+                limits.get("max_concurrency", DEFAULT_MAX_CONCURRENCY) * key_count
+            )
+        return _limiters[key]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+通用结果缓存
+
+以字符串为键保存可JSON序列化的结果，存储在容量受限的SQLite数据库中，
+超出容量时按最近最少使用(LRU)淘汰，可选按存活时间(TTL)过期。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Optional
+
+class ResultCache:
+    """基于SQLite的键值结果缓存"""
+
+    def __init__(self, path: str, max_bytes: int, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_lru ON results (last_access)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存结果
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[Any]: 缓存的值，不存在或已过期时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if self.ttl is not None and now - row[1] > self.ttl:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def age(self, key: str) -> Optional[float]:
+        """
+        缓存结果已保存的秒数，不更新访问时间
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[float]: 秒数，不存在时返回None（已过期的结果仍返回秒数）
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT created FROM results WHERE key = ?", (key,)).fetchone()
+        return None if row is None else max(0.0, time.time() - row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        保存结果，并在超出容量时淘汰最久未使用的条目
+
+        Args:
+            key (str): 缓存键
+            value (Any): 可JSON序列化的值
+        """
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, created, last_access)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded.encode("utf-8")), now, now)
+                )
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        """
+        删除缓存结果
+
+        Args:
+            key (str): 缓存键
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def _evict(self):
+        """按LRU顺序淘汰条目直到总大小不超过上限"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        with self.conn:
+            self.conn.executemany("DELETE FROM results WHERE key = ?", victims)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
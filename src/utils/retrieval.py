@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+基于BM25的文件片段检索
+
+将大文件按行切分为片段，建立内存BM25索引，只把与查询最相关的片段放入提示词。
+大文件按字节区间切分后由多个进程并行流式建立索引，片段正文不常驻内存，
+选中后再按偏移量读取。
+
+中文按字切分、英文按单词切分，两者之间没有共同的检索词，中文查询本身无法匹配英文日志。
+查询中的常见运维术语（错误、超时、拒绝等）补充对应的英文检索词（见 QUERY_SYNONYMS），
+其余中文词仍然无法匹配英文内容；没有任何片段匹配时退回到读取完整文件。
+"""
+
+import os
+import re
+import math
+import heapq
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.utils.token_utils import estimate_tokens
+
+# 每个片段的目标字节数（约500个token），片段总是在行边界结束
+CHUNK_BYTES = 2048
+
+# 并行建索引时每个任务处理的字节区间大小
+SEGMENT_BYTES = 32 * 1024 * 1024
+
+# 小于该大小的输入在当前进程内建立索引，避免进程启动开销
+PARALLEL_THRESHOLD = 64 * 1024 * 1024
+
+# 检索模式默认放入提示词的token数
+RETRIEVAL_TOKEN_BUDGET = 8000
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD_PATTERN = re.compile(r"[a-z0-9_]{2,}|[\u4e00-\u9fff]+")
+
+# 查询中的中文术语对应的英文检索词，用于中文查询检索英文日志和代码
+QUERY_SYNONYMS = {
+    "错误": ("error", "errors", "err", "exception"),
+    "异常": ("exception", "error", "traceback"),
+    "失败": ("fail", "failed", "failure", "error"),
+    "警告": ("warn", "warning"),
+    "超时": ("timeout", "timed", "deadline"),
+    "拒绝": ("denied", "refused", "reject", "rejected"),
+    "权限": ("permission", "denied", "forbidden"),
+    "连接": ("connection", "connect", "connected"),
+    "断开": ("disconnect", "disconnected", "closed", "reset"),
+    "崩溃": ("crash", "crashed", "panic", "segfault", "fatal"),
+    "内存": ("memory", "oom", "heap"),
+    "磁盘": ("disk", "space", "filesystem"),
+    "启动": ("start", "started", "starting", "boot"),
+    "停止": ("stop", "stopped", "shutdown"),
+    "重启": ("restart", "restarted", "reboot"),
+    "登录": ("login", "logon", "auth", "session"),
+    "认证": ("auth", "authentication", "unauthorized"),
+    "证书": ("certificate", "cert", "ssl", "tls"),
+    "请求": ("request", "requests"),
+    "响应": ("response", "reply"),
+    "端口": ("port", "listen"),
+    "进程": ("process", "pid"),
+    "配置": ("config", "configuration", "settings"),
+    "数据库": ("database", "db", "sql"),
+    "未找到": ("not", "found", "missing", "404"),
+}
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索词
+
+    英文和数字按单词切分，中文按单字和相邻双字切分。
+
+    Args:
+        text (str): 输入文本
+
+    Returns:
+        List[str]: 检索词列表
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            terms.extend(word)
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+def query_terms(query: str) -> List[str]:
+    """
+    将查询切分为检索词，并补充其中中文术语对应的英文检索词
+
+    Args:
+        query (str): 查询文本
+
+    Returns:
+        List[str]: 检索词列表
+    """
+    terms = tokenize(query)
+    for word, synonyms in QUERY_SYNONYMS.items():
+        if word in query:
+            terms.extend(synonyms)
+    return terms
+
+class Chunk:
+    """文件片段的位置信息"""
+
+    __slots__ = ("filename", "offset", "length", "start_line", "end_line")
+
+    def __init__(self, filename: str, offset: int, length: int, start_line: int, end_line: int):
+        self.filename = filename
+        self.offset = offset
+        self.length = length
+        self.start_line = start_line
+        self.end_line = end_line
+
+    def read(self) -> str:
+        """
+        从文件中读取片段正文
+
+        Returns:
+            str: 片段内容
+        """
+        with open(self.filename, "rb") as f:
+            f.seek(self.offset)
+            return f.read(self.length).decode("utf-8", errors="replace")
+
+    def label(self) -> str:
+        """
+        生成带行号范围的片段名称
+
+        Returns:
+            str: 形如 "app.log (第10-52行)" 的名称
+        """
+        return f"{self.filename} (第{self.start_line}-{self.end_line}行)"
+
+def split_line_chunks(text: str) -> List[Tuple[int, int, str]]:
+    """
+    将文本按行切分为片段
+
+    Args:
+        text (str): 文本内容
+
+    Returns:
+        List[Tuple[int, int, str]]: (起始行, 结束行, 片段内容) 列表，行号从1开始
+    """
+    chunks = []
+    lines = []
+    size = 0
+    first_line = 1
+    for number, line in enumerate(text.splitlines(keepends=True), 1):
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunks.append((first_line, number, "".join(lines)))
+            first_line = number + 1
+            lines = []
+            size = 0
+    if lines:
+        chunks.append((first_line, first_line + len(lines) - 1, "".join(lines)))
+    return chunks
+
+def split_segments(filename: str, segment_bytes: int = SEGMENT_BYTES) -> List[Tuple[int, int]]:
+    """
+    将文件切分为在行边界对齐的字节区间
+
+    Args:
+        filename (str): 文件路径
+        segment_bytes (int): 每个区间的目标大小
+
+    Returns:
+        List[Tuple[int, int]]: (起始偏移, 结束偏移) 列表
+    """
+    size = os.path.getsize(filename)
+    segments = []
+    start = 0
+    with open(filename, "rb") as f:
+        while start < size:
+            end = min(start + segment_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            segments.append((start, end))
+            start = end
+    return segments
+
+def index_segment(task: Tuple[str, int, int, Optional[Set[str]]]) -> Tuple[int, List[Tuple], int, int]:
+    """
+    流式读取一个字节区间并统计各片段的词频
+
+    Args:
+        task: (文件路径, 起始偏移, 结束偏移, 需要统计的检索词集合，None表示全部)
+
+    Returns:
+        Tuple: (区间行数, [(偏移, 长度, 起始行, 结束行, 片段词数, 词频)], 片段数, 总词数)
+            行号相对于区间起点，只返回包含被统计检索词的片段
+    """
+    filename, start, end, vocabulary = task
+    postings = []
+    chunk_count = 0
+    total_terms = 0
+    line_count = 0
+
+    def flush(offset, lines, first_line):
+        nonlocal chunk_count, total_terms
+        terms = tokenize(b"".join(lines).decode("utf-8", errors="replace"))
+        length = len(terms)
+        chunk_count += 1
+        total_terms += length
+        if vocabulary is not None:
+            terms = [term for term in terms if term in vocabulary]
+        if terms:
+            postings.append((offset, sum(len(line) for line in lines),
+                             first_line, first_line + len(lines) - 1,
+                             length, dict(Counter(terms))))
+
+    with open(filename, "rb") as f:
+        f.seek(start)
+        position = start
+        chunk_offset = start
+        chunk_lines = []
+        chunk_size = 0
+        first_line = 1
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            line_count += 1
+            chunk_lines.append(line)
+            chunk_size += len(line)
+            if chunk_size >= CHUNK_BYTES:
+                flush(chunk_offset, chunk_lines, first_line)
+                first_line = line_count + 1
+                chunk_offset = position
+                chunk_lines = []
+                chunk_size = 0
+        if chunk_lines:
+            flush(chunk_offset, chunk_lines, first_line)
+
+    return line_count, postings, chunk_count, total_terms
+
+class BM25Index:
+    """片段级BM25内存索引"""
+
+    def __init__(self):
+        self.chunks = []          # type: List[Chunk]
+        self.lengths = []         # type: List[int]
+        self.postings = {}        # type: Dict[str, List[Tuple[int, int]]]
+        self.chunk_count = 0
+        self.total_terms = 0
+
+    def add_segment(self, filename: str, line_base: int, result: Tuple[int, List[Tuple], int, int]):
+        """
+        合并一个字节区间的索引结果
+
+        Args:
+            filename (str): 文件路径
+            line_base (int): 区间起点之前的行数
+            result: index_segment 的返回值
+        """
+        _, postings, chunk_count, total_terms = result
+        self.chunk_count += chunk_count
+        self.total_terms += total_terms
+        for offset, length, start_line, end_line, doc_length, frequencies in postings:
+            chunk_id = len(self.chunks)
+            self.chunks.append(Chunk(filename, offset, length,
+                                     line_base + start_line, line_base + end_line))
+            self.lengths.append(doc_length)
+            for term, count in frequencies.items():
+                self.postings.setdefault(term, []).append((chunk_id, count))
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[float, Chunk]]:
+        """
+        按BM25得分检索片段
+
+        Args:
+            query (str): 查询文本
+            limit (int): 返回的最大片段数
+
+        Returns:
+            List[Tuple[float, Chunk]]: (得分, 片段) 列表，按得分降序排列
+        """
+        if not self.chunk_count:
+            return []
+        average_length = self.total_terms / self.chunk_count or 1.0
+        scores = Counter()
+        for term in set(query_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+            for chunk_id, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
+
+def build_index(filenames: Iterable[str], vocabulary: Optional[Set[str]] = None,
+                processes: Optional[int] = None) -> BM25Index:
+    """
+    为文件建立BM25索引，大文件按区间并行处理
+
+    Args:
+        filenames (Iterable[str]): 文件列表
+        vocabulary (Set[str], optional): 只统计这些检索词；为None时建立完整索引
+        processes (int, optional): 并行进程数，默认为CPU核数
+
+    Returns:
+        BM25Index: 索引
+    """
+    tasks = []
+    for filename in filenames:
+        for start, end in split_segments(filename, SEGMENT_BYTES):
+            tasks.append((filename, start, end, vocabulary))
+
+    total_bytes = sum(end - start for _, start, end, _ in tasks)
+    if len(tasks) > 1 and total_bytes >= PARALLEL_THRESHOLD and (processes or os.cpu_count() or 1) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(index_segment, tasks)
+    else:
+        results = [index_segment(task) for task in tasks]
+
+    index = BM25Index()
+    line_base = {}
+    for (filename, _, _, _), result in zip(tasks, results):
+        base = line_base.get(filename, 0)
+        index.add_segment(filename, base, result)
+        line_base[filename] = base + result[0]
+    return index
+
+def retrieve_file_contents(filenames: List[str], query: str,
+                           budget: int = RETRIEVAL_TOKEN_BUDGET) -> Optional[List[Tuple[str, str]]]:
+    """
+    检索与查询最相关的文件片段
+
+    Args:
+        filenames (List[str]): 文件列表
+        query (str): 用户查询
+        budget (int): 片段内容的token预算
+
+    Returns:
+        Optional[List[Tuple[str, str]]]: (带行号范围的片段名称, 片段内容) 列表，
+            按文件和行号排序；没有任何片段匹配时返回None（例如中文查询中没有
+            QUERY_SYNONYMS 里的术语而文件是英文的）
+    """
+    vocabulary = set(query_terms(query))
+    try:
+        index = build_index(filenames, vocabulary)
+    except OSError:
+        # 文件无法读取时交由常规读取流程报告错误
+        return None
+
+    selected = []
+    used = 0
+    for score, chunk in index.search(query, limit=max(1, budget // 100)):
+        text = chunk.read()
+        tokens = estimate_tokens(text)
+        if used + tokens > budget:
+            continue
+        selected.append((chunk, text))
+        used += tokens
+
+    if not selected:
+        print("没有检索到与查询相关的片段（中文查询只能通过常见术语匹配英文内容），读取完整文件")
+        return None
+
+    selected.sort(key=lambda item: (filenames.index(item[0].filename), item[0].start_line))
+    print(f"检索到 {len(selected)} 个相关片段 (共 {index.chunk_count} 个片段, 预估 {used} tokens)")
+    return [(chunk.label(), text.rstrip("\n")) for chunk, text in selected]
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+按优先级和客户端公平调度提供商请求
+
+后台进程和网关同时服务交互式的 shell 用户和后台批处理时，请求先在调度器中排队，
+由调度器在提供商的速率限制器（见 utils/rate_limiter.py）有空余时逐个放行:
+
+- 优先级类别之间严格按 interactive > script > batch 的顺序放行，交互式请求总是排在
+  已经排队的脚本和批处理请求之前
+- 同一类别内按客户端加权公平排队（虚拟完成时间），提交大量请求的客户端不会让其他
+  客户端一直等待
+- 准入控制: 按限制器的速率估计新请求的排队时间，超过该类别的最长等待时间或队列
+  已满时立即拒绝，而不是让请求排到超时
+- 每个请求的排队时间单独记录，与提供商延迟分开统计
+"""
+
+import time
+import heapq
+import itertools
+import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.utils.rate_limiter import RateLimiter
+
+# 优先级类别，从高到低
+PRIORITY_CLASSES = ("interactive", "script", "batch")
+
+# 未指定优先级时使用的类别
+DEFAULT_PRIORITY = "interactive"
+
+# 各类别允许的最长预计排队秒数，超过时拒绝新请求，None 表示不限
+MAX_QUEUE_WAIT = {"interactive": 30.0, "script": 300.0, "batch": None}
+
+# 各类别最多排队的请求数
+MAX_QUEUE_LENGTH = {"interactive": 256, "script": 1024, "batch": 100000}
+
+# 计算排队时间分位数时保留的最近请求数
+WAIT_WINDOW = 1000
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """最近秩法分位数，没有数据时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+class Ticket:
+    """
+    调度器中的一个请求
+
+    wait() 返回True后请求可以发送，发送完成后调用 Scheduler.done 归还并发槽位。
+    """
+
+    def __init__(self, priority: str, client: str, cost: float,
+                 run: Optional[Callable[[], Any]] = None):
+        self.priority = priority
+        self.client = client
+        self.cost = cost
+        self.run = run
+        self.start = 0.0
+        self.order = (0, 0.0, 0)  # type: Tuple[int, float, int]
+        self.enqueued = time.monotonic()
+        self.granted = threading.Event()
+        # queued、running、done 或 cancelled
+        self.state = "queued"
+        self.queue_wait = None  # type: Optional[float]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待调度器放行
+
+        Args:
+            timeout (float, optional): 最长等待秒数
+
+        Returns:
+            bool: 是否已放行，被取消或调度器关闭时为False
+        """
+        return self.granted.wait(timeout) and self.state in ("running", "done")
+
+class Scheduler:
+    """
+    一个提供商的请求调度器
+
+    Args:
+        limiter (RateLimiter): 提供商的速率限制器，决定放行的速率和并发数
+        weights (Dict[str, float], optional): 客户端的权重，默认为1
+        max_wait (Dict[str, float], optional): 覆盖 MAX_QUEUE_WAIT 中的值
+        max_length (Dict[str, int], optional): 覆盖 MAX_QUEUE_LENGTH 中的值
+    """
+
+    COUNTERS = ("admitted", "rejected", "cancelled", "dispatched")
+
+    def __init__(self, limiter: RateLimiter, weights: Optional[Dict[str, float]] = None,
+                 max_wait: Optional[Dict[str, Optional[float]]] = None,
+                 max_length: Optional[Dict[str, int]] = None):
+        self.limiter = limiter
+        self.weights = dict(weights or {})
+        self.max_wait = dict(MAX_QUEUE_WAIT, **(max_wait or {}))
+        self.max_length = dict(MAX_QUEUE_LENGTH, **(max_length or {}))
+        self.cond = threading.Condition()
+        self.heap = []  # type: List[Tuple[Tuple[int, float, int], Ticket]]
+        self.sequence = itertools.count()
+        # 每个类别的虚拟时间和每个客户端最后一个请求的虚拟完成时间
+        self.vtime = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self.finish = {}  # type: Dict[Tuple[str, str], float]
+        self.queued = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.counters = {name: dict.fromkeys(self.COUNTERS, 0) for name in PRIORITY_CLASSES}
+        self.waits = {name: deque(maxlen=WAIT_WINDOW) for name in PRIORITY_CLASSES}  # type: Dict[str, Deque[float]]
+        self.running = 0
+        self.closed = False
+        # 放行的请求数不超过限制器的并发数，执行回调的线程不会排队
+        self.executor = ThreadPoolExecutor(max_workers=limiter.max_concurrency,
+                                           thread_name_prefix="scheduler")
+        self.thread = threading.Thread(target=self._dispatch, name="scheduler-dispatch", daemon=True)
+        self.thread.start()
+
+    def estimated_wait(self, priority: str) -> float:
+        """
+        按限制器的速率估计该类别新请求的排队秒数（调用时需持有 cond）
+
+        Args:
+            priority (str): 优先级类别
+
+        Returns:
+            float: 排在它前面（同类别和更高类别）的请求全部放行所需的秒数
+        """
+        rank = PRIORITY_CLASSES.index(priority)
+        ahead = sum(self.queued[name] for name in PRIORITY_CLASSES[:rank + 1])
+        return ahead / self.limiter.rate if self.limiter.rate > 0 else 0.0
+
+    def _enqueue(self, ticket: Ticket, priority: str) -> None:
+        """按虚拟完成时间把请求放入类别的队列（调用时需持有 cond）"""
+        key = (priority, ticket.client)
+        ticket.priority = priority
+        ticket.start = max(self.vtime[priority], self.finish.get(key, 0.0))
+        finish = ticket.start + ticket.cost / max(self.weights.get(ticket.client, 1.0), 1e-6)
+        self.finish[key] = finish
+        ticket.order = (PRIORITY_CLASSES.index(priority), finish, next(self.sequence))
+        heapq.heappush(self.heap, (ticket.order, ticket))
+        self.queued[priority] += 1
+        self.cond.notify_all()
+
+    def submit(self, priority: str = DEFAULT_PRIORITY, client: str = "", cost: float = 1.0,
+               run: Optional[Callable[[], Any]] = None) -> Tuple[bool, Any]:
+        """
+        提交一个请求
+
+        Args:
+            priority (str): 优先级类别，PRIORITY_CLASSES 之一
+            client (str): 客户端标识，同一类别内按客户端公平排队
+            cost (float): 请求的代价（如估计的token数），客户端按代价之和分享放行次数
+            run (Callable[[], Any], optional): 放行后在调度器的线程中执行的函数，执行完
+                自动归还槽位；不提供时调用者等待 Ticket.wait 后自行发送并调用 done
+
+        Returns:
+            Tuple[bool, Any]: (是否接受, Ticket 或拒绝原因)
+        """
+        if priority not in PRIORITY_CLASSES:
+            return False, f"未知的优先级: {priority}，可选 {', '.join(PRIORITY_CLASSES)}"
+        ticket = Ticket(priority, client, max(float(cost), 1e-6), run)
+        with self.cond:
+            if self.closed:
+                return False, "调度器已关闭"
+            limit = self.max_wait[priority]
+            wait = self.estimated_wait(priority)
+            if self.queued[priority] >= self.max_length[priority]:
+                reason = f"{priority} 队列已满（{self.queued[priority]} 个请求）"
+            elif limit is not None and wait > limit:
+                reason = f"{priority} 队列预计等待 {wait:.0f} 秒，超过 {limit:.0f} 秒"
+            else:
+                reason = None
+            if reason is not None:
+                self.counters[priority]["rejected"] += 1
+                return False, reason
+            self.counters[priority]["admitted"] += 1
+            self._enqueue(ticket, priority)
+        return True, ticket
+
+    def promote(self, ticket: Ticket, priority: str) -> bool:
+        """
+        把仍在排队的请求提升到更高的类别（例如交互式请求合并到了排队中的批处理请求）
+
+        Args:
+            ticket (Ticket): 请求
+            priority (str): 新的类别
+
+        Returns:
+            bool: 是否已提升
+        """
+        if priority not in PRIORITY_CLASSES:
+            return False
+        with self.cond:
+            if ticket.state != "queued" or \
+                    PRIORITY_CLASSES.index(priority) >= PRIORITY_CLASSES.index(ticket.priority):
+                return False
+            # 旧的堆条目因 order 不再匹配而被跳过
+            self.queued[ticket.priority] -= 1
+            self._enqueue(ticket, priority)
+        return True
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """
+        取消尚未放行的请求
+
+        Returns:
+            bool: 是否已取消，已经放行的请求返回False
+        """
+        with self.cond:
+            if ticket.state != "queued":
+                return False
+            ticket.state = "cancelled"
+            self.queued[ticket.priority] -= 1
+            self.counters[ticket.priority]["cancelled"] += 1
+        ticket.granted.set()
+        return True
+
+    def done(self, ticket: Ticket) -> None:
+        """请求发送完成后归还并发槽位"""
+        with self.cond:
+            if ticket.state != "running":
+                return
+            ticket.state = "done"
+            self.running -= 1
+        self.limiter.release()
+
+    def _pop(self) -> Optional[Ticket]:
+        """取出最优先的请求（调用时需持有 cond）"""
+        while self.heap:
+            order, ticket = heapq.heappop(self.heap)
+            if ticket.state != "queued" or order != ticket.order:
+                continue
+            priority = ticket.priority
+            self.queued[priority] -= 1
+            self.vtime[priority] = max(self.vtime[priority], ticket.start)
+            if not self.queued[priority]:
+                # 类别空闲后重新开始计算虚拟时间
+                self.vtime[priority] = 0.0
+                for key in [key for key in self.finish if key[0] == priority]:
+                    del self.finish[key]
+            return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        """限制器有空余时放行最优先的请求，直到调度器关闭"""
+        while True:
+            with self.cond:
+                while not self.closed and not any(self.queued.values()):
+                    self.cond.wait()
+                if self.closed:
+                    return
+            # 取得槽位和令牌之后才选择请求，等待期间到达的交互式请求排在前面
+            self.limiter.acquire()
+            with self.cond:
+                ticket = None if self.closed else self._pop()
+                if ticket is not None:
+                    ticket.state = "running"
+                    ticket.queue_wait = time.monotonic() - ticket.enqueued
+                    self.waits[ticket.priority].append(ticket.queue_wait * 1000)
+                    self.counters[ticket.priority]["dispatched"] += 1
+                    self.running += 1
+            if ticket is None:
+                self.limiter.release()
+                continue
+            ticket.granted.set()
+            if ticket.run is not None:
+                self.executor.submit(self._run, ticket)
+
+    def _run(self, ticket: Ticket) -> None:
+        try:
+            ticket.run()
+        finally:
+            self.done(ticket)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        当前统计
+
+        Returns:
+            Dict[str, Any]: running（已放行未完成的请求数）和每个类别的 queued、计数以及
+                排队时间分位数（毫秒）
+        """
+        with self.cond:
+            classes = {}
+            for name in PRIORITY_CLASSES:
+                stats = dict(self.counters[name], queued=self.queued[name])
+                waits = list(self.waits[name])
+                for label, fraction in (("p50", 0.5), ("p99", 0.99)):
+                    value = percentile(waits, fraction)
+                    stats[f"queue_wait_{label}_ms"] = round(value, 1) if value is not None else None
+                classes[name] = stats
+            return {"running": self.running, "classes": classes}
+
+    def close(self, wait: bool = True) -> None:
+        """
+        停止放行，取消仍在排队的请求
+
+        Args:
+            wait (bool): 是否等待已放行的回调执行完
+        """
+        with self.cond:
+            self.closed = True
+            queued = [ticket for _, ticket in self.heap if ticket.state == "queued"]
+            self.cond.notify_all()
+        for ticket in queued:
+            self.cancel(ticket)
+        self.executor.shutdown(wait=wait)
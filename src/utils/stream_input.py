@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+管道输入处理
+
+`df -h | bcopilot "清理空间"` 这样的用法中，标准输入的内容作为名为 <stdin> 的文件
+加入提示，与 -filename 指定的文件使用相同的token预算处理。
+
+输入以固定大小的块读取，只保留开头和结尾（环形缓冲区），中间部分只统计行数后丢弃，
+因此无论输入多大内存占用都是常数，并且读取速度不会拖慢产生输出的命令。
+开头和结尾中连续重复的行被折叠，读到EOF后立即开始请求。
+
+标准输入只在确实有输入时读取:
+- 非交互运行（标准错误不是终端）时，管道在 STDIN_WAIT_SECONDS 秒内没有数据也没有结束时
+  忽略，cron、CI 或 ssh 继承的不会关闭的管道不会让查询一直等待；在终端中运行时一直等待
+  管道输入，`slow_cmd | bcopilot ...` 中启动较慢的命令不会被丢弃，-wait-stdin 在非交互运行时
+  也一直等待
+- 重定向的文件只在从头开始且不为空时读取。`while read q; do bcopilot "$q"; done < queries.txt`
+  中标准输入是循环正在读取的文件，读取位置不在开头，不读取也不移动读取位置
+- -no-stdin 完全跳过标准输入
+"""
+
+import os
+import sys
+import stat
+import select
+from collections import deque
+from typing import Optional, Tuple
+
+from config.constants import STDIN_HEAD_BYTES, STDIN_TAIL_BYTES, STDIN_WAIT_SECONDS
+from src.utils.file_utils import collapse_repeated_lines
+
+# 管道输入在提示中使用的文件名
+STDIN_NAME = "<stdin>"
+
+# 每次读取的字节数
+READ_CHUNK_BYTES = 64 * 1024
+
+class HeadTailBuffer:
+    """保留输入开头和结尾的有界缓冲区"""
+
+    def __init__(self, head_bytes: int = STDIN_HEAD_BYTES, tail_bytes: int = STDIN_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.head_full = False
+        self.tail = deque()
+        self.tail_size = 0
+        self.total_bytes = 0
+        self.omitted_bytes = 0
+        self.omitted_lines = 0
+        # 最近丢弃的一块是否以换行结尾，用于判断结尾部分的第一行是否完整
+        self.dropped_newline = True
+
+    def write(self, data: bytes) -> None:
+        """
+        追加一块输入
+
+        Args:
+            data (bytes): 输入数据
+        """
+        self.total_bytes += len(data)
+        if not self.head_full:
+            self.head += data
+            if len(self.head) <= self.head_bytes:
+                return
+            # 开头在最后一个完整行处结束，剩余部分进入结尾缓冲区
+            cut = self.head.rfind(b"\n", 0, self.head_bytes) + 1
+            if cut == 0:
+                # 开头就是一个超长的行，只保留其前 head_bytes 个字节
+                cut = self.head_bytes
+            data = bytes(self.head[cut:])
+            del self.head[cut:]
+            self.head_full = True
+
+        self.tail.append(data)
+        self.tail_size += len(data)
+        while self.tail_size - len(self.tail[0]) >= self.tail_bytes:
+            dropped = self.tail.popleft()
+            self.tail_size -= len(dropped)
+            self.omitted_bytes += len(dropped)
+            self.omitted_lines += dropped.count(b"\n")
+            self.dropped_newline = dropped.endswith(b"\n")
+
+    def getvalue(self) -> str:
+        """
+        生成保留内容的文本，重复行已折叠，省略的中间部分以标记代替
+
+        Returns:
+            str: 文本内容
+        """
+        head = bytes(self.head)
+        tail = b"".join(self.tail)
+        if tail and not self.dropped_newline:
+            # 结尾部分的第一行不完整，计入省略的行
+            newline = tail.find(b"\n")
+            partial = tail if newline < 0 else tail[:newline + 1]
+            tail = tail[len(partial):]
+            self.omitted_bytes += len(partial)
+            self.omitted_lines += 1
+            self.dropped_newline = True
+
+        lines = collapse_repeated_lines(head.decode("utf-8", errors="replace").splitlines())
+        if self.omitted_bytes:
+            lines.append(f"[输入已截断: 省略了中间 {self.omitted_lines} 行, {self.omitted_bytes} 字节]")
+        lines.extend(collapse_repeated_lines(tail.decode("utf-8", errors="replace").splitlines()))
+        return "\n".join(lines)
+
+def read_stream(fd: int, head_bytes: int = STDIN_HEAD_BYTES,
+                tail_bytes: int = STDIN_TAIL_BYTES) -> Tuple[str, int]:
+    """
+    读取文件描述符直到EOF，只保留开头和结尾
+
+    Args:
+        fd (int): 文件描述符
+        head_bytes (int): 保留的开头字节数
+        tail_bytes (int): 保留的结尾字节数
+
+    Returns:
+        Tuple[str, int]: (保留的文本内容, 读取的总字节数)
+    """
+    buffer = HeadTailBuffer(head_bytes, tail_bytes)
+    while True:
+        data = os.read(fd, READ_CHUNK_BYTES)
+        if not data:
+            break
+        buffer.write(data)
+    return buffer.getvalue(), buffer.total_bytes
+
+def stdin_mode() -> Optional[int]:
+    """标准输入的文件类型，被替换为非文件对象或已关闭时返回None"""
+    try:
+        return os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def stdin_is_piped() -> bool:
+    """
+    判断标准输入是否为管道或重定向的文件
+
+    终端、/dev/null 以及被替换为非文件对象的标准输入都不读取，避免无输入时阻塞。
+
+    Returns:
+        bool: 是否可能需要读取标准输入
+    """
+    mode = stdin_mode()
+    return mode is not None and (stat.S_ISFIFO(mode) or stat.S_ISREG(mode))
+
+def file_has_input(fd: int) -> bool:
+    """
+    判断重定向的文件是否应作为输入读取
+
+    Args:
+        fd (int): 文件描述符
+
+    Returns:
+        bool: 读取位置在开头且文件不为空时为True
+    """
+    try:
+        return os.lseek(fd, 0, os.SEEK_CUR) == 0 and os.fstat(fd).st_size > 0
+    except OSError:
+        return False
+
+def wait_for_input(fd: int, timeout: float) -> bool:
+    """
+    等待管道中有数据或管道结束
+
+    Args:
+        fd (int): 文件描述符
+        timeout (float): 最长等待秒数
+
+    Returns:
+        bool: 是否可以读取（包括已到EOF）
+    """
+    try:
+        return bool(select.select([fd], [], [], timeout)[0])
+    except (OSError, ValueError):
+        return False
+
+def is_interactive() -> bool:
+    """
+    判断是否由用户在终端中运行
+
+    Returns:
+        bool: 标准错误是终端时为True
+    """
+    try:
+        return sys.stderr.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+def read_stdin(wait: Optional[float] = STDIN_WAIT_SECONDS) -> Optional[str]:
+    """
+    读取管道输入
+
+    Args:
+        wait (float, optional): 非交互运行时管道没有数据最多等待的秒数，为None时一直等待
+
+    Returns:
+        Optional[str]: 输入内容，标准输入不是管道、没有输入或输入为空时返回None
+    """
+    if not stdin_is_piped():
+        return None
+    fd = sys.stdin.fileno()
+    if stat.S_ISREG(stdin_mode()):
+        if not file_has_input(fd):
+            return None
+    elif wait is not None and not is_interactive() and not wait_for_input(fd, wait):
+        print(f"警告: 标准输入在 {wait:g} 秒内没有数据，已忽略"
+              f"（使用 -wait-stdin 等待输入，或使用 -no-stdin 跳过读取）", file=sys.stderr)
+        return None
+    content, total_bytes = read_stream(fd)
+    if not content.strip():
+        return None
+    print(f"已读取标准输入: {total_bytes} 字节")
+    return content
@@ -43,11 +43,13 @@ def estimate_tokens(text: str) -> int:
     # 一般英文中平均一个token约等于4个字符
     # 中文和其他非拉丁语系通常一个字符就是一个token
 
+    # 计算ASCII字符数（编码时忽略非ASCII字符，避免逐字符遍历大文件）
+    ascii_count = len(text.encode("ascii", "ignore"))
+
     # 计算非ASCII字符数（如中文）
-    non_ascii_count = sum(1 for char in text if ord(char) > 127)
+    non_ascii_count = len(text) - ascii_count
 
-    # 计算ASCII字符数并除以4（估算英文tokens）
-    ascii_count = len(text) - non_ascii_count
+    # ASCII字符数除以4（估算英文tokens）
     ascii_tokens = ascii_count / 4
 
     # 非ASCII字符按1:1计算tokens
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+启动流程的耗时追踪
+
+`-trace` 参数或环境变量 BCOPILOT_TRACE=1 开启后，记录各阶段（预连接、环境探测、
+读取文件、请求等）的开始和结束时间，结束时在标准错误输出中打印时间线，
+可以直接看出哪些阶段是并行进行的。未开启时 span 几乎没有开销。
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+# 开启追踪的环境变量
+TRACE_ENV = "BCOPILOT_TRACE"
+
+# 时间线的宽度（字符数）
+TIMELINE_WIDTH = 40
+
+class Tracer:
+    """记录各阶段耗时的追踪器"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans = []  # type: List[Tuple[str, float, float, str, Optional[str]]]
+        self.lock = threading.Lock()
+
+    def enable(self) -> None:
+        """开启追踪，时间从此刻开始计算"""
+        self.enabled = True
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        记录一个阶段
+
+        Args:
+            name (str): 阶段名称
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.add(name, start, time.perf_counter(), error)
+
+    def add(self, name: str, start: float, end: float, error: Optional[str] = None) -> None:
+        """
+        添加一个已经结束的阶段
+
+        Args:
+            name (str): 阶段名称
+            start (float): 开始时间 (time.perf_counter)
+            end (float): 结束时间 (time.perf_counter)
+            error (str, optional): 阶段失败时的异常类型
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.spans.append((name, start, end, threading.current_thread().name, error))
+
+    def report(self, out: Optional[TextIO] = None) -> None:
+        """
+        输出时间线，每个阶段一行，横条表示其在整个流程中的位置
+
+        Args:
+            out (TextIO, optional): 输出位置，默认为标准错误
+        """
+        if not self.enabled or not self.spans:
+            return
+        out = out or sys.stderr
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        total = max(end for _, _, end, _, _ in spans) - self.origin
+        scale = TIMELINE_WIDTH / total if total > 0 else 0
+        name_width = max(len(span[0]) for span in spans)
+        print(f"[trace] 总耗时 {total * 1000:.1f} ms", file=out)
+        for name, start, end, thread, error in spans:
+            begin = int((start - self.origin) * scale)
+            length = max(1, int((end - self.origin) * scale) - begin)
+            bar = " " * begin + "#" * length
+            status = f" 失败: {error}" if error else ""
+            print(f"[trace] {name:<{name_width}} {(start - self.origin) * 1000:8.1f} "
+                  f"-> {(end - self.origin) * 1000:8.1f} ms |{bar:<{TIMELINE_WIDTH}}| "
+                  f"{thread}{status}", file=out)
+
+# 进程内共享的追踪器
+tracer = Tracer(enabled=os.environ.get(TRACE_ENV, "") not in ("", "0"))
@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+"""
+多台主机共享的批处理工作队列模块包
+"""
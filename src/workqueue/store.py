@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+工作队列的存储
+
+多台主机上的工作进程从同一个队列领取查询，队列可以是共享存储上的目录或一个SQLite文件:
+
+目录队列
+    pending/<编号>.json          等待处理的条目
+    leased/<编号>~<进程>~<令牌>.json  已被领取的条目，文件修改时间是最近一次续租的时间
+    done/<编号>.json             结果，failed/ 中是失败结果的硬链接
+    workers/<进程>.json          每个工作进程最近上报的统计
+
+    领取是把条目从 pending/ 原子重命名到 leased/，只有一个进程能成功；结果用 os.link
+    写入 done/，已存在时失败，因此每个条目只接受第一个结果。租约超时（进程退出或失联）
+    的条目被重命名回 pending/ 重新分配。
+
+SQLite队列
+    同样的状态保存在 items 表中，领取、续租和完成都在一个写事务中完成。多台主机共享
+    时文件系统必须支持可靠的文件锁，因此不使用WAL模式（需要共享内存，只能在同一台主机上使用）。
+
+条目可能被执行多次（租约超时后原进程仍然完成了请求），但每个条目只记录一个结果。
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+# 租约的默认时长（秒），工作进程每隔三分之一时长续租一次
+DEFAULT_LEASE_TIMEOUT = 120.0
+
+# 目录队列每次领取时最多查看的等待条目数
+CLAIM_SCAN_LIMIT = 256
+
+# 工作进程名称中允许的字符，其他字符替换为下划线
+WORKER_NAME_PATTERN = re.compile(r"[^A-Za-z0-9_.-]")
+
+def worker_name(name: str) -> str:
+    """把工作进程名称转换为可以用在文件名中的形式"""
+    return WORKER_NAME_PATTERN.sub("_", name)[:64] or "worker"
+
+def new_item_ids(count: int) -> List[str]:
+    """
+    生成一批条目的编号
+
+    编号以添加时间开头，按字典序排列即为添加顺序。
+
+    Args:
+        count (int): 条目数
+
+    Returns:
+        List[str]: 编号列表
+    """
+    prefix = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    return [f"{prefix}-{index:07d}" for index in range(count)]
+
+class QueueLease:
+    """
+    一个已领取的条目
+
+    Args:
+        item (Dict[str, Any]): 条目，包含 id、query、context 和 added
+        worker (str): 领取的工作进程
+        token (str): 租约标识，续租和完成时用于确认租约仍然有效
+    """
+
+    def __init__(self, item: Dict[str, Any], worker: str, token: str):
+        self.item = item
+        self.worker = worker
+        self.token = token
+
+    @property
+    def id(self) -> str:
+        return self.item["id"]
+
+class DirectoryQueue:
+    """
+    基于目录的工作队列，见模块说明
+
+    Args:
+        path (str): 队列目录，通常位于多台主机共享的存储上
+        lease_timeout (float): 租约时长（秒）
+    """
+
+    def __init__(self, path: str, lease_timeout: float = DEFAULT_LEASE_TIMEOUT):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        for name in ("pending", "leased", "done", "failed", "workers", "tmp"):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _temp_file(self, data: Dict[str, Any]) -> str:
+        """把数据写入临时文件，返回路径"""
+        temp_path = os.path.join(self._dir("tmp"), f"{uuid.uuid4().hex}.json")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        return temp_path
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def add(self, queries: List[str], context: Dict[str, str]) -> int:
+        """
+        添加查询
+
+        Args:
+            queries (List[str]): 查询列表
+            context (Dict[str, str]): 所有查询共享的bash环境上下文
+
+        Returns:
+            int: 添加的条目数
+        """
+        now = time.time()
+        for item_id, query in zip(new_item_ids(len(queries)), queries):
+            item = {"id": item_id, "query": query, "context": context, "added": now}
+            os.replace(self._temp_file(item), os.path.join(self._dir("pending"), f"{item_id}.json"))
+        return len(queries)
+
+    def claim(self, worker: str, count: int) -> List[QueueLease]:
+        """
+        领取最早添加的条目
+
+        Args:
+            worker (str): 工作进程名称
+            count (int): 最多领取的条目数
+
+        Returns:
+            List[QueueLease]: 领取到的条目，可能少于 count
+        """
+        worker = worker_name(worker)
+        names = sorted(name for name in os.listdir(self._dir("pending")) if name.endswith(".json"))
+        leases = []  # type: List[QueueLease]
+        for name in names[:CLAIM_SCAN_LIMIT]:
+            if len(leases) >= count:
+                break
+            item_id = name[:-len(".json")]
+            token = f"{item_id}~{worker}~{uuid.uuid4().hex[:8]}.json"
+            lease_path = os.path.join(self._dir("leased"), token)
+            try:
+                # 重命名是原子的，同时领取的进程中只有一个成功
+                os.rename(os.path.join(self._dir("pending"), name), lease_path)
+                # 租约从现在开始计时；失败说明刚被当作超时的租约放回
+                os.utime(lease_path)
+            except FileNotFoundError:
+                continue
+            if os.path.exists(os.path.join(self._dir("done"), name)):
+                # 超时后放回的条目已经由原来的进程完成
+                self._unlink(lease_path)
+                continue
+            item = self._read(lease_path)
+            if item is not None:
+                leases.append(QueueLease(item, worker, token))
+        return leases
+
+    def renew(self, leases: List[QueueLease]) -> List[QueueLease]:
+        """
+        续租
+
+        Args:
+            leases (List[QueueLease]): 进行中的条目
+
+        Returns:
+            List[QueueLease]: 已经失去租约（超时后被重新分配）的条目
+        """
+        lost = []
+        for lease in leases:
+            try:
+                os.utime(os.path.join(self._dir("leased"), lease.token))
+            except FileNotFoundError:
+                lost.append(lease)
+        return lost
+
+    def complete(self, lease: QueueLease, result: Dict[str, Any]) -> bool:
+        """
+        记录结果并结束租约
+
+        Args:
+            lease (QueueLease): 领取的条目
+            result (Dict[str, Any]): 结果，包含 success
+
+        Returns:
+            bool: 是否被接受；条目已经有结果时返回False
+        """
+        temp_path = self._temp_file(result)
+        name = f"{lease.id}.json"
+        try:
+            # 硬链接在目标已存在时失败，保证每个条目只接受一个结果
+            os.link(temp_path, os.path.join(self._dir("done"), name))
+            accepted = True
+        except FileExistsError:
+            accepted = False
+        finally:
+            self._unlink(temp_path)
+        if accepted and not result.get("success"):
+            try:
+                os.link(os.path.join(self._dir("done"), name), os.path.join(self._dir("failed"), name))
+            except FileExistsError:
+                pass
+        self._unlink(os.path.join(self._dir("leased"), lease.token))
+        return accepted
+
+    def release(self, lease: QueueLease) -> None:
+        """放弃租约，条目立即回到等待状态"""
+        try:
+            os.rename(os.path.join(self._dir("leased"), lease.token),
+                      os.path.join(self._dir("pending"), f"{lease.id}.json"))
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self) -> int:
+        """
+        把超时的租约放回等待状态
+
+        Returns:
+            int: 放回的条目数
+        """
+        deadline = time.time() - self.lease_timeout
+        requeued = 0
+        for token in os.listdir(self._dir("leased")):
+            path = os.path.join(self._dir("leased"), token)
+            try:
+                if os.path.getmtime(path) > deadline:
+                    continue
+                item_id = token.split("~", 1)[0]
+                if os.path.exists(os.path.join(self._dir("done"), f"{item_id}.json")):
+                    self._unlink(path)
+                    continue
+                os.rename(path, os.path.join(self._dir("pending"), f"{item_id}.json"))
+                requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def progress(self) -> Dict[str, int]:
+        """
+        队列进度
+
+        Returns:
+            Dict[str, int]: 等待(pending)、进行中(leased)、已完成(done)和其中失败(failed)的条目数
+        """
+        return {name: sum(1 for entry in os.listdir(self._dir(name)) if entry.endswith(".json"))
+                for name in ("pending", "leased", "done", "failed")}
+
+    def report(self, stats: Dict[str, Any]) -> None:
+        """保存工作进程的统计"""
+        os.replace(self._temp_file(stats),
+                   os.path.join(self._dir("workers"), f"{worker_name(stats['worker'])}.json"))
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """所有工作进程最近上报的统计"""
+        stats = (self._read(os.path.join(self._dir("workers"), name))
+                 for name in sorted(os.listdir(self._dir("workers"))))
+        return [entry for entry in stats if entry is not None]
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """按编号顺序逐个返回结果"""
+        for name in sorted(os.listdir(self._dir("done"))):
+            result = self._read(os.path.join(self._dir("done"), name))
+            if result is not None:
+                yield result
+
+    def close(self) -> None:
+        pass
+
+    def _unlink(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class SqliteQueue:
+    """
+    基于SQLite文件的工作队列，见模块说明
+
+    Args:
+        path (str): 数据库文件路径
+        lease_timeout (float): 租约时长（秒）
+    """
+
+    def __init__(self, path: str, lease_timeout: float = DEFAULT_LEASE_TIMEOUT):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                    isolation_level=None)
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " id TEXT UNIQUE NOT NULL,"
+                " query TEXT NOT NULL,"
+                " context TEXT NOT NULL,"
+                " added REAL NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " worker TEXT,"
+                " token TEXT,"
+                " lease_until REAL,"
+                " success INTEGER,"
+                " result TEXT,"
+                " finished REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, seq)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " worker TEXT PRIMARY KEY,"
+                " stats TEXT NOT NULL)"
+            )
+
+    def _write(self, statements) -> Any:
+        """在一个写事务中执行，返回 statements 的返回值"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def add(self, queries: List[str], context: Dict[str, str]) -> int:
+        """添加查询，见 DirectoryQueue.add"""
+        now = time.time()
+        encoded = json.dumps(context, ensure_ascii=False)
+        rows = [(item_id, query, encoded, now)
+                for item_id, query in zip(new_item_ids(len(queries)), queries)]
+        self._write(lambda conn: conn.executemany(
+            "INSERT INTO items (id, query, context, added) VALUES (?, ?, ?, ?)", rows))
+        return len(rows)
+
+    def claim(self, worker: str, count: int) -> List[QueueLease]:
+        """领取最早添加的条目，包括租约已经超时的条目，见 DirectoryQueue.claim"""
+        worker = worker_name(worker)
+
+        def statements(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT seq, id, query, context, added FROM items"
+                " WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)"
+                " ORDER BY seq LIMIT ?", (now, count)).fetchall()
+            leases = []
+            for seq, item_id, query, context, added in rows:
+                token = uuid.uuid4().hex
+                conn.execute("UPDATE items SET status = 'leased', worker = ?, token = ?, lease_until = ?"
+                             " WHERE seq = ?", (worker, token, now + self.lease_timeout, seq))
+                leases.append(QueueLease({"id": item_id, "query": query,
+                                          "context": json.loads(context), "added": added},
+                                         worker, token))
+            return leases
+
+        return self._write(statements)
+
+    def renew(self, leases: List[QueueLease]) -> List[QueueLease]:
+        """续租，返回已经失去租约的条目，见 DirectoryQueue.renew"""
+        def statements(conn):
+            until = time.time() + self.lease_timeout
+            return [lease for lease in leases if conn.execute(
+                "UPDATE items SET lease_until = ? WHERE id = ? AND token = ? AND status = 'leased'",
+                (until, lease.id, lease.token)).rowcount == 0]
+
+        return self._write(statements)
+
+    def complete(self, lease: QueueLease, result: Dict[str, Any]) -> bool:
+        """记录结果，条目已经有结果时返回False，见 DirectoryQueue.complete"""
+        encoded = json.dumps(result, ensure_ascii=False)
+        return self._write(lambda conn: conn.execute(
+            "UPDATE items SET status = 'done', success = ?, result = ?, finished = ?, token = NULL"
+            " WHERE id = ? AND status != 'done'",
+            (1 if result.get("success") else 0, encoded, time.time(), lease.id)).rowcount == 1)
+
+    def release(self, lease: QueueLease) -> None:
+        """放弃租约，条目立即回到等待状态"""
+        self._write(lambda conn: conn.execute(
+            "UPDATE items SET status = 'pending', worker = NULL, token = NULL, lease_until = NULL"
+            " WHERE id = ? AND token = ? AND status = 'leased'", (lease.id, lease.token)))
+
+    def requeue_expired(self) -> int:
+        """把超时的租约放回等待状态，返回放回的条目数"""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE items SET status = 'pending', worker = NULL, token = NULL, lease_until = NULL"
+            " WHERE status = 'leased' AND lease_until < ?", (time.time(),)).rowcount)
+
+    def progress(self) -> Dict[str, int]:
+        """队列进度，见 DirectoryQueue.progress"""
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status"))
+            failed = self.conn.execute(
+                "SELECT COUNT(*) FROM items WHERE status = 'done' AND success = 0").fetchone()[0]
+        return {"pending": counts.get("pending", 0), "leased": counts.get("leased", 0),
+                "done": counts.get("done", 0), "failed": failed}
+
+    def report(self, stats: Dict[str, Any]) -> None:
+        """保存工作进程的统计"""
+        encoded = json.dumps(stats, ensure_ascii=False)
+        self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO workers (worker, stats) VALUES (?, ?)",
+            (worker_name(stats["worker"]), encoded)))
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """所有工作进程最近上报的统计"""
+        with self.lock:
+            rows = self.conn.execute("SELECT stats FROM workers ORDER BY worker").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """按添加顺序逐个返回结果"""
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT seq, result FROM items WHERE status = 'done' AND seq > ?"
+                    " ORDER BY seq LIMIT 1000", (last,)).fetchall()
+            if not rows:
+                return
+            for seq, result in rows:
+                last = seq
+                yield json.loads(result)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+def open_queue(spec: str, lease_timeout: float = DEFAULT_LEASE_TIMEOUT):
+    """
+    打开工作队列
+
+    Args:
+        spec (str): 以 .db、.sqlite 或 .sqlite3 结尾时为SQLite文件，否则为目录
+        lease_timeout (float): 租约时长（秒）
+
+    Returns:
+        DirectoryQueue 或 SqliteQueue
+    """
+    if spec.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteQueue(spec, lease_timeout)
+    return DirectoryQueue(spec, lease_timeout)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+工作进程和协调报告
+
+每台主机运行一个或多个工作进程，从共享队列（见 workqueue/store.py）领取查询，
+在本机提供商的速率限制和密钥池约束下发送请求，把结果写回队列。进行中的条目定期续租，
+进程退出或失联后条目在租约超时时重新分配。限流、服务端错误和网络错误等暂时性的失败
+不写回结果，退避后把条目放回队列重试；其他失败作为结果写回。
+"""
+
+import os
+import time
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import get_provider_config, is_retryable, request_generation
+from src.utils.http_client import get_session
+from src.utils.key_pool import get_key_pool
+from src.utils.rate_limiter import get_rate_limiter
+from src.workqueue.store import QueueLease
+
+# 每次领取的条目数上限相对于并发数的倍数
+CLAIM_FACTOR = 2
+
+# 没有可领取的条目时再次检查的间隔秒数
+IDLE_POLL_INTERVAL = 5.0
+
+# 上报统计的间隔秒数
+REPORT_INTERVAL = 5.0
+
+# 超过该秒数没有上报统计的工作进程视为已停止
+WORKER_STALE_AFTER = 30.0
+
+# 每个工作进程对同一条目的最多重试次数，超过后作为失败写回
+MAX_ITEM_RETRIES = 5
+
+# 放回队列前的退避秒数，按重试次数加倍
+RETRY_DELAY = 2.0
+
+# 退避秒数的上限
+MAX_RETRY_DELAY = 60.0
+
+def default_worker_name() -> str:
+    """默认的工作进程名称: 主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class QueueWorker:
+    """
+    从队列领取查询并生成命令的工作进程
+
+    Args:
+        queue: 工作队列（DirectoryQueue 或 SqliteQueue）
+        model_manager (ModelManager, optional): 已加载的模型配置
+        name (str, optional): 工作进程名称，默认为主机名-进程号
+        provider_config (Dict[str, Any], optional): 使用的提供商，默认为当前的命令提供商
+        poll_interval (float): 没有可领取的条目时再次检查的间隔秒数
+    """
+
+    def __init__(self, queue, model_manager: Optional[ModelManager] = None,
+                 name: Optional[str] = None,
+                 provider_config: Optional[Dict[str, Any]] = None,
+                 poll_interval: float = IDLE_POLL_INTERVAL):
+        self.queue = queue
+        self.model_manager = model_manager or ModelManager()
+        self.name = name or default_worker_name()
+        self.provider_config = provider_config or get_provider_config(self.model_manager)
+        self.provider_name = self.model_manager.config.get("command", {}).get("provider")
+        self.keys = get_key_pool(self.provider_config, self.model_manager)
+        self.limiter = get_rate_limiter(self.provider_config, len(self.keys))
+        self.session = get_session(self.provider_config["url"])
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.inflight = {}  # type: Dict[str, QueueLease]
+        # 本进程对每个条目的重试次数
+        self.retries = {}  # type: Dict[str, int]
+        now = time.time()
+        self.stats = {"worker": self.name, "host": socket.gethostname(), "pid": os.getpid(),
+                      "provider": self.provider_name, "model": self.provider_config["model"],
+                      "started": now, "updated": now, "completed": 0, "failed": 0,
+                      "duplicates": 0, "lost": 0, "retried": 0, "prompt_tokens": 0,
+                      "completion_tokens": 0,
+                      "stopped": False}
+
+    def stop(self) -> None:
+        """停止领取新条目，尚未开始的条目放回队列"""
+        self.stop_event.set()
+
+    def report(self) -> None:
+        """把统计写入队列"""
+        with self.lock:
+            self.stats["updated"] = time.time()
+            stats = dict(self.stats, inflight=len(self.inflight))
+        self.queue.report(stats)
+
+    def heartbeat(self) -> None:
+        """定期续租进行中的条目并上报统计，直到工作进程停止"""
+        interval = min(REPORT_INTERVAL, self.queue.lease_timeout / 3)
+        while not self.stop_event.wait(interval):
+            with self.lock:
+                leases = list(self.inflight.values())
+            lost = self.queue.renew(leases) if leases else []
+            with self.lock:
+                self.stats["lost"] += len(lost)
+            self.report()
+
+    def process(self, lease: QueueLease) -> None:
+        """发送一个条目的请求并写回结果"""
+        if self.stop_event.is_set():
+            self.queue.release(lease)
+            with self.lock:
+                self.inflight.pop(lease.token, None)
+            return
+
+        usage = {}  # type: Dict[str, Any]
+        start = time.time()
+        with self.limiter:
+            success, answer = request_generation(self.provider_config, lease.item["query"],
+                                                 lease.item["context"], False, None, usage,
+                                                 self.model_manager, self.session,
+                                                 provider_name=self.provider_name)
+        if not success and is_retryable(usage):
+            with self.lock:
+                attempts = self.retries.get(lease.id, 0) + 1
+                self.retries[lease.id] = attempts
+            if attempts <= MAX_ITEM_RETRIES:
+                # 暂时性失败不写回结果（结果只接受第一个），退避后放回队列
+                self.stop_event.wait(min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1)))
+                self.queue.release(lease)
+                with self.lock:
+                    self.inflight.pop(lease.token, None)
+                    self.stats["retried"] += 1
+                return
+        result = {"id": lease.id, "query": lease.item["query"], "success": success,
+                  "answer": answer, "worker": self.name, "usage": usage,
+                  "started": start, "finished": time.time()}
+        accepted = self.queue.complete(lease, result)
+        with self.lock:
+            self.inflight.pop(lease.token, None)
+            if not accepted:
+                # 租约超时后由其他进程先完成了
+                self.stats["duplicates"] += 1
+                return
+            self.stats["completed" if success else "failed"] += 1
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            self.stats["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def run(self, follow: bool = False) -> Dict[str, Any]:
+        """
+        处理队列中的条目
+
+        Args:
+            follow (bool): 队列处理完后是否继续等待新条目（直到调用 stop）
+
+        Returns:
+            Dict[str, Any]: 本进程的统计
+        """
+        heartbeat = threading.Thread(target=self.heartbeat, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        capacity = self.limiter.max_concurrency * CLAIM_FACTOR
+        futures = set()  # type: set
+        try:
+            with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency) as executor:
+                while not self.stop_event.is_set():
+                    self.queue.requeue_expired()
+                    leases = []  # type: List[QueueLease]
+                    if len(futures) < capacity:
+                        leases = self.queue.claim(self.name, capacity - len(futures))
+                    with self.lock:
+                        self.inflight.update((lease.token, lease) for lease in leases)
+                    futures.update(executor.submit(self.process, lease) for lease in leases)
+
+                    if futures:
+                        done, futures = wait(futures, timeout=self.poll_interval,
+                                             return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                        continue
+                    progress = self.queue.progress()
+                    # 其他进程的租约可能超时，队列中没有任何未完成的条目时才结束
+                    if not follow and not progress["pending"] and not progress["leased"]:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+        finally:
+            self.stop_event.set()
+            heartbeat.join()
+            with self.lock:
+                self.stats["stopped"] = True
+            self.report()
+        return self.stats
+
+def queue_report(queue, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    汇总所有工作进程的进度和吞吐量
+
+    Args:
+        queue: 工作队列
+        now (float, optional): 当前时间
+
+    Returns:
+        Dict[str, Any]: progress（各状态的条目数）、workers（每个进程的统计，加上
+            rate（每秒完成数）和 alive）、throughput（运行中进程的每秒完成数之和）、
+            overall（从第一个进程启动到最近一次上报的平均每秒完成数）和
+            eta（预计剩余秒数，无法估计时为None）
+    """
+    now = time.time() if now is None else now
+    progress = queue.progress()
+    workers = []
+    for stats in queue.workers():
+        elapsed = max(stats["updated"] - stats["started"], 1e-6)
+        finished = stats["completed"] + stats["failed"]
+        alive = not stats.get("stopped") and now - stats["updated"] < WORKER_STALE_AFTER
+        workers.append(dict(stats, rate=finished / elapsed, alive=alive))
+    throughput = sum(worker["rate"] for worker in workers if worker["alive"])
+    overall = 0.0
+    if workers:
+        span = max(worker["updated"] for worker in workers) - min(worker["started"] for worker in workers)
+        overall = progress["done"] / span if span > 0 else 0.0
+    remaining = progress["pending"] + progress["leased"]
+    eta = remaining / throughput if throughput and remaining else (0.0 if not remaining else None)
+    return {"progress": progress, "workers": workers, "throughput": throughput,
+            "overall": overall, "eta": eta}
+
+def format_report(report: Dict[str, Any]) -> str:
+    """协调报告的文本形式"""
+    progress = report["progress"]
+    total = progress["pending"] + progress["leased"] + progress["done"]
+    eta = "未知" if report["eta"] is None else f"{report['eta']:.0f} 秒"
+    lines = [f"进度: {progress['done']}/{total}（失败 {progress['failed']}，进行中 {progress['leased']}，"
+             f"等待 {progress['pending']}），当前吞吐量 {report['throughput']:.2f} 查询/秒，"
+             f"平均 {report['overall']:.2f} 查询/秒，预计剩余 {eta}"]
+    for worker in report["workers"]:
+        state = "运行中" if worker["alive"] else "已停止"
+        lines.append(f"  {worker['worker']:<24} {state}  完成 {worker['completed']}  失败 {worker['failed']}  "
+                     f"{worker['rate']:.2f}/秒  tokens {worker['prompt_tokens']}+{worker['completion_tokens']}"
+                     f"  重复 {worker['duplicates']}  重试 {worker.get('retried', 0)}")
+    return "\n".join(lines)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+基础生成器提示词布局测试用例
+"""
+
+import unittest
+import os
+import sys
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.prompts import COMMAND_SYSTEM_PROMPT, COMMAND_REFUSAL_MESSAGE
+from src.generators.base_generator import build_messages, extract_usage
+
+
+class TestPromptLayout(unittest.TestCase):
+    """提示词分块布局与缓存标记测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.context = {
+            "current_directory": "/home/user",
+            "username": "testuser",
+            "hostname": "testhost",
+            "ubuntu_version": "20.04"
+        }
+        self.file_contents = [("app.log", "line1\nline2")]
+        self.siliconflow = {
+            "url": "https://api.siliconflow.cn/v1/chat/completions",
+            "model": "Pro/deepseek-ai/DeepSeek-V3"
+        }
+        self.openrouter = {
+            "url": "https://openrouter.ai/api/v1/chat/completions",
+            "model": "anthropic/claude-3.7-sonnet"
+        }
+
+    def test_static_system_prompt(self):
+        """测试系统提示词不包含随调用变化的值"""
+        messages = build_messages("列出文件", self.context, self.siliconflow)
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertEqual(messages[0]["content"], COMMAND_SYSTEM_PROMPT)
+        self.assertIn(COMMAND_REFUSAL_MESSAGE, COMMAND_SYSTEM_PROMPT)
+        self.assertNotIn("/home/user", messages[0]["content"])
+
+    def test_query_is_last(self):
+        """测试查询位于文件内容之后，共享前缀保持不变"""
+        first = build_messages("统计行数", self.context, self.siliconflow,
+                               file_contents=self.file_contents)
+        second = build_messages("查找错误", self.context, self.siliconflow,
+                                file_contents=self.file_contents)
+
+        user_text = first[1]["content"]
+        self.assertLess(user_text.index("line2"), user_text.index("统计行数"))
+
+        prefix = user_text[:user_text.index("用户请求")]
+        self.assertTrue(second[1]["content"].startswith(prefix))
+
+    def test_openrouter_cache_control(self):
+        """测试OpenRouter上的Anthropic模型添加缓存断点"""
+        messages = build_messages("统计行数", self.context, self.openrouter,
+                                  is_script=True, file_contents=self.file_contents)
+        system_blocks = messages[0]["content"]
+        user_blocks = messages[1]["content"]
+
+        self.assertIn("cache_control", system_blocks[-1])
+        self.assertIn("cache_control", user_blocks[-2])
+        self.assertIn("app.log", user_blocks[-2]["text"])
+        self.assertNotIn("cache_control", user_blocks[-1])
+
+    def test_no_cache_control_when_disabled(self):
+        """测试prompt_cache关闭时不添加缓存标记"""
+        provider = dict(self.openrouter, prompt_cache=False)
+        messages = build_messages("统计行数", self.context, provider)
+        for block in messages[0]["content"] + messages[1]["content"]:
+            self.assertNotIn("cache_control", block)
+
+    def test_extract_usage(self):
+        """测试从不同服务商的响应中提取缓存命中"""
+        openai_style = {"usage": {"prompt_tokens": 2000, "completion_tokens": 20,
+                                  "prompt_tokens_details": {"cached_tokens": 1536}}}
+        deepseek_style = {"usage": {"prompt_tokens": 1000, "completion_tokens": 10,
+                                    "prompt_cache_hit_tokens": 768}}
+
+        self.assertEqual(extract_usage(openai_style)["cached_tokens"], 1536)
+        self.assertEqual(extract_usage(deepseek_style)["cached_tokens"], 768)
+        self.assertNotIn("cached_tokens", extract_usage({"usage": {"prompt_tokens": 5}}))
+        self.assertEqual(extract_usage({})["prompt_tokens"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
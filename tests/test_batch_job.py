@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+提供商离线批处理任务的测试用例
+"""
+
+import unittest
+import os
+import sys
+import json
+import tempfile
+from argparse import Namespace
+from unittest.mock import MagicMock, patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_provider import MockProvider
+from src.cli import batch_commands
+from src.generators.batch_job import (
+    batch_base_url,
+    parse_result_line,
+    submit_job,
+    load_job,
+    list_jobs,
+    job_client,
+    job_status,
+    wait_for_job,
+    iter_results,
+    save_job
+)
+from src.utils.http_client import close_sessions
+
+CONTEXT = {"current_directory": "/tmp", "username": "user", "hostname": "host",
+           "ubuntu_version": "22.04"}
+
+
+def key_manager(keys):
+    """按密钥文件名返回密钥的模型配置管理器"""
+    model_manager = MagicMock()
+    model_manager.get_api_key.side_effect = keys.get
+    model_manager.config = {"command": {"provider": "mock"}}
+    return model_manager
+
+
+class TestBatchFormat(unittest.TestCase):
+    """批处理地址和结果解析测试类"""
+
+    def test_batch_base_url(self):
+        """测试由聊天接口地址推断批处理接口地址"""
+        self.assertEqual(batch_base_url({"url": "https://api.openai.com/v1/chat/completions"}),
+                         "https://api.openai.com/v1")
+        self.assertEqual(batch_base_url({"url": "https://x/api/chat", "batch_url": "https://y/v1/"}),
+                         "https://y/v1")
+        self.assertIsNone(batch_base_url({"url": "https://x/api/chat"}))
+
+    def test_parse_result_line(self):
+        """测试解析结果文件和错误文件中的行"""
+        ok = {"custom_id": "q-2", "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": " ls -la \n"}}],
+            "usage": {"prompt_tokens": 40, "completion_tokens": 3}}}, "error": None}
+        self.assertEqual(parse_result_line(json.dumps(ok), 3),
+                         (2, True, "ls -la", {"prompt_tokens": 40, "completion_tokens": 3}))
+        failed = {"custom_id": "q-0", "response": {"status_code": 429, "body": {
+            "error": {"message": "超出限额"}}}, "error": None}
+        self.assertEqual(parse_result_line(json.dumps(failed), 3),
+                         (0, False, "API错误 (429): 超出限额", {}))
+        expired = {"custom_id": "q-1", "response": None,
+                   "error": {"code": "batch_expired", "message": "未在完成窗口内处理"}}
+        self.assertEqual(parse_result_line(json.dumps(expired), 3)[2],
+                         "API错误 (batch_expired): 未在完成窗口内处理")
+        self.assertIsNone(parse_result_line(json.dumps(dict(ok, custom_id="q-3")), 3))
+        self.assertIsNone(parse_result_line(json.dumps(dict(ok, custom_id="other")), 3))
+        self.assertIsNone(parse_result_line("not json", 3))
+
+
+class TestBatchJob(unittest.TestCase):
+    """通过模拟提供商测试批处理任务"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.provider = MockProvider(reply="du -sh *", batch_seconds=0.2).start()
+        self.config = {"url": self.provider.url, "model": "mock-model", "key_file": "a.txt"}
+        self.model_manager = key_manager({"a.txt": "key-a"})
+        self.queries = [f"统计第{index}个目录的大小" for index in range(7)]
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.provider.stop()
+        close_sessions()
+        self.temp_dir.cleanup()
+
+    def submit(self, queries=None, **kwargs):
+        success, job = submit_job(queries or self.queries, CONTEXT, self.model_manager,
+                                  provider_config=self.config, directory=self.temp_dir.name,
+                                  **kwargs)
+        self.assertTrue(success, job)
+        return job
+
+    def test_submit_wait_collect(self):
+        """测试分批提交、轮询和收集结果"""
+        self.provider.error_rate = 0.3
+        self.provider.random.seed(3)
+        job = self.submit(max_requests=3)
+        self.assertEqual([(batch["start"], batch["count"]) for batch in job["batches"]],
+                         [(0, 3), (3, 3), (6, 1)])
+        self.assertEqual(load_job(job["name"], self.temp_dir.name)["queries"], self.queries)
+        self.assertEqual([saved["name"] for saved in list_jobs(self.temp_dir.name)], [job["name"]])
+
+        lines = self.provider.files["file-1"]["data"].decode("utf-8").splitlines()
+        first = json.loads(lines[0])
+        self.assertEqual((first["custom_id"], first["url"]), ("q-0", "/v1/chat/completions"))
+        self.assertEqual(first["body"]["model"], "mock-model")
+        self.assertIn(self.queries[0], first["body"]["messages"][-1]["content"])
+
+        client = job_client(job, self.model_manager)
+        updates = []
+        self.assertTrue(wait_for_job(job, client, self.temp_dir.name, interval=0.02,
+                                     max_interval=0.1, on_update=lambda current: updates.append(
+                                         job_status(current))))
+        self.assertEqual(updates[-1], "completed")
+        self.assertEqual(load_job(job["name"], self.temp_dir.name)["batches"][0]["status"], "completed")
+
+        results = [result for _, result in iter_results(job, client)]
+        self.assertEqual(sorted(result["index"] for result in results), list(range(7)))
+        succeeded = [result for result in results if result["success"]]
+        failed = [result for result in results if not result["success"]]
+        self.assertTrue(succeeded and failed)
+        self.assertEqual({result["answer"] for result in succeeded}, {"du -sh *"})
+        self.assertTrue(all("500" in result["answer"] for result in failed))
+        self.assertEqual(succeeded[0]["query"], self.queries[succeeded[0]["index"]])
+        self.assertEqual(succeeded[0]["usage"]["key"], "a.txt")
+        self.assertGreater(succeeded[0]["usage"]["prompt_tokens"], 0)
+
+    def test_failed_batch_and_other_key(self):
+        """测试批处理失败时每个查询都报告错误，以及其他密钥无法查询"""
+        self.provider.batch_status = "failed"
+        job = self.submit(self.queries[:2])
+        client = job_client(job, self.model_manager)
+        self.assertTrue(wait_for_job(job, client, self.temp_dir.name, interval=0.02))
+        results = [result for _, result in iter_results(job, client)]
+        self.assertEqual([result["success"] for result in results], [False, False])
+        self.assertIn("failed", results[0]["answer"])
+
+        self.assertIsNone(job_client(job, key_manager({})))
+        other = job_client(dict(job, key_config={"key_file": "b.txt"}, key="b.txt"),
+                           key_manager({"b.txt": "key-b"}))
+        success, message = other.retrieve(job["batches"][0]["id"])
+        self.assertFalse(success)
+        self.assertIn("404", message)
+
+    def test_poll_backoff(self):
+        """测试没有进展时轮询间隔增长"""
+        self.provider.batch_seconds = 5
+        job = self.submit(self.queries[:1])
+        client = job_client(job, self.model_manager)
+        self.assertFalse(wait_for_job(job, client, self.temp_dir.name, interval=0.05,
+                                      max_interval=0.3, timeout=1.0))
+        # 固定0.05秒间隔时为20次
+        self.assertLessEqual(self.provider.batch_calls["retrieve"], 8)
+        self.assertIn(job_status(job), ("validating", "in_progress"))
+
+    def test_submit_errors(self):
+        """测试无法推断接口地址和缺少密钥"""
+        success, message = submit_job(self.queries, CONTEXT, self.model_manager,
+                                      provider_config=dict(self.config, url="http://x/api/generate"),
+                                      directory=self.temp_dir.name)
+        self.assertFalse(success)
+        self.assertIn("batch_url", message)
+        success, message = submit_job(self.queries, CONTEXT, key_manager({}),
+                                      provider_config=self.config, directory=self.temp_dir.name)
+        self.assertFalse(success)
+        self.assertIn("未找到API密钥", message)
+        self.assertEqual(list_jobs(self.temp_dir.name), [])
+
+    def test_collect_command(self):
+        """测试 batch-collect 输出结果文件并只写入一次历史记录"""
+        job = self.submit(self.queries[:3])
+        client = job_client(job, self.model_manager)
+        wait_for_job(job, client, self.temp_dir.name, interval=0.02)
+        output = os.path.join(self.temp_dir.name, "answers.jsonl")
+        args = Namespace(job=job["name"], output=output, wait=False)
+        with patch.object(batch_commands, "load_job", side_effect=lambda name: load_job(
+                name, self.temp_dir.name)), \
+                patch.object(batch_commands, "save_job", side_effect=lambda current: None), \
+                patch.object(batch_commands, "ModelManager", return_value=self.model_manager), \
+                patch.object(batch_commands, "append_to_history") as history, \
+                patch('builtins.print'):
+            batch_commands.handle_batch_collect_command(args)
+            self.assertEqual(history.call_count, 3)
+            with open(output, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual(sorted(record["index"] for record in records), [0, 1, 2])
+            self.assertEqual({record["command"] for record in records}, {"du -sh *"})
+
+            saved = load_job(job["name"], self.temp_dir.name)
+            saved["batches"][0]["collected"] = True
+            with patch.object(batch_commands, "load_job", return_value=saved):
+                batch_commands.handle_batch_collect_command(args)
+            self.assertEqual(history.call_count, 3)
+
+
+    def test_collect_after_download_failure(self):
+        """测试结果下载失败的批处理不标记为已收集，再次收集时写入历史记录"""
+        job = self.submit(self.queries[:3])
+        client = job_client(job, self.model_manager)
+        wait_for_job(job, client, self.temp_dir.name, interval=0.02)
+        args = Namespace(job=job["name"], output=None, wait=False)
+
+        def failing_lines(file_id, errors):
+            errors.append("API错误 (502): bad gateway")
+            return iter(())
+
+        with patch.object(batch_commands, "load_job", side_effect=lambda name: load_job(
+                name, self.temp_dir.name)), \
+                patch.object(batch_commands, "save_job", side_effect=lambda current: save_job(
+                    current, self.temp_dir.name)), \
+                patch.object(batch_commands, "ModelManager", return_value=self.model_manager), \
+                patch.object(batch_commands, "append_to_history") as history, \
+                patch('builtins.print'):
+            with patch("src.generators.batch_job.BatchClient.iter_lines", side_effect=failing_lines), \
+                    self.assertRaises(SystemExit):
+                batch_commands.handle_batch_collect_command(args)
+            self.assertEqual(history.call_count, 0)
+            self.assertFalse(load_job(job["name"], self.temp_dir.name)["batches"][0]["collected"])
+
+            batch_commands.handle_batch_collect_command(args)
+            self.assertEqual(history.call_count, 3)
+            self.assertTrue(load_job(job["name"], self.temp_dir.name)["batches"][0]["collected"])
+            batch_commands.handle_batch_collect_command(args)
+            self.assertEqual(history.call_count, 3)
+
+if __name__ == "__main__":
+    unittest.main()
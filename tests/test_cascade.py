@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+级联路由测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.prompts import COMMAND_REFUSAL_MESSAGE
+from src.cli.stats_commands import cascade_stats, estimate_savings, format_stats
+from src.generators.base_generator import generate_bash_command
+from src.generators.cascade import choose_start_tier, check_output, generate_with_cascade
+from src.generators.escalation import EscalationMemory
+from src.utils.output_checks import command_names, check_command
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+TIERS = [
+    ("lite", {"url": "https://api.example.com/v1/chat/completions", "model": "lite-model",
+              "token_limit": 32000, "key_file": "lite_key.txt"}),
+    ("strong", {"url": "https://api.example.com/v1/chat/completions", "model": "strong-model",
+                "token_limit": 128000, "key_file": "strong_key.txt"})
+]
+
+
+class TestOutputChecks(unittest.TestCase):
+    """本地检查测试类"""
+
+    def test_command_names(self):
+        """测试找出处于命令位置的程序名"""
+        self.assertEqual(command_names("ls -la | grep foo && echo $(date) > out.txt"),
+                         ["ls", "grep", "echo", "date"])
+        self.assertEqual(command_names("FOO=1 sudo -u www timeout 5 du -sh /var"),
+                         ["sudo", "timeout", "du"])
+        self.assertEqual(command_names('for f in *.txt; do wc -l "$f"; done'), ["wc"])
+        self.assertEqual(command_names("./configure && make"), ["make"])
+
+    def test_check_command(self):
+        """测试命令模式的各项检查"""
+        self.assertIsNone(check_command("find . -name '*.log' -mtime +30 -delete"))
+        self.assertIsNone(check_command("```bash\nls -la\n```"))
+        self.assertIsNone(check_command("tar czf backup.tgz \\\n  /etc"))
+        self.assertEqual(check_command("  "), "输出为空")
+        self.assertEqual(check_command("ls\nrm -rf build"), "命令模式返回了多行输出")
+        self.assertTrue(check_command("echo 'unterminated").startswith("语法错误"))
+        self.assertEqual(check_command("nonexistent_tool_xyz --all | sort"),
+                         "命令不存在: nonexistent_tool_xyz")
+
+    def test_check_output(self):
+        """测试拒绝消息通过检查，脚本只检查语法"""
+        self.assertIsNone(check_output(COMMAND_REFUSAL_MESSAGE))
+        script = "[SCRIPT_NAME: setup]\n```bash\napt-get install -y jq\njq . a.json\n```"
+        self.assertIsNone(check_output(script, is_script=True))
+        broken = "[SCRIPT_NAME: setup]\n```bash\nif true; then\n  echo hi\n```"
+        self.assertTrue(check_output(broken, is_script=True).startswith("语法错误"))
+
+    def test_choose_start_tier(self):
+        """测试按复杂度和之前的结果选择起始层级"""
+        self.assertEqual(choose_start_tier("列出当前目录的文件", 2), 0)
+        self.assertEqual(choose_start_tier("每隔5分钟检查磁盘使用率，如果超过90%就清理日志并发送报告", 2), 1)
+        self.assertEqual(choose_start_tier("列出当前目录的文件", 2, remembered=1), 1)
+        self.assertEqual(choose_start_tier("列出当前目录的文件", 2, remembered=5), 1)
+
+
+class TestCascade(unittest.TestCase):
+    """级联生成测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, "escalations.db")
+        patcher = patch('src.generators.cascade.open_escalation_memory',
+                        side_effect=lambda: EscalationMemory(path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model_manager = MagicMock()
+        self.model_manager.get_cascade.return_value = TIERS
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def fake_request(self, replies):
+        """按提供商返回预设回复的 request_generation"""
+        def request(provider_config, query, context, is_script, file_contents, usage,
+                    model_manager, session, conversation, provider_name=None):
+            usage.update(provider=provider_name, model=provider_config["model"],
+                         latency_ms=100 if provider_name == "lite" else 900,
+                         prompt_tokens=50, completion_tokens=10)
+            return replies[provider_name]
+        return request
+
+    @patch('builtins.print')
+    def test_escalates_on_failed_check(self, mock_print):
+        """测试输出未通过检查时改用下一层级，并记住通过的层级"""
+        replies = {"lite": (True, "ls\nrm -rf build"), "strong": (True, "rm -rf build")}
+        with patch('src.generators.cascade.request_generation',
+                   side_effect=self.fake_request(replies)) as mock_request:
+            usage = {}
+            result = generate_with_cascade("删除 build 目录", CONTEXT, usage=usage,
+                                           model_manager=self.model_manager)
+            self.assertEqual(result, (True, "rm -rf build"))
+            self.assertEqual(usage["tier"], 1)
+            self.assertEqual(usage["provider"], "strong")
+            self.assertEqual(usage["latency_ms"], 1000)
+            self.assertEqual(usage["prompt_tokens"], 100)
+            self.assertEqual([a["passed"] for a in usage["cascade"]], [False, True])
+            self.assertEqual(usage["cascade"][0]["reason"], "命令模式返回了多行输出")
+
+            # 相同的查询直接从通过检查的层级开始
+            generate_with_cascade("删除  build 目录", CONTEXT, model_manager=self.model_manager)
+            self.assertEqual(mock_request.call_count, 3)
+            self.assertEqual(mock_request.call_args[1]["provider_name"], "strong")
+
+    @patch('builtins.print')
+    def test_last_output_returned_when_all_fail(self, mock_print):
+        """测试所有层级都未通过检查时返回最后一个成功的输出"""
+        replies = {"lite": (True, "nonexistent_tool_xyz -a"), "strong": (False, "API错误 (500): boom")}
+        with patch('src.generators.cascade.request_generation', side_effect=self.fake_request(replies)):
+            usage = {}
+            result = generate_with_cascade("统计", CONTEXT, usage=usage, model_manager=self.model_manager)
+        self.assertEqual(result, (True, "nonexistent_tool_xyz -a"))
+        self.assertEqual(usage["tier"], 0)
+        self.assertIn("警告: 输出未通过检查（命令不存在: nonexistent_tool_xyz）",
+                      [call[0][0] for call in mock_print.call_args_list])
+
+    @patch('src.generators.cascade.generate_with_cascade', return_value=(True, "ls"))
+    def test_generate_bash_command_uses_cascade(self, mock_cascade):
+        """测试配置了级联路由时 generate_bash_command 使用级联生成"""
+        self.assertEqual(generate_bash_command("列出文件", CONTEXT, model_manager=self.model_manager),
+                         (True, "ls"))
+        mock_cascade.assert_called_once()
+
+
+class TestCascadeStats(unittest.TestCase):
+    """级联统计测试类"""
+
+    def test_stats(self):
+        """测试各层级通过率和节省耗时的统计"""
+        def entry(latency, tier, attempts, mode="command"):
+            return {"mode": mode, "latency_ms": latency, "tier": tier, "cascade": attempts}
+
+        lite_ok = {"tier": 0, "provider": "lite", "latency_ms": 100, "passed": True, "reason": None}
+        lite_bad = {"tier": 0, "provider": "lite", "latency_ms": 100, "passed": False,
+                    "reason": "命令不存在: jq"}
+        strong_ok = {"tier": 1, "provider": "strong", "latency_ms": 900, "passed": True, "reason": None}
+        entries = [entry(100, 0, [lite_ok])] * 3 + [
+            entry(1000, 1, [lite_bad, strong_ok]),
+            entry(900, 1, [strong_ok]),
+            {"mode": "command", "latency_ms": 500, "answer": "没有级联的记录"}
+        ]
+
+        stats = cascade_stats(entries)
+        group = stats["command"]
+        self.assertEqual(group["queries"], 5)
+        self.assertEqual(group["tiers"][0]["attempts"], 4)
+        self.assertEqual(group["tiers"][0]["passed"], 3)
+        self.assertEqual(group["tiers"][0]["reasons"]["命令不存在"], 1)
+        self.assertEqual(group["final"][1], 2)
+        # 全部使用 strong: 5 * 900，实际: 3 * 100 + 1000 + 900
+        self.assertEqual(estimate_savings(group), (2300, "strong"))
+        report = format_stats(stats)
+        self.assertIn("命令模式: 5 次查询", report)
+        self.assertIn("节省约 2.3 秒", report)
+        self.assertEqual(cascade_stats(entries, mode="script"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
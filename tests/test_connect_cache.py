@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+DNS缓存和TLS会话恢复测试用例
+"""
+
+import unittest
+import os
+import ssl
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.dns_cache import DNSCache
+from urllib3.connection import HTTPConnection
+
+from src.utils.http_client import (
+    CachedDNSHTTPConnection,
+    _consume_session_tickets,
+    _open_connection,
+    close_sessions,
+    get_session
+)
+
+# 只存在于缓存中的主机名，系统无法解析
+HOST = "provider.test"
+
+
+class ReplyHandler(BaseHTTPRequestHandler):
+    """返回固定回复，每次请求后关闭连接，并记录TLS会话是否被恢复"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if isinstance(self.connection, ssl.SSLSocket):
+            self.server.reused.append(self.connection.session_reused)
+        self.server.hosts.append(self.headers["Host"])
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(context=None):
+    """在 127.0.0.1 上启动服务器"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReplyHandler)
+    server.reused = []
+    server.hosts = []
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestDNSCache(unittest.TestCase):
+    """DNS缓存测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "dns.db")
+        real = socket.getaddrinfo
+        self.lookups = []
+
+        def getaddrinfo(host, *args, **kwargs):
+            self.lookups.append(host)
+            return real(host, *args, **kwargs)
+
+        patcher = patch("src.utils.dns_cache.socket.getaddrinfo", side_effect=getaddrinfo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_resolve_is_cached_across_instances(self):
+        """测试解析结果保存在磁盘上，之后的进程直接使用"""
+        cache = DNSCache(self.path)
+        addresses = cache.resolve("localhost", 443)
+        self.assertTrue(addresses)
+        self.assertEqual(cache.resolve("localhost", 443), addresses)
+        cache.close()
+
+        cache = DNSCache(self.path)
+        self.assertEqual(cache.resolve("localhost", 443), addresses)
+        self.assertEqual(self.lookups, ["localhost"])
+        cache.forget("localhost", 443)
+        cache.resolve("localhost", 443)
+        self.assertEqual(len(self.lookups), 2)
+        cache.close()
+
+    def test_ttl(self):
+        """测试超过存活时间的结果重新解析"""
+        cache = DNSCache(self.path, ttl=0)
+        cache.resolve("localhost", 443)
+        time.sleep(0.01)
+        cache.resolve("localhost", 443)
+        self.assertEqual(len(self.lookups), 2)
+        cache.close()
+
+    def test_ip_and_unknown_hosts(self):
+        """测试IP地址不解析，无法解析的主机名返回空列表且不缓存"""
+        cache = DNSCache(self.path)
+        self.assertEqual(cache.resolve("127.0.0.1", 80), ["127.0.0.1"])
+        self.assertEqual(self.lookups, [])
+        self.assertEqual(cache.resolve("nonexistent.invalid", 80), [])
+        self.assertIsNone(cache.cache.get("nonexistent.invalid:80"))
+        cache.close()
+
+
+class TestCachedConnections(unittest.TestCase):
+    """使用DNS缓存和TLS会话恢复的连接测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DNSCache(os.path.join(self.temp_dir.name, "dns.db"))
+        patcher = patch("src.utils.dns_cache._dns_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.servers = []
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        close_sessions()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_cached_address_is_used(self):
+        """测试连接使用缓存的地址，Host 头仍为主机名"""
+        server = start_server()
+        self.servers.append(server)
+        self.cache.cache.put(f"{HOST}:{server.server_port}", ["127.0.0.1"])
+        url = f"http://{HOST}:{server.server_port}/"
+        response = get_session(url).get(url, timeout=5)
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(server.hosts, [f"{HOST}:{server.server_port}"])
+
+    def test_stale_address_is_forgotten(self):
+        """测试缓存的地址无法连接时重新解析"""
+        server = start_server()
+        self.servers.append(server)
+        key = f"localhost:{server.server_port}"
+        self.cache.cache.put(key, ["127.0.0.3"])
+        url = f"http://localhost:{server.server_port}/"
+        self.assertEqual(get_session(url).get(url, timeout=5).text, "ok")
+        self.assertNotEqual(self.cache.cache.get(key), ["127.0.0.3"])
+
+    @unittest.skipUnless(shutil.which("openssl"), "需要 openssl 生成测试证书")
+    def test_tls_session_is_resumed(self):
+        """测试同一主机的新连接恢复之前的TLS会话"""
+        cert = os.path.join(self.temp_dir.name, "cert.pem")
+        key = os.path.join(self.temp_dir.name, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", f"/CN={HOST}", "-addext", f"subjectAltName=DNS:{HOST}",
+                        "-keyout", key, "-out", cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server = start_server(context)
+        self.servers.append(server)
+        self.cache.cache.put(f"{HOST}:{server.server_port}", ["127.0.0.1"])
+
+        url = f"https://{HOST}:{server.server_port}/"
+        for _ in range(3):
+            # 服务器每次请求后关闭连接，之后的请求需要建立新连接
+            self.assertEqual(get_session(url).get(url, verify=cert, timeout=5).text, "ok")
+        self.assertEqual(server.reused, [False, True, True])
+
+    def test_missing_urllib3_internals(self):
+        """测试 urllib3 的内部接口不存在时退化为不使用缓存、不预连接"""
+        url = f"http://{HOST}:80/"
+        with patch("src.utils.http_client.connection_pool", return_value=object()):
+            _open_connection(url, 1)
+            _consume_session_tickets(url)
+
+        conn = CachedDNSHTTPConnection(HOST, 80)
+        del conn._dns_host
+        with patch.object(HTTPConnection, "_new_conn", return_value="socket"), \
+                patch("src.utils.http_client.shared_dns_cache") as mock_cache:
+            self.assertEqual(conn._new_conn(), "socket")
+        mock_cache.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+后台进程和 shell 集成测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.daemon.client import request, EXIT_CANCELLED
+from src.daemon.server import (CopilotDaemon, DaemonServer, answer_cache_key, prepare_socket_dir,
+                               remove_stale_socket)
+from src.daemon.shell_init import render_shell_init, client_path
+from src.utils.result_cache import ResultCache
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+PROVIDER = {
+    "url": "https://api.siliconflow.cn/v1/chat/completions",
+    "model": "Pro/deepseek-ai/DeepSeek-V3",
+    "token_limit": 64000,
+    "key_file": "siliconflow_key.txt"
+}
+
+
+class TestDaemon(unittest.TestCase):
+    """后台进程测试类"""
+
+    def setUp(self):
+        """在临时套接字上启动后台进程"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, "daemon.sock")
+        model_manager = MagicMock()
+        model_manager.get_command_provider.return_value = PROVIDER
+        self.cache = ResultCache(os.path.join(self.temp_dir, "answers.db"), 1024 * 1024, 3600)
+        self.copilot = CopilotDaemon(self.cache, model_manager, CONTEXT)
+
+        # 模拟的提供商: 收到 "slow" 开头的查询时阻塞直到 release
+        self.release = threading.Event()
+        self.calls = []
+
+        def fake_generate(query, context, **kwargs):
+            self.calls.append((query, context["current_directory"]))
+            if query.startswith("slow"):
+                self.release.wait(5)
+            return True, f"echo {query}"
+
+        patchers = [patch('src.daemon.server.generate_bash_command', side_effect=fake_generate),
+                    patch('src.daemon.server.append_to_history')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.server = DaemonServer(self.socket_path, self.copilot)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05})
+        self.thread.start()
+
+    def tearDown(self):
+        """停止后台进程"""
+        self.release.set()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.copilot.close()
+        shutil.rmtree(self.temp_dir)
+
+    def generate(self, query, client="1", cwd="/srv"):
+        return request(self.socket_path, {"op": "generate", "client": client, "cwd": cwd, "query": query},
+                       timeout=5)
+
+    def test_generate_and_cache(self):
+        """测试生成结果被缓存，缓存命中的往返时间低于30毫秒"""
+        reply = self.generate("列出文件")
+        self.assertEqual(reply, {"ok": True, "result": "echo 列出文件", "cached": False})
+        self.assertEqual(self.calls, [("列出文件", "/srv")])
+
+        start = time.perf_counter()
+        reply = self.generate("列出文件")
+        elapsed = time.perf_counter() - start
+        self.assertTrue(reply["cached"])
+        self.assertLess(elapsed, 0.03)
+        self.assertEqual(len(self.calls), 1)
+
+        # 不同目录下的相同查询不共享缓存
+        self.assertFalse(self.generate("列出文件", cwd="/tmp")["cached"])
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_supersede(self):
+        """测试同一客户端的新请求取代尚未完成的旧请求"""
+        replies = {}
+        first = threading.Thread(target=lambda: replies.setdefault("first", self.generate("slow 1")))
+        first.start()
+        while not self.calls:
+            time.sleep(0.01)
+
+        self.assertEqual(self.generate("列出文件"), {"ok": True, "result": "echo 列出文件", "cached": False})
+        first.join(5)
+        self.assertEqual(replies["first"], {"ok": False, "cancelled": True})
+
+        # 被取代的请求完成后结果仍写入缓存
+        self.release.set()
+        key = answer_cache_key("slow 1", "/srv", PROVIDER)
+        deadline = time.time() + 5
+        while self.cache.get(key) is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.generate("slow 1")["cached"])
+
+    def test_cancel_and_disconnect(self):
+        """测试显式取消和客户端断开都会放弃等待"""
+        replies = {}
+        waiter = threading.Thread(target=lambda: replies.setdefault("reply", self.generate("slow 2", "7")))
+        waiter.start()
+        while not self.calls:
+            time.sleep(0.01)
+        self.assertTrue(request(self.socket_path, {"op": "cancel", "client": "7"})["found"])
+        waiter.join(5)
+        self.assertTrue(replies["reply"]["cancelled"])
+
+        # 客户端进程被中断（Ctrl-C）时关闭连接
+        process = subprocess.Popen([sys.executable, "-S", client_path(), self.socket_path,
+                                    "generate", "8", "/srv", "slow 3"])
+        while len(self.calls) < 2:
+            time.sleep(0.01)
+        process.terminate()
+        process.wait(5)
+        deadline = time.time() + 5
+        while self.copilot.stats["cancelled"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.copilot.stats["cancelled"], 2)
+
+    def test_priority_and_status(self):
+        """测试请求的优先级类别和 ping 中的排队统计"""
+        reply = request(self.socket_path, {"op": "generate", "client": "9", "cwd": "/srv",
+                                           "query": "列出文件", "priority": "batch"}, timeout=5)
+        self.assertEqual(reply, {"ok": True, "result": "echo 列出文件", "cached": False})
+        reply = request(self.socket_path, {"op": "generate", "client": "9", "cwd": "/srv",
+                                           "query": "查看磁盘", "priority": "urgent"}, timeout=5)
+        self.assertFalse(reply["ok"])
+        self.assertIn("未知的优先级", reply["error"])
+
+        status = request(self.socket_path, {"op": "ping"})
+        classes = status["scheduler"]["classes"]
+        self.assertEqual(classes["batch"]["dispatched"], 1)
+        self.assertIsNotNone(classes["batch"]["queue_wait_p50_ms"])
+        self.assertEqual(classes["interactive"]["dispatched"], 0)
+        self.assertIn("p50_ms", status["latency"])
+
+    def test_client_script(self):
+        """测试 shell 快捷键调用的客户端脚本"""
+        command = [sys.executable, "-S", client_path(), self.socket_path, "generate", "1", "/srv"]
+        result = subprocess.run(command + ["查看磁盘"], capture_output=True, text=True, timeout=10)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "echo 查看磁盘")
+
+        result = subprocess.run(command + [" "], capture_output=True, text=True, timeout=10)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("查询为空", result.stderr)
+        self.assertNotEqual(EXIT_CANCELLED, result.returncode)
+
+
+class TestSocketOwner(unittest.TestCase):
+    """套接字归属检查测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.socket_path = os.path.join(self.temp_dir, "run", "daemon.sock")
+
+    def test_socket_dir(self):
+        """测试套接字目录以0700创建，其他用户可写的目录被拒绝"""
+        prepare_socket_dir(self.socket_path)
+        self.assertEqual(os.stat(os.path.dirname(self.socket_path)).st_mode & 0o777, 0o700)
+        os.chmod(os.path.dirname(self.socket_path), 0o777)
+        with self.assertRaises(RuntimeError):
+            prepare_socket_dir(self.socket_path)
+        os.chmod(os.path.dirname(self.socket_path), 0o700)
+        with patch("os.getuid", return_value=os.getuid() + 1), self.assertRaises(RuntimeError):
+            prepare_socket_dir(self.socket_path)
+
+    def test_foreign_socket(self):
+        """测试其他用户的套接字不会被删除，客户端也不会连接"""
+        prepare_socket_dir(self.socket_path)
+        open(self.socket_path, "w").close()
+        with patch("os.getuid", return_value=os.getuid() + 1), self.assertRaises(RuntimeError):
+            remove_stale_socket(self.socket_path)
+        self.assertTrue(os.path.exists(self.socket_path))
+        with patch("posix.getuid", return_value=os.getuid() + 1), self.assertRaises(PermissionError):
+            request(self.socket_path, {"op": "ping"}, timeout=1.0)
+        # 属于当前用户但没有进程监听的套接字文件按遗留文件删除
+        remove_stale_socket(self.socket_path)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+class TestShellInit(unittest.TestCase):
+    """shell 集成脚本测试类"""
+
+    def test_render(self):
+        """测试生成的脚本语法正确并引用客户端和套接字"""
+        script = render_shell_init("bash", "/run/user/1000/bcopilot 1.sock")
+        self.assertIn("bind -x '\"\\C-g\": __bcopilot_widget'", script)
+        self.assertIn("'/run/user/1000/bcopilot 1.sock'", script)
+        self.assertIn(client_path(), script)
+        result = subprocess.run(["bash", "-n"], input=script, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        script = render_shell_init("zsh", "/tmp/b.sock", "^X^G")
+        self.assertIn("bindkey '^X^G' __bcopilot_widget", script)
+        self.assertIn("line-pre-redraw __bcopilot_check", script)
+        if shutil.which("zsh"):
+            result = subprocess.run(["zsh", "-n"], input=script, capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+        with self.assertRaises(ValueError):
+            render_shell_init("fish", "/tmp/b.sock")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+命令模式自动切换到脚本模式的测试用例
+"""
+
+import unittest
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.prompts import COMMAND_REFUSAL_MESSAGE
+from src.generators.base_generator import stream_request
+from src.generators.escalation import (
+    refusal_state,
+    is_refusal,
+    normalize_query,
+    EscalationMemory,
+    speculate
+)
+from src.generators.command_generator import handle_command_generation
+from src.utils.complexity import score_complexity, is_likely_complex
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+SCRIPT_TEXT = "[SCRIPT_NAME: disk_check]\n```bash\ndf -h\n```"
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """按模型名返回预设回复的流式接口，每段之间稍作停顿"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.requests.append(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for piece in server.replies[payload["model"]]:
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(server.delay)
+            usage = {"choices": [], "usage": {"prompt_tokens": 50, "completion_tokens": 9}}
+            self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode())
+            self.wfile.flush()
+            server.completed.append(payload["model"])
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnected.append(payload["model"])
+
+
+class TestRefusalDetection(unittest.TestCase):
+    """拒绝消息检测测试类"""
+
+    def test_partial_text(self):
+        """测试流式回复的开头即可判断是否为拒绝消息"""
+        self.assertIsNone(refusal_state(""))
+        self.assertIsNone(refusal_state("这个"))
+        self.assertTrue(refusal_state("这个任务无法"))
+        self.assertTrue(refusal_state("“" + COMMAND_REFUSAL_MESSAGE))
+        self.assertFalse(refusal_state("find"))
+        self.assertFalse(refusal_state("这个目录"))
+
+    def test_full_text(self):
+        """测试完整回复，包括改写过措辞的拒绝消息"""
+        self.assertTrue(is_refusal(COMMAND_REFUSAL_MESSAGE))
+        self.assertTrue(is_refusal("该任务无法用一行命令完成，请使用 -script 参数"))
+        self.assertFalse(is_refusal("find . -name '*.log' -mtime +30 -delete"))
+
+    def test_normalize_query(self):
+        """测试查询规范化"""
+        self.assertEqual(normalize_query("  Backup   MySQL 数据库。"), "backup mysql 数据库")
+
+    def test_complexity(self):
+        """测试本地复杂度估计"""
+        self.assertFalse(is_likely_complex("查找大于100MB的文件"))
+        self.assertFalse(is_likely_complex("列出所有正在运行的docker容器"))
+        query = "每隔5分钟检查磁盘使用率，如果超过90%就清理日志，然后发送邮件通知"
+        self.assertTrue(is_likely_complex(query))
+        self.assertGreater(score_complexity(query), score_complexity("查找大于100MB的文件"))
+
+
+class TestSpeculation(unittest.TestCase):
+    """推测执行测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.completed = []
+        self.server.disconnected = []
+        self.server.delay = 0.02
+        self.server.replies = {"script-model": [SCRIPT_TEXT[i:i + 4] for i in range(0, len(SCRIPT_TEXT), 4)] * 20}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        self.model_manager = MagicMock()
+        self.model_manager.get_command_provider.return_value = {
+            "url": url, "model": "command-model", "key_file": "key.txt"}
+        self.model_manager.get_script_provider.return_value = {
+            "url": url, "model": "script-model", "key_file": "key.txt"}
+        self.model_manager.get_api_key.return_value = "key"
+        self.model_manager.config = {}
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stream_request(self):
+        """测试流式回复的拼接、用量提取和提前结束"""
+        self.server.replies["command-model"] = ["df ", "-h", " /"]
+        provider = self.model_manager.get_command_provider()
+        usage = {}
+        result = stream_request(provider, {}, {"model": "command-model"}, 5, usage)
+        self.assertEqual(result, (True, "df -h /"))
+        self.assertEqual(usage["completion_tokens"], 9)
+        self.assertTrue(self.server.requests[0]["stream"])
+
+        result = stream_request(provider, {}, {"model": "command-model"}, 5,
+                                on_text=lambda text: text.startswith("df"))
+        self.assertEqual(result, (True, "df"))
+
+    def test_refusal_uses_speculative_script(self):
+        """测试命令被拒绝时使用已经开始的脚本请求，且拒绝消息只接收开头"""
+        self.server.replies["command-model"] = ["这个", "任务无法", "用单行", "命令完成，", "请使用", " -script"]
+        self.server.delay = 0.05
+        self.server.replies["script-model"] = [SCRIPT_TEXT]
+        start = time.monotonic()
+        command, script = speculate("监控磁盘", CONTEXT, model_manager=self.model_manager)
+        self.assertTrue(is_refusal(command.result[1]))
+        self.assertNotIn("-script", command.result[1])
+        self.assertIsNotNone(script)
+        self.assertEqual(script.wait(), (True, SCRIPT_TEXT))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_command_cancels_script(self):
+        """测试命令不是拒绝消息时取消脚本请求并关闭其连接"""
+        self.server.replies["command-model"] = ["df", " -h"]
+        command, script = speculate("监控磁盘", CONTEXT, model_manager=self.model_manager)
+        self.assertEqual(command.result, (True, "df -h"))
+        self.assertIsNone(script)
+        deadline = time.monotonic() + 5
+        while "script-model" not in self.server.disconnected and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertIn("script-model", self.server.disconnected)
+        self.assertNotIn("script-model", self.server.completed)
+
+    @patch('builtins.print')
+    def test_command_uses_cascade(self, mock_print):
+        """测试推测执行的命令请求同样按级联路由选择层级并检查输出"""
+        self.server.replies["lite-model"] = ["ls", "\nrm -rf build"]
+        self.server.replies["command-model"] = ["rm -rf build"]
+        url = self.model_manager.get_command_provider()["url"]
+        tiers = [("lite", {"url": url, "model": "lite-model", "key_file": "key.txt"}),
+                 ("strong", {"url": url, "model": "command-model", "key_file": "key.txt"})]
+        self.model_manager.get_cascade.side_effect = lambda mode: tiers if mode == "command" else []
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('src.generators.cascade.open_escalation_memory',
+                      side_effect=lambda: EscalationMemory(os.path.join(directory, "escalations.db"))):
+            command, script = speculate("删除 build 目录", CONTEXT, model_manager=self.model_manager)
+        self.assertEqual(command.result, (True, "rm -rf build"))
+        self.assertIsNone(script)
+        self.assertEqual(command.usage["tier"], 1)
+        self.assertEqual(command.usage["provider"], "strong")
+        self.assertEqual([a["passed"] for a in command.usage["cascade"]], [False, True])
+
+
+class TestCommandEscalation(unittest.TestCase):
+    """命令生成自动切换测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.memory_path = os.path.join(self.temp_dir.name, "escalations.db")
+        patcher = patch('src.generators.command_generator.open_escalation_memory',
+                        side_effect=lambda: EscalationMemory(self.memory_path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    @patch('builtins.print')
+    @patch('src.generators.command_generator.append_to_history')
+    @patch('src.generators.command_generator.handle_script_generation')
+    @patch('src.generators.command_generator.generate_bash_command')
+    def test_refusal_escalates_and_is_remembered(self, mock_generate, mock_script, mock_history, mock_print):
+        """测试拒绝消息触发脚本生成，之后相同的查询直接生成脚本"""
+        mock_generate.return_value = (True, COMMAND_REFUSAL_MESSAGE)
+        handle_command_generation("统计 nginx 日志", CONTEXT)
+        mock_script.assert_called_once()
+        mock_history.assert_not_called()
+
+        handle_command_generation("统计  Nginx 日志。", CONTEXT)
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(mock_script.call_count, 2)
+
+    @patch('builtins.print')
+    @patch('src.generators.command_generator.append_to_history')
+    @patch('src.generators.command_generator.speculate')
+    @patch('src.generators.command_generator.generate_bash_command')
+    def test_simple_answer_disables_speculation(self, mock_generate, mock_speculate, mock_history, mock_print):
+        """测试复杂查询的命令成功后，相同的查询不再推测执行脚本"""
+        query = "每隔5分钟检查磁盘使用率，如果超过90%就清理日志"
+        command = MagicMock(result=(True, "df -h"), usage={})
+        mock_speculate.return_value = (command, None)
+        mock_generate.return_value = (True, "df -h")
+
+        handle_command_generation(query, CONTEXT)
+        handle_command_generation(query, CONTEXT)
+        self.assertEqual(mock_speculate.call_count, 1)
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(mock_history.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+预处理文件缓存测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.file_cache import FileCache
+from src.utils import file_utils
+
+
+class TestFileCache(unittest.TestCase):
+    """预处理文件缓存测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = FileCache(os.path.join(self.temp_dir.name, "cache.db"), max_bytes=10 ** 6)
+        self.file_path = os.path.join(self.temp_dir.name, "app.log")
+        with open(self.file_path, "w") as f:
+            f.write("ERROR disk full\n" * 50)
+            f.write("".join(f"INFO request {i} handled\n" for i in range(300)))
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """测试保存和读取预处理结果"""
+        self.assertIsNone(self.cache.get(self.file_path, "tokens"))
+        self.cache.put(self.file_path, "tokens", 123)
+        self.assertEqual(self.cache.get(self.file_path, "tokens"), 123)
+
+    def test_content_hash_fallback(self):
+        """测试元数据变化但内容不变时仍能命中缓存"""
+        self.cache.put(self.file_path, "summary", "摘要")
+        st = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.cache.get(self.file_path, "summary"), "摘要")
+
+    def test_content_change_invalidates(self):
+        """测试内容变化后缓存失效"""
+        self.cache.put(self.file_path, "tokens", 123)
+        with open(self.file_path, "a") as f:
+            f.write("INFO appended\n")
+        self.assertIsNone(self.cache.get(self.file_path, "tokens"))
+
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = FileCache(os.path.join(self.temp_dir.name, "small.db"), max_bytes=2500)
+        try:
+            cache.put(self.file_path, "a", "x" * 1000)
+            cache.put(self.file_path, "b", "y" * 1000)
+            cache.get(self.file_path, "a")
+            cache.put(self.file_path, "c", "z" * 1000)
+
+            self.assertIsNotNone(cache.get(self.file_path, "a"))
+            self.assertIsNone(cache.get(self.file_path, "b"))
+            self.assertIsNotNone(cache.get(self.file_path, "c"))
+            self.assertLessEqual(cache.total_size(), 2500)
+        finally:
+            cache.close()
+
+    def test_read_file_contents_uses_cache(self):
+        """测试重复读取时复用缓存的token数和压缩表示"""
+        with patch.object(file_utils, "MODEL_TOKEN_LIMITS",
+                          {file_utils.COMMAND_MODEL: 3800}):
+            first = file_utils.read_file_contents([self.file_path], False, cache=self.cache)
+            with patch.object(file_utils, "read_text", side_effect=AssertionError("不应读取文件")):
+                second = file_utils.read_file_contents([self.file_path], False, cache=self.cache)
+
+        self.assertEqual(first, second)
+        self.assertIn("[上一行重复 49 次]", first[0][1])
+        self.assertIn("内容已截断", first[0][1])
+
+    def test_fit_to_budget_truncates(self):
+        """测试超出预算时保留开头和结尾"""
+        content = "\n".join(f"line {i} " + "x" * 40 for i in range(2000))
+        fitted = file_utils.fit_to_budget("big.txt", content, 1000)
+
+        self.assertIn("内容已截断", fitted)
+        self.assertIn("line 0 ", fitted)
+        self.assertIn("line 1999 ", fitted)
+        self.assertLessEqual(file_utils.estimate_tokens(fitted), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+团队共享缓存网关的测试用例
+"""
+
+import unittest
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from benchmarks.mock_provider import MockProvider
+from src.cli.gateway_commands import parse_upstreams
+from src.gateway.server import Gateway, GatewayServer, UpstreamReply, error_body
+from src.generators.base_generator import send_request, stream_request
+from src.utils.http_client import close_sessions
+from src.utils.result_cache import ResultCache
+
+HEADERS = {"Authorization": "Bearer test-key", "Content-Type": "application/json"}
+
+PAYLOAD = {"model": "mock-model", "messages": [{"role": "user", "content": "列出文件"}]}
+
+
+class TestGateway(unittest.TestCase):
+    """缓存网关测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.provider = MockProvider(ttfb=0.3, reply="du -sh *").start()
+        self.gateway = Gateway({"mock": {"url": self.provider.url, "key_file": None}},
+                               cache=ResultCache(os.path.join(self.temp_dir.name, "gateway.db"),
+                                                 1024 * 1024))
+        self.server = GatewayServer(("127.0.0.1", 0), self.gateway)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self.config = {"url": f"{self.base}/mock/v1/chat/completions", "model": "mock-model",
+                       "token_limit": 32000, "key_file": "mock_key.txt"}
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.gateway.close()
+        self.provider.stop()
+        close_sessions()
+        self.temp_dir.cleanup()
+
+    def post(self, payload=None, headers=None, path="/mock/v1/chat/completions"):
+        return requests.post(self.base + path, json=payload or PAYLOAD,
+                             headers=HEADERS if headers is None else headers, timeout=10)
+
+    def test_coalesce_identical_requests(self):
+        """测试同时到达的相同请求只向上游发送一次"""
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(lambda _: self.post(), range(20)))
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual({response.json()["choices"][0]["message"]["content"]
+                          for response in responses}, {"du -sh *"})
+        self.assertEqual(self.provider.requests, 1)
+        sources = [response.headers["X-Bcopilot-Cache"] for response in responses]
+        self.assertEqual(sources.count("miss"), 1)
+
+        metrics = requests.get(self.base + "/metrics", timeout=5).json()
+        self.assertEqual(metrics["requests"], 20)
+        self.assertEqual(metrics["upstream_calls"], 1)
+        self.assertEqual(metrics["cache_hits"] + metrics["coalesced"], 19)
+        self.assertEqual(metrics["hit_rate"], 0.95)
+        self.assertIsNotNone(metrics["latency_p99_ms"])
+
+    def test_failed_reply_not_shared(self):
+        """测试合并的请求只共享成功的回复，领头请求失败时其余请求用自己的密钥重新发送"""
+        original = self.gateway.call_upstream
+        calls = []
+
+        def call_upstream(route, payload, authorization):
+            calls.append(authorization)
+            time.sleep(0.3)
+            if authorization == "Bearer bad-key":
+                return UpstreamReply(401, error_body("无效的API密钥", 401))
+            return original(route, payload, authorization)
+
+        body = json.dumps(PAYLOAD).encode("utf-8")
+        with patch.object(self.gateway, "call_upstream", side_effect=call_upstream):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                bad = pool.submit(self.gateway.handle_completion, "mock", body,
+                                  {"Authorization": "Bearer bad-key"})
+                time.sleep(0.1)
+                good = pool.submit(self.gateway.handle_completion, "mock", body, HEADERS)
+                (bad_reply, _), (good_reply, source) = bad.result(), good.result()
+        self.assertEqual(bad_reply.status, 401)
+        self.assertEqual(good_reply.status, 200)
+        self.assertEqual(source, "miss")
+        self.assertEqual(calls, ["Bearer bad-key", HEADERS["Authorization"]])
+
+    def test_cache_and_stream(self):
+        """测试缓存命中、流式客户端和跳过缓存"""
+        self.assertEqual(self.post().headers["X-Bcopilot-Cache"], "miss")
+        self.assertEqual(self.post().headers["X-Bcopilot-Cache"], "hit")
+        self.assertEqual(send_request(self.config, HEADERS, PAYLOAD, 5, report_cache=False),
+                         (True, "du -sh *"))
+
+        pieces = []
+        usage = {}
+        stream_payload = dict(PAYLOAD, stream=True, stream_options={"include_usage": True})
+        result = stream_request(self.config, HEADERS, stream_payload, 5, usage,
+                                on_text=lambda text: pieces.append(text) and False)
+        self.assertEqual(result, (True, "du -sh *"))
+        self.assertEqual("".join(pieces), "du -sh *")
+        self.assertGreater(usage["completion_tokens"], 0)
+        self.assertEqual(self.provider.requests, 1)
+
+        response = self.post(headers=dict(HEADERS, **{"Cache-Control": "no-cache"}))
+        self.assertEqual(response.headers["X-Bcopilot-Cache"], "miss")
+        self.assertEqual(self.provider.requests, 2)
+
+        other = self.post(dict(PAYLOAD, messages=[{"role": "user", "content": "磁盘用量"}]))
+        self.assertEqual(other.headers["X-Bcopilot-Cache"], "miss")
+
+    def test_errors_not_cached(self):
+        """测试上游错误原样返回且不缓存"""
+        self.provider.error_rate = 1.0
+        self.assertEqual(self.post().status_code, 500)
+        self.assertEqual(self.post().status_code, 500)
+        self.assertEqual(self.provider.statuses[500], 2)
+        self.provider.error_rate = 0.0
+        self.assertEqual(self.post().status_code, 200)
+
+        self.provider.rate_limit_rate = 1.0
+        response = self.post(PAYLOAD | {"temperature": 0.5})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+    def test_bad_requests(self):
+        """测试缺少密钥、未知提供商和无效请求体"""
+        self.assertEqual(self.post(headers={}).status_code, 401)
+        self.assertEqual(self.post(path="/other/v1/chat/completions").status_code, 404)
+        self.assertEqual(self.post(path="/mock/v1/embeddings").status_code, 404)
+        response = requests.post(self.base + "/mock/chat/completions", data=b"[1, 2]",
+                                 headers=HEADERS, timeout=5)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.provider.requests, 0)
+        health = requests.get(self.base + "/health", timeout=5).json()
+        self.assertEqual(health["upstreams"], ["mock"])
+
+    def test_priority_scheduling(self):
+        """测试优先级请求头和各类别的排队统计"""
+        response = self.post(headers=dict(HEADERS, **{"X-Bcopilot-Priority": "bulk"}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.provider.requests, 0)
+        response = self.post(headers=dict(HEADERS, **{"X-Bcopilot-Priority": "batch",
+                                                      "X-Bcopilot-Client": "nightly"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post(PAYLOAD | {"temperature": 0.5}).status_code, 200)
+
+        metrics = requests.get(self.base + "/metrics", timeout=5).json()
+        classes = metrics["scheduler"]["mock"]["classes"]
+        self.assertEqual(classes["batch"]["dispatched"], 1)
+        self.assertEqual(classes["interactive"]["dispatched"], 1)
+        self.assertIsNotNone(classes["batch"]["queue_wait_p50_ms"])
+        self.assertIsNone(classes["script"]["queue_wait_p50_ms"])
+        self.assertIsNotNone(metrics["upstream_latency_p50_ms"])
+        self.assertEqual(metrics["rejected"], 0)
+
+    def test_parse_upstreams(self):
+        """测试 -upstream 参数解析"""
+        self.assertEqual(parse_upstreams(["local=http://127.0.0.1:8000/v1/chat/completions"]),
+                         {"local": {"url": "http://127.0.0.1:8000/v1/chat/completions",
+                                    "key_file": None}})
+        self.assertEqual(parse_upstreams(None), {})
+        for entry in ("local", "=http://x", "local=ftp://x", "a/b=http://x"):
+            with self.assertRaises(ValueError):
+                parse_upstreams([entry])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+历史记录存储测试用例
+"""
+
+import unittest
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.log.history_store import HistoryStore, make_entry, load_sparse_index
+from src.log.history import append_to_history, HistoryWriter
+
+
+LEGACY_HISTORY = """
+=== 2024-03-01 10:00:00 [command] ===
+查询: 查找大于100MB的文件
+结果: find . -type f -size +100M
+============================================================
+
+=== 2024-03-02 11:30:00 [script] ===
+查询: 备份主目录
+相关文件: a.txt, b.json
+结果: [SCRIPT_NAME: backup_home]
+tar czf backup.tar.gz ~
+脚本位置: /tmp/backup_home.sh
+============================================================
+"""
+
+
+class TestHistoryStore(unittest.TestCase):
+    """历史记录存储测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(self.temp_dir.name, auto_compact=False)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_append_and_search(self):
+        """测试追加记录后的全文检索和字段过滤"""
+        self.store.append(make_entry("查找nginx错误日志", "grep error /var/log/nginx/error.log",
+                                     model="qwen", provider="siliconflow", latency_ms=120))
+        self.store.append(make_entry("备份数据库", "pg_dump db > db.sql", "script", model="claude"))
+
+        results = self.store.search("nginx")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["provider"], "siliconflow")
+        self.assertEqual(results[0]["latency_ms"], 120)
+
+        self.assertEqual(len(self.store.search("错误日志")), 1)
+        self.assertEqual(len(self.store.search(mode="script")), 1)
+        self.assertEqual(len(self.store.search(model="qwen")), 1)
+        self.assertEqual(len(self.store.search("nginx", mode="script")), 0)
+        self.assertEqual(self.store.get(results[0]["id"])["query"], "查找nginx错误日志")
+
+    def test_incremental_sync(self):
+        """测试索引只追赶新追加的记录，并忽略未写完的行"""
+        self.store.append(make_entry("第一条", "echo 1"))
+        self.assertEqual(self.store.sync(), 1)
+        self.assertEqual(self.store.sync(), 0)
+
+        with open(self.store.active_segment(), "ab") as f:
+            f.write(b'{"query": "incomplete"')
+        self.assertEqual(self.store.sync(), 0)
+        with open(self.store.active_segment(), "ab") as f:
+            f.write(b', "answer": "ls", "timestamp": 1.0, "mode": "command"}\n')
+        self.assertEqual(self.store.sync(), 1)
+        self.assertEqual(self.store.count(), 2)
+
+    def test_time_range_and_order(self):
+        """测试时间范围过滤和按时间倒序排列"""
+        for i in range(5):
+            entry = make_entry(f"query {i}", "ls")
+            entry["timestamp"] = 1000.0 + i
+            self.store.append(entry)
+
+        results = self.store.search(since=1001.0, until=1004.0)
+        self.assertEqual([entry["query"] for entry in results], ["query 3", "query 2", "query 1"])
+        self.assertEqual(len(self.store.search(limit=2)), 2)
+
+    def test_import_legacy(self):
+        """测试导入旧版文本格式，同一文件只导入一次"""
+        legacy = os.path.join(self.temp_dir.name, "bcopilot_history.log")
+        with open(legacy, "w") as f:
+            f.write(LEGACY_HISTORY)
+
+        self.assertEqual(self.store.import_legacy(legacy), 2)
+        self.assertIsNone(self.store.import_legacy(legacy))
+
+        script = self.store.search(mode="script")[0]
+        self.assertEqual(script["files"], ["a.txt", "b.json"])
+        self.assertEqual(script["script_path"], "/tmp/backup_home.sh")
+        self.assertIn("tar czf backup.tar.gz ~", script["answer"])
+        self.assertEqual(len(self.store.search(filename="b.json")), 1)
+        self.assertEqual(self.store.search("100MB")[0]["answer"], "find . -type f -size +100M")
+
+    def test_concurrent_import_legacy(self):
+        """测试多个进程同时导入同一文件时只导入一次"""
+        legacy = os.path.join(self.temp_dir.name, "bcopilot_history.log")
+        with open(legacy, "w") as f:
+            f.write(LEGACY_HISTORY * 20)
+        barrier = threading.Barrier(4)
+
+        def run(_):
+            # 每个线程使用自己的连接，相当于一个独立的进程
+            store = HistoryStore(self.temp_dir.name, auto_compact=False)
+            try:
+                barrier.wait()
+                return store.import_legacy(legacy)
+            finally:
+                store.close()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            counts = list(pool.map(run, range(4)))
+        self.assertEqual(sorted(counts, key=str), [40, None, None, None])
+        self.store.sync()
+        self.assertEqual(self.store.count(), 40)
+
+    def test_import_legacy_rolls_segments(self):
+        """测试导入大量旧版记录时按大小切换分段"""
+        legacy = os.path.join(self.temp_dir.name, "bcopilot_history.log")
+        with open(legacy, "w") as f:
+            f.write(LEGACY_HISTORY * 50)
+        store = HistoryStore(os.path.join(self.temp_dir.name, "small"), segment_max_bytes=2048,
+                             auto_compact=False)
+        self.addCleanup(store.close)
+
+        self.assertEqual(store.import_legacy(legacy), 100)
+        segments = store.segments()
+        self.assertGreater(len(segments), 5)
+        for name in segments[:-1]:
+            size = os.path.getsize(os.path.join(store.directory, name))
+            self.assertLess(size, 2048 + 1024)
+        self.assertEqual(len(store.search(mode="script", limit=1000)), 50)
+
+    def test_append_to_history(self):
+        """测试 append_to_history 写入结构化字段"""
+        usage = {"provider": "openrouter", "model": "anthropic/claude", "latency_ms": 900,
+                 "prompt_tokens": 1200, "completion_tokens": 300, "cached_tokens": 1000}
+        writer = HistoryWriter(self.store)
+        with patch("src.log.history._writer", writer):
+            append_to_history("生成脚本", "echo hi", "script", "/tmp/x.sh", ["x.txt"], usage)
+        writer.flush()
+
+        with open(self.store.active_segment()) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry["mode"], "script")
+        self.assertEqual(entry["script_path"], "/tmp/x.sh")
+        self.assertEqual(entry["files"], ["x.txt"])
+        self.assertEqual(entry["cached_tokens"], 1000)
+        self.assertEqual(entry["model"], "anthropic/claude")
+
+
+    def test_writer_survives_errors(self):
+        """测试写入异常不会终止写入线程，历史记录目录不可用时不影响调用者"""
+        store = MagicMock()
+        store.append.side_effect = [ValueError("bad entry"), None]
+        writer = HistoryWriter(store)
+        with patch("builtins.print") as mock_print, patch("src.log.history.atexit.register"):
+            writer.submit(make_entry("a", "b"))
+            writer.submit(make_entry("c", "d"))
+            deadline = time.time() + 5
+            while writer.queue.unfinished_tasks and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(store.append.call_count, 2)
+        self.assertIn("bad entry", mock_print.call_args[0][0])
+        self.assertTrue(writer.thread.is_alive())
+
+        writer = HistoryWriter()
+        with patch("src.log.history.HistoryStore", side_effect=PermissionError("denied")), \
+                patch("builtins.print") as mock_print:
+            writer.submit(make_entry("a", "b"))
+            writer.flush()
+        self.assertIsNone(writer.thread)
+        self.assertIn("denied", mock_print.call_args[0][0])
+
+def _write_records(directory, worker, count, segment_max_bytes):
+    """并发写入测试的子进程：写入大小不一的记录"""
+    store = HistoryStore(directory, segment_max_bytes=segment_max_bytes, auto_compact=False)
+    for i in range(count):
+        # 每第5条记录超过 SINGLE_WRITE_BYTES，在排他锁下写入
+        padding = "y" * (8192 if i % 5 == 0 else 10 * (worker % 7))
+        store.append(make_entry(f"worker {worker} record {i}", padding,
+                                latency_ms=worker * 1000 + i))
+
+def _write_records_split(directory, worker, count, segment_max_bytes):
+    """并发写入测试的子进程：每次 write 最多写入1KB，大记录必然被拆分为多次 write"""
+    real_write = os.write
+
+    def split_write(fd, data):
+        written = real_write(fd, bytes(data[:1024]))
+        time.sleep(0.0005)
+        return written
+
+    with patch("os.write", split_write):
+        _write_records(directory, worker, count, segment_max_bytes)
+
+
+class TestHistoryConcurrency(unittest.TestCase):
+    """历史记录并发写入测试类"""
+
+    WORKERS = 200
+    RECORDS = 20
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def _run_writers(self, segment_max_bytes, target=_write_records):
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=target,
+                                     args=(self.temp_dir.name, worker, self.RECORDS, segment_max_bytes))
+                     for worker in range(self.WORKERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+    def _check_records(self):
+        store = HistoryStore(self.temp_dir.name, auto_compact=False)
+        seen = set()
+        for name in store.segments():
+            with open(os.path.join(self.temp_dir.name, name), "rb") as f:
+                for line in f:
+                    # 每一行都必须是完整的记录
+                    entry = json.loads(line)
+                    worker, record = divmod(entry["latency_ms"], 1000)
+                    self.assertEqual(entry["query"], f"worker {worker} record {record}")
+                    expected = 8192 if record % 5 == 0 else 10 * (worker % 7)
+                    self.assertEqual(len(entry["answer"]), expected)
+                    seen.add(entry["latency_ms"])
+        self.assertEqual(len(seen), self.WORKERS * self.RECORDS)
+        self.assertEqual(store.count(), self.WORKERS * self.RECORDS)
+        store.close()
+
+    def test_concurrent_appends(self):
+        """测试数百个进程同时追加时记录不交错、不丢失"""
+        self._run_writers(segment_max_bytes=1024 * 1024 * 1024)
+        self._check_records()
+
+    def test_concurrent_appends_with_rotation(self):
+        """测试并发追加过程中切换分段时记录仍然完整"""
+        self._run_writers(segment_max_bytes=256 * 1024)
+        self._check_records()
+
+    def test_split_writes_do_not_interleave(self):
+        """测试大记录拆分为多次 write 时，其他进程的小记录不会插入其中"""
+        self._run_writers(segment_max_bytes=1024 * 1024 * 1024, target=_write_records_split)
+        self._check_records()
+
+
+class TestHistorySegments(unittest.TestCase):
+    """历史记录分段、压缩和保留策略测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(self.temp_dir.name, segment_max_bytes=4096,
+                                  max_bytes=10 * 1024 * 1024, auto_compact=False)
+        self.base = float(int(time.time()) - 86400)
+        patcher = patch("src.log.history_store.SEAL_GRACE_SECONDS", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def _append(self, count, start=None):
+        start = start if start is not None else self.base
+        for i in range(count):
+            entry = make_entry(f"query {i} " + "x" * 100, f"echo {i}")
+            entry["timestamp"] = start + i
+            self.store.append(entry)
+
+    def test_rotate_and_compress(self):
+        """测试按大小切换分段，并压缩已封存的分段"""
+        self._append(200)
+        self.assertGreater(len(self.store.segments()), 1)
+
+        stats = self.store.compact()
+        self.assertGreater(stats["compressed"], 0)
+        segments = self.store.segments()
+        self.assertTrue(all(name.endswith(".gz") for name in segments[:-1]))
+        self.assertFalse(segments[-1].endswith(".gz"))
+
+        # 索引在压缩后仍然完整，继续写入不受影响
+        self._append(1, start=self.base + 5000)
+        self.assertEqual(self.store.count(), 201)
+        self.assertEqual(len(self.store.search("query 150")), 1)
+
+    def test_read_log_time_range(self):
+        """测试按时间范围读取日志时只解压相关的块"""
+        self._append(200)
+        self.store.compact()
+        sparse_index = load_sparse_index(os.path.join(self.temp_dir.name, self.store.segments()[0]))
+        self.assertIsNotNone(sparse_index["max_ts"])
+
+        entries = list(self.store.read_log(since=self.base + 50, until=self.base + 60))
+        self.assertEqual([entry["timestamp"] for entry in entries], [self.base + 50 + i for i in range(10)])
+
+    def test_rebuild_index_from_compressed(self):
+        """测试删除检索索引后可以从压缩分段重建"""
+        self._append(200)
+        self.store.compact()
+        self.store.close()
+        os.remove(self.store.index_path)
+
+        store = HistoryStore(self.temp_dir.name, auto_compact=False)
+        self.assertEqual(store.count(), 200)
+        store.close()
+
+    def test_retention(self):
+        """测试按时间和总大小删除已封存的分段"""
+        old = self.base - 30 * 86400
+        self._append(100, start=old)
+        self._append(100)
+        self.store.settings["retention_days"] = 7
+        stats = self.store.compact()
+        self.assertGreater(stats["removed"], 0)
+        # 保留策略以分段为单位，只有同时包含新旧记录的分段会留下旧记录
+        self.assertLess(len(list(self.store.read_log(until=self.base))), 40)
+        self.assertEqual(len(self.store.search("query", until=old + 50)), 0)
+
+        self.store.settings["max_bytes"] = 0
+        self.store.compact()
+        self.assertEqual(len(self.store.segments()), 1)
+
+    def test_time_based_roll(self):
+        """测试当前分段超过最长写入时间后切换"""
+        self._append(1)
+        self.store.settings["segment_max_age"] = 60
+        self.assertEqual(self.store.compact()["rolled"], 1)
+        self.assertEqual(len(self.store.segments()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+API密钥池的测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_provider import MockProvider
+from src.config.model_manager import ModelManager
+from src.generators.base_generator import call_with_keys, request_generation
+from src.utils.http_client import close_sessions
+from src.utils.key_pool import KeyPool, get_key_pool, missing_key_message, provider_keys
+from src.utils.rate_limiter import get_rate_limiter
+
+CONTEXT = {"current_directory": "/tmp", "username": "user", "hostname": "host",
+           "ubuntu_version": "22.04"}
+
+
+def key_manager(keys):
+    """按密钥文件名返回密钥的模型配置管理器"""
+    model_manager = MagicMock()
+    model_manager.get_api_key.side_effect = keys.get
+    model_manager.config = {}
+    return model_manager
+
+
+class TestKeyPool(unittest.TestCase):
+    """密钥池测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        # 暂停状态按密钥在进程内共享，每个测试使用独立的状态
+        patcher = patch("src.utils.key_pool._cooldowns", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_outstanding_tokens(self):
+        """测试选择在途token数最少的密钥"""
+        pool = KeyPool([("a", "key-a"), ("b", "key-b"), ("c", "key-c")])
+        big = pool.acquire(5000)
+        small = pool.acquire(100)
+        third = pool.acquire(200)
+        self.assertEqual(len({big.label, small.label, third.label}), 3)
+        # c 的在途token最少
+        self.assertEqual(pool.acquire(10).label, small.label)
+        big.release({"status": 200, "prompt_tokens": 40, "completion_tokens": 2})
+        self.assertEqual(pool.acquire(10).label, big.label)
+
+        usage = {row["key"]: row for row in pool.snapshot()}
+        self.assertEqual(usage[big.label]["prompt_tokens"], 40)
+        self.assertEqual(usage[big.label]["requests"], 2)
+        self.assertEqual(usage[big.label]["inflight"], 1)
+
+    def test_cooldown(self):
+        """测试返回429和401的密钥暂停使用"""
+        pool = KeyPool([("a", "key-a"), ("b", "key-b")])
+        lease = pool.acquire()
+        lease.release({"status": 429, "retry_after": "30"})
+        lease.release({"status": 429})
+        other = pool.acquire()
+        self.assertNotEqual(other.label, lease.label)
+        other.release({"status": 401})
+
+        self.assertIsNone(pool.acquire(cooling=False))
+        # 都在暂停期时等待最早恢复的密钥
+        with patch("src.utils.key_pool.time.sleep") as mock_sleep:
+            self.assertEqual(pool.acquire().label, lease.label)
+        self.assertTrue(25 < mock_sleep.call_args[0][0] <= 30)
+        snapshot = {row["key"]: row for row in pool.snapshot()}
+        self.assertEqual(snapshot[lease.label]["rate_limited"], 1)
+        self.assertEqual(snapshot[other.label]["unauthorized"], 1)
+        self.assertGreater(snapshot[other.label]["cooldown"], 500)
+        self.assertLessEqual(snapshot[lease.label]["cooldown"], 30)
+
+    def test_cooldown_shared_between_pools(self):
+        """测试暂停状态按密钥在密钥池之间共享，只有401/403暂停的密钥时不等待"""
+        first = KeyPool([("a", "key-a"), ("b", "key-b")])
+        second = KeyPool([("shared", "key-a"), ("c", "key-c")])
+        lease = first.acquire()
+        lease.release({"status": 429, "retry_after": "5"})
+        expected = "c" if lease.value == "key-a" else "shared"
+        self.assertEqual(second.acquire().label, expected)
+
+        pool = KeyPool([("d", "key-d")])
+        pool.acquire().release({"status": 401})
+        with patch("src.utils.key_pool.time.sleep") as mock_sleep:
+            self.assertEqual(pool.acquire().label, "d")
+        mock_sleep.assert_not_called()
+
+    def test_call_with_keys_retries_other_key(self):
+        """测试被限流时换用其他密钥重试"""
+        pool = KeyPool([("a", "key-a"), ("b", "key-b")])
+        seen = []
+
+        def call(headers, usage):
+            seen.append(headers["Authorization"])
+            usage["status"] = 429 if len(seen) == 1 else 200
+            return usage["status"] == 200, "ok"
+
+        usage = {}
+        self.assertEqual(call_with_keys(pool, {"Authorization": "Bearer "}, {"messages": []}, call, usage),
+                         (True, "ok"))
+        self.assertEqual(len(set(seen)), 2)
+        self.assertEqual(usage["key"], seen[1][len("Bearer key-"):])
+
+        # 所有密钥都被限流时返回最后一次的结果
+        pool = KeyPool([("c", "key-c")])
+        self.assertEqual(call_with_keys(pool, {}, {}, lambda headers, usage: usage.update(status=429)
+                                        or (False, "429")), (False, "429"))
+
+    def test_provider_keys(self):
+        """测试从密钥文件和环境变量读取密钥"""
+        provider = {"url": "http://x", "model": "m", "key_file": "a.txt",
+                    "key_files": ["b.txt", "missing.txt", "dup.txt"], "key_env": "TEST_POOL_KEYS"}
+        model_manager = key_manager({"a.txt": "key-a", "b.txt": "key-b", "dup.txt": "key-a"})
+        with patch.dict(os.environ, {"TEST_POOL_KEYS": "key-c, key-d\nkey-b"}):
+            keys = provider_keys(provider, model_manager)
+        self.assertEqual(keys, [("a.txt", "key-a"), ("b.txt", "key-b"),
+                                ("TEST_POOL_KEYS[1]", "key-c"), ("TEST_POOL_KEYS[2]", "key-d")])
+        self.assertIs(get_key_pool(provider, model_manager), get_key_pool(provider, model_manager))
+
+    def test_rate_limit_per_key(self):
+        """测试速率限制按密钥数放大"""
+        provider = {"url": "http://limits", "model": "m",
+                    "rate_limit": {"requests_per_minute": 60, "max_concurrency": 2}}
+        self.assertEqual(get_rate_limiter(provider).max_concurrency, 2)
+        limiter = get_rate_limiter(provider, 3)
+        self.assertEqual(limiter.max_concurrency, 6)
+        self.assertAlmostEqual(limiter.rate, 3.0)
+
+    def test_api_key_read_once(self):
+        """测试密钥文件每个进程只读取一次"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "key.txt")
+            model_manager = ModelManager()
+            self.assertIsNone(model_manager.get_api_key(path))
+            with open(path, "w") as f:
+                f.write("first\n")
+            self.assertEqual(model_manager.get_api_key(path), "first")
+            with open(path, "w") as f:
+                f.write("second\n")
+            self.assertEqual(ModelManager().get_api_key(path), "first")
+
+
+class TestKeyPoolRequests(unittest.TestCase):
+    """通过模拟提供商测试密钥分配"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        patcher = patch("src.utils.key_pool._cooldowns", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        close_sessions()
+
+    def test_requests_spread_across_keys(self):
+        """测试请求分散到多个密钥上，并记录所用密钥"""
+        with MockProvider(reply="ls") as provider:
+            config = {"url": provider.url, "model": "mock-model", "token_limit": 32000,
+                      "key_file": "a.txt", "key_files": ["b.txt"]}
+            model_manager = key_manager({"a.txt": "key-a", "b.txt": "key-b"})
+            labels = []
+            with patch('builtins.print'):
+                for _ in range(4):
+                    usage = {}
+                    self.assertEqual(request_generation(config, "列出文件", CONTEXT, usage=usage,
+                                                        model_manager=model_manager), (True, "ls"))
+                    labels.append(usage["key"])
+            self.assertEqual(sorted(labels), ["a.txt", "a.txt", "b.txt", "b.txt"])
+            rows = get_key_pool(config, model_manager).snapshot()
+            self.assertEqual([row["requests"] for row in rows], [2, 2])
+            self.assertTrue(all(row["completion_tokens"] == 2 for row in rows))
+
+            missing = dict(config, key_file="none.txt", key_files=[])
+            success, message = request_generation(missing, "列出文件", CONTEXT,
+                                                  model_manager=model_manager)
+            self.assertFalse(success)
+            self.assertIn("未找到API密钥", message)
+
+    def test_missing_key_env_only(self):
+        """测试只配置环境变量的提供商没有密钥时返回错误消息而不是抛出异常"""
+        config = {"url": "https://keys.example.com/v1/chat/completions", "model": "mock-model",
+                  "token_limit": 32000, "key_env": "BCOPILOT_TEST_MISSING_KEYS"}
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("BCOPILOT_TEST_MISSING_KEYS", None)
+            success, message = request_generation(config, "列出文件", CONTEXT,
+                                                  model_manager=key_manager({}))
+        self.assertFalse(success)
+        self.assertIn("环境变量 BCOPILOT_TEST_MISSING_KEYS", message)
+        self.assertEqual(missing_key_message({"key_file": "a.txt", "key_files": ["b.txt"]}),
+                         "未找到API密钥，请检查 a.txt、b.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+查询入口的测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from argparse import Namespace
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import main
+from src.generators.session import open_session
+from src.utils.stream_input import STDIN_NAME
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+
+def query_args(query, **kwargs):
+    """普通查询的命令行参数"""
+    values = dict(command=None, query=query, interactive=False, script=False, filename=None,
+                  retrieve=False, workspace=None, mapreduce=False, continue_session=False,
+                  session=None, no_stdin=False, wait_stdin=False, trace=False)
+    values.update(kwargs)
+    return Namespace(**values)
+
+
+class TestMain(unittest.TestCase):
+    """查询入口测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+        def fake_open_session(name, continue_latest):
+            return open_session(name, continue_latest, self.directory)
+
+        def fake_generation(query, context, file_contents, filenames, conversation):
+            self.calls.append((query, file_contents, conversation))
+            if conversation is not None:
+                conversation.add_turn(query, "ls")
+
+        self.calls = []
+        for target, kwargs in (('src.main.prewarm_providers', {}),
+                               ('src.main.traced_bash_context', {"return_value": CONTEXT}),
+                               ('src.main.read_stdin', {"return_value": "secret from pipe\n"}),
+                               ('src.main.open_session', {"side_effect": fake_open_session}),
+                               ('src.main.handle_command_generation', {"side_effect": fake_generation})):
+            patcher = patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def run_main(self, args):
+        with patch('src.main.parse_arguments', return_value=args), patch('builtins.print'):
+            main()
+
+    def test_plain_query_has_no_session(self):
+        """测试普通查询不打开会话，管道输入不写入磁盘"""
+        self.run_main(query_args("列出文件"))
+        query, file_contents, conversation = self.calls[0]
+        self.assertEqual(file_contents[0][0], STDIN_NAME)
+        self.assertIsNone(conversation)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_no_stdin(self):
+        """测试 -no-stdin 不读取标准输入"""
+        with patch('src.main.read_stdin') as mock_read:
+            self.run_main(query_args("列出文件", no_stdin=True))
+        mock_read.assert_not_called()
+        self.assertIsNone(self.calls[0][1])
+
+    def test_wait_stdin(self):
+        """测试 -wait-stdin 一直等待管道输入"""
+        with patch('src.main.read_stdin', return_value=None) as mock_read:
+            self.run_main(query_args("列出文件", wait_stdin=True))
+        mock_read.assert_called_once_with(None)
+
+    def test_session_is_saved(self):
+        """测试 -session 保存会话，-continue 在其基础上继续"""
+        self.run_main(query_args("列出文件", session="work"))
+        self.assertEqual(os.listdir(self.directory), ["work.json"])
+        self.run_main(query_args("改成递归", continue_session=True))
+        conversation = self.calls[-1][2]
+        self.assertEqual([turn[0] for turn in conversation.turns], ["列出文件", "改成递归"])
+
+    def test_malformed_session_continues(self):
+        """测试会话文件损坏时按新会话继续查询"""
+        with open(os.path.join(self.directory, "work.json"), "w", encoding="utf-8") as f:
+            f.write('{"name": "work"}')
+        self.run_main(query_args("列出文件", session="work"))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(self.calls[0][2].turns), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+分块处理(map-reduce)测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.generators import mapreduce_generator
+from src.generators.mapreduce_generator import iter_file_chunks, map_reduce_file_contents
+from src.utils.rate_limiter import RateLimiter
+
+
+class TestMapReduce(unittest.TestCase):
+    """分块处理测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "huge.log")
+        with open(self.file_path, "w") as f:
+            for i in range(400):
+                f.write(f"INFO worker {i} heartbeat ok\n" if i % 100 else f"ERROR worker {i} crashed\n")
+        self.calls = []
+
+        def fake_send(provider_config, headers, payload, timeout, usage=None, report_cache=True):
+            chunk = payload["messages"][1]["content"]
+            self.calls.append(chunk)
+            if "ERROR" in chunk:
+                return True, "包含 ERROR 行: worker crashed"
+            return True, "无相关信息"
+
+        patches = [
+            patch.object(mapreduce_generator, "send_request", side_effect=fake_send),
+            patch.object(mapreduce_generator, "MAPREDUCE_CACHE_FILE",
+                         os.path.join(self.temp_dir.name, "cache.db")),
+            patch.object(mapreduce_generator, "MAP_CHUNK_TOKENS", 200),
+            patch.object(mapreduce_generator, "get_rate_limiter",
+                         return_value=RateLimiter(requests_per_minute=60000, max_concurrency=4)),
+            patch('src.config.model_manager.ModelManager.get_api_key', return_value="test-key"),
+            # 密钥的暂停状态在进程内共享，每个测试使用独立的状态
+            patch('src.utils.key_pool._cooldowns', {}),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_chunks_stable_after_append(self):
+        """测试文件追加内容后之前的完整片段保持不变"""
+        before = list(iter_file_chunks(self.file_path, 200))
+        with open(self.file_path, "a") as f:
+            f.write("INFO appended line\n" * 20)
+        after = list(iter_file_chunks(self.file_path, 200))
+
+        self.assertEqual(before[:-1], after[:len(before) - 1])
+        self.assertEqual(before[0][0], 1)
+        self.assertEqual(after[-1][1], 420)
+
+    def test_irrelevant_chunks_dropped(self):
+        """测试没有相关信息的片段不进入reduce阶段"""
+        with patch('builtins.print'):
+            notes = map_reduce_file_contents("哪些worker崩溃了", [self.file_path])
+
+        self.assertEqual(len(notes), 4)
+        for label, text in notes:
+            self.assertIn("huge.log (第", label)
+            self.assertIn("worker crashed", text)
+
+    def test_rerun_only_processes_new_chunks(self):
+        """测试重新运行时只处理新增或变化的片段"""
+        with patch('builtins.print'):
+            map_reduce_file_contents("哪些worker崩溃了", [self.file_path])
+            first_calls = len(self.calls)
+
+            with open(self.file_path, "a") as f:
+                f.write("ERROR worker 999 crashed\n")
+            map_reduce_file_contents("哪些worker崩溃了", [self.file_path])
+
+        self.assertEqual(len(self.calls) - first_calls, 1)
+
+    def small_provider(self, token_limit):
+        return patch.object(mapreduce_generator, "get_provider_config", return_value={
+            "url": "https://api.example.com/v1/chat/completions", "model": "small-model",
+            "token_limit": token_limit, "key_file": "small_key.txt"})
+
+    def test_reduce_stops_without_progress(self):
+        """测试每条提取结果都接近片段预算时，再次汇总没有缩小结果就停止"""
+        def fake_send(provider_config, headers, payload, timeout, usage=None, report_cache=True):
+            self.calls.append(payload["messages"][1]["content"])
+            return True, "worker crashed " * 40
+
+        with patch.object(mapreduce_generator, "send_request", side_effect=fake_send), \
+                self.small_provider(5000), patch('builtins.print') as mock_print:
+            notes = map_reduce_file_contents("哪些worker崩溃了", [self.file_path])
+
+        chunks = len(list(iter_file_chunks(self.file_path, 200)))
+        self.assertEqual(len(notes), chunks)
+        self.assertEqual(len(self.calls), chunks * 2)
+        printed = " ".join(" ".join(map(str, call[0])) for call in mock_print.call_args_list)
+        self.assertIn("没有缩小", printed)
+
+    def test_context_too_small(self):
+        """测试模型上下文小于预留的token数时给出错误而不是按非正的预算切分"""
+        with self.small_provider(4096), patch('builtins.print') as mock_print:
+            self.assertIsNone(map_reduce_file_contents("哪些worker崩溃了", [self.file_path]))
+        self.assertIn("过小", mock_print.call_args[0][0])
+        self.assertEqual(self.calls, [])
+
+    def test_retry_on_rate_limit_status(self):
+        """测试按记录的状态码（而不是错误文本）在429时重试"""
+        def fake_send(provider_config, headers, payload, timeout, usage=None, report_cache=True):
+            self.calls.append(payload["messages"][1]["content"])
+            if len(self.calls) == 1:
+                usage["status"] = 429
+                return False, "rate limited"
+            usage["status"] = 200
+            return True, "无相关信息"
+
+        with patch.object(mapreduce_generator, "send_request", side_effect=fake_send), \
+                patch.object(mapreduce_generator, "MAP_CHUNK_TOKENS", 100000), \
+                patch.object(mapreduce_generator.time, "sleep") as mock_sleep, \
+                patch('builtins.print'):
+            self.assertEqual(map_reduce_file_contents("哪些worker崩溃了", [self.file_path]), [])
+        self.assertEqual(len(self.calls), 2)
+        # 先按分块处理的退避等待，再由密钥池等到被限流的密钥恢复
+        self.assertEqual(mock_sleep.call_args_list[0][0], (1,))
+
+
+class TestRateLimiter(unittest.TestCase):
+    """速率限制器测试类"""
+
+    def test_requests_per_minute(self):
+        """测试超出突发容量后按速率放行"""
+        limiter = RateLimiter(requests_per_minute=600, max_concurrency=2)
+        start = time.monotonic()
+        for _ in range(4):
+            with limiter:
+                pass
+        # 前2个请求立即放行，之后每0.1秒放行一个
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+模拟提供商和基准结果比较的测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_provider import MockProvider
+from benchmarks.suite import compare_results, percentile
+from src.generators.base_generator import send_request, stream_request
+from src.utils.http_client import close_sessions, get_session
+
+HEADERS = {"Authorization": "Bearer test-key", "Content-Type": "application/json"}
+
+PAYLOAD = {"model": "mock-model", "messages": [{"role": "user", "content": "列出文件"}]}
+
+
+class TestMockProvider(unittest.TestCase):
+    """模拟提供商测试类"""
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        close_sessions()
+
+    def provider_config(self, provider):
+        return {"url": provider.url, "model": "mock-model", "token_limit": 32000,
+                "key_file": "mock_key.txt"}
+
+    def test_completion_and_stream(self):
+        """测试普通回复、流式回复和用量"""
+        with MockProvider(reply="find . -name '*.log'", tokens_per_second=1000) as provider:
+            config = self.provider_config(provider)
+            usage = {}
+            self.assertEqual(send_request(config, HEADERS, PAYLOAD, 5, usage, report_cache=False),
+                             (True, "find . -name '*.log'"))
+            self.assertEqual(usage["completion_tokens"], 4)
+
+            pieces = []
+            usage = {}
+            result = stream_request(config, HEADERS, PAYLOAD, 5, usage,
+                                    on_text=lambda text: pieces.append(text) and False)
+            self.assertEqual(result, (True, "find . -name '*.log'"))
+            self.assertEqual(len(pieces), 4)
+            self.assertEqual(usage["completion_tokens"], 4)
+            self.assertEqual(provider.statuses[200], 2)
+
+    def test_timing(self):
+        """测试首字节延迟和生成速度"""
+        with MockProvider(ttfb=0.1, tokens_per_second=50, response_tokens=5) as provider:
+            session = get_session(provider.url)
+            start = time.perf_counter()
+            ok, reply = send_request(self.provider_config(provider), HEADERS, PAYLOAD, 5,
+                                     report_cache=False, session=session)
+            elapsed = time.perf_counter() - start
+            self.assertTrue(ok)
+            self.assertEqual(len(reply.split()), 5)
+            self.assertGreaterEqual(elapsed, 0.2)
+
+    def test_fault_injection(self):
+        """测试429和500错误注入及缺少密钥时的401"""
+        with MockProvider(rate_limit_rate=1.0) as provider:
+            ok, message = send_request(self.provider_config(provider), HEADERS, PAYLOAD, 5,
+                                       report_cache=False)
+            self.assertFalse(ok)
+            self.assertIn("429", message)
+        with MockProvider(error_rate=1.0) as provider:
+            ok, message = send_request(self.provider_config(provider), HEADERS, PAYLOAD, 5,
+                                       report_cache=False)
+            self.assertIn("500", message)
+            ok, message = send_request(self.provider_config(provider), {}, PAYLOAD, 5,
+                                       report_cache=False)
+            self.assertIn("401", message)
+            self.assertEqual(provider.statuses[401], 1)
+        with MockProvider(rate_limit_rate=0.5, seed=1) as provider:
+            results = [send_request(self.provider_config(provider), HEADERS, PAYLOAD, 5,
+                                    report_cache=False)[0] for _ in range(20)]
+            self.assertIn(True, results)
+            self.assertIn(False, results)
+
+
+class TestBenchmarkComparison(unittest.TestCase):
+    """基准结果比较测试类"""
+
+    def test_percentile(self):
+        """测试最近秩法分位数"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+
+    def test_compare_results(self):
+        """测试按指标方向标出变差的指标"""
+        old = {"metrics": {"e2e_p50_ms": 100, "throughput_c4_rps": 40, "peak_rss_kb": 1000,
+                           "removed_ms": 1}}
+        new = {"metrics": {"e2e_p50_ms": 120, "throughput_c4_rps": 44, "peak_rss_kb": 1050,
+                           "added_ms": 1}}
+        rows = {row["name"]: row for row in compare_results(old, new)}
+        self.assertEqual(set(rows), {"e2e_p50_ms", "throughput_c4_rps", "peak_rss_kb"})
+        self.assertTrue(rows["e2e_p50_ms"]["regression"])
+        self.assertFalse(rows["throughput_c4_rps"]["regression"])
+        self.assertFalse(rows["peak_rss_kb"]["regression"])
+        self.assertAlmostEqual(rows["e2e_p50_ms"]["change"], 0.2)
+
+        slower = {"metrics": {"throughput_c4_rps": 30}}
+        self.assertTrue(compare_results({"metrics": {"throughput_c4_rps": 40}}, slower)[0]["regression"])
+
+
+if __name__ == "__main__":
+    unittest.main()
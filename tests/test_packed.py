@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+合并命令请求和批量命令的测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_provider import MockProvider
+from config.prompts import COMMAND_REFUSAL_MESSAGE, PACKED_COMMAND_SYSTEM_PROMPT
+from src.cli.batch_commands import format_result, read_queries
+from src.generators import packed_generator
+from src.generators.packed_generator import PackedRunner, build_packed_messages, parse_packed_reply
+from src.utils.http_client import close_sessions
+
+CONTEXT = {"current_directory": "/tmp", "username": "user", "hostname": "host",
+           "ubuntu_version": "22.04"}
+
+
+class TestPackedPrompt(unittest.TestCase):
+    """合并请求的提示词和回复解析测试类"""
+
+    def test_build_packed_messages(self):
+        """测试查询按编号排列在最后"""
+        provider = {"url": "http://x/v1/chat/completions", "model": "m"}
+        messages = build_packed_messages(["列出文件", "查看\n磁盘  用量"], CONTEXT, provider,
+                                         [("a.txt", "hello")])
+        self.assertEqual(messages[0]["content"], PACKED_COMMAND_SYSTEM_PROMPT)
+        user = messages[1]["content"]
+        self.assertIn("a.txt", user)
+        self.assertTrue(user.rstrip().endswith("[1] 列出文件\n[2] 查看 磁盘 用量"))
+        self.assertLess(user.index("/tmp"), user.index("[1]"))
+
+    def test_parse_packed_reply(self):
+        """测试按编号拆分回复，忽略无法确定归属的回答"""
+        reply = "\n".join([
+            "```",
+            "[1] ls -la",
+            "[2] `df -h`",
+            f"[3] {COMMAND_REFUSAL_MESSAGE}",
+            "[4] du -sh *",
+            "[4] du -sh .",
+            "[5]",
+            "[9] echo extra",
+            "```",
+        ])
+        answers = parse_packed_reply(reply, 6)
+        self.assertEqual(answers, {0: "ls -la", 1: "df -h", 2: COMMAND_REFUSAL_MESSAGE})
+        self.assertEqual(parse_packed_reply("无法回答", 3), {})
+
+
+class TestPackedRunner(unittest.TestCase):
+    """合并请求执行测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.provider = MockProvider(reply="find . -name '*.log'").start()
+        self.config = {"url": self.provider.url, "model": "mock-model", "token_limit": 32000,
+                       "key_file": "key.txt",
+                       "rate_limit": {"requests_per_minute": 100000, "max_concurrency": 4}}
+        self.model_manager = MagicMock()
+        self.model_manager.get_command_provider.return_value = self.config
+        self.model_manager.get_api_key.return_value = "key"
+        self.model_manager.config = {"command": {"provider": "mock"}}
+        self.queries = [f"查找第{index}个目录下的日志" for index in range(10)]
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.provider.stop()
+        close_sessions()
+
+    def test_packed_requests(self):
+        """测试10个查询按每组4个合并为3次请求"""
+        runner = PackedRunner(CONTEXT, model_manager=self.model_manager, pack_size=4)
+        results = runner.run(self.queries)
+        self.assertEqual([result["query"] for result in results], self.queries)
+        self.assertTrue(all(result["success"] and result["packed"] for result in results))
+        self.assertEqual({result["answer"] for result in results}, {"find . -name '*.log'"})
+        self.assertEqual(self.provider.requests, 3)
+        self.assertEqual((runner.stats.requests, runner.stats.packed, runner.stats.fallback), (3, 10, 0))
+        self.assertEqual(results[0]["usage"]["provider"], "mock")
+        self.assertEqual(results[0]["usage"]["key"], "key.txt")
+        self.assertGreater(results[0]["usage"]["prompt_tokens"], 0)
+
+    def test_fallback_for_unparsed_answers(self):
+        """测试无法解析的回答改为单独请求"""
+        real_parse = packed_generator.parse_packed_reply
+
+        def drop_second(reply, count):
+            answers = real_parse(reply, count)
+            answers.pop(1, None)
+            return answers
+
+        with patch.object(packed_generator, "parse_packed_reply", side_effect=drop_second):
+            runner = PackedRunner(CONTEXT, model_manager=self.model_manager, pack_size=5)
+            results = runner.run(self.queries)
+        self.assertEqual([result["packed"] for result in results],
+                         [True, False, True, True, True] * 2)
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(self.provider.requests, 4)
+        self.assertEqual((runner.stats.packed, runner.stats.fallback), (8, 2))
+
+    @patch.object(packed_generator, "PACKED_RETRY_DELAY", 0.01)
+    def test_failed_packed_request(self):
+        """测试合并请求失败时重试合并请求而不是逐个单独请求，仍然失败时整组报告错误"""
+        self.provider.error_rate = 1.0
+        runner = PackedRunner(CONTEXT, model_manager=self.model_manager, pack_size=3)
+        results = runner.run(self.queries[:3])
+        self.assertEqual(self.provider.requests, 1 + packed_generator.PACKED_RETRIES)
+        self.assertFalse(any(result["success"] for result in results))
+        self.assertIn("500", results[0]["answer"])
+        self.assertEqual((runner.stats.failed, runner.stats.fallback), (3, 0))
+
+        # 暂时性失败后重试成功，其他错误不重试
+        self.provider.error_rate = 0.0
+        for failure, calls in (({"status": 503}, 2), ({"status": 400}, 1)):
+            runner = PackedRunner(CONTEXT, model_manager=self.model_manager, pack_size=3)
+            replies = [(False, "API错误", failure)]
+            real_request = runner.request_packed
+            with patch.object(runner, "request_packed", side_effect=lambda queries: (
+                    replies.pop() if replies else real_request(queries))) as mock_packed:
+                results = runner.run(self.queries[:3])
+            self.assertEqual(mock_packed.call_count, calls)
+            self.assertEqual(all(result["success"] for result in results), calls == 2)
+
+        self.model_manager.get_api_key.return_value = None
+        runner = PackedRunner(CONTEXT, model_manager=self.model_manager)
+        results = runner.run(self.queries[:2])
+        self.assertIn("未找到API密钥", results[0]["answer"])
+
+
+class TestBatchCommand(unittest.TestCase):
+    """批量命令测试类"""
+
+    def test_read_queries(self):
+        """测试读取查询列表时忽略空行和注释"""
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("# 日常任务\n列出文件\n\n  查看磁盘用量  \n")
+        try:
+            self.assertEqual(read_queries(f.name), ["列出文件", "查看磁盘用量"])
+        finally:
+            os.unlink(f.name)
+
+    def test_format_result(self):
+        """测试以注释加命令的形式输出"""
+        self.assertEqual(format_result(1, {"query": "列出文件", "success": True, "answer": "ls"}),
+                         "# 1. 列出文件\nls\n")
+        self.assertEqual(format_result(2, {"query": "q", "success": False, "answer": "API错误"}),
+                         "# 2. q\n# 错误: API错误\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
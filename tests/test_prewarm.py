@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+预连接和耗时追踪测试用例
+"""
+
+import unittest
+import os
+import io
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.generators.base_generator import prewarm_providers, request_generation
+from src.utils.dns_cache import DNSCache
+from src.utils.http_client import close_sessions, prewarm, prewarmed_session
+from src.utils.trace import Tracer
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+
+class CountingServer(ThreadingHTTPServer):
+    """记录接受的连接数的服务器"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """返回固定回复的对话接口"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"choices": [{"message": {"content": "ls -la"}}],
+                           "usage": {"prompt_tokens": 20, "completion_tokens": 3}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestPrewarm(unittest.TestCase):
+    """预连接测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        # 解析 localhost 时使用临时的DNS缓存，不写入项目的 cache/dns.db
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DNSCache(os.path.join(self.temp_dir.name, "dns.db"))
+        patcher = patch("src.utils.dns_cache._dns_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = CountingServer(("127.0.0.1", 0), ChatHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        self.provider = {"url": self.url, "model": "test-model",
+                         "token_limit": 32000, "key_file": "test_key.txt"}
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_request_uses_prewarmed_connection(self):
+        """测试请求使用预先建立的连接，不再建立新连接"""
+        prewarm(self.url)
+        prewarm(self.url)
+        session = prewarmed_session(self.url)
+        self.assertIsNotNone(session)
+        self.assertEqual(self.server.connections, 1)
+
+        model_manager = MagicMock()
+        model_manager.get_api_key.return_value = "test-key"
+        usage = {}
+        result = request_generation(self.provider, "列出文件", CONTEXT, False, None, usage,
+                                    model_manager, None, None, provider_name="test")
+        self.assertEqual(result, (True, "ls -la"))
+        self.assertEqual(usage["provider"], "test")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_no_prewarm(self):
+        """测试没有预连接的主机返回None"""
+        self.assertIsNone(prewarmed_session(self.url))
+
+    def test_prewarm_failure_is_ignored(self):
+        """测试预连接失败不抛出异常，请求时重新建立连接"""
+        self.server.shutdown()
+        self.server.server_close()
+        prewarm(self.url, timeout=1)
+        self.assertIsNotNone(prewarmed_session(self.url))
+
+    def test_prewarm_providers(self):
+        """测试按模式和查询复杂度选择预连接的提供商"""
+        script_url = self.url.replace("127.0.0.1", "localhost")
+        model_manager = MagicMock()
+        model_manager.get_cascade.side_effect = lambda mode: [
+            (mode, {"url": self.url if mode == "command" else script_url})]
+
+        prewarm_providers(model_manager, False, "列出当前目录的文件")
+        self.assertEqual([c[0][0] for c in model_manager.get_cascade.call_args_list], ["command"])
+        self.assertIsNone(prewarmed_session(script_url))
+
+        prewarm_providers(model_manager, False, "每隔5分钟检查磁盘使用率，如果超过90%就清理日志并发送报告")
+        self.assertIsNotNone(prewarmed_session(script_url))
+
+
+class TestTracer(unittest.TestCase):
+    """耗时追踪测试类"""
+
+    def test_disabled(self):
+        """测试未开启时不记录"""
+        tracer = Tracer()
+        with tracer.span("context"):
+            pass
+        out = io.StringIO()
+        tracer.report(out)
+        self.assertEqual(tracer.spans, [])
+        self.assertEqual(out.getvalue(), "")
+
+    def test_report_shows_overlap(self):
+        """测试时间线显示并行进行的阶段"""
+        tracer = Tracer(enabled=True)
+
+        def background():
+            with tracer.span("prewarm"):
+                time.sleep(0.1)
+
+        thread = threading.Thread(target=background, name="prewarm")
+        thread.start()
+        with tracer.span("files"):
+            time.sleep(0.1)
+        thread.join()
+        with self.assertRaises(ValueError):
+            with tracer.span("request"):
+                raise ValueError("boom")
+
+        out = io.StringIO()
+        tracer.report(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("[trace] 总耗时"))
+        self.assertEqual(len(lines), 4)
+        bars = {line.split()[1]: line.split("|")[1] for line in lines[1:]}
+        # 两个并行阶段的横条从同一位置开始，请求在其后
+        self.assertEqual(bars["prewarm"].index("#"), bars["files"].index("#"))
+        self.assertGreater(bars["request"].index("#"), bars["files"].index("#"))
+        self.assertIn("失败: ValueError", lines[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
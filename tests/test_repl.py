@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+交互模式和多轮对话测试用例
+"""
+
+import unittest
+import os
+import sys
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cli.repl import Repl
+from src.generators.base_generator import build_messages, send_request
+from src.generators.conversation import Conversation
+from src.utils.http_client import get_session
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+PROVIDER = {
+    "url": "https://api.siliconflow.cn/v1/chat/completions",
+    "model": "Pro/deepseek-ai/DeepSeek-V3",
+    "token_limit": 64000,
+    "key_file": "siliconflow_key.txt"
+}
+
+
+class TestConversation(unittest.TestCase):
+    """多轮对话测试类"""
+
+    def test_first_turn_matches_single_query(self):
+        """测试第一轮的消息与单次查询完全相同"""
+        conversation = Conversation(CONTEXT, [("a.txt", "hello")])
+        self.assertEqual(conversation.build_messages("列出文件", PROVIDER),
+                         build_messages("列出文件", CONTEXT, PROVIDER, file_contents=[("a.txt", "hello")]))
+
+    def test_follow_up_keeps_prefix(self):
+        """测试后续轮次在之前的消息后追加，前缀保持不变"""
+        conversation = Conversation(CONTEXT)
+        first = conversation.build_messages("列出文件", PROVIDER)
+        conversation.add_turn("列出文件", "ls")
+        second = conversation.build_messages("包括隐藏文件", PROVIDER)
+        conversation.add_turn("包括隐藏文件", "ls -a")
+        third = conversation.build_messages("按大小排序", PROVIDER)
+
+        self.assertEqual(second[:len(first)], first)
+        self.assertEqual(third[:len(second) - 1], second[:-1])
+        self.assertEqual([message["role"] for message in third],
+                         ["system", "user", "assistant", "user", "assistant", "user"])
+        self.assertIn("按大小排序", third[-1]["content"])
+
+    def test_trim_to_token_limit(self):
+        """测试超出 token_limit 时丢弃最早的中间轮次"""
+        conversation = Conversation(CONTEXT)
+        conversation.add_turn("第一轮", "ls")
+        for i in range(20):
+            conversation.add_turn(f"第{i}次修改", "x" * 2000)
+        provider = dict(PROVIDER, token_limit=4000 + 3000)
+
+        messages = conversation.build_messages("最后一次", provider)
+        self.assertEqual(messages[2]["content"], "ls")
+        self.assertIn("最后一次", messages[-1]["content"])
+        self.assertLess(len(messages), 2 + 1 + 40 + 1)
+        self.assertIn("第19次修改", messages[-3]["content"])
+
+    def test_reset(self):
+        """测试重置对话"""
+        conversation = Conversation(CONTEXT)
+        conversation.add_turn("列出文件", "ls")
+        conversation.reset()
+        self.assertEqual(len(conversation.build_messages("查看磁盘", PROVIDER)), 2)
+
+
+class TestRepl(unittest.TestCase):
+    """交互模式测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.model_manager = MagicMock()
+        self.model_manager.get_command_provider.return_value = PROVIDER
+        self.model_manager.get_script_provider.return_value = PROVIDER
+        self.repl = Repl(context=CONTEXT, model_manager=self.model_manager)
+
+    @patch('builtins.print')
+    @patch('src.cli.repl.append_to_history')
+    @patch('src.cli.repl.generate_bash_command')
+    def test_multi_turn(self, mock_generate, mock_history, mock_print):
+        """测试多轮提问共享对话、模型配置和连接"""
+        mock_generate.side_effect = [(True, "find . -name '*.log'"), (True, "find . -name '*.log' -delete")]
+
+        self.assertTrue(self.repl.ask("找出日志文件"))
+        self.assertTrue(self.repl.ask("然后删除它们"))
+
+        self.assertEqual(len(self.repl.conversation.turns), 2)
+        first_kwargs = mock_generate.call_args_list[0][1]
+        second_kwargs = mock_generate.call_args_list[1][1]
+        self.assertIs(first_kwargs["conversation"], self.repl.conversation)
+        self.assertIs(first_kwargs["model_manager"], self.model_manager)
+        self.assertIs(first_kwargs["session"], second_kwargs["session"])
+        self.assertEqual(mock_history.call_count, 2)
+
+    @patch('builtins.print')
+    @patch('src.cli.repl.append_to_history')
+    @patch('src.cli.repl.generate_bash_command')
+    def test_failed_turn_not_recorded(self, mock_generate, mock_history, mock_print):
+        """测试失败的请求不加入对话"""
+        mock_generate.return_value = (False, "API错误 (500): boom")
+        self.assertFalse(self.repl.ask("找出日志文件"))
+        self.assertEqual(self.repl.conversation.turns, [])
+        mock_history.assert_not_called()
+
+    @patch('builtins.print')
+    def test_commands(self, mock_print):
+        """测试内置命令"""
+        self.repl.conversation.add_turn("列出文件", "ls")
+        self.assertTrue(self.repl.handle_command(":script"))
+        self.assertTrue(self.repl.is_script)
+        self.assertIn("script", self.repl.prompt())
+        self.assertTrue(self.repl.handle_command(":reset"))
+        self.assertEqual(self.repl.conversation.turns, [])
+        self.assertFalse(self.repl.handle_command(":quit"))
+
+    def test_complete(self):
+        """测试基于历史记录的补全"""
+        self.repl.completions = ["查找大文件", "查找日志", ":help"]
+        self.assertEqual(self.repl.complete("查找", 0), "查找大文件")
+        self.assertEqual(self.repl.complete("查找", 1), "查找日志")
+        self.assertIsNone(self.repl.complete("查找", 2))
+
+
+class TestSessionReuse(unittest.TestCase):
+    """连接复用测试类"""
+
+    def test_get_session(self):
+        """测试同一主机共享会话"""
+        first = get_session("https://api.example.com/v1/chat/completions")
+        second = get_session("https://api.example.com:443/v1/models")
+        third = get_session("https://other.example.com/v1/chat/completions")
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+
+    @patch('builtins.print')
+    def test_send_request_uses_session(self, mock_print):
+        """测试提供会话时通过会话发送请求"""
+        session = MagicMock()
+        session.post.return_value.status_code = 200
+        session.post.return_value.json.return_value = {"choices": [{"message": {"content": "ls"}}]}
+        with patch('src.generators.base_generator.requests.post') as mock_post:
+            success, result = send_request(PROVIDER, {}, {}, 30, session=session)
+        self.assertTrue(success)
+        self.assertEqual(result, "ls")
+        session.post.assert_called_once()
+        mock_post.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
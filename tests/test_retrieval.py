@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+文件片段检索测试用例
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import retrieval
+from src.utils.retrieval import query_terms, tokenize, build_index, retrieve_file_contents
+
+
+class TestRetrieval(unittest.TestCase):
+    """BM25片段检索测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "app.log")
+        with open(self.file_path, "w") as f:
+            for i in range(1, 3001):
+                if i == 1500:
+                    f.write("ERROR payment gateway timeout order=42\n")
+                else:
+                    f.write(f"INFO request {i} served in 12ms\n")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_tokenize(self):
+        """测试英文按单词、中文按单字和双字切分"""
+        self.assertEqual(tokenize("Disk FULL on /var"), ["disk", "full", "on", "var"])
+        self.assertEqual(tokenize("超时"), ["超", "时", "超时"])
+
+    def test_retrieve_relevant_chunk(self):
+        """测试检索结果包含相关行及其行号范围"""
+        result = retrieve_file_contents([self.file_path], "payment timeout", budget=2000)
+
+        self.assertEqual(len(result), 1)
+        label, content = result[0]
+        self.assertIn("payment gateway timeout", content)
+        start, end = label.split("第")[1].rstrip("行)").split("-")
+        self.assertLessEqual(int(start), 1500)
+        self.assertGreaterEqual(int(end), 1500)
+        self.assertNotIn("request 1 served", content)
+
+    def test_chinese_query_matches_english_log(self):
+        """测试中文查询中的常见术语补充英文检索词，可以检索英文日志"""
+        self.assertIn("timeout", query_terms("支付超时的错误"))
+        result = retrieve_file_contents([self.file_path], "支付超时的错误", budget=2000)
+        self.assertIsNotNone(result)
+        self.assertIn("payment gateway timeout", result[0][1])
+
+    def test_no_match_returns_none(self):
+        """测试没有任何片段匹配时返回None"""
+        self.assertIsNone(retrieve_file_contents([self.file_path], "kubernetes"))
+
+    def test_segments_keep_global_line_numbers(self):
+        """测试多区间并行建索引时行号保持全局一致"""
+        with patch.object(retrieval, "SEGMENT_BYTES", 4096), \
+             patch.object(retrieval, "PARALLEL_THRESHOLD", 0):
+            index = build_index([self.file_path], processes=2)
+
+        single = build_index([self.file_path])
+        self.assertEqual(index.total_terms, single.total_terms)
+
+        (_, chunk), = index.search("payment", limit=1)
+        lines = chunk.read().splitlines()
+        self.assertEqual(lines[1500 - chunk.start_line], "ERROR payment gateway timeout order=42")
+        self.assertEqual(len(lines), chunk.end_line - chunk.start_line + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
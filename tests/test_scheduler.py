@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+请求调度器的测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.rate_limiter import RateLimiter
+from src.utils.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    """调度器测试类"""
+
+    def start(self, requests_per_minute=60000, **kwargs):
+        """创建并发数为1的调度器，并用一个请求占住槽位"""
+        scheduler = Scheduler(RateLimiter(requests_per_minute, 1), **kwargs)
+        self.addCleanup(scheduler.close)
+        accepted, hold = scheduler.submit("batch", "hold")
+        self.assertTrue(accepted)
+        self.assertTrue(hold.wait(5))
+        return scheduler, hold
+
+    def submit_all(self, scheduler, requests, order):
+        """按 (类别, 客户端, 名称) 提交请求，放行时记录名称"""
+        tickets = {}
+        for priority, client, name in requests:
+            accepted, ticket = scheduler.submit(priority, client, run=lambda name=name: order.append(name))
+            self.assertTrue(accepted, ticket)
+            tickets[name] = ticket
+        return tickets
+
+    def drain(self, order, count):
+        deadline = time.time() + 5
+        while len(order) < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(order), count)
+
+    def test_priority_classes(self):
+        """测试交互式请求排在先到的脚本和批处理请求之前"""
+        scheduler, hold = self.start()
+        order = []
+        self.submit_all(scheduler, [("batch", "job", "b1"), ("batch", "job", "b2"),
+                                    ("script", "ci", "s1"), ("interactive", "shell", "i1")], order)
+        scheduler.done(hold)
+        self.drain(order, 4)
+        self.assertEqual(order, ["i1", "s1", "b1", "b2"])
+
+        stats = scheduler.snapshot()["classes"]
+        self.assertEqual(stats["batch"]["dispatched"], 3)
+        self.assertEqual(stats["interactive"]["queued"], 0)
+        # 交互式请求只等了占住槽位的请求
+        self.assertLess(stats["interactive"]["queue_wait_p50_ms"], stats["batch"]["queue_wait_p99_ms"])
+
+    def test_fair_between_clients(self):
+        """测试同一类别内按客户端轮流放行，权重高的客户端放行更多"""
+        scheduler, hold = self.start()
+        order = []
+        self.submit_all(scheduler, [("batch", "a", f"a{index}") for index in range(4)] +
+                        [("batch", "b", f"b{index}") for index in range(2)], order)
+        scheduler.done(hold)
+        self.drain(order, 6)
+        self.assertEqual(order, ["a0", "b0", "a1", "b1", "a2", "a3"])
+
+        scheduler, hold = self.start(weights={"a": 2})
+        order = []
+        self.submit_all(scheduler, [("batch", "a", f"a{index}") for index in range(4)] +
+                        [("batch", "b", f"b{index}") for index in range(4)], order)
+        scheduler.done(hold)
+        self.drain(order, 8)
+        self.assertEqual(order, ["a0", "a1", "b0", "a2", "a3", "b1", "b2", "b3"])
+
+    def test_admission_control(self):
+        """测试按限制器速率估计的排队时间超过上限或队列已满时拒绝"""
+        scheduler, hold = self.start(requests_per_minute=60, max_wait={"interactive": 2.0},
+                                     max_length={"batch": 2})
+        # 每秒放行1个，第4个交互式请求预计等待3秒
+        results = [scheduler.submit("interactive", "shell")[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        results = [scheduler.submit("batch", "job")[0] for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        accepted, reason = scheduler.submit("urgent", "shell")
+        self.assertFalse(accepted)
+        self.assertIn("未知的优先级", reason)
+
+        stats = scheduler.snapshot()["classes"]
+        self.assertEqual((stats["interactive"]["queued"], stats["interactive"]["rejected"]), (3, 1))
+        self.assertEqual((stats["batch"]["queued"], stats["batch"]["rejected"]), (2, 1))
+        scheduler.done(hold)
+
+    def test_promote_and_cancel(self):
+        """测试提升排队中请求的类别，以及取消的请求不再放行"""
+        scheduler, hold = self.start()
+        order = []
+        tickets = self.submit_all(scheduler, [("batch", "job", "b1"), ("batch", "job", "b2"),
+                                              ("script", "ci", "s1")], order)
+        self.assertTrue(scheduler.promote(tickets["b2"], "interactive"))
+        self.assertFalse(scheduler.promote(tickets["s1"], "batch"))
+        self.assertTrue(scheduler.cancel(tickets["b1"]))
+        self.assertFalse(tickets["b1"].wait(0))
+        scheduler.done(hold)
+        self.drain(order, 2)
+        time.sleep(0.05)
+        self.assertEqual(order, ["b2", "s1"])
+        self.assertFalse(scheduler.cancel(tickets["b2"]))
+        self.assertIsNotNone(tickets["b2"].queue_wait)
+
+        stats = scheduler.snapshot()
+        self.assertEqual(stats["classes"]["batch"]["cancelled"], 1)
+        self.assertEqual(stats["classes"]["interactive"]["dispatched"], 1)
+        self.assertEqual(stats["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+会话延续测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.generators.session import Session, open_session, latest_session, DEFAULT_SESSION
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+PROVIDER = {
+    "url": "https://api.siliconflow.cn/v1/chat/completions",
+    "model": "Pro/deepseek-ai/DeepSeek-V3",
+    "token_limit": 64000
+}
+
+CONFIG = "\n".join(f"key{i}: value{i}" for i in range(200))
+
+
+class TestSession(unittest.TestCase):
+    """会话延续测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def _first_turn(self, name="work"):
+        session = Session(name, self.directory)
+        conversation = session.start(CONTEXT, [("app.yaml", CONFIG)])
+        first = conversation.build_messages("生成部署命令", PROVIDER)
+        conversation.add_turn("生成部署命令", "kubectl apply -f app.yaml")
+        self.assertTrue(session.save())
+        return first
+
+    def test_prefix_is_byte_stable(self):
+        """测试重新加载的会话重建出完全相同的前缀"""
+        first = self._first_turn()
+
+        session = Session("work", self.directory)
+        conversation = session.resume(CONTEXT)
+        second = conversation.build_messages("加上命名空间", PROVIDER)
+        self.assertEqual(second[:len(first)], first)
+        conversation.add_turn("加上命名空间", "kubectl apply -n prod -f app.yaml")
+        session.save()
+
+        session = Session("work", self.directory)
+        third = session.resume(CONTEXT).build_messages("再加上 dry-run", PROVIDER)
+        self.assertEqual(third[:len(second) - 1], second[:-1])
+        self.assertEqual(third[len(second) - 1]["content"], second[-1]["content"])
+
+    def test_unchanged_file_is_referenced(self):
+        """测试已发送且未修改的文件只发送引用"""
+        self._first_turn()
+        session = Session("work", self.directory)
+        messages = session.resume(CONTEXT, [("app.yaml", CONFIG)]).build_messages("加上命名空间", PROVIDER)
+        self.assertIn("app.yaml 与之前发送的内容相同", messages[-1]["content"])
+        self.assertNotIn("key199", messages[-1]["content"])
+
+    def test_changed_file_sends_diff(self):
+        """测试已发送但有修改的文件只发送差异"""
+        self._first_turn()
+        changed = CONFIG.replace("value100", "changed100")
+        session = Session("work", self.directory)
+        conversation = session.resume(CONTEXT, [("app.yaml", changed), ("new.txt", "hello")])
+        last = conversation.build_messages("根据修改后的配置重新生成", PROVIDER)[-1]["content"]
+        self.assertIn("-key100: value100", last)
+        self.assertIn("+key100: changed100", last)
+        self.assertNotIn("key199", last)
+        self.assertIn("hello", last)
+
+        # 保存后以修改后的内容作为下一次比较的基准
+        conversation.add_turn("根据修改后的配置重新生成", "kubectl apply -f app.yaml")
+        session.save()
+        session = Session("work", self.directory)
+        last = session.resume(CONTEXT, [("app.yaml", changed)]).build_messages("再来", PROVIDER)[-1]["content"]
+        self.assertIn("与之前发送的内容相同", last)
+
+    def test_context_change_noted(self):
+        """测试环境变化时附加当前目录"""
+        self._first_turn()
+        session = Session("work", self.directory)
+        moved = dict(CONTEXT, current_directory="/srv/app")
+        last = session.resume(moved).build_messages("再来", PROVIDER)[-1]["content"]
+        self.assertIn("/srv/app", last)
+
+    def test_save_requires_new_turn(self):
+        """测试请求失败（没有新的问答）时不保存"""
+        session = Session("work", self.directory)
+        session.start(CONTEXT)
+        self.assertFalse(session.save())
+        self.assertFalse(os.path.exists(session.path))
+
+    def test_malformed_session_file(self):
+        """测试无法读取或格式错误的会话文件按新会话处理"""
+        path = os.path.join(self.directory, "work.json")
+        for content in ("{not json", "[]", '{"name": "work"}', '{"conversation": {}, "files": {}}'):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            with patch('builtins.print') as mock_print:
+                session = Session("work", self.directory)
+            self.assertIn("将开始新的会话", mock_print.call_args[0][0])
+            self.assertIsNone(session.conversation)
+            self.assertEqual(session.files, {})
+            conversation = session.resume(CONTEXT, [("app.yaml", CONFIG)])
+            self.assertEqual(conversation.turns, [])
+
+        conversation.add_turn("生成部署命令", "kubectl apply -f app.yaml")
+        self.assertTrue(session.save())
+        self.assertEqual(len(Session("work", self.directory).conversation.turns), 1)
+
+    def test_open_session(self):
+        """测试 -continue 选择最近使用的会话"""
+        self.assertEqual(open_session(None, True, self.directory).name, DEFAULT_SESSION)
+        self._first_turn("older")
+        time.sleep(0.01)
+        self._first_turn("newer")
+        os.utime(os.path.join(self.directory, "older.json"), (1, 1))
+        self.assertEqual(latest_session(self.directory), "newer")
+        self.assertEqual(open_session(None, True, self.directory).name, "newer")
+        self.assertEqual(open_session("older", False, self.directory).name, "older")
+        self.assertEqual(open_session(None, False, self.directory).name, DEFAULT_SESSION)
+        with self.assertRaises(ValueError):
+            open_session("../etc/passwd", False, self.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+管道输入测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.stream_input import HeadTailBuffer, read_stdin, read_stream, STDIN_NAME
+from src.utils.file_utils import read_file_contents
+
+
+class TestHeadTailBuffer(unittest.TestCase):
+    """有界缓冲区测试类"""
+
+    def test_small_input_kept(self):
+        """测试未超出容量的输入完整保留，重复行被折叠"""
+        buffer = HeadTailBuffer(1024, 1024)
+        buffer.write(b"Filesystem Size\n/dev/sda1 100G\n")
+        buffer.write(b"retry\nretry\nretry\ndone\n")
+        self.assertEqual(buffer.getvalue(),
+                         "Filesystem Size\n/dev/sda1 100G\nretry\n[上一行重复 2 次]\ndone")
+
+    def test_head_and_tail(self):
+        """测试超出容量时保留开头和结尾，统计省略的行"""
+        buffer = HeadTailBuffer(100, 100)
+        for i in range(10000):
+            buffer.write(f"line {i:05d}\n".encode())
+        lines = buffer.getvalue().splitlines()
+        marker = [line for line in lines if line.startswith("[输入已截断")]
+        self.assertEqual(len(marker), 1)
+        head = lines[:lines.index(marker[0])]
+        tail = lines[lines.index(marker[0]) + 1:]
+
+        self.assertEqual(head[0], "line 00000")
+        self.assertEqual(tail[-1], "line 09999")
+        # 所有保留和省略的行加起来等于输入行数
+        omitted = int(marker[0].split("省略了中间 ")[1].split(" 行")[0])
+        self.assertEqual(len(head) + omitted + len(tail), 10000)
+        self.assertEqual(tail[0], f"line {len(head) + omitted:05d}")
+
+    def test_constant_memory(self):
+        """测试大量输入时缓冲区大小有上限"""
+        buffer = HeadTailBuffer(64 * 1024, 64 * 1024)
+        chunk = b"x" * 100 + b"\n"
+        chunk = chunk * (65536 // len(chunk))
+        for _ in range(2000):
+            buffer.write(chunk)
+            self.assertLessEqual(len(buffer.head) + buffer.tail_size, 3 * 64 * 1024 + len(chunk))
+        self.assertGreater(buffer.total_bytes, 100 * 1024 * 1024)
+        self.assertLess(len(buffer.getvalue()), 200 * 1024)
+
+    def test_long_line(self):
+        """测试没有换行的超长输入"""
+        buffer = HeadTailBuffer(1000, 1000)
+        for _ in range(100):
+            buffer.write(b"a" * 999)
+        value = buffer.getvalue()
+        self.assertLess(len(value), 3000)
+        self.assertIn("[输入已截断", value)
+
+
+class TestReadStream(unittest.TestCase):
+    """管道读取测试类"""
+
+    def test_pipe(self):
+        """测试从管道读取到EOF，生产者不会被阻塞"""
+        read_fd, write_fd = os.pipe()
+        total = 20 * 1024 * 1024
+
+        def produce():
+            line = b"2024-05-01 ERROR disk full on /var\n"
+            written = 0
+            with os.fdopen(write_fd, "wb") as f:
+                while written < total:
+                    f.write(line * 1000)
+                    written += len(line) * 1000
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        content, total_bytes = read_stream(read_fd, 4096, 4096)
+        producer.join(10)
+        os.close(read_fd)
+
+        self.assertFalse(producer.is_alive())
+        self.assertGreaterEqual(total_bytes, total)
+        self.assertIn("上一行重复", content)
+        self.assertIn("[输入已截断", content)
+
+    def test_budget_shared_with_files(self):
+        """测试管道输入与文件一起分配预算，且不写入文件缓存"""
+        cache = MagicMock()
+        cache.get.return_value = None
+        stdin_content = "\n".join(f"/dev/sd{i} {i}G" for i in range(5))
+        with patch('src.utils.file_utils.read_text', return_value="hello"):
+            with patch('src.utils.file_utils.estimate_tokens', side_effect=len):
+                result = read_file_contents(["a.txt"], False, cache=cache,
+                                            extra_contents=[(STDIN_NAME, stdin_content)])
+        self.assertEqual(result, [("a.txt", "hello"), (STDIN_NAME, stdin_content)])
+        for call in cache.get.call_args_list + cache.put.call_args_list:
+            self.assertNotEqual(call[0][0], STDIN_NAME)
+
+
+
+class TestReadStdin(unittest.TestCase):
+    """标准输入读取测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "queries.txt")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("列出文件\n查看磁盘\n统计行数\n")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def read_from(self, stream, **kwargs):
+        with patch('sys.stdin', stream), patch('builtins.print') as mock_print:
+            return read_stdin(**kwargs), mock_print
+
+    def test_redirected_file(self):
+        """测试只读取从头开始的重定向文件，循环正在读取的文件不读取也不移动读取位置"""
+        with open(self.path, "rb", buffering=0) as stream:
+            content, _ = self.read_from(stream)
+        self.assertEqual(content.splitlines(), ["列出文件", "查看磁盘", "统计行数"])
+
+        with open(self.path, "rb", buffering=0) as stream:
+            offset = os.lseek(stream.fileno(), len("列出文件\n".encode()), os.SEEK_SET)
+            content, _ = self.read_from(stream)
+            self.assertIsNone(content)
+            self.assertEqual(os.lseek(stream.fileno(), 0, os.SEEK_CUR), offset)
+
+        with open(os.path.join(self.temp_dir.name, "empty.txt"), "wb+", buffering=0) as stream:
+            self.assertIsNone(self.read_from(stream)[0])
+
+    def test_while_read_loop(self):
+        """测试 while read q; do bcopilot "$q"; done < queries.txt 处理每一个查询"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys; from src.utils.stream_input import read_stdin; "
+                "print(sys.argv[1], read_stdin() is None)")
+        script = f'while read q; do "{sys.executable}" -c "{code}" "$q"; done < "{self.path}"'
+        result = subprocess.run(["bash", "-c", script], cwd=root, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, timeout=60)
+        self.assertEqual(result.stdout.decode("utf-8").splitlines(),
+                         ["列出文件 True", "查看磁盘 True", "统计行数 True"])
+
+    def test_pipe_never_closes(self):
+        """测试继承的管道没有数据也不关闭时不会一直等待"""
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, write_fd)
+        with os.fdopen(read_fd, "rb", buffering=0) as stream, \
+                patch('src.utils.stream_input.is_interactive', return_value=False):
+            start = time.time()
+            content, mock_print = self.read_from(stream, wait=0.1)
+        self.assertIsNone(content)
+        self.assertLess(time.time() - start, 5)
+        self.assertIn("-wait-stdin", mock_print.call_args[0][0])
+        self.assertIn("-no-stdin", mock_print.call_args[0][0])
+
+    def test_slow_pipe_waited_for(self):
+        """测试在终端中运行或使用 -wait-stdin 时等待启动较慢的命令的输出"""
+        for interactive, wait in ((True, 0.1), (False, None)):
+            read_fd, write_fd = os.pipe()
+
+            def write_later():
+                time.sleep(0.3)
+                os.write(write_fd, b"slow output\n")
+                os.close(write_fd)
+
+            threading.Thread(target=write_later, daemon=True).start()
+            with os.fdopen(read_fd, "rb", buffering=0) as stream, \
+                    patch('src.utils.stream_input.is_interactive', return_value=interactive):
+                content, _ = self.read_from(stream, wait=wait)
+            self.assertEqual(content, "slow output")
+
+    def test_pipe_with_data(self):
+        """测试管道有数据时读取到EOF"""
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"Filesystem Size\n/dev/sda1 100G\n")
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb", buffering=0) as stream:
+            content, _ = self.read_from(stream, wait=0.1)
+        self.assertEqual(content, "Filesystem Size\n/dev/sda1 100G")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+回答缓存预热的测试用例
+"""
+
+import unittest
+import os
+import sys
+import json
+import time
+import tempfile
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.daemon.server import CopilotDaemon, Job, answer_cache_key
+from src.daemon.warmer import CacheWarmer, WarmBudget, rank_queries
+from src.log.history_store import HistoryStore, make_entry
+from src.utils.result_cache import ResultCache
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+PROVIDER = {
+    "url": "https://warm.example.com/v1/chat/completions",
+    "model": "warm-model",
+    "token_limit": 64000,
+    "key_file": "warm_key.txt",
+    "rate_limit": {"requests_per_minute": 100000, "max_concurrency": 4},
+    "warm_tokens_per_day": 1000
+}
+
+
+class TestWarmer(unittest.TestCase):
+    """缓存预热测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.temp_dir.name, "history"), auto_compact=False)
+        self.now = time.time()
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def add(self, query, cwd="/srv", days_ago=0.0, times=1, model="warm-model", tokens=400):
+        for index in range(times):
+            self.store.append(make_entry(query, f"echo {query}", timestamp=self.now - days_ago * 86400 - index,
+                                         cwd=cwd, model=model, prompt_tokens=tokens - 10,
+                                         completion_tokens=10))
+
+    def test_rank_queries(self):
+        """测试按目录分组、按频率和最近使用时间排列，统计所有模型的记录"""
+        self.add("列出  文件", times=2)
+        self.add("列出 文件", days_ago=1, tokens=200)
+        self.add("查看磁盘", days_ago=20, times=3)
+        self.add("查看磁盘", cwd="/tmp")
+        self.add("检查端口", times=4, model="other-model")
+        self.add("很久以前", days_ago=40, times=5)
+
+        ranked = rank_queries(self.store, self.now)
+        self.assertEqual([(item["query"], item["cwd"], item["count"]) for item in ranked],
+                         [("检查端口", "/srv", 4), ("列出  文件", "/srv", 3), ("查看磁盘", "/srv", 3)])
+        self.assertEqual(ranked[1]["tokens"], 333)
+        self.assertGreater(ranked[1]["score"], 2.8)
+        self.assertLess(ranked[2]["score"], 0.5)
+        self.assertEqual(len(rank_queries(self.store, self.now, min_count=1)), 4)
+
+    def test_warm_round(self):
+        """测试只刷新缺失和即将过期的回答，并遵守每天的token上限"""
+        for query in ("查看磁盘", "列出文件", "检查端口", "统计行数"):
+            self.add(query, times=2)
+        model_manager = MagicMock()
+        model_manager.get_command_provider.return_value = PROVIDER
+        cache = ResultCache(os.path.join(self.temp_dir.name, "answers.db"), 1024 * 1024, 3600)
+        copilot = CopilotDaemon(cache, model_manager, CONTEXT)
+        self.addCleanup(copilot.close)
+        cache.put(answer_cache_key("查看磁盘", "/srv", PROVIDER), "df -h")
+
+        calls = []
+
+        def fake_generate(query, context, usage=None, **kwargs):
+            calls.append((query, context["current_directory"]))
+            usage.update(prompt_tokens=390, completion_tokens=10)
+            return True, f"echo {query}"
+
+        budget = WarmBudget(os.path.join(self.temp_dir.name, "warmer.json"))
+        warmer = CacheWarmer(copilot, self.store, budget, idle_seconds=0)
+        with patch('src.daemon.server.generate_bash_command', side_effect=fake_generate), \
+                patch('src.daemon.server.append_to_history') as history:
+            result = warmer.warm_round(self.now)
+            self.assertEqual((result["warmed"], result["fresh"], result["tokens"]), (2, 1, 800))
+            self.assertTrue(warmer.stats["budget_exhausted"])
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(calls[0][1], "/srv")
+            self.assertEqual(cache.get(answer_cache_key(calls[0][0], "/srv", PROVIDER)),
+                             f"echo {calls[0][0]}")
+            self.assertEqual(budget.spent(f"{PROVIDER['url']}|{PROVIDER['model']}", self.now), 800)
+
+            # 第二天: 即将过期的回答和上次超出预算的查询
+            with cache.lock:
+                cache.conn.execute("UPDATE results SET created = ? WHERE key = ?",
+                                   (time.time() - 3000, answer_cache_key("查看磁盘", "/srv", PROVIDER)))
+                cache.conn.commit()
+            result = warmer.warm_round(self.now + 86400)
+            self.assertEqual((result["warmed"], result["fresh"]), (2, 2))
+            self.assertIn(("查看磁盘", "/srv"), calls)
+            self.assertEqual(len(set(calls)), 4)
+            history.assert_not_called()
+
+        with open(budget.path, encoding="utf-8") as f:
+            self.assertEqual(sum(json.load(f)["tokens"].values()), 800)
+        self.assertEqual(copilot.stats["generated"], 0)
+        self.assertEqual(copilot.status()["warmer"], None)
+
+    def test_idle_and_disabled(self):
+        """测试用户请求进行中不算空闲，以及上限为0时不预热"""
+        model_manager = MagicMock()
+        model_manager.get_command_provider.return_value = dict(PROVIDER, warm_tokens_per_day=0)
+        cache = ResultCache(os.path.join(self.temp_dir.name, "answers.db"), 1024 * 1024, 3600)
+        copilot = CopilotDaemon(cache, model_manager, CONTEXT)
+        self.addCleanup(copilot.close)
+        copilot.last_request -= 60
+        self.assertGreaterEqual(copilot.idle_for(), 60)
+        copilot.jobs["user"] = Job("user")
+        self.assertEqual(copilot.idle_for(), 0.0)
+        copilot.jobs["user"].warm = True
+        self.assertGreaterEqual(copilot.idle_for(), 60)
+
+        self.add("查看磁盘", times=3)
+        warmer = CacheWarmer(copilot, self.store, WarmBudget(os.path.join(self.temp_dir.name, "w.json")),
+                             idle_seconds=0)
+        self.assertEqual(warmer.warm_round(self.now)["candidates"], 0)
+        self.assertEqual(warmer.snapshot()["tokens_per_day"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+监视模式测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+import threading
+from argparse import Namespace
+from unittest.mock import patch, MagicMock
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cli.watch_commands import handle_watch_command
+from src.utils.file_follower import FileFollower
+from src.generators.watch_generator import Watcher, WatchStats
+from config.prompts import WATCH_NONE_MESSAGE
+
+
+CONTEXT = {
+    "current_directory": "/home/user",
+    "username": "testuser",
+    "hostname": "testhost",
+    "ubuntu_version": "20.04"
+}
+
+PROVIDER = {
+    "url": "https://api.siliconflow.cn/v1/chat/completions",
+    "model": "Pro/deepseek-ai/DeepSeek-V3",
+    "token_limit": 64000,
+    "key_file": "siliconflow_key.txt"
+}
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+class TestFileFollower(unittest.TestCase):
+    """文件跟踪测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "app.log")
+        append(self.path, "old line\n" * 1000)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def read(self, follower):
+        return b"".join(follower.read_new()).decode()
+
+    def test_only_appended_content(self):
+        """测试只读取新追加的内容，不完整的行留到下一次"""
+        follower = FileFollower(self.path)
+        self.assertEqual(follower.initial_size, 9000)
+        self.assertEqual(self.read(follower), "")
+
+        append(self.path, "first\nsec")
+        self.assertEqual(self.read(follower), "first\n")
+        append(self.path, "ond\n")
+        self.assertEqual(self.read(follower), "second\n")
+        # 已处理的部分不会被重新读取
+        self.assertEqual(follower.offset, 9000 + len("first\nsecond\n"))
+        follower.close()
+
+        follower = FileFollower(self.path, from_start=True)
+        self.assertEqual(self.read(follower).count("old line"), 1000)
+        follower.close()
+
+    def test_truncate_and_rotate(self):
+        """测试文件被截断和被轮转"""
+        follower = FileFollower(self.path, use_inotify=False)
+        append(self.path, "before rotate\n")
+        os.rename(self.path, self.path + ".1")
+        append(self.path + ".1", "late write\n")
+        append(self.path, "new file\n")
+        self.assertEqual(self.read(follower), "before rotate\nlate write\nnew file\n")
+        self.assertEqual(follower.rotations, 1)
+
+        with open(self.path, "w") as f:
+            f.write("x\n")
+        self.assertEqual(self.read(follower), "x\n")
+        self.assertEqual(follower.truncations, 1)
+        follower.close()
+
+    def test_inotify_wakes_on_append(self):
+        """测试 inotify 在文件追加内容时立即返回"""
+        follower = FileFollower(self.path)
+        if follower.mode != "inotify":
+            follower.close()
+            self.skipTest("系统不支持inotify")
+        append(os.path.join(self.temp_dir.name, "other.log"), "noise\n")
+        timer = threading.Timer(0.1, append, (self.path, "wake\n"))
+        timer.start()
+        start = time.monotonic()
+        follower.wait(5)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.read(follower), "wake\n")
+        timer.join()
+        follower.close()
+
+
+class TestWatchStats(unittest.TestCase):
+    """监视统计测试类"""
+
+    def test_levels_counted_once_per_line(self):
+        """测试每行只计入第一个匹配的日志级别，与文件格式摘要相同"""
+        stats = WatchStats()
+        stats.add(b"ERROR retry after WARN, ERROR again\nINFO ok\nplain line\n")
+        stats.add(b"WARNING disk 90%\n2024 INFO DEBUG mixed\n")
+        self.assertEqual(stats.lines, 5)
+        self.assertEqual(dict(stats.levels), {"ERROR": 1, "INFO": 2, "WARN": 1})
+
+
+class TestWatcher(unittest.TestCase):
+    """监视模式测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "app.log")
+        append(self.path, "2024-05-01 INFO started\n" * 10000)
+        model_manager = MagicMock()
+        model_manager.get_command_provider.return_value = PROVIDER
+        model_manager.get_api_key.return_value = "key"
+        model_manager.config = {"command": {"provider": "siliconflow"}}
+        self.follower = FileFollower(self.path, use_inotify=False)
+        self.output = []
+        self.watcher = Watcher(self.path, "磁盘满时给出清理命令", self.follower, CONTEXT,
+                               model_manager, debounce=2, min_interval=10, max_wait=30,
+                               output=self.output.append)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.follower.close()
+        self.temp_dir.cleanup()
+
+    @patch('src.generators.watch_generator.append_to_history')
+    @patch('src.generators.watch_generator.send_request')
+    def test_debounce_and_interval(self, mock_send, mock_history):
+        """测试防抖、最长等待和最短请求间隔"""
+        mock_send.return_value = (True, WATCH_NONE_MESSAGE)
+        self.assertIsNone(self.watcher.step(now=0))
+
+        append(self.path, "2024-05-01 INFO ok\n")
+        self.assertIsNone(self.watcher.step(now=100))
+        self.assertEqual(self.watcher.due_in(now=101), 1)
+        self.assertEqual(self.watcher.step(now=102), (True, WATCH_NONE_MESSAGE))
+        self.assertEqual(self.output, [])
+
+        # 两次请求之间至少间隔 min_interval
+        append(self.path, "2024-05-01 ERROR disk full\n")
+        self.assertIsNone(self.watcher.step(now=104.5))
+        self.assertEqual(self.watcher.due_in(now=105), 7)
+
+        # 文件持续增长时最长等待 max_wait
+        mock_send.return_value = (True, "du -sh /var/log/* | sort -h")
+        for now in range(106, 140):
+            append(self.path, "2024-05-01 ERROR disk full\n")
+            self.watcher.step(now=now)
+        self.assertEqual(mock_send.call_count, 2)
+        self.assertEqual(len(self.output), 1)
+        self.assertIn("du -sh", self.output[0])
+        mock_history.assert_called_once()
+
+    @patch('src.generators.watch_generator.send_request')
+    def test_only_new_content_sent(self, mock_send):
+        """测试只发送新内容和之前内容的摘要，前缀保持不变"""
+        mock_send.return_value = (True, WATCH_NONE_MESSAGE)
+        append(self.path, "2024-05-01 WARN disk 91%\n")
+        self.watcher.step(now=0)
+        self.watcher.step(now=5)
+        append(self.path, "2024-05-01 ERROR disk full\n")
+        self.watcher.step(now=20)
+        self.watcher.step(now=25)
+
+        self.assertEqual(mock_send.call_count, 2)
+        first = mock_send.call_args_list[0][0][2]["messages"]
+        second = mock_send.call_args_list[1][0][2]["messages"]
+        self.assertEqual(first[0], second[0])
+        content = second[1]["content"]
+        self.assertIn("ERROR disk full", content)
+        self.assertNotIn("WARN disk 91%", content)
+        self.assertNotIn("INFO started", content)
+        self.assertIn("已处理 1 行", content)
+        self.assertIn("WARN=1", content)
+        self.assertIn("监视开始前已有", content)
+
+    @patch('src.generators.watch_generator.send_request')
+    def test_failed_request_keeps_content(self, mock_send):
+        """测试请求失败时保留新内容，间隔后重试"""
+        mock_send.return_value = (False, "API错误 (500): boom")
+        append(self.path, "2024-05-01 ERROR disk full\n")
+        self.watcher.step(now=0)
+        self.assertEqual(self.watcher.step(now=3), (False, "API错误 (500): boom"))
+        self.assertIn("错误", self.output[0])
+        self.assertIsNone(self.watcher.step(now=5))
+
+        mock_send.return_value = (True, WATCH_NONE_MESSAGE)
+        self.watcher.step(now=13)
+        self.assertIn("ERROR disk full", mock_send.call_args[0][2]["messages"][1]["content"])
+        self.assertIsNone(self.watcher.due_in())
+
+
+class TestWatchCommand(unittest.TestCase):
+    """watch 命令测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "app.log")
+        append(self.path, "2024-05-01 ERROR disk full\n")
+        self.model_manager = MagicMock()
+        self.model_manager.get_command_provider.return_value = PROVIDER
+        self.model_manager.get_api_key.return_value = "key"
+        self.model_manager.config = {"command": {"provider": "siliconflow"}}
+        self.args = Namespace(filename=self.path, query="磁盘满时给出清理命令", from_start=True,
+                              poll_interval=0.1, poll=True, debounce=0.0, interval=0.0)
+        patchers = [patch('src.generators.watch_generator.ModelManager', return_value=self.model_manager),
+                    patch('src.cli.watch_commands.get_bash_context', return_value=CONTEXT),
+                    patch('src.generators.watch_generator.append_to_history')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    @patch('src.generators.watch_generator.send_request')
+    def test_watch_command(self, mock_send):
+        """测试 watch 命令发送一次请求后按 Ctrl-C 结束"""
+        mock_send.return_value = (True, "du -sh /var/log/*")
+
+        def run_once(watcher):
+            watcher.collect()
+            watcher.send()
+            raise KeyboardInterrupt
+
+        with patch.object(Watcher, "run", autospec=True, side_effect=run_once), \
+                patch('builtins.print') as mock_print:
+            handle_watch_command(self.args)
+        self.assertEqual(mock_send.call_count, 1)
+        self.assertIn("共发送 1 次请求", mock_print.call_args[0][0])
+
+    def test_missing_key(self):
+        """测试没有API密钥时给出错误并退出"""
+        self.model_manager.get_api_key.return_value = None
+        with patch('builtins.print') as mock_print, self.assertRaises(SystemExit):
+            handle_watch_command(self.args)
+        self.assertIn("未找到API密钥", mock_print.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+分布式批处理工作队列的测试用例
+"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_provider import MockProvider
+from src.utils.http_client import close_sessions
+from src.workqueue.store import DirectoryQueue, SqliteQueue, open_queue
+from src.workqueue import worker as worker_module
+from src.workqueue.worker import QueueWorker, format_report, queue_report
+
+CONTEXT = {"current_directory": "/tmp", "username": "user", "hostname": "host",
+           "ubuntu_version": "22.04"}
+
+
+class QueueTests:
+    """两种队列共用的测试，子类提供 queue_spec"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spec = os.path.join(self.temp_dir.name, self.queue_spec)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        close_sessions()
+        self.temp_dir.cleanup()
+
+    def open(self, lease_timeout=60.0):
+        queue = open_queue(self.spec, lease_timeout)
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_claim_is_exclusive(self):
+        """测试同时领取的进程不会得到相同的条目"""
+        queue = self.open()
+        queue.add([f"查询{index}" for index in range(120)], CONTEXT)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            batches = list(pool.map(lambda index: [lease.id for _ in range(10)
+                                                   for lease in self.open().claim(f"w{index}", 3)],
+                                    range(6)))
+        claimed = [item_id for batch in batches for item_id in batch]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), 120)
+        self.assertEqual(queue.progress(), {"pending": 0, "leased": 120, "done": 0, "failed": 0})
+
+    def test_complete_exactly_once(self):
+        """测试租约超时后重新分配，每个条目只接受第一个结果"""
+        queue = self.open(lease_timeout=0.2)
+        queue.add(["列出文件", "查看磁盘"], CONTEXT)
+        first = queue.claim("dead", 1)[0]
+        self.assertEqual(first.item["query"], "列出文件")
+        self.assertEqual(first.item["context"], CONTEXT)
+        time.sleep(0.3)
+        self.assertEqual(queue.requeue_expired(), 1)
+        self.assertEqual(queue.renew([first]), [first])
+
+        second = queue.claim("alive", 2)
+        self.assertEqual([lease.id for lease in second][0], first.id)
+        self.assertTrue(queue.complete(second[0], {"id": first.id, "success": True, "answer": "ls"}))
+        # 原进程在租约超时后才完成
+        self.assertFalse(queue.complete(first, {"id": first.id, "success": True, "answer": "ls -l"}))
+        self.assertTrue(queue.complete(second[1], {"id": second[1].id, "success": False,
+                                                   "answer": "API错误 (500)"}))
+        self.assertEqual([result["answer"] for result in queue.results()], ["ls", "API错误 (500)"])
+        self.assertEqual(queue.progress(), {"pending": 0, "leased": 0, "done": 2, "failed": 1})
+        self.assertEqual(queue.claim("alive", 5), [])
+
+    def test_release_and_renew(self):
+        """测试续租保持租约，放弃的条目回到等待状态"""
+        queue = self.open(lease_timeout=0.3)
+        queue.add(["a", "b"], CONTEXT)
+        leases = queue.claim("w", 2)
+        for _ in range(3):
+            time.sleep(0.15)
+            self.assertEqual(queue.renew(leases), [])
+            self.assertEqual(queue.requeue_expired(), 0)
+        queue.release(leases[0])
+        self.assertEqual(queue.progress()["pending"], 1)
+        self.assertEqual([lease.id for lease in queue.claim("other", 2)], [leases[0].id])
+
+    def test_workers_with_dead_worker(self):
+        """测试多个工作进程完成所有条目，失联进程的条目在租约超时后重新分配"""
+        queue = self.open(lease_timeout=0.5)
+        queue.add([f"统计第{index}个目录" for index in range(30)], CONTEXT)
+        queue.claim("dead", 4)
+
+        model_manager = MagicMock()
+        model_manager.get_api_key.return_value = "key"
+        model_manager.config = {"command": {"provider": "mock"}}
+        with MockProvider(reply="du -sh", ttfb=0.01) as provider:
+            config = {"url": provider.url, "model": "mock-model", "key_file": "key.txt",
+                      "rate_limit": {"requests_per_minute": 100000, "max_concurrency": 3}}
+            workers = [QueueWorker(self.open(lease_timeout=0.5), model_manager, f"host{index}",
+                                   config, poll_interval=0.05) for index in range(2)]
+            threads = [threading.Thread(target=worker.run) for worker in workers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+            self.assertEqual(provider.requests, 30)
+
+        results = list(queue.results())
+        self.assertEqual(len(results), 30)
+        self.assertEqual({result["answer"] for result in results}, {"du -sh"})
+        self.assertEqual(sum(worker.stats["completed"] for worker in workers), 30)
+
+        report = queue_report(queue)
+        self.assertEqual(report["progress"]["done"], 30)
+        self.assertEqual(report["eta"], 0.0)
+        self.assertEqual({worker["worker"] for worker in report["workers"]}, {"host0", "host1"})
+        self.assertFalse(any(worker["alive"] for worker in report["workers"]))
+        self.assertGreater(report["overall"], 0)
+        self.assertIn("30/30", format_report(report))
+
+    def test_transient_failures_are_retried(self):
+        """测试限流和网络错误放回队列重试，其他失败和超过重试次数的条目作为失败写回"""
+        queue = self.open()
+        queue.add(["限流", "网络", "无效请求", "一直限流"], CONTEXT)
+        attempts = {}
+
+        def fake_generation(provider_config, query, context, is_script, file_contents, usage,
+                            *args, **kwargs):
+            attempts[query] = attempts.get(query, 0) + 1
+            usage["key"] = "key.txt"
+            if query == "无效请求":
+                usage["status"] = 400
+                return False, "API错误 (400): bad request"
+            if query == "一直限流" or attempts[query] == 1:
+                if query != "网络":
+                    usage["status"] = 429
+                return False, "被限流或连接失败"
+            usage["status"] = 200
+            return True, "ls"
+
+        model_manager = MagicMock()
+        model_manager.get_api_key.return_value = "key"
+        model_manager.config = {"command": {"provider": "mock"}}
+        config = {"url": "https://queue.example.com/v1/chat/completions", "model": "mock-model",
+                  "key_file": "key.txt",
+                  "rate_limit": {"requests_per_minute": 100000, "max_concurrency": 2}}
+        worker = QueueWorker(self.open(), model_manager, "host", config, poll_interval=0.02)
+        with patch.object(worker_module, "request_generation", side_effect=fake_generation), \
+                patch.object(worker_module, "RETRY_DELAY", 0.0), \
+                patch.object(worker_module, "MAX_ITEM_RETRIES", 2):
+            stats = worker.run()
+
+        results = {result["query"]: result for result in queue.results()}
+        self.assertEqual(attempts, {"限流": 2, "网络": 2, "无效请求": 1, "一直限流": 3})
+        self.assertTrue(results["限流"]["success"] and results["网络"]["success"])
+        self.assertFalse(results["无效请求"]["success"] or results["一直限流"]["success"])
+        self.assertEqual((stats["completed"], stats["failed"], stats["retried"]), (2, 2, 4))
+        self.assertEqual(queue.progress(), {"pending": 0, "leased": 0, "done": 4, "failed": 2})
+
+
+class TestDirectoryQueue(QueueTests, unittest.TestCase):
+    """目录队列测试类"""
+
+    queue_spec = "queue"
+
+    def test_open_queue(self):
+        """测试按路径选择队列类型"""
+        self.assertIsInstance(self.open(), DirectoryQueue)
+        self.assertTrue(os.path.isdir(os.path.join(self.spec, "pending")))
+
+
+class TestSqliteQueue(QueueTests, unittest.TestCase):
+    """SQLite队列测试类"""
+
+    queue_spec = "queue.db"
+
+    def test_open_queue(self):
+        """测试按路径选择队列类型"""
+        self.assertIsInstance(self.open(), SqliteQueue)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+工作区索引测试用例
+"""
+
+import unittest
+import os
+import sys
+import sqlite3
+import tempfile
+from unittest.mock import patch
+
+# 确保项目根目录在Python路径中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.index.workspace_index import WorkspaceIndex, workspace_file_contents
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+    """工作区索引测试类"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, "project")
+        os.makedirs(os.path.join(self.root, "src"))
+        os.makedirs(os.path.join(self.root, ".git"))
+        self._write("src/server.py", "def start_server(port):\n    listen(port)\n")
+        self._write("deploy.sh", "#!/bin/bash\ndocker compose up -d\n")
+        self._write(".git/config", "[core]\n")
+        self.index = WorkspaceIndex(self.root, os.path.join(self.temp_dir.name, "index.db"))
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def _write(self, path, content):
+        with open(os.path.join(self.root, path), "w") as f:
+            f.write(content)
+
+    def test_build_and_search(self):
+        """测试建立索引并检索相关片段"""
+        stats = self.index.update(rebuild=True)
+        self.assertEqual(stats["added"], 2)
+
+        results = self.index.search("docker compose")
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0][0].startswith("deploy.sh (第1-2行)"))
+        self.assertIn("docker compose up", results[0][1])
+
+        summary = self.index.summary()
+        self.assertIn("共 2 个文件", summary)
+        self.assertIn("python=1", summary)
+
+    def test_incremental_update(self):
+        """测试增量更新只重新索引变化的文件"""
+        self.index.update()
+        self._write("deploy.sh", "#!/bin/bash\nkubectl apply -f k8s/\n")
+        self._write("README.md", "# project\n")
+        os.remove(os.path.join(self.root, "src", "server.py"))
+
+        stats = self.index.update()
+        self.assertEqual(stats.get("updated"), 1)
+        self.assertEqual(stats.get("added"), 1)
+        self.assertEqual(stats.get("removed"), 1)
+        self.assertEqual(self.index.search("docker"), [])
+        self.assertEqual(len(self.index.search("kubectl")), 1)
+        self.assertEqual(self.index.search("start_server"), [])
+
+    def test_touch_without_change(self):
+        """测试只有mtime变化的文件不会重新索引"""
+        self.index.update()
+        path = os.path.join(self.root, "deploy.sh")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+        stats = self.index.update()
+        self.assertEqual(stats.get("unchanged"), 2)
+        self.assertNotIn("updated", stats)
+
+    def test_terms_not_stored(self):
+        """测试检索词不保存原文，删除和重建后检索结果仍然正确"""
+        self.index.update()
+        self.assertEqual({row[0] for row in self.index.conn.execute("SELECT terms FROM chunk_terms")},
+                         {None})
+        self._write("deploy.sh", "#!/bin/bash\nkubectl apply -f k8s/\n")
+        self.index.update()
+        self.assertEqual(self.index.conn.execute(
+            "SELECT rowid FROM chunk_terms WHERE chunk_terms MATCH 'docker'").fetchall(), [])
+        self.index.update(rebuild=True)
+        self.assertEqual(self.index.search("docker"), [])
+        self.assertEqual(len(self.index.search("kubectl")), 1)
+        self.assertEqual(len(self.index.search("start_server")), 1)
+
+    def test_old_format_is_reset(self):
+        """测试旧格式的索引在打开时清空，需要重新建立"""
+        path = os.path.join(self.temp_dir.name, "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE VIRTUAL TABLE chunk_terms USING fts5(terms)")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("INSERT INTO meta VALUES ('updated_at', '1')")
+        conn.commit()
+        conn.close()
+
+        index = WorkspaceIndex(self.root, path)
+        self.assertFalse(index.exists())
+        index.update()
+        self.assertEqual(len(index.search("docker")), 1)
+        index.close()
+
+    def test_missing_index_not_created(self):
+        """测试查询没有索引的目录时不创建空的索引数据库"""
+        directory = os.path.join(self.temp_dir.name, "indexes")
+        with patch("src.index.workspace_index.WORKSPACE_INDEX_DIR", directory), \
+                patch("builtins.print"):
+            self.assertIsNone(workspace_file_contents(self.root, "docker"))
+        self.assertFalse(os.path.exists(directory))
+
+
+if __name__ == '__main__':
+    unittest.main()